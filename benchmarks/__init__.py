@@ -0,0 +1,39 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+"""
+Stand-alone benchmarks for the planner. Each module can be run from the project root, for example:
+
+    python -m benchmarks.bench_expressions
+"""
+
+import contextlib
+import os
+
+
+def setup_django():
+    """
+    Configures Django so that benchmarks can import the planner's models.
+    """
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'server.settings')
+    django.setup()
+
+
+@contextlib.contextmanager
+def test_database():
+    """
+    Creates an empty test database for the duration of the block, as the test runner does, so that
+    benchmarks can fill it with synthetic data.
+    """
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    database_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(database_name, verbosity=0)
+        teardown_test_environment()
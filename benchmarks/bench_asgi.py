@@ -0,0 +1,164 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+"""
+Load-tests the read-heavy API endpoints served by a single ASGI worker (uvicorn) and by a single WSGI worker
+(gunicorn with a pool of threads), reporting the requests per second and the latency percentiles of each.
+Both servers are started by this script on local ports, against the database of the current settings, which
+should already contain a catalog. Neither server is a dependency of the planner: install uvicorn and gunicorn
+to run it.
+
+Each of the `--concurrency` clients sends requests one after the other over a new connection, cycling through
+'/api/meeting/get', '/api/section/search' and '/api/data/course' requests for CRNs and courses of the latest
+term of the catalog. The clients run in this process, which should therefore run on other cores than the
+servers for the throughput to be that of the servers.
+
+    python -m benchmarks.bench_asgi [--concurrency 200] [--duration 10] [--threads 32] [--servers asgi,wsgi]
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import urlencode
+
+from benchmarks import setup_django
+
+setup_django()
+
+from plan.models import CourseOffering, Section
+
+SERVER_COMMANDS = {
+    'asgi': [sys.executable, '-m', 'uvicorn', 'server.asgi:application', '--host', '127.0.0.1', '--port', '{port}',
+             '--workers', '1', '--log-level', 'warning', '--no-access-log'],
+    'wsgi': [sys.executable, '-m', 'gunicorn.app.wsgiapp', 'server.wsgi:application', '--bind',
+             '127.0.0.1:{port}', '--workers', '1', '--threads', '{threads}', '--log-level', 'warning']
+}
+
+
+def get_paths(limit=100):
+    """
+    Returns the request paths to cycle through, for sections and courses of the latest term of the catalog.
+    """
+    offering = CourseOffering.objects.order_by('-year', '-term_type').first()
+    if offering is None:
+        raise SystemExit('The database does not contain any course offering.')
+
+    sections = Section.objects.filter(course_offering__year=offering.year,
+                                      course_offering__term_type=offering.term_type) \
+        .order_by('crn').values_list('crn', 'course_offering__course__subject', 'course_offering__course__number')
+
+    paths = []
+    for crn, subject, number in sections[:limit]:
+        paths.append('/api/meeting/get?' + urlencode({'crn': crn}))
+        paths.append('/api/section/search?' + urlencode({'year': offering.year, 'term': offering.term_type,
+                                                         'course': subject + ' ' + number}))
+        paths.append('/api/data/course?' + urlencode({'action': 'get', 'subject': subject, 'number': number}))
+    return paths
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(name, port, threads):
+    command = [argument.format(port=port, threads=threads) for argument in SERVER_COMMANDS[name]]
+    process = subprocess.Popen(command, env=dict(os.environ))
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit('The {} server exited with status {}.'.format(name, process.returncode))
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+
+    process.kill()
+    raise SystemExit('The {} server did not start listening.'.format(name))
+
+
+async def fetch(port, path):
+    """
+    Sends a GET request over a new connection and returns the status code, once the response was read.
+    """
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write('GET {} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n'.format(path).encode('ascii'))
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    return int(response.split(b' ', 2)[1]) if response else 0
+
+
+async def run_load(port, paths, concurrency, duration):
+    """
+    Sends requests from `concurrency` clients for `duration` seconds. Returns the latency of each successful
+    request in milliseconds, and the number of failed requests.
+    """
+    latencies = []
+    errors = 0
+    requests = itertools.cycle(paths)
+    deadline = time.monotonic() + duration
+
+    async def client():
+        nonlocal errors
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                status = await fetch(port, next(requests))
+            except OSError:
+                status = 0
+            if status == 200:
+                latencies.append((time.perf_counter() - start) * 1000)
+            else:
+                errors += 1
+
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    return latencies, errors
+
+
+def get_percentile(values, percentile):
+    return values[min(len(values) - 1, int(len(values) * percentile / 100))] if values else float('nan')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--warmup', type=float, default=2)
+    parser.add_argument('--threads', type=int, default=32, help='Threads of the WSGI worker')
+    parser.add_argument('--servers', default='asgi,wsgi')
+    args = parser.parse_args()
+
+    paths = get_paths()
+    print('Paths: {}, concurrency: {}, duration: {} s'.format(len(paths), args.concurrency, args.duration))
+    print('{:<6} {:>9} {:>7} {:>10} {:>10} {:>10}'.format('Server', 'Requests', 'Errors', 'Req/s', 'p50 (ms)',
+                                                           'p99 (ms)'))
+
+    for name in args.servers.split(','):
+        port = get_free_port()
+        process = start_server(name, port, args.threads)
+        try:
+            asyncio.run(run_load(port, paths, args.concurrency, args.warmup))
+            latencies, errors = asyncio.run(run_load(port, paths, args.concurrency, args.duration))
+        finally:
+            process.terminate()
+            process.wait()
+
+        latencies.sort()
+        print('{:<6} {:>9} {:>7} {:>10.1f} {:>10.2f} {:>10.2f}'.format(
+            name, len(latencies), errors, len(latencies) / args.duration, get_percentile(latencies, 50),
+            get_percentile(latencies, 99)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+"""
+Measures the latency of fetching the full course catalog from `/api/data/course`, against a test database
+filled with a synthetic catalog. Compares serializing the catalog on every request to serving the snapshot
+of the current catalog version, compressed or not, and to revalidating it with its ETag.
+
+    python -m benchmarks.bench_catalog [--courses 20000] [--repeat 20] [--seed 0]
+"""
+
+import argparse
+import random
+import time
+
+from benchmarks import setup_django, test_database
+
+setup_django()
+
+from django.http import JsonResponse
+from django.test import Client
+from plan.catalog import CatalogSnapshot
+from plan.handlers import DataHandler
+from plan.models import Course
+
+SUBJECTS = ['ANTH', 'ART', 'BIOL', 'CHEM', 'CSC', 'ECON', 'ENGL', 'GEOG', 'HIST', 'MATH', 'PHYS', 'SENG']
+
+
+def generate_catalog(rng, courses):
+    """
+    Returns `courses` unsaved `Course` instances with distinct codes, a quarter of them with a requisite.
+    """
+    catalog = []
+    for index in range(courses):
+        subject = SUBJECTS[index % len(SUBJECTS)]
+        number = str(100 + index // len(SUBJECTS))
+        requirement = None
+        if catalog and rng.random() < 0.25:
+            other = rng.choice(catalog)
+            requirement = {'expressions': [{'expression_type': 'course', 'message': '',
+                                            'subject': other.subject, 'number': other.number,
+                                            'requisite_type': 'prerequisite'}]}
+
+        catalog.append(Course(subject=subject, number=number, name='Course ' + str(index),
+                              credits=1.5, hours_lectures=3, hours_labs=rng.choice([0, 2]),
+                              hours_tutorials=rng.choice([0, 1]), offered_spring=rng.random() < 0.5,
+                              offered_summer=rng.random() < 0.2, offered_fall=rng.random() < 0.7,
+                              requirement=requirement))
+    return catalog
+
+
+def measure(function, repeat):
+    """
+    Returns the median duration of `function` in milliseconds, along with its last result.
+    """
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        durations.append((time.perf_counter() - start) * 1000)
+    return sorted(durations)[len(durations) // 2], result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--courses', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with test_database():
+        Course.objects.bulk_create(generate_catalog(random.Random(args.seed), args.courses), batch_size=2000)
+        CatalogSnapshot.bump_version()
+        client = Client()
+
+        def fetch_legacy():
+            return JsonResponse({'method': 'data_course', 'response': DataHandler.get_course_catalog()})
+
+        def fetch_cold():
+            CatalogSnapshot.bump_version()
+            return client.get('/api/data/course', {'action': 'get'}, HTTP_ACCEPT_ENCODING='gzip')
+
+        def fetch(**headers):
+            return lambda: client.get('/api/data/course', {'action': 'get'}, **headers)
+
+        legacy, legacy_response = measure(fetch_legacy, args.repeat)
+        cold, _ = measure(fetch_cold, args.repeat)
+        identity, identity_response = measure(fetch(), args.repeat)
+        compressed, compressed_response = measure(fetch(HTTP_ACCEPT_ENCODING='gzip'), args.repeat)
+        not_modified, not_modified_response = measure(fetch(HTTP_IF_NONE_MATCH=identity_response['ETag']),
+                                                      args.repeat)
+        assert not_modified_response.status_code == 304
+
+        print('Courses: {}'.format(args.courses))
+        print('Serialized per request:  {:8.2f} ms  {:>10} bytes'.format(legacy, len(legacy_response.content)))
+        print('Snapshot rebuild (gzip): {:8.2f} ms'.format(cold))
+        print('Snapshot:                {:8.2f} ms  {:>10} bytes'.format(identity, len(identity_response.content)))
+        print('Snapshot (gzip):         {:8.2f} ms  {:>10} bytes'.format(compressed,
+                                                                       len(compressed_response.content)))
+        print('Not modified (304):      {:8.2f} ms'.format(not_modified))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+"""
+Evaluates a program's requirements against a synthetic cohort with `CohortEvaluator`, and compares it to
+evaluating each student's `SequenceSnapshot` one at a time.
+
+    python -m benchmarks.bench_cohorts [--students 50000] [--courses 2000] [--seed 0]
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from benchmarks import setup_django
+
+setup_django()
+
+from benchmarks.bench_expressions import generate_requisite
+from plan.cohorts import CohortBitmap, CohortEvaluator, CourseIndex
+from plan.expressions import ExpressionFactory
+from plan.snapshots import SequenceSnapshot
+
+
+def generate_cohort(rng, course_index, students, core_courses, terms=12, courses_per_term=4):
+    """
+    Returns the parallel entry arrays of a cohort in which every student has completed
+    `courses_per_term` courses in each of `terms` consecutive terms, half of them core courses.
+    """
+    np_rng = np.random.default_rng(rng.randint(0, 2 ** 32))
+    per_student = terms * courses_per_term
+
+    rows = np.repeat(np.arange(students), per_student)
+    positions = np.where(np_rng.random(students * per_student) < 0.5,
+                         np_rng.integers(0, core_courses, size=students * per_student),
+                         np_rng.integers(0, len(course_index), size=students * per_student))
+    first_ordinals = SequenceSnapshot.get_term_ordinal(2020, 1) + np_rng.integers(0, 3, size=students)
+    ordinals = np.repeat(first_ordinals, per_student) + np.tile(np.repeat(np.arange(terms), courses_per_term),
+                                                                students)
+    target_ordinals = first_ordinals + terms - 1
+    return rows, positions, ordinals, target_ordinals
+
+
+def get_snapshot(course_index, rows, positions, ordinals, target_ordinals, student):
+    course_ordinals = {}
+    for index in np.flatnonzero(rows == student):
+        course_code = course_index.course_codes[positions[index]]
+        course_ordinals[course_code] = min(course_ordinals.get(course_code, ordinals[index]), ordinals[index])
+    return SequenceSnapshot(course_ordinals, target_ordinal=int(target_ordinals[student]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=50000)
+    parser.add_argument('--courses', type=int, default=2000)
+    parser.add_argument('--core-courses', type=int, default=40)
+    parser.add_argument('--expressions', type=int, default=4)
+    parser.add_argument('--sample', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    subjects = ['CSC', 'SENG', 'MATH', 'STAT', 'PHYS', 'ECE', 'CHEM', 'BIOL']
+    course_index = CourseIndex('{} {}'.format(subjects[index % len(subjects)], 100 + index // len(subjects))
+                               for index in range(args.courses))
+    core_courses = course_index.course_codes[:args.core_courses]
+    requirements = {'expressions': [generate_requisite(rng, course_codes=core_courses)
+                                    for _ in range(args.expressions)]}
+    entries = generate_cohort(rng, course_index, args.students, len(core_courses))
+
+    start = time.perf_counter()
+    cohort = CohortBitmap.from_entries(course_index, args.students, *entries)
+    encode_time = time.perf_counter() - start
+
+    evaluator = CohortEvaluator(cohort)
+    evaluator.evaluate_requirements(requirements)
+
+    start = time.perf_counter()
+    result = evaluator.evaluate_requirements(requirements)
+    evaluate_time = time.perf_counter() - start
+
+    sample = range(min(args.sample, args.students))
+    snapshots = [get_snapshot(course_index, *entries, student) for student in sample]
+    expressions = [ExpressionFactory.build_and_get_expression(json_data) for json_data in requirements['expressions']]
+
+    start = time.perf_counter()
+    scalar = [all(expression.evaluate_expression(snapshot).satisfied for expression in expressions)
+              for snapshot in snapshots]
+    scalar_time = (time.perf_counter() - start) * args.students / len(snapshots)
+
+    # The equivalence of both evaluations is tested by plan.tests.CohortEvaluatorTestCase
+    mismatches = sum(expected != actual for expected, actual in zip(scalar, result['satisfied'].tolist()))
+
+    nodes = len(result['nodes'])
+    print('{} students, {} courses, {} requirement nodes\n'.format(args.students, args.courses, nodes))
+    print('encode bit arrays:                {:>10.1f} ms ({:.1f} MB)'.format(
+        encode_time * 1000, (cohort.before_target.nbytes + cohort.through_target.nbytes) / 2 ** 20))
+    print('vectorized evaluation:            {:>10.1f} ms'.format(evaluate_time * 1000))
+    print('per-student snapshot evaluation:  {:>10.1f} ms (extrapolated from {} students)'.format(
+        scalar_time * 1000, len(snapshots)))
+    print('\nsatisfied: {} / {}, speed-up: {:.1f}x, mismatches: {}'.format(
+        int(result['satisfied'].sum()), args.students, scalar_time / evaluate_time, mismatches))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+"""
+Measures the throughput of seat updates when many workers register in the same section at once, against a test
+database: each worker repeatedly takes a seat with `SeatCounter`, or a spot on the waitlist, and frees it. Workers
+are threads or processes, each with its own database connection, and are compared to a single worker making as
+many updates. As every attempt frees what it takes, the counters left behind tell whether any update was lost.
+Workers share the test database, so the benchmark is meant to run against PostgreSQL.
+
+    python -m benchmarks.bench_enrollment [--workers 16] [--attempts 200] [--capacity 8]
+"""
+
+import argparse
+import multiprocessing
+import threading
+import time
+
+from benchmarks import setup_django, test_database
+
+setup_django()
+
+from django.db import connection, connections
+from plan.enrollment import EnrollmentStatus, SeatCounter
+from plan.models import Course, CourseOffering, Section
+
+CRN = 10000
+
+
+def register_with_counter(attempts):
+    """
+    Takes and frees a seat `attempts` times with `SeatCounter`.
+    """
+    for _ in range(attempts):
+        status, _ = SeatCounter.enroll(CRN)
+        if status == EnrollmentStatus.ENROLLED:
+            SeatCounter.drop(CRN)
+        elif status == EnrollmentStatus.WAITLISTED:
+            SeatCounter.leave_waitlist(CRN)
+
+
+def run_worker(function, attempts):
+    try:
+        function(attempts)
+    finally:
+        connection.close()
+
+
+def run_workers(worker_type, function, workers, attempts):
+    """
+    Runs `function` in `workers` threads or processes at once, and returns the duration in seconds.
+    """
+    if worker_type == 'process':
+        # Forked processes must not share the connection of their parent
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        pool = [context.Process(target=run_worker, args=(function, attempts)) for _ in range(workers)]
+    else:
+        pool = [threading.Thread(target=run_worker, args=(function, attempts)) for _ in range(workers)]
+
+    start = time.perf_counter()
+    for worker in pool:
+        worker.start()
+    for worker in pool:
+        worker.join()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--attempts', type=int, default=200)
+    parser.add_argument('--capacity', type=int, default=8)
+    args = parser.parse_args()
+
+    with test_database():
+        course = Course.objects.create(subject='CSC', number='110', name='Course', credits=1.5, hours_lectures=3,
+                                       hours_labs=0, hours_tutorials=0)
+        offering = CourseOffering.objects.create(course=course, year=2020, term_type='fall')
+        Section.objects.create(crn=CRN, course_offering=offering, name='A01', section_type='lecture',
+                               capacity=args.capacity, waitlist_capacity=args.capacity // 2)
+        sections = Section.objects.filter(crn=CRN)
+
+        print('{} workers, {} attempts each, {} seats'.format(args.workers, args.attempts, args.capacity))
+        print('{:<28} {:>10} {:>14} {:>10} {:>12}'.format('Workers', 'Time (ms)', 'Updates/sec', 'Enrolled',
+                                                         'Waitlisted'))
+        for label, worker_type, workers, attempts in [
+                ('Single thread', 'thread', 1, args.workers * args.attempts),
+                ('Threads', 'thread', args.workers, args.attempts),
+                ('Processes', 'process', args.workers, args.attempts)]:
+            sections.update(enrolled=0, waitlisted=0, seat_updates=0)
+            duration = run_workers(worker_type, register_with_counter, workers, attempts)
+
+            enrolled, waitlisted, updates = sections.values_list('enrolled', 'waitlisted', 'seat_updates').get()
+            print('{:<28} {:>10.1f} {:>14.0f} {:>10} {:>12}'.format(label, duration * 1000, updates / duration,
+                                                                    enrolled, waitlisted))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+"""
+Compares building and evaluating requisite trees with per-node schema validation (the previous behaviour of
+the expression classes) against the compiled, cached expression trees built by `ExpressionFactory`.
+
+    python -m benchmarks.bench_expressions [--trees 10000] [--distinct 1000] [--seed 0]
+"""
+
+import argparse
+import random
+import time
+
+import jsonschema
+
+from benchmarks import setup_django
+
+setup_django()
+
+from plan.expressions import ExpressionFactory
+from plan.schemas import *
+from plan.snapshots import SequenceSnapshot
+
+SUBJECTS = ['CSC', 'SENG', 'MATH', 'STAT', 'PHYS', 'ECE', 'CHEM', 'BIOL']
+
+LEGACY_SCHEMAS = {
+    'COURSE': COURSE_EXPRESSION_SCHEMA,
+    'CONDITIONAL': CONDITIONAL_EXPRESSION_SCHEMA,
+    'LIST': LIST_EXPRESSION_SCHEMA,
+    'REGISTRATION_RESTRICTION': REGISTRATION_RESTRICTION_EXPRESSION_SCHEMA
+}
+
+
+def generate_requisite(rng, depth=0, course_codes=None):
+    """
+    Returns a random requisite JSON document, nested at most four levels deep. Course expressions refer to
+    random course codes, or to codes picked from `course_codes` if specified.
+    """
+    kind = rng.random()
+    if depth >= 3 or kind < 0.45:
+        if course_codes is None:
+            subject, number = rng.choice(SUBJECTS), str(rng.randint(100, 499))
+        else:
+            subject, number = rng.choice(course_codes).split(' ')
+        return {
+            'expression_type': 'COURSE',
+            'subject': subject,
+            'number': number,
+            'requisite_type': rng.choice(['P', 'C'])
+        }
+    if kind < 0.8:
+        return {
+            'expression_type': 'CONDITIONAL',
+            'condition': rng.choice(['AND', 'OR']),
+            'expression_one': generate_requisite(rng, depth + 1, course_codes),
+            'expression_two': generate_requisite(rng, depth + 1, course_codes)
+        }
+    expressions = [generate_requisite(rng, depth + 1, course_codes) for _ in range(rng.randint(2, 5))]
+    return {
+        'expression_type': 'LIST',
+        'threshold_type': 'geq',
+        'threshold_value': rng.randint(1, len(expressions)),
+        'expressions': expressions
+    }
+
+
+def build_legacy(json_data):
+    """
+    Validates every node three times, as the expression constructors used to, before building the tree.
+    """
+    pending = [json_data]
+    while pending:
+        node = pending.pop()
+        for _ in range(2):
+            jsonschema.validate(node, LEGACY_SCHEMAS[node['expression_type']])
+        jsonschema.validate(node, EXPRESSION_SCHEMA)
+
+        if node['expression_type'] == 'CONDITIONAL':
+            pending.extend([node['expression_one'], node['expression_two']])
+        elif node['expression_type'] == 'LIST':
+            pending.extend(node['expressions'])
+        elif node['expression_type'] == 'REGISTRATION_RESTRICTION':
+            pending.append(node['expression'])
+
+    return ExpressionFactory.lower_expression(json_data)
+
+
+def generate_snapshot(rng, years=4, courses_per_term=5):
+    course_ordinals = {}
+    term_ordinals = []
+    for year in range(2020, 2020 + years):
+        for term_type in (1, 2, 3):
+            ordinal = SequenceSnapshot.get_term_ordinal(year, term_type)
+            term_ordinals.append(ordinal)
+            for _ in range(courses_per_term):
+                course_code = SequenceSnapshot.get_course_code(rng.choice(SUBJECTS), str(rng.randint(100, 499)))
+                course_ordinals.setdefault(course_code, ordinal)
+    return SequenceSnapshot(course_ordinals, term_ordinals)
+
+
+def measure(label, function, documents):
+    start = time.perf_counter()
+    results = [function(document) for document in documents]
+    elapsed = time.perf_counter() - start
+    print('{:<40} {:>10.1f} ms {:>10.2f} us/tree'.format(label, elapsed * 1000, elapsed * 1e6 / len(documents)))
+    return elapsed, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trees', type=int, default=10000)
+    parser.add_argument('--distinct', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    pool = [generate_requisite(rng) for _ in range(args.distinct)]
+    documents = [rng.choice(pool) for _ in range(args.trees)]
+    sequence = generate_snapshot(rng)
+
+    print('{} requisite trees drawn from {} distinct documents\n'.format(args.trees, args.distinct))
+
+    legacy_build, legacy_trees = measure('build, per-node validation', build_legacy, documents)
+    legacy_evaluate, _ = measure('evaluate, per-node validated trees',
+                                 lambda tree: tree.evaluate_expression(sequence), legacy_trees)
+
+    ExpressionFactory.clear_cache()
+    measure('build, compiled (cold cache)', ExpressionFactory.build_and_get_expression, pool)
+    compiled_build, compiled_trees = measure('build, compiled (warm cache)',
+                                             ExpressionFactory.build_and_get_expression, documents)
+    compiled_evaluate, _ = measure('evaluate, compiled trees',
+                                   lambda tree: tree.evaluate_expression(sequence), compiled_trees)
+
+    print('\nbuild speed-up:            {:.1f}x'.format(legacy_build / compiled_build))
+    print('build + evaluate speed-up: {:.1f}x'.format(
+        (legacy_build + legacy_evaluate) / (compiled_build + compiled_evaluate)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+"""
+Measures the requests needed to render the calendar of a schedule, against a test database: fetching the
+meetings of each section with `/api/meeting/get`, compared to a single request to `/api/meeting/batch`.
+Requests go through the Django test client, so the durations exclude network round trips, which add the
+client's latency once per request.
+
+    python -m benchmarks.bench_meetings [--courses 6] [--repeat 50]
+"""
+
+import argparse
+import datetime
+
+from benchmarks import setup_django, test_database
+
+setup_django()
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from benchmarks.bench_catalog import measure
+from plan.models import Course, CourseOffering, Meeting, Schedule, ScheduleSection, Section
+
+# The sections of each course, with the days and start minute of each of their meetings
+SECTION_PATTERNS = [
+    ('lecture', [(0b00101, 8 * 60 + 30), (0b10000, 8 * 60 + 30)]),
+    ('lab', [(0b00010, 14 * 60 + 30)]),
+    ('tutorial', [(0b01000, 10 * 60 + 30)])
+]
+
+
+def create_schedule(user, courses):
+    """
+    Creates a schedule with the sections of `courses` courses: a lecture meeting twice, a lab and a tutorial
+    each, except for one course in two without a tutorial.
+    """
+    schedule = Schedule.objects.create(user=user, year=2020, term='fall', name='Benchmark')
+
+    crn = 10000
+    for index in range(courses):
+        course = Course.objects.create(subject='CSC', number=str(100 + index), name='Course', credits=1.5,
+                                       hours_lectures=3, hours_labs=2, hours_tutorials=1)
+        offering = CourseOffering.objects.create(course=course, year=2020, term_type='fall')
+
+        for section_type, meetings in SECTION_PATTERNS[:3 if index % 2 == 0 else 2]:
+            crn += 1
+            section = Section.objects.create(crn=crn, course_offering=offering, name=section_type[0].upper() + '01',
+                                             section_type=section_type)
+            Meeting.objects.bulk_create(Meeting(section=section, start_date=datetime.date(2020, 9, 8),
+                                                end_date=datetime.date(2020, 12, 4), weekdays=weekdays,
+                                                start_minute=start_minute + index * 10,
+                                                end_minute=start_minute + index * 10 + 50)
+                                        for weekdays, start_minute in meetings)
+            ScheduleSection.objects.create(schedule=schedule, section=section)
+
+    return schedule
+
+
+def read_content(response):
+    return b''.join(response.streaming_content) if response.streaming else response.content
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--courses', type=int, default=6)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    with test_database():
+        user = User.objects.create_user(username='benchmark', password='benchmark')
+        schedule = create_schedule(user, args.courses)
+        crns = list(Section.objects.order_by('crn').values_list('crn', flat=True))
+
+        client = Client()
+        client.force_login(user)
+
+        def fetch_per_section():
+            return [client.get('/api/meeting/get', {'crn': crn}) for crn in crns]
+
+        def fetch_batch(**parameters):
+            return lambda: [client.get('/api/meeting/batch', dict(parameters, id=schedule.id))]
+
+        print('Sections: {}'.format(len(crns)))
+        for label, function in [('Per section', fetch_per_section),
+                                ('Batch', fetch_batch()),
+                                ('Batch (compact)', fetch_batch(encoding='compact')),
+                                ('Batch (compact, streamed)', fetch_batch(encoding='compact', stream='true'))]:
+            queries = []
+            with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+                size = sum(len(read_content(response)) for response in function())
+            duration, responses = measure(lambda: [read_content(response) for response in function()], args.repeat)
+            print('{:<26} {:>3} requests {:>4} queries {:8.2f} ms {:>8} bytes'.format(
+                label, len(responses), len(queries), duration, size))
+
+
+if __name__ == '__main__':
+    main()
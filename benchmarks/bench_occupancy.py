@@ -0,0 +1,77 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+"""
+Measures building the occupancy heatmap of a term, against a test database filled with a synthetic term of
+about 60k sections and 200k meetings by the generators of `benchmarks.dataset`: counting the slots of every
+meeting fetched as a model, compared to `TermOccupancy`, which loads the meetings grouped by their times as
+column arrays and accumulates a difference array, and to its cached instance.
+
+    python -m benchmarks.bench_occupancy [--courses 20000] [--repeat 5] [--seed 0]
+"""
+
+import argparse
+import random
+
+from benchmarks import setup_django, test_database
+
+setup_django()
+
+from benchmarks.bench_catalog import measure
+from benchmarks.dataset import TERMS, bulk_insert, generate_courses, generate_meetings, generate_sections, get_ids
+from plan.analytics import TermOccupancy
+from plan.models import Course, CourseOffering, Meeting, Section
+
+YEAR, TERM_TYPE = TERMS[2][:2]
+
+
+def count_per_meeting():
+    """
+    Returns the occupancy of the term as lists, adding every slot of every meeting one at a time.
+    """
+    occupancy = [[0] * TermOccupancy.SLOTS_PER_DAY for _ in range(TermOccupancy.DAYS_PER_WEEK)]
+    meetings = Meeting.objects.filter(section__course_offering__year=YEAR,
+                                      section__course_offering__term_type=TERM_TYPE)
+    for meeting in meetings.iterator():
+        first_slot = meeting.start_minute // TermOccupancy.SLOT_MINUTES
+        end_slot = min(-(-meeting.end_minute // TermOccupancy.SLOT_MINUTES), TermOccupancy.SLOTS_PER_DAY)
+        for day in range(TermOccupancy.DAYS_PER_WEEK):
+            if meeting.weekdays & (1 << day):
+                for slot in range(first_slot, end_slot):
+                    occupancy[day][slot] += 1
+    return occupancy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--courses', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    with test_database():
+        # Every course is offered in the term, and has three sections of three meetings on average
+        bulk_insert(Course, generate_courses(rng, args.courses))
+        course_ids = get_ids(Course.objects, args.courses)
+        bulk_insert(CourseOffering, (CourseOffering(course_id=course_id, year=YEAR, term_type=TERM_TYPE)
+                                     for course_id in course_ids))
+        offerings = [(offering_id, 2) for offering_id in get_ids(CourseOffering.objects, args.courses)]
+        sections_by_term = [[] for _ in TERMS]
+        sections = bulk_insert(Section, generate_sections(rng, offerings, sections_by_term))
+        meetings = bulk_insert(Meeting, generate_meetings(rng, ((crn, 2) for crn in sections_by_term[2])))
+        print('{} sections, {} meetings'.format(sections, meetings))
+
+        print('{:<28} {:>10}'.format('Method', 'Time (ms)'))
+        for label, function in [('Per meeting', count_per_meeting),
+                                ('Column arrays', lambda: TermOccupancy.from_term(YEAR, TERM_TYPE)),
+                                ('Column arrays (lecture)',
+                                 lambda: TermOccupancy.from_term(YEAR, TERM_TYPE, section_type='lecture')),
+                                ('Cached', lambda: TermOccupancy.get_instance(YEAR, TERM_TYPE))]:
+            duration, _ = measure(function, args.repeat)
+            print('{:<28} {:>10.1f}'.format(label, duration))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+"""
+Measures the per-term section index of `ScheduleCoordinator` against a test database filled with one term of
+synthetic sections: the time to load the index and the memory it holds, then the latency of its queries
+compared to the equivalent ORM queries.
+
+    python -m benchmarks.bench_schedule_index [--sections 10000] [--repeat 20] [--seed 0]
+"""
+
+import argparse
+import datetime
+import gc
+import random
+import tracemalloc
+
+from benchmarks import setup_django, test_database
+
+setup_django()
+
+from django.db import connection
+from plan.conflicts import ConflictIndex, MeetingRecord
+from plan.coordinators import ScheduleCoordinator
+from benchmarks.bench_catalog import measure
+from plan.models import Course, CourseOffering, Meeting, Section
+from plan.timetables import TimetableGenerator
+
+SECTIONS_PER_COURSE = 4
+
+# The days of the week of the meetings of a section, as registrar patterns
+WEEKDAY_PATTERNS = [0b00101, 0b01010, 0b10101, 0b00001, 0b00010, 0b00100, 0b01000, 0b10000]
+
+
+def create_term(sections, rng):
+    """
+    Creates `sections` sections offered in fall 2020, four per course, each with one to three meetings.
+    """
+    # Primary keys are fetched again, as not every database returns them from bulk inserts
+    Course.objects.bulk_create(
+        (Course(subject='CSC', number=str(1000 + index), name='Course', credits=1.5, hours_lectures=3,
+                hours_labs=0, hours_tutorials=0) for index in range(sections // SECTIONS_PER_COURSE)),
+        batch_size=2000)
+    CourseOffering.objects.bulk_create((CourseOffering(course_id=course_id, year=2020, term_type='fall')
+                                        for course_id in Course.objects.order_by('id').values_list('id', flat=True)),
+                                       batch_size=2000)
+    offerings = list(CourseOffering.objects.order_by('id').values_list('id', flat=True))
+
+    section_types = ['lecture', 'lecture', 'lab', 'tutorial']
+    Section.objects.bulk_create(
+        (Section(crn=10000 + index, course_offering_id=offerings[index // SECTIONS_PER_COURSE],
+                 name='A{:02d}'.format(index % SECTIONS_PER_COURSE),
+                 section_type=section_types[index % SECTIONS_PER_COURSE]) for index in range(sections)),
+        batch_size=2000)
+
+    meetings = []
+    for index in range(sections):
+        for _ in range(rng.randint(1, 3)):
+            start_minute = rng.randrange(8 * 60, 20 * 60, 30)
+            meetings.append(Meeting(section_id=10000 + index, start_date=datetime.date(2020, 9, 8),
+                                    end_date=datetime.date(2020, 12, 4), weekdays=rng.choice(WEEKDAY_PATTERNS),
+                                    start_minute=start_minute, end_minute=start_minute + rng.choice([50, 80])))
+    Meeting.objects.bulk_create(meetings, batch_size=5000)
+    return len(meetings)
+
+
+def measure_memory(function):
+    """
+    Returns the memory in bytes still allocated by the result of `function`, along with the result.
+    """
+    gc.collect()
+    tracemalloc.start()
+    result = function()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sections', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    with test_database():
+        meetings = create_term(args.sections, rng)
+        print('Sections: {}, meetings: {}'.format(args.sections, meetings))
+
+        # Loading, including the two queries, and building the index from records already in memory
+        duration, coordinator = measure(lambda: ScheduleCoordinator.from_term(2020, 'fall'), 5)
+        print('{:<40} {:10.2f} ms'.format('Load index (with queries)', duration))
+
+        sections = coordinator.sections
+        records = [record for section_records in coordinator.records for record in section_records]
+        duration, _ = measure(lambda: ScheduleCoordinator(2020, 'fall', sections, records), 5)
+        print('{:<40} {:10.2f} ms'.format('Build index (in memory)', duration))
+
+        size, coordinator = measure_memory(lambda: ScheduleCoordinator.from_term(2020, 'fall'))
+        print('{:<40} {:10.2f} MB'.format('Index memory', size / 2 ** 20))
+
+        schedule_crns = rng.sample(coordinator.crns, 6)
+        busy_records = [ScheduleCoordinator.get_busy_record(0b00101, 8 * 60 + 30, 9 * 60 + 50),
+                        ScheduleCoordinator.get_busy_record(0b00010, 13 * 60, 14 * 60)]
+        course_code, course = 'CSC 1042', ('CSC', '1042')
+        timetable_courses = [('CSC', str(1000 + index)) for index in range(5)]
+
+        def find_compatible_with_orm():
+            index = ConflictIndex(MeetingRecord.from_queryset(Meeting.objects.filter(section__in=schedule_crns)))
+            section_records = {}
+            for record in MeetingRecord.from_queryset(Meeting.objects.filter(
+                    section__course_offering__year=2020, section__course_offering__term_type='fall')):
+                section_records.setdefault(record.crn, []).append(record)
+            return [crn for crn in sorted(section_records) if crn not in schedule_crns and
+                    not index.find_conflicts(section_records[crn])]
+
+        comparisons = [
+            ('Sections of a course', lambda: coordinator.find_sections(course_code),
+             lambda: list(Section.objects.filter(course_offering__course__subject=course[0],
+                                                 course_offering__course__number=course[1],
+                                                 course_offering__year=2020,
+                                                 course_offering__term_type='fall')
+                          .order_by('crn').values_list('crn', flat=True))),
+            ('Sections free at busy times', lambda: coordinator.find_sections(busy_records=busy_records), None),
+            ('Sections compatible with a schedule', lambda: coordinator.find_sections(schedule_crns=schedule_crns),
+             find_compatible_with_orm),
+            ('Timetable generator (5 courses)', lambda: coordinator.get_timetable_generator(timetable_courses),
+             lambda: TimetableGenerator.from_courses(timetable_courses, 2020, 'fall'))
+        ]
+
+        print('{:<40} {:>10} {:>10}'.format('Query', 'Index', 'ORM'))
+        for label, index_function, orm_function in comparisons:
+            index_duration, _ = measure(index_function, args.repeat)
+            orm_duration = measure(orm_function, args.repeat)[0] if orm_function is not None else None
+            print('{:<40} {:7.2f} ms {}'.format(label, index_duration, '{:7.2f} ms'.format(orm_duration)
+                                                 if orm_duration is not None else '{:>10}'.format('-')))
+
+        queries = []
+        with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+            for _, index_function, _ in comparisons:
+                index_function()
+        print('Queries made by the index: {}'.format(len(queries)))
+
+
+if __name__ == '__main__':
+    main()
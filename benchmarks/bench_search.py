@@ -0,0 +1,94 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+"""
+Measures the latency of course search queries against a test database filled with a synthetic catalog: the
+time to build the `CourseSearchIndex`, the median and 99th percentile latency of each query answered by the
+index and through `/api/data/course/search`, and the time to apply the update of a single course.
+
+    python -m benchmarks.bench_search [--courses 20000] [--repeat 200] [--seed 0]
+"""
+
+import argparse
+import random
+import time
+
+from benchmarks import setup_django, test_database
+
+setup_django()
+
+from django.test import Client
+from benchmarks.bench_catalog import SUBJECTS, generate_catalog
+from plan.models import Course
+from plan.search import CourseSearchIndex
+
+NAME_WORDS = ['Introduction', 'Advanced', 'Topics', 'Data', 'Structures', 'Algorithms', 'Calculus', 'Linear',
+              'Algebra', 'Statistics', 'Probability', 'Programming', 'Software', 'Engineering', 'Design', 'Systems',
+              'Organic', 'Chemistry', 'Physics', 'Mechanics', 'History', 'Literature', 'Economics', 'Theory',
+              'Networks', 'Databases', 'Security', 'Machine', 'Learning', 'Graphics', 'Ethics', 'Methods']
+
+QUERIES = ['CSC 2', 'CSC 225', 'math', 'data struct', 'calculus', 'calculas', 'intro prog', 'a', 'linear alg',
+           'machine learning', 'xyz']
+
+
+def get_percentile(durations, percentile):
+    durations = sorted(durations)
+    return durations[min(len(durations) - 1, int(len(durations) * percentile / 100))]
+
+
+def measure_latencies(function, repeat):
+    """
+    Returns the median and 99th percentile durations of `function` in milliseconds.
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - start) * 1000)
+    return get_percentile(durations, 50), get_percentile(durations, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--courses', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    with test_database():
+        catalog = generate_catalog(rng, args.courses)
+        for course in catalog:
+            course.name = ' '.join(rng.sample(NAME_WORDS, rng.randint(1, 4)))
+        Course.objects.bulk_create(catalog, batch_size=2000)
+
+        start = time.perf_counter()
+        index = CourseSearchIndex.get_instance()
+        print('Courses: {}, subjects: {}, vocabulary: {} tokens'.format(len(index), len(SUBJECTS),
+                                                                       len(index.vocabulary)))
+        print('Build index: {:.2f} ms'.format((time.perf_counter() - start) * 1000))
+
+        client = Client()
+        print('{:<20} {:>8} {:>10} {:>10} {:>12} {:>12}'.format('Query', 'Results', 'p50 (ms)', 'p99 (ms)',
+                                                                 'HTTP p50', 'HTTP p99'))
+        for query in QUERIES:
+            # The first query of a prefix fills the prefix cache, so the cache is cleared before each repetition
+            def search():
+                index.prefix_courses.clear()
+                return index.search(query)
+
+            results = search()
+            median, high = measure_latencies(search, args.repeat)
+            http_median, http_high = measure_latencies(
+                lambda: client.get('/api/data/course/search', {'q': query}), args.repeat)
+            print('{:<20} {:>8} {:>10.3f} {:>10.3f} {:>12.3f} {:>12.3f}'.format(
+                query, len(results), median, high, http_median, http_high))
+
+        courses = list(Course.objects.values_list('pk', 'subject', 'number', 'name')[:args.repeat])
+        median, high = measure_latencies(lambda: index.update_course(*courses.pop()), len(courses))
+        print('Update a course: p50 {:.3f} ms, p99 {:.3f} ms'.format(median, high))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+"""
+Measures the size of an `AnonymousSequence` stored in a session and the time to read and write it on each
+request, compared to storing the same sequence as a JSON document of course codes. Sizes are in bytes, for the
+stored value itself and for the session data as stored by the session backend, which is compressed and signed.
+
+    python -m benchmarks.bench_sessions [--repeat 2000]
+"""
+
+import argparse
+import json
+
+from benchmarks import setup_django
+
+setup_django()
+
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from benchmarks.bench_catalog import measure
+from plan.anonymous import AnonymousSequence
+from plan.models import Course
+
+# (terms, courses per term) of the measured sequences
+SIZES = [(4, 5), (12, 5), (24, 6)]
+
+
+def build_sequence(term_count, course_count):
+    sequence = AnonymousSequence('My sequence')
+    course_id = 1000
+    for index in range(term_count):
+        year, term_type = 2020 + index // 3, index % 3 + 1
+        sequence.add_term(year, term_type)
+        for _ in range(course_count):
+            sequence.add_course(Course(pk=course_id), year, term_type)
+            course_id += 1
+    return sequence
+
+
+def build_document(sequence):
+    """
+    Returns the JSON-serializable document of the same sequence, identifying courses by their codes.
+    """
+    return {'name': sequence.name, 'terms': [{'year': ordinal // 3, 'term_type': ordinal % 3 + 1,
+                                              'courses': ['CSC {}'.format(course_id) for course_id in course_ids]}
+                                             for ordinal, course_ids in sequence.terms.items()]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    store = SessionStore()
+    print('{:<10} {:>8} {:>10} {:>12} {:>14} {:>16}'.format('Sequence', 'Value', 'JSON value', 'Session',
+                                                            'JSON session', 'Read+write (us)'))
+
+    for term_count, course_count in SIZES:
+        sequence = build_sequence(term_count, course_count)
+        session = {}
+        sequence.save(session)
+
+        def read_and_write():
+            stored = AnonymousSequence.from_session(session)
+            stored.add_course(Course(pk=1), 2020, 1)
+            stored.remove_course(Course(pk=1), 2020, 1)
+            stored.save(session)
+
+        duration, _ = measure(read_and_write, args.repeat)
+        document = build_document(sequence)
+        print('{:<10} {:>8} {:>10} {:>12} {:>14} {:>16.1f}'.format(
+            '{} x {}'.format(term_count, course_count), len(session[AnonymousSequence.SESSION_KEY]),
+            len(json.dumps(document, separators=(',', ':'))), len(store.encode(session)),
+            len(store.encode({'sequence': document})), duration * 1000))
+
+
+if __name__ == '__main__':
+    main()
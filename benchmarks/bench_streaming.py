@@ -0,0 +1,81 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+"""
+Measures the time and peak memory of serving the full course catalog from `/api/data/course` without the
+snapshot of `CatalogSnapshot`, against a test database filled with a synthetic catalog of growing size:
+building the whole document and encoding it with `JsonResponse`, compared to streaming it with the 'stream'
+parameter. Streamed responses are consumed chunk by chunk, as a server writes them, rather than joined.
+
+The peak memory is the peak of the Python allocations traced by `tracemalloc` while a request is served,
+which excludes the buffers of the database driver. Durations are measured without tracing.
+
+    python -m benchmarks.bench_streaming [--courses 25000,50000,100000] [--repeat 5] [--seed 0]
+"""
+
+import argparse
+import random
+import tracemalloc
+
+from benchmarks import setup_django, test_database
+
+setup_django()
+
+from django.http import JsonResponse
+from django.test import Client
+from benchmarks.bench_catalog import generate_catalog, measure
+from plan.handlers import DataHandler
+from plan.models import Course
+
+
+def fetch_materialized():
+    response = JsonResponse({'method': 'data_course', 'response': DataHandler.get_course_catalog()})
+    return len(response.content)
+
+
+def fetch_streamed(client):
+    response = client.get('/api/data/course', {'action': 'get', 'stream': 'true'})
+    return sum(len(chunk) for chunk in response.streaming_content)
+
+
+def measure_peak(function):
+    """
+    Returns the peak size of the memory allocated while calling `function` in megabytes, along with its result.
+    """
+    tracemalloc.start()
+    try:
+        result = function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024 / 1024, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--courses', default='25000,50000,100000', help='Comma-separated catalog sizes')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    sizes = sorted(int(size) for size in args.courses.split(','))
+    catalog = generate_catalog(random.Random(args.seed), sizes[-1])
+
+    with test_database():
+        client = Client()
+
+        print('{:>8} {:<13} {:>10} {:>12} {:>12}'.format('Courses', 'Response', 'Time (ms)', 'Peak (MB)', 'Bytes'))
+        inserted = 0
+        for size in sizes:
+            Course.objects.bulk_create(catalog[inserted:size], batch_size=2000)
+            inserted = size
+
+            for label, function in [('Materialized', fetch_materialized),
+                                    ('Streamed', lambda: fetch_streamed(client))]:
+                duration, length = measure(function, args.repeat)
+                peak, _ = measure_peak(function)
+                print('{:>8} {:<13} {:>10.1f} {:>12.1f} {:>12}'.format(size, label, duration, peak, length))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,336 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+"""
+Benchmarks every endpoint of `plan/urls.py`, requisite evaluation and section conflict checks against the
+synthetic institution of `benchmarks.dataset`, created in a test database. Requests go through the Django test
+client, as a logged in user with a schedule and a sequence or as an anonymous user with a sequence in their
+session. For each case, the median (p50) and 95th percentile (p95) durations and the number of SQL queries are
+reported. Cases changing data restore it before each repetition, outside of the measured time.
+
+Results can be saved with '--save', for example on the main branch, and later runs compared to them with
+'--baseline'. The run then fails with exit status 1 if a case regressed: if its p50 or p95 grew by more than
+'--threshold' (a fraction) and '--min-delta' milliseconds, if it makes more queries, or if it failed. Results
+are only comparable between runs with the same scale and seed, on the same machine.
+
+    python -m benchmarks.bench_suite [--scale 1] [--seed 0] [--repeat 20] [--cases api_section]
+                                     [--save results.json] [--baseline results.json] [--threshold 0.25]
+                                     [--min-delta 1]
+"""
+
+import argparse
+import gc
+import itertools
+import json
+import random
+import sys
+import time
+
+from benchmarks import setup_django, test_database
+
+setup_django()
+
+from django.db import connection
+from django.test import Client
+from benchmarks.bench_meetings import read_content
+from benchmarks.dataset import generate_dataset
+from plan.coordinators.schedule_coordinator import ScheduleCoordinator
+from plan.models import Course, Schedule, ScheduleSection, Section, Sequence
+from plan.snapshots import SequenceSnapshot
+from plan.urls import urlpatterns
+
+
+class Case:
+    """
+    A benchmark case calling `run` with the value returned by `prepare`, which is not measured. `endpoint` is
+    the name of the URL pattern requested by `run`, if any.
+    """
+
+    def __init__(self, name, endpoint, run, prepare=None):
+        self.name = name
+        self.endpoint = endpoint
+        self.run = run
+        self.prepare = prepare if prepare is not None else lambda: None
+
+
+def get(client, path, **parameters):
+    return lambda state=None: client.get(path, parameters)
+
+
+def get_cases(dataset):
+    """
+    Returns the benchmark cases, with the users, schedules and sequences they need.
+    """
+    year, term, term_type = dataset.terms[2][:3]
+    schedule = Schedule.objects.filter(year=year, term=term).select_related('user').order_by('id').first()
+    user = schedule.user
+    schedule_crns = list(ScheduleSection.objects.filter(schedule=schedule).values_list('section_id', flat=True))
+    other_crn = next(crn for crn in dataset.sections_by_term[2] if crn not in schedule_crns)
+    coordinator = ScheduleCoordinator.get_instance(year, term)
+    subject, number = Section.objects.filter(crn=schedule_crns[0]).values_list(
+        'course_offering__course__subject', 'course_offering__course__number').get()
+
+    # The timetables are generated for the first three courses of the term which can be taken together
+    course_codes = []
+    for course_code in Section.objects.filter(course_offering__year=year, course_offering__term_type=term) \
+            .order_by('crn').values_list('course_offering__course__subject', 'course_offering__course__number'):
+        if course_code not in course_codes and len(course_codes) < 3 and next(
+                coordinator.get_timetable_generator(course_codes + [course_code]).iter_timetables(), None):
+            course_codes.append(course_code)
+    program = dataset.programs[0]
+
+    # The user compares ten schedules of the term
+    rng = random.Random(dataset.seed)
+    for index in range(1, 10):
+        option = Schedule.objects.create(user=user, year=year, term=term, name='Option {}'.format(index))
+        ScheduleSection.objects.bulk_create(ScheduleSection(schedule=option, section_id=crn) for crn in
+                                            rng.sample(dataset.sections_by_term[2], 5))
+
+    user_client = Client()
+    user_client.force_login(user)
+
+    # The sequence of the anonymous user holds the first courses of the program, the next one being added and
+    # removed by the benchmark
+    anonymous_client = Client()
+    anonymous_client.get('/api/plan/sequence', {'action': 'add', 'name': 'Sequence'})
+    anonymous_client.get('/api/plan/term', {'action': 'add', 'year': year, 'term_type': term_type})
+    program_numbers = [str(program_number) for program_number in range(100, 115)]
+    for program_number in program_numbers[:6]:
+        anonymous_client.get('/api/plan/course', {'action': 'add', 'subject': program, 'number': program_number,
+                                                  'year': year, 'term_type': term_type,
+                                                  'ignore_requirements': 'true'})
+    plan_course = {'subject': program, 'number': program_numbers[6], 'year': year, 'term_type': term_type,
+                   'ignore_requirements': 'true'}
+    plan_term = {'year': year + 2, 'term_type': 1}
+
+    registrations = itertools.count()
+
+    def logged_in_client():
+        client = Client()
+        client.force_login(user)
+        return client
+
+    def create_schedule():
+        Schedule.objects.filter(user=user, name='Benchmark').delete()
+        return Schedule.objects.create(user=user, year=year, term=term, name='Benchmark').id
+
+    sequence_snapshot = SequenceSnapshot.from_sequence(Sequence.objects.filter(user=user).first())
+    requisite_courses = list(Course.objects.exclude(requirement=None).order_by('id')[:200])
+    other_section = Section.objects.get(crn=other_crn)
+
+    return [
+        Case('view_home', 'home', get(user_client, '/')),
+        Case('view_program', 'program', get(user_client, '/program')),
+        Case('view_schedule', 'schedule', get(user_client, '/schedule', id=schedule.id)),
+        Case('view_schedule_add', 'schedule_add', get(user_client, '/schedule/add')),
+        Case('view_account', 'account', get(user_client, '/account')),
+        Case('account_login', 'account_login',
+             lambda client: client.post('/account/login', {'username': user.username,
+                                                           'password': dataset.password}), Client),
+        Case('account_logout', 'account_logout', lambda client: client.get('/account/logout'), logged_in_client),
+        Case('account_register', 'account_register',
+             lambda username: Client().post('/account/register', {'username': username, 'email': '',
+                                                                  'password': dataset.password}),
+             lambda: 'registered{}'.format(next(registrations))),
+        Case('api_data_course (course)', 'api_data_course',
+             get(anonymous_client, '/api/data/course', action='get', subject=subject, number=number)),
+        Case('api_data_course (subject)', 'api_data_course',
+             get(anonymous_client, '/api/data/course', action='get', subject=subject)),
+        Case('api_data_course (catalog)', 'api_data_course',
+             get(anonymous_client, '/api/data/course', action='get')),
+        Case('api_data_course (streamed)', 'api_data_course',
+             get(anonymous_client, '/api/data/course', action='get', stream='true')),
+        Case('api_data_course_search', 'api_data_course_search',
+             get(anonymous_client, '/api/data/course/search', q='data struct')),
+        Case('api_data_offering', 'api_data_offering',
+             get(anonymous_client, '/api/data/offering', action='get', year=year, term_type=term)),
+        Case('api_data_occupancy', 'api_data_occupancy',
+             get(anonymous_client, '/api/data/occupancy', action='get', year=year, term_type=term)),
+        Case('api_data_program', 'api_data_program',
+             get(anonymous_client, '/api/data/program', action='get', institution=dataset.institution)),
+        Case('api_plan_course (add)', 'api_plan_course',
+             get(anonymous_client, '/api/plan/course', action='add', **plan_course),
+             get(anonymous_client, '/api/plan/course', action='remove', **plan_course)),
+        Case('api_plan_course (remove)', 'api_plan_course',
+             get(anonymous_client, '/api/plan/course', action='remove', **plan_course),
+             get(anonymous_client, '/api/plan/course', action='add', **plan_course)),
+        Case('api_plan_program (evaluate)', 'api_plan_program',
+             get(anonymous_client, '/api/plan/program', action='evaluate', institution=dataset.institution,
+                 name=program)),
+        Case('api_plan_program (plan)', 'api_plan_program',
+             get(anonymous_client, '/api/plan/program', action='plan', institution=dataset.institution,
+                 name=program, year=year, term_type=term_type, time_budget=1)),
+        Case('api_plan_sequence (get)', 'api_plan_sequence',
+             get(anonymous_client, '/api/plan/sequence', action='get')),
+        Case('api_plan_sequence (add)', 'api_plan_sequence',
+             lambda client: client.get('/api/plan/sequence', {'action': 'add', 'name': 'Sequence'}), Client),
+        Case('api_plan_term (add)', 'api_plan_term',
+             get(anonymous_client, '/api/plan/term', action='add', **plan_term),
+             get(anonymous_client, '/api/plan/term', action='remove', **plan_term)),
+        Case('api_plan_term (remove)', 'api_plan_term',
+             get(anonymous_client, '/api/plan/term', action='remove', **plan_term),
+             get(anonymous_client, '/api/plan/term', action='add', **plan_term)),
+        Case('api_schedule_add', 'api_schedule_add',
+             lambda state: user_client.post('/api/schedule/add', {'year': year, 'term': term_type,
+                                                                  'name': 'Benchmark'}),
+             lambda: Schedule.objects.filter(user=user, name='Benchmark').delete()),
+        Case('api_schedule_get', 'api_schedule_get', get(user_client, '/api/schedule/get')),
+        Case('api_schedule_remove', 'api_schedule_remove',
+             lambda schedule_id: user_client.post('/api/schedule/remove', {'schedule-id': schedule_id}),
+             create_schedule),
+        Case('api_schedule_compare', 'api_schedule_compare',
+             get(user_client, '/api/schedule/compare', year=year, term=term)),
+        Case('api_schedule_generate', 'api_schedule_generate',
+             get(anonymous_client, '/api/schedule/generate', year=year, term=term, rank='days',
+                 courses=','.join(' '.join(course_code) for course_code in course_codes))),
+        Case('api_section_get', 'api_section_get', get(user_client, '/api/section/get', id=schedule.id)),
+        Case('api_section_search (course)', 'api_section_search',
+             get(anonymous_client, '/api/section/search', year=year, term=term, course=subject + ' ' + number)),
+        Case('api_section_search (schedule)', 'api_section_search',
+             get(user_client, '/api/section/search', year=year, term=term, id=schedule.id,
+                 busy='MR 08:30-09:50')),
+        Case('api_section_seats', 'api_section_seats',
+             get(user_client, '/api/section/seats', year=year, term=term, id=schedule.id)),
+        Case('api_meeting_get', 'api_meeting_get', get(anonymous_client, '/api/meeting/get', crn=schedule_crns[0])),
+        Case('api_meeting_batch', 'api_meeting_batch',
+             get(user_client, '/api/meeting/batch', id=schedule.id, encoding='compact')),
+        Case('api_cache_stats', 'api_cache_stats', get(anonymous_client, '/api/cache/stats')),
+        Case('metrics', 'metrics', get(anonymous_client, '/metrics')),
+        Case('evaluate_requirement (200 courses)', None,
+             lambda state: [course.evaluate_requirement(sequence_snapshot) for course in requisite_courses]),
+        Case('Schedule.does_section_conflict', None, lambda state: schedule.does_section_conflict(other_section)),
+        Case('ScheduleCoordinator.find_conflicts', None,
+             lambda state: coordinator.find_conflicts(other_crn, schedule_crns))
+    ]
+
+
+def get_percentile(values, percentile):
+    values = sorted(values)
+    return values[max(0, -(-len(values) * percentile // 100) - 1)]
+
+
+def run_case(case, repeat):
+    """
+    Returns the p50 and p95 durations of a case in milliseconds and its median number of queries, after a
+    first unmeasured run. Raises AssertionError if a request fails.
+    """
+    durations = []
+    query_counts = []
+    for index in range(repeat + 1):
+        state = case.prepare()
+        queries = []
+        # As with `timeit`, the garbage collector is disabled while measuring, to make durations less noisy
+        gc.collect()
+        gc.disable()
+        try:
+            with connection.execute_wrapper(lambda execute, *args: queries.append(None) or execute(*args)):
+                start = time.perf_counter()
+                response = case.run(state)
+                if hasattr(response, 'status_code'):
+                    read_content(response)
+                duration = (time.perf_counter() - start) * 1000
+        finally:
+            gc.enable()
+
+        assert getattr(response, 'status_code', 200) < 400, 'status {}'.format(response.status_code)
+        if index > 0:
+            durations.append(duration)
+            query_counts.append(len(queries))
+
+    return {'p50': get_percentile(durations, 50), 'p95': get_percentile(durations, 95),
+            'queries': get_percentile(query_counts, 50)}
+
+
+def compare(name, result, baseline, threshold, min_delta):
+    """
+    Returns the changes of a result relative to its baseline as text, and whether it is a regression.
+    """
+    if 'error' in result:
+        return result['error'], True
+    if baseline is None or 'error' in baseline:
+        return 'new', False
+
+    changes = []
+    regressed = False
+    for key in ('p50', 'p95'):
+        delta = result[key] - baseline[key]
+        ratio = delta / baseline[key] if baseline[key] else 0
+        changes.append('{} {:+.0%}'.format(key, ratio))
+        if ratio > threshold and delta > min_delta:
+            regressed = True
+            changes[-1] += ' (regressed)'
+
+    if result['queries'] != baseline['queries']:
+        changes.append('queries {:+d}'.format(result['queries'] - baseline['queries']))
+        if result['queries'] > baseline['queries']:
+            regressed = True
+            changes[-1] += ' (regressed)'
+    return ', '.join(changes), regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=float, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--cases', help='Only run the cases whose name contains this text')
+    parser.add_argument('--save', help='Path of the JSON file to save the results to')
+    parser.add_argument('--baseline', help='Path of the JSON file of the results to compare to')
+    parser.add_argument('--threshold', type=float, default=0.25)
+    parser.add_argument('--min-delta', type=float, default=1)
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if (baseline['scale'], baseline['seed']) != (args.scale, args.seed):
+            print('Warning: the baseline was run with scale {} and seed {}.'.format(baseline['scale'],
+                                                                                   baseline['seed']))
+
+    with test_database():
+        start = time.perf_counter()
+        dataset = generate_dataset(args.seed, args.scale)
+        print('Generated {} courses, {} sections, {} meetings and {} users in {:.1f} s'.format(
+            dataset.courses, dataset.sections, dataset.meetings, dataset.users, time.perf_counter() - start))
+
+        cases = get_cases(dataset)
+        missing = {pattern.name for pattern in urlpatterns} - {case.endpoint for case in cases}
+        if missing:
+            raise SystemExit('No benchmark case for the endpoints: {}'.format(', '.join(sorted(missing))))
+
+        results = {}
+        regressions = []
+        print('{:<40} {:>10} {:>10} {:>8}  {}'.format('Case', 'p50 (ms)', 'p95 (ms)', 'Queries', 'Change'))
+        for case in cases:
+            if args.cases and args.cases not in case.name:
+                continue
+
+            try:
+                result = run_case(case, args.repeat)
+            except Exception as error:
+                result = {'error': '{}: {}'.format(type(error).__name__, error)}
+            results[case.name] = result
+
+            change, regressed = compare(case.name, result, baseline['results'].get(case.name) if baseline else None,
+                                        args.threshold, args.min_delta)
+            if regressed:
+                regressions.append(case.name)
+            if 'error' in result:
+                print('{:<40} {:>10} {:>10} {:>8}  {}'.format(case.name, '-', '-', '-', change))
+            else:
+                print('{:<40} {:>10.2f} {:>10.2f} {:>8}  {}'.format(case.name, result['p50'], result['p95'],
+                                                                   result['queries'], change if baseline else ''))
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump({'scale': args.scale, 'seed': args.seed, 'repeat': args.repeat, 'results': results}, file,
+                      indent=2, sort_keys=True)
+
+    if regressions:
+        print('\n{} regressed: {}'.format(len(regressions), ', '.join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+"""
+Measures the timetable generator on synthetic courses, each with lecture, lab and tutorial sections.
+
+    python -m benchmarks.bench_timetables [--courses 6] [--sections 20] [--seed 0]
+"""
+
+import argparse
+import itertools
+import random
+import time
+
+from benchmarks import setup_django
+
+setup_django()
+
+from plan.conflicts import MeetingRecord
+from plan.timetables import DaysOnCampusScorer, EarlyMorningScorer, TimetableGenerator
+
+# Lectures meet Monday, Wednesday and Thursday for 50 minutes, or Tuesday and Friday for 80 minutes
+LECTURE_PATTERNS = [(0b0001101, 50), (0b0010010, 80)]
+
+TERM_START = 737676  # 2020-09-08
+TERM_END = 737763    # 2020-12-04
+
+
+def generate_section(rng, crn, section_type):
+    if section_type == 'lecture':
+        weekdays, duration = rng.choice(LECTURE_PATTERNS)
+    else:
+        weekdays, duration = 1 << rng.randrange(5), 170 if section_type == 'lab' else 50
+
+    start_minute = rng.randrange(8 * 60 + 30, 18 * 60 + 30 - duration, 60)
+    return crn, [MeetingRecord(crn, weekdays, start_minute, start_minute + duration, TERM_START, TERM_END)]
+
+
+def generate_groups(rng, courses, sections):
+    """
+    Splits the sections of each course into lectures, labs and tutorials.
+    """
+    groups = []
+    crn = 10000
+    for _ in range(courses):
+        lectures = max(1, sections // 5)
+        tutorials = max(1, sections // 4)
+        labs = max(1, sections - lectures - tutorials)
+        for section_type, count in (('lecture', lectures), ('lab', labs), ('tutorial', tutorials)):
+            groups.append([generate_section(rng, crn + index, section_type) for index in range(count)])
+            crn += count
+    return groups
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--courses', type=int, default=6)
+    parser.add_argument('--sections', type=int, default=20)
+    parser.add_argument('--stream', type=int, default=10000)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    groups = generate_groups(random.Random(args.seed), args.courses, args.sections)
+    print('{} courses, {} sections in {} groups\n'.format(args.courses, args.courses * args.sections, len(groups)))
+
+    start = time.perf_counter()
+    generator = TimetableGenerator(groups)
+    print('conflict bitmatrix:             {:>10.1f} ms'.format((time.perf_counter() - start) * 1000))
+
+    start = time.perf_counter()
+    first = next(generator.iter_timetables(), None)
+    print('first timetable:                {:>10.1f} ms'.format((time.perf_counter() - start) * 1000))
+
+    start = time.perf_counter()
+    streamed = sum(1 for _ in itertools.islice(generator.iter_timetables(), args.stream))
+    print('stream {:>6} timetables:        {:>10.1f} ms'.format(streamed, (time.perf_counter() - start) * 1000))
+
+    start = time.perf_counter()
+    ranked = generator.rank([DaysOnCampusScorer(weight=10), EarlyMorningScorer()], args.limit)
+    print('rank top {:<3} (days, mornings): {:>10.1f} ms'.format(args.limit, (time.perf_counter() - start) * 1000))
+
+    if first is None:
+        print('\nno valid timetable')
+    else:
+        print('\nbest score: {}, crns: {}'.format(ranked[0][0], ranked[0][1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+"""
+A seeded generator of a synthetic institution, of the size of a large university at scale 1:
+  - 20k courses over 24 subjects, a third of them with a requisite on courses of the same subject with a lower
+    number, and a program per subject
+  - 60k sections of the offerings of four terms, with 200k meetings
+  - 50k users, each with a schedule of five sections of one of the terms and a sequence of four terms of four
+    courses each
+
+The same seed and scale always generate the same data, so that benchmarks run against it are comparable
+between runs. Rows are inserted in batches, without creating all their models at once.
+"""
+
+import datetime
+import itertools
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from benchmarks.bench_expressions import generate_requisite
+from benchmarks.bench_search import NAME_WORDS
+from plan.models import Course, CourseOffering, Meeting, Program, Schedule, ScheduleSection, Section, Sequence, \
+    Term, TermCourse
+from plan.snapshots import SequenceSnapshot
+
+SUBJECTS = ['ANTH', 'ART', 'ASTR', 'BIOC', 'BIOL', 'CHEM', 'CIVE', 'CSC', 'ECE', 'ECON', 'EDUC', 'ENGL', 'GEOG',
+            'HIST', 'LING', 'MATH', 'MECH', 'MUS', 'PHIL', 'PHYS', 'POLI', 'PSYC', 'SENG', 'STAT']
+NUMBER_SUFFIXES = ['', 'A', 'B', 'C']
+
+# The terms of the course offerings, as (year, term type, Term.term_type, first day, last day)
+TERMS = [
+    (2020, 'spring', 1, datetime.date(2020, 1, 6), datetime.date(2020, 4, 3)),
+    (2020, 'summer', 2, datetime.date(2020, 5, 4), datetime.date(2020, 7, 31)),
+    (2020, 'fall', 3, datetime.date(2020, 9, 8), datetime.date(2020, 12, 4)),
+    (2021, 'spring', 1, datetime.date(2021, 1, 11), datetime.date(2021, 4, 9))
+]
+
+# The number of sections of each offering and of meetings of each section, averaging 3 and 3.3
+SECTION_COUNTS = [1, 2, 3, 3, 4, 5]
+MEETING_COUNTS = [1, 2, 3, 3, 4, 5, 5]
+WEEKDAY_PATTERNS = [0b0001010, 0b0010100, 0b0101010, 0b0000010, 0b0000100, 0b0001000, 0b0010000, 0b0100000]
+
+INSTITUTION = 'University of Victoria'
+PASSWORD = 'benchmark'
+BATCH_SIZE = 5000
+
+
+class Dataset:
+    """
+    The sizes of a generated dataset, along with the identifiers the benchmarks need to build their requests.
+    """
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def get_username(index):
+    return 'user{:06d}'.format(index)
+
+
+def bulk_insert(model, objects):
+    """
+    Inserts the unsaved instances of an iterable in batches of `BATCH_SIZE`. Returns the number of rows.
+    """
+    count = 0
+    objects = iter(objects)
+    batch = list(itertools.islice(objects, BATCH_SIZE))
+    while batch:
+        model.objects.bulk_create(batch)
+        count += len(batch)
+        batch = list(itertools.islice(objects, BATCH_SIZE))
+    return count
+
+
+def get_ids(queryset, count):
+    """
+    Returns the primary keys of the last `count` rows of a model in insertion order, as not every database
+    returns them from bulk inserts.
+    """
+    ids = list(queryset.order_by('-id').values_list('id', flat=True)[:count])
+    ids.reverse()
+    return ids
+
+
+def generate_courses(rng, count):
+    subject_codes = {subject: [] for subject in SUBJECTS}
+    for index in range(count):
+        subject = SUBJECTS[index % len(SUBJECTS)]
+        position = index // len(SUBJECTS)
+        number = str(100 + position % 400) + NUMBER_SUFFIXES[position // 400 % len(NUMBER_SUFFIXES)]
+
+        # Requisites only refer to the courses of the same subject generated before, so that the prerequisite
+        # graph is acyclic
+        codes = subject_codes[subject]
+        requirement = None
+        if codes and rng.random() < 0.35:
+            requirement = {'expressions': [generate_requisite(rng, depth=2, course_codes=codes[-40:])]}
+        codes.append(subject + ' ' + number)
+
+        yield Course(subject=subject, number=number, name=' '.join(rng.sample(NAME_WORDS, rng.randint(1, 4))),
+                     credits=rng.choice([1.5, 1.5, 1.5, 3, 0.5]), hours_lectures=3, hours_labs=rng.choice([0, 2, 3]),
+                     hours_tutorials=rng.choice([0, 1]), offered_spring=rng.random() < 0.5,
+                     offered_summer=rng.random() < 0.2, offered_fall=rng.random() < 0.7, requirement=requirement)
+
+
+def generate_programs():
+    """
+    Yields a program per subject, requiring ten of its first fifteen courses.
+    """
+    for subject in SUBJECTS:
+        expressions = [{'expression_type': 'COURSE', 'subject': subject, 'number': str(number),
+                        'requisite_type': 'P'} for number in range(100, 115)]
+        yield Program(institution=INSTITUTION, name=subject, requirements={'expressions': [
+            {'expression_type': 'LIST', 'threshold_type': 'geq', 'threshold_value': 10, 'expressions': expressions}
+        ]})
+
+
+def generate_sections(rng, offerings, sections_by_term):
+    crn = 10000
+    for course_offering_id, term_index in offerings:
+        for index in range(rng.choice(SECTION_COUNTS)):
+            crn += 1
+            section_type = 'lecture' if index == 0 else rng.choice(['lecture', 'lab', 'tutorial'])
+            sections_by_term[term_index].append(crn)
+            yield Section(crn=crn, course_offering_id=course_offering_id, name='{}{:02d}'.format(
+                section_type[0].upper(), index + 1), section_type=section_type)
+
+
+def generate_meetings(rng, sections):
+    for crn, term_index in sections:
+        _, _, _, start_date, end_date = TERMS[term_index]
+        for _ in range(rng.choice(MEETING_COUNTS)):
+            start_minute = rng.randrange(8 * 60, 20 * 60, 30)
+            yield Meeting(section_id=crn, start_date=start_date, end_date=end_date,
+                          weekdays=rng.choice(WEEKDAY_PATTERNS), start_minute=start_minute,
+                          end_minute=start_minute + rng.choice([50, 80, 110]))
+
+
+def generate_dataset(seed=0, scale=1.0):
+    """
+    Fills the database with the synthetic institution of the given seed, scaled by `scale`. Returns its
+    `Dataset`.
+    """
+    rng = random.Random(seed)
+    course_count = max(int(20000 * scale), len(SUBJECTS) * 20)
+    user_count = max(int(50000 * scale), 10)
+
+    bulk_insert(Course, generate_courses(rng, course_count))
+    course_ids = get_ids(Course.objects, course_count)
+    bulk_insert(Program, generate_programs())
+
+    # A course is offered in one or two of the terms
+    offerings = [(course_id, term_index) for course_id in course_ids
+                 for term_index in sorted(rng.sample(range(len(TERMS)), rng.choice([1, 1, 2])))]
+    bulk_insert(CourseOffering, (CourseOffering(course_id=course_id, year=TERMS[term_index][0],
+                                                term_type=TERMS[term_index][1])
+                                 for course_id, term_index in offerings))
+    offering_ids = get_ids(CourseOffering.objects, len(offerings))
+
+    # About 60k sections at scale 1, for 3 sections per offering, the offerings beyond having no section
+    offerings = [(offering_id, term_index) for offering_id, (_, term_index) in zip(offering_ids, offerings)]
+    del offerings[int(60000 * scale / 3):]
+    sections_by_term = [[] for _ in TERMS]
+    section_count = bulk_insert(Section, generate_sections(rng, offerings, sections_by_term))
+    meeting_count = bulk_insert(Meeting, generate_meetings(rng, (
+        (crn, term_index) for term_index, crns in enumerate(sections_by_term) for crn in crns)))
+
+    # Passwords are hashed once, as hashing is deliberately slow
+    password = make_password(PASSWORD)
+    bulk_insert(User, (User(username=get_username(index), password=password) for index in range(user_count)))
+    user_ids = get_ids(User.objects, user_count)
+
+    schedule_terms = [rng.randrange(len(TERMS)) for _ in user_ids]
+    bulk_insert(Schedule, (Schedule(user_id=user_id, year=TERMS[term_index][0], term=TERMS[term_index][1],
+                                    name='Schedule') for user_id, term_index in zip(user_ids, schedule_terms)))
+    schedule_ids = get_ids(Schedule.objects, user_count)
+    bulk_insert(ScheduleSection, (ScheduleSection(schedule_id=schedule_id, section_id=crn)
+                                  for schedule_id, term_index in zip(schedule_ids, schedule_terms)
+                                  for crn in rng.sample(sections_by_term[term_index],
+                                                        min(5, len(sections_by_term[term_index])))))
+
+    bulk_insert(Sequence, (Sequence(user_id=user_id, name='Sequence') for user_id in user_ids))
+    sequence_ids = get_ids(Sequence.objects, user_count)
+    first_ordinal = SequenceSnapshot.get_term_ordinal(2020, 3)
+    bulk_insert(Term, (Term(user_id=sequence_id, year=year, term_type=term_type)
+                       for sequence_id in sequence_ids
+                       for year, term_type in map(SequenceSnapshot.get_term,
+                                                  range(first_ordinal, first_ordinal + 4))))
+    term_ids = get_ids(Term.objects, user_count * 4)
+    bulk_insert(TermCourse, (TermCourse(term_id=term_id, course_id=course_id) for term_id in term_ids
+                             for course_id in rng.sample(course_ids, 4)))
+
+    return Dataset(seed=seed, scale=scale, courses=course_count, sections=section_count, meetings=meeting_count,
+                   users=user_count, terms=TERMS, sections_by_term=sections_by_term, institution=INSTITUTION,
+                   programs=SUBJECTS, password=PASSWORD)
@@ -0,0 +1,135 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+import threading
+import numpy as np
+from django.conf import settings
+from django.db.models import Count
+from plan.cache import LRUCache, MISSING
+from plan.catalog import CatalogSnapshot
+from plan.models import Meeting
+
+
+class TermOccupancy:
+    """
+    The number of sections meeting during each slot of `SLOT_MINUTES` minutes of each day of the week over a term,
+    as a matrix of shape (`DAYS_PER_WEEK`, `SLOTS_PER_DAY`) indexed by `Weekday` value and slot of the day. A
+    meeting occupies every slot it overlaps, as in the index of `ScheduleCoordinator`.
+
+    The meetings of the term are loaded as column arrays of their weekdays and start and end minutes, grouped
+    by the database with the number of sections meeting at those times, so that the duplicate meetings of a
+    section are counted once and only a few hundred rows are fetched for a whole term. The matrix is then built
+    without iterating over the meetings: each (meeting, day) adds its number of sections at its first slot and
+    subtracts it after its last slot of a difference array, which is accumulated with `np.bincount` and summed
+    along the day with `np.cumsum`.
+
+    Occupancies are cached per term and filters by `get_instance` for the current catalog version.
+    """
+
+    SLOT_MINUTES = 5
+    SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+    DAYS_PER_WEEK = 7
+
+    CACHE_SIZE = 256
+
+    _cache = None
+    _cache_lock = threading.Lock()
+
+    __slots__ = ('meeting_count', 'occupancy')
+
+    def __init__(self, weekdays, start_minutes, end_minutes, counts=None):
+        """
+        Args:
+            weekdays: An array of the weekday bitmask of every meeting, bit `n` set for `Weekday(n)`
+            start_minutes: An array of the start minute of the day of every meeting
+            end_minutes: An array of the end minute of the day of every meeting
+            counts: If set, an array of the number of sections of every meeting, one each by default
+        """
+        weekdays = np.asarray(weekdays, dtype=np.int64)
+        counts = np.ones(len(weekdays), dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+        self.meeting_count = int(counts.sum())
+
+        meetings, days = np.nonzero((weekdays[:, np.newaxis] >> np.arange(self.DAYS_PER_WEEK)) & 1)
+        first_slots = np.asarray(start_minutes, dtype=np.int64)[meetings] // self.SLOT_MINUTES
+        end_slots = np.minimum(-(-np.asarray(end_minutes, dtype=np.int64)[meetings] // self.SLOT_MINUTES),
+                               self.SLOTS_PER_DAY)
+
+        # Each day has an extra slot receiving the subtractions of the meetings ending at midnight
+        width = self.SLOTS_PER_DAY + 1
+        size = self.DAYS_PER_WEEK * width
+        differences = np.bincount(days * width + first_slots, weights=counts[meetings], minlength=size) - \
+            np.bincount(days * width + end_slots, weights=counts[meetings], minlength=size)
+        self.occupancy = np.cumsum(differences.reshape(self.DAYS_PER_WEEK, width), axis=1)[:, :-1].astype(np.int64)
+
+    @staticmethod
+    def from_term(year, term_type, subject=None, section_type=None, date=None):
+        """
+        Loads the meetings of the sections offered in a term with a single query, grouped by their times.
+
+        Args:
+            year: The year of the course offerings
+            term_type: The term of the course offerings ('spring', 'summer' or 'fall')
+            subject: If set, only the meetings of the courses of this subject
+            section_type: If set, only the meetings of the sections of this type (e.g 'lecture')
+            date: If set, only the meetings whose date range includes this date
+        """
+        meetings = Meeting.objects.filter(section__course_offering__year=year,
+                                          section__course_offering__term_type=term_type)
+        if subject is not None:
+            meetings = meetings.filter(section__course_offering__course__subject=subject)
+        if section_type is not None:
+            meetings = meetings.filter(section__section_type=section_type)
+        if date is not None:
+            meetings = meetings.filter(start_date__lte=date, end_date__gte=date)
+
+        rows = np.array(list(meetings.values_list('weekdays', 'start_minute', 'end_minute')
+                             .annotate(sections=Count('section', distinct=True)).order_by()),
+                        dtype=np.int64).reshape(-1, 4)
+        return TermOccupancy(rows[:, 0], rows[:, 1], rows[:, 2], rows[:, 3])
+
+    @staticmethod
+    def get_instance(year, term_type, subject=None, section_type=None, date=None):
+        """
+        Returns the cached occupancy of a term with the filters of `from_term`, loading it if there is none for
+        the current catalog version.
+        """
+        cache = TermOccupancy._get_cache()
+        version = CatalogSnapshot.get_version()
+        key = (year, term_type, subject, section_type, date)
+
+        entry = cache.get(key)
+        if entry is not MISSING and entry[0] == version:
+            return entry[1]
+
+        occupancy = TermOccupancy.from_term(year, term_type, subject, section_type, date)
+        cache.set(key, (version, occupancy))
+        return occupancy
+
+    @staticmethod
+    def _get_cache():
+        if TermOccupancy._cache is None:
+            with TermOccupancy._cache_lock:
+                if TermOccupancy._cache is None:
+                    ttl = getattr(settings, 'PLAN_CACHE', {}).get('TTL', 300)
+                    TermOccupancy._cache = LRUCache(TermOccupancy.CACHE_SIZE, ttl)
+        return TermOccupancy._cache
+
+    def get_peak(self):
+        """
+        Returns the greatest number of sections meeting during a slot, and the (weekday, slot) pairs at which it
+        is reached.
+        """
+        peak = int(self.occupancy.max(initial=0))
+        if peak == 0:
+            return 0, []
+        return peak, [(int(day), int(slot)) for day, slot in zip(*np.nonzero(self.occupancy == peak))]
+
+    def to_dict(self):
+        peak, peak_slots = self.get_peak()
+        return {
+            'slot_minutes': self.SLOT_MINUTES,
+            'meetings': self.meeting_count,
+            'peak': peak,
+            'peak_slots': [{'weekday': day, 'start_minute': slot * self.SLOT_MINUTES} for day, slot in peak_slots],
+            'occupancy': self.occupancy.tolist()
+        }
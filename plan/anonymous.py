@@ -0,0 +1,196 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+import base64
+import struct
+from django.db import transaction
+from plan.evaluations import SequenceEvaluation
+from plan.models import Course, Sequence, Term, TermCourse
+from plan.snapshots import SequenceSnapshot
+
+
+class AnonymousSequence:
+    """
+    The sequence of a user who is not logged in, stored in their session rather than in the `Sequence`, `Term`
+    and `TermCourse` tables until it is promoted into them with `promote`.
+
+    Terms are identified by their `SequenceSnapshot` ordinal and courses by their primary key, each term holding
+    an insertion-ordered dictionary of its courses, so that adding or removing a term or course costs O(1). The
+    sequence is stored as a single base64-encoded string of the following little-endian binary layout, which is
+    independent of the session serializer:
+      - A header with the format version (1 byte), the length of the UTF-8 encoded name (2 bytes) and the number
+        of terms (2 bytes), followed by the name
+      - For each term, its ordinal (2 bytes) and number of courses (2 bytes), followed by the primary key of
+        each course (4 bytes each)
+    """
+
+    SESSION_KEY = 'anonymous_sequence'
+    VERSION = 1
+
+    HEADER = struct.Struct('<BHH')
+    TERM = struct.Struct('<HH')
+    COURSE_SIZE = 4
+
+    # The latest year of a term, whose ordinal must fit in the 2 bytes of the layout
+    MAX_YEAR = (0xFFFF - 2) // 3
+
+    __slots__ = ('name', 'terms')
+
+    def __init__(self, name, terms=None):
+        """
+        Args:
+            name: The name of the sequence
+            terms: A dictionary mapping term ordinals to dictionaries with the primary key of each course of the
+                   term as keys, and None as values
+        """
+        self.name = name
+        self.terms = terms if terms is not None else {}
+
+    @staticmethod
+    def from_session(session):
+        """
+        Returns the sequence stored in a session, or None if there is none. A sequence stored with another format
+        version cannot be read, and is treated as missing.
+        """
+        data = session.get(AnonymousSequence.SESSION_KEY)
+        if data is None:
+            return None
+
+        try:
+            return AnonymousSequence.decode(data)
+        except (ValueError, struct.error):
+            return None
+
+    def save(self, session):
+        session[self.SESSION_KEY] = self.encode()
+
+    @staticmethod
+    def delete(session):
+        session.pop(AnonymousSequence.SESSION_KEY, None)
+
+    def encode(self):
+        name = self.name.encode('utf-8')
+        parts = [self.HEADER.pack(self.VERSION, len(name), len(self.terms)), name]
+        for ordinal, course_ids in self.terms.items():
+            parts.append(self.TERM.pack(ordinal, len(course_ids)))
+            parts.append(struct.pack('<{}I'.format(len(course_ids)), *course_ids))
+        return base64.b64encode(b''.join(parts)).decode('ascii')
+
+    @staticmethod
+    def decode(data):
+        """
+        Returns the sequence encoded by `encode`. Raises ValueError if the data is not of the current format
+        version, and `struct.error` if it is truncated.
+        """
+        data = base64.b64decode(data)
+        version, name_length, term_count = AnonymousSequence.HEADER.unpack_from(data)
+        if version != AnonymousSequence.VERSION:
+            raise ValueError('Unsupported anonymous sequence version {}'.format(version))
+
+        offset = AnonymousSequence.HEADER.size
+        name = data[offset:offset + name_length].decode('utf-8')
+        offset += name_length
+
+        terms = {}
+        for _ in range(term_count):
+            ordinal, course_count = AnonymousSequence.TERM.unpack_from(data, offset)
+            offset += AnonymousSequence.TERM.size
+            terms[ordinal] = dict.fromkeys(struct.unpack_from('<{}I'.format(course_count), data, offset))
+            offset += course_count * AnonymousSequence.COURSE_SIZE
+
+        return AnonymousSequence(name, terms)
+
+    def has_term(self, year, term_type):
+        return SequenceSnapshot.get_term_ordinal(year, term_type) in self.terms
+
+    def add_term(self, year, term_type):
+        """
+        Adds an empty term. Returns False if the term already exists, and raises ValueError if its year is not
+        between 0 and `MAX_YEAR`.
+        """
+        if not 0 <= year <= self.MAX_YEAR:
+            raise ValueError('Unsupported year {}'.format(year))
+        ordinal = SequenceSnapshot.get_term_ordinal(year, term_type)
+        if ordinal in self.terms:
+            return False
+        self.terms[ordinal] = {}
+        return True
+
+    def remove_term(self, year, term_type):
+        """
+        Removes a term along with its courses. Returns False if there is no such term.
+        """
+        return self.terms.pop(SequenceSnapshot.get_term_ordinal(year, term_type), None) is not None
+
+    def add_course(self, course, year, term_type):
+        """
+        Adds a `Course` to an existing term. Returns False if the term already contains it.
+        """
+        course_ids = self.terms[SequenceSnapshot.get_term_ordinal(year, term_type)]
+        if course.pk in course_ids:
+            return False
+        course_ids[course.pk] = None
+        return True
+
+    def remove_course(self, course, year, term_type):
+        """
+        Removes a `Course` from a term. Returns False if the term does not contain it.
+        """
+        course_ids = self.terms.get(SequenceSnapshot.get_term_ordinal(year, term_type), {})
+        if course.pk not in course_ids:
+            return False
+        del course_ids[course.pk]
+        return True
+
+    def get_courses(self):
+        """
+        Returns the `Course` of every primary key of the sequence with a single query, courses which no longer
+        exist being omitted.
+        """
+        return Course.objects.in_bulk(self._get_course_ids())
+
+    def get_evaluation(self):
+        """
+        Returns the `SequenceEvaluation` of the sequence, which is built anew for each request.
+        """
+        courses = self.get_courses()
+        placements = [(courses[course_id], ordinal) for ordinal, course_ids in self.terms.items()
+                      for course_id in course_ids if course_id in courses]
+        return SequenceEvaluation(None, placements, self.terms.keys())
+
+    def to_dict(self):
+        courses = self.get_courses()
+        result = {
+            'name': self.name,
+            'terms': [{'year': year, 'term_type': term_type,
+                       'courses': [str(courses[course_id]) for course_id in self.terms[ordinal]
+                                   if course_id in courses]}
+                      for ordinal, (year, term_type) in sorted((ordinal, SequenceSnapshot.get_term(ordinal))
+                                                               for ordinal in self.terms)]
+        }
+        return result
+
+    def promote(self, user):
+        """
+        Stores the sequence as the `Sequence` of a user, with one bulk insert for its terms and one for their
+        courses. Returns the new `Sequence`.
+        """
+        with transaction.atomic():
+            sequence = Sequence.objects.create(user=user, name=self.name)
+            terms = Term.objects.bulk_create(Term(user=sequence, year=year, term_type=term_type) for
+                                             year, term_type in map(SequenceSnapshot.get_term, self.terms))
+
+            # Not every database returns the primary keys of bulk inserts
+            if any(term.pk is None for term in terms):
+                terms = Term.objects.filter(user=sequence)
+            term_ids = {SequenceSnapshot.get_term_ordinal(term.year, term.term_type): term.pk for term in terms}
+
+            # Courses removed from the catalog since they were added are skipped
+            course_ids = set(Course.objects.filter(pk__in=self._get_course_ids()).values_list('pk', flat=True))
+            TermCourse.objects.bulk_create(TermCourse(term_id=term_ids[ordinal], course_id=course_id)
+                                           for ordinal, term_course_ids in self.terms.items()
+                                           for course_id in term_course_ids if course_id in course_ids)
+        return sequence
+
+    def _get_course_ids(self):
+        return {course_id for course_ids in self.terms.values() for course_id in course_ids}
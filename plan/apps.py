@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class PlanConfig(AppConfig):
     name = 'plan'
+
+    def ready(self):
+        # Connects the signal receivers keeping the precomputed indexes up to date
+        from . import signals
@@ -0,0 +1,34 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """
+    An ASGI handler which reads the streaming responses that are asynchronous iterators, such as
+    `StreamingJsonResponse`, with `async for`. Django itself iterates streaming responses synchronously within
+    the event loop, which blocks every other request while their content is produced.
+    """
+
+    async def send_response(self, response, send):
+        if not (response.streaming and hasattr(response, '__aiter__')):
+            return await super().send_response(response, send)
+
+        response_headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode('ascii')
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            response_headers.append((bytes(header), bytes(value)))
+        for cookie in response.cookies.values():
+            response_headers.append((b'Set-Cookie', cookie.output(header='').encode('ascii').strip()))
+
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': response_headers})
+        async for part in response:
+            for chunk, _ in self.chunk_bytes(part):
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body'})
+        await sync_to_async(response.close, thread_sensitive=True)()
@@ -0,0 +1,289 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from plan.catalog import CatalogSnapshot
+from plan.models import Course, CourseOffering, Meeting, Section
+
+# Returned by `LRUCache.get` for missing entries, as None is a valid cached value
+MISSING = object()
+
+
+class LRUCache:
+    """
+    A thread-safe, in-process cache evicting the least recently used entry beyond `max_size` entries, in
+    which each entry expires `ttl` seconds after it was set.
+    """
+
+    def __init__(self, max_size=10000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Returns the value of the entry, or `MISSING` if there is no such entry or it has expired.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return MISSING
+
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return MISSING
+
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class CatalogCache:
+    """
+    A read-through cache of the catalog lookups made by the handlers, which are effectively read-only during a
+    term. Every lookup is first answered by an in-process `LRUCache`, then by the shared Django cache alias
+    given by the 'SHARED' entry of the `PLAN_CACHE` setting if any, and only then by the database.
+
+    Every entry records the catalog version it was loaded at. The signals of `plan.signals` invalidate the
+    entries containing a written instance once the write commits, and record in the shared cache the version of
+    the write to their keys before the new catalog version is visible to any other process. Once a process sees
+    a new version, an entry loaded at an earlier one is kept if the writes of the process since did not change
+    its key, or else if the shared cache tells that no write did, and a shared entry is only used if it was
+    loaded after the last write to its key. Without a shared cache, the writes of other processes therefore
+    reload every entry. The cached instances are shared between requests, and must not be modified.
+
+    The following settings are read from the `PLAN_CACHE` dictionary:
+      - MAX_SIZE: The maximum number of in-process entries, 10000 by default
+      - TTL: The lifetime of an entry in seconds, 300 by default
+      - SHARED: The alias of a cache of the `CACHES` setting dedicated to the catalog, None by default
+    """
+
+    KEY_PREFIX = 'plan:lookup:'
+    # The prefix of the version of the last write to the entries of a key, or to every entry for `ALL_KEYS`
+    CHANGED_PREFIX = 'plan:changed:'
+    ALL_KEYS = '*'
+
+    # The version recorded for the keys being written, until the version of the write is known
+    PENDING = float('inf')
+
+    # The number of writes of this process remembered to keep the entries they did not change
+    MAX_SUCCESSORS = 64
+
+    # The fields by which the entries containing an instance of each model are keyed
+    KEY_FIELDS = {
+        Course: ('subject', 'number'),
+        CourseOffering: ('year', 'term_type'),
+        Section: ('crn',),
+        Meeting: ('section_id',)
+    }
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_size=10000, ttl=300, shared=None):
+        self.local = LRUCache(max_size, ttl)
+        self.shared = caches[shared] if shared else None
+        self.ttl = ttl
+        # Maps a version to the version following it by a write of this process, and the keys it changed
+        self.successors = OrderedDict()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.stats_lock = threading.Lock()
+
+    @staticmethod
+    def get_instance():
+        if CatalogCache._instance is None:
+            with CatalogCache._instance_lock:
+                if CatalogCache._instance is None:
+                    options = getattr(settings, 'PLAN_CACHE', {})
+                    CatalogCache._instance = CatalogCache(options.get('MAX_SIZE', 10000), options.get('TTL', 300),
+                                                          options.get('SHARED'))
+        return CatalogCache._instance
+
+    def get_course(self, subject, number):
+        """
+        Returns the `Course` with the given subject and number, or None if there is none.
+        """
+        return self.get_or_load(self.get_course_key(subject, number),
+                                lambda: Course.objects.filter(subject=subject, number=number).first())
+
+    def get_section(self, crn):
+        """
+        Returns the `Section` with the given CRN, or None if there is none.
+        """
+        return self.get_or_load(self.get_section_key(crn), lambda: Section.objects.filter(crn=crn).first())
+
+    def get_meetings(self, crn):
+        """
+        Returns a tuple of the meetings of the section with the given CRN.
+        """
+        return self.get_or_load(self.get_meetings_key(crn),
+                                lambda: tuple(Meeting.objects.filter(section_id=crn).order_by('id')))
+
+    def get_offerings(self, year, term_type):
+        """
+        Returns a tuple of the course offerings of a term, with their course, ordered by course code.
+        """
+        return self.get_or_load(self.get_offerings_key(year, term_type), lambda: tuple(
+            CourseOffering.objects.filter(year=year, term_type=term_type).select_related('course')
+            .order_by('course__subject', 'course__number')))
+
+    def get_or_load(self, key, load):
+        version = CatalogSnapshot.get_version()
+        entry = self.local.get(key)
+        if entry is not MISSING and self._is_unchanged(key, entry[0], version):
+            self._count('hits')
+            if entry[0] != version:
+                self.local.set(key, (version, entry[1]))
+            return entry[1]
+
+        if self.shared is not None:
+            shared_key = self.KEY_PREFIX + key
+            changed_keys = [self.CHANGED_PREFIX + key, self.CHANGED_PREFIX + self.ALL_KEYS]
+            values = self.shared.get_many([shared_key] + changed_keys)
+            changed = max(values.get(changed_key, 0) for changed_key in changed_keys)
+
+            if entry is not MISSING and changed <= entry[0]:
+                self._count('hits')
+                self.local.set(key, (version, entry[1]))
+                return entry[1]
+
+            shared_entry = values.get(shared_key)
+            if shared_entry is not None and changed <= shared_entry[0]:
+                self._count('shared_hits')
+                self.local.set(key, (version, shared_entry[1]))
+                return shared_entry[1]
+
+        self._count('misses')
+        value = load()
+
+        # Within a transaction, the value may include writes which are not committed yet
+        if not transaction.get_connection().in_atomic_block:
+            self.local.set(key, (version, value))
+            if self.shared is not None:
+                self.shared.set(shared_key, (version, value), self.ttl)
+        return value
+
+    def mark_changed(self, keys, version=PENDING):
+        """
+        Records in the shared cache the version of a write to the entries with the given keys, which must be
+        done before the version is visible to the other processes, and therefore first as `PENDING`.
+        """
+        if self.shared is not None:
+            self.shared.set_many({self.CHANGED_PREFIX + key: version for key in keys}, self.ttl)
+
+    def invalidate(self, *keys, versions=None):
+        """
+        Removes the entries with the given keys, once the write changing them committed.
+
+        Args:
+            keys: The keys of the entries changed by the write
+            versions: The catalog versions before and after the write, as returned by `bump_version`, with which
+                      the other entries are kept
+        """
+        for key in keys:
+            self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete_many([self.KEY_PREFIX + key for key in keys])
+
+        if versions is not None and versions[0] is not None:
+            with self.stats_lock:
+                self.successors[versions[0]] = (versions[1], frozenset(keys))
+                while len(self.successors) > self.MAX_SUCCESSORS:
+                    self.successors.popitem(last=False)
+
+    def _is_unchanged(self, key, entry_version, version):
+        """
+        Returns whether the writes of this process from the version of an entry to the given one did not change
+        its key, which is False if any other process wrote in between.
+        """
+        while entry_version < version:
+            successor = self.successors.get(entry_version)
+            if successor is None or key in successor[1]:
+                return False
+            entry_version = successor[0]
+        return entry_version == version
+
+    def clear(self):
+        """
+        Removes every in-process entry. The shared entries are left to be invalidated by `ALL_KEYS`.
+        """
+        self.local.clear()
+
+    def _count(self, name):
+        with self.stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get_stats(self):
+        with self.stats_lock:
+            hits, shared_hits, misses = self.hits, self.shared_hits, self.misses
+
+        lookups = hits + shared_hits + misses
+        return {
+            'hits': hits,
+            'shared_hits': shared_hits,
+            'misses': misses,
+            'hit_ratio': (hits + shared_hits) / lookups if lookups else None,
+            'entries': len(self.local),
+            'evictions': self.local.evictions
+        }
+
+    @staticmethod
+    def get_instance_keys(instance):
+        """
+        Returns the keys of all the entries containing a catalog model instance.
+        """
+        if isinstance(instance, Course):
+            terms = CourseOffering.objects.filter(course_id=instance.pk).values_list('year', 'term_type').distinct()
+            return [CatalogCache.get_course_key(instance.subject, instance.number)] + \
+                [CatalogCache.get_offerings_key(year, term_type) for year, term_type in terms]
+        if isinstance(instance, CourseOffering):
+            return [CatalogCache.get_offerings_key(instance.year, instance.term_type)]
+        if isinstance(instance, Section):
+            return [CatalogCache.get_section_key(instance.crn)]
+        if isinstance(instance, Meeting):
+            return [CatalogCache.get_meetings_key(instance.section_id)]
+        return []
+
+    @staticmethod
+    def get_course_key(subject, number):
+        return 'course:{}:{}'.format(subject, number)
+
+    @staticmethod
+    def get_section_key(crn):
+        return 'section:{}'.format(crn)
+
+    @staticmethod
+    def get_meetings_key(crn):
+        return 'meetings:{}'.format(crn)
+
+    @staticmethod
+    def get_offerings_key(year, term_type):
+        return 'offerings:{}:{}'.format(year, term_type)
@@ -0,0 +1,135 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+import gzip
+import hashlib
+import json
+import threading
+import time
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from plan.models import CatalogVersion
+
+
+class CatalogSnapshot:
+    """
+    The serialized course catalog at a given catalog version, precomputed once and then served as is.
+
+    Catalog versions are stored in the database by `CatalogVersion`, so that every process of a deployment agrees
+    on them. Each version has a scope: `CATALOG` is bumped by the signals of `plan.signals` on every write to a
+    `Course`, `CourseOffering`, `Section` or `Meeting`, and `COURSES` only on writes to a `Course`, for the
+    indexes built from the courses alone. A version is bumped within the transaction of the write, so that it
+    becomes visible to the other processes along with the data it covers, and is undone if the write is rolled
+    back. New versions are derived from the current time, so that a version undone by a rollback, whose caches
+    may still be held by a process, is never reused.
+
+    Outside of a transaction, versions are read from the database at most once per `VERSION_TTL` seconds
+    (the 'VERSION_TTL' entry of the `PLAN_CACHE` setting, 1 by default) by each process, which bounds how long
+    the other processes serve data older than a write. As long as the version is unchanged, the snapshot is
+    reused, and a client presenting its ETag is answered without touching the database.
+    """
+
+    CATALOG = 'catalog'
+    COURSES = 'courses'
+
+    _snapshot = None
+    _lock = threading.Lock()
+
+    # The versions read by this process, by scope, as (version, expiry time) pairs
+    _versions = {}
+
+    __slots__ = ('version', 'etag', 'content', 'compressed_content')
+
+    def __init__(self, version, content):
+        """
+        Args:
+            version: The catalog version the content was built at
+            content: The UTF-8 encoded JSON document
+        """
+        self.version = version
+        self.etag = '"{}-{}"'.format(version, hashlib.sha1(content).hexdigest()[:16])
+        self.content = content
+        self.compressed_content = gzip.compress(content)
+
+    @staticmethod
+    def get_version(scope=CATALOG):
+        """
+        Returns the current version of a scope. Within a transaction, the version is always read from the
+        database, so that the versions bumped by the transaction itself are seen.
+        """
+        connection = transaction.get_connection()
+        if not connection.in_atomic_block:
+            entry = CatalogSnapshot._versions.get(scope)
+            if entry is not None and entry[1] > time.monotonic():
+                return entry[0]
+
+        version = CatalogVersion.objects.filter(scope=scope).values_list('version', flat=True).first()
+        if version is None:
+            version = CatalogVersion.objects.get_or_create(
+                scope=scope, defaults={'version': CatalogSnapshot._get_next_version(0)})[0].version
+
+        if not connection.in_atomic_block:
+            ttl = getattr(settings, 'PLAN_CACHE', {}).get('VERSION_TTL', 1)
+            CatalogSnapshot._versions[scope] = (version, time.monotonic() + ttl)
+        return version
+
+    @staticmethod
+    def bump_version(scope=CATALOG):
+        """
+        Changes the version of a scope within the current transaction. Returns the previous version, None if
+        there was none, and the new version, between which no other process can change the version.
+        """
+        with transaction.atomic(savepoint=False):
+            previous = CatalogVersion.objects.select_for_update().filter(scope=scope) \
+                .values_list('version', flat=True).first()
+            version = CatalogSnapshot._get_next_version(previous or 0)
+            if previous is None:
+                CatalogVersion.objects.create(scope=scope, version=version)
+            else:
+                CatalogVersion.objects.filter(scope=scope).update(version=version)
+
+        # The version read by this process is outdated once the transaction commits
+        CatalogSnapshot._versions.pop(scope, None)
+        transaction.on_commit(lambda: CatalogSnapshot._versions.pop(scope, None))
+        return previous, version
+
+    @staticmethod
+    def _get_next_version(version):
+        return max(version + 1, int(time.time() * 1000000))
+
+    @staticmethod
+    def get_instance(build_document):
+        """
+        Returns the snapshot of the current catalog version, building it if needed.
+
+        Args:
+            build_document: A callable returning the JSON-serializable document to serve
+        """
+        version = CatalogSnapshot.get_version()
+        snapshot = CatalogSnapshot._snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+
+        with CatalogSnapshot._lock:
+            snapshot = CatalogSnapshot._snapshot
+            if snapshot is None or snapshot.version != version:
+                content = json.dumps(build_document(), cls=DjangoJSONEncoder, separators=(',', ':'))
+                snapshot = CatalogSnapshot(version, content.encode('utf-8'))
+                CatalogSnapshot._snapshot = snapshot
+
+        return snapshot
+
+    def is_not_modified(self, request):
+        """
+        Returns True if the request's If-None-Match header contains the snapshot's ETag.
+        """
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is None:
+            return False
+
+        etags = [etag.strip() for etag in if_none_match.split(',')]
+        return '*' in etags or self.etag in etags or 'W/' + self.etag in etags
+
+    def accepts_gzip(self, request):
+        return 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
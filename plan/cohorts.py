@@ -0,0 +1,235 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+import numpy as np
+from plan.expressions import ConditionType, ExpressionFactory, ExpressionType, RequisiteType
+from plan.models import Course, Term, TermCourse
+from plan.snapshots import SequenceSnapshot
+
+
+class CourseIndex:
+    """
+    Assigns every course of the catalog a dense integer index, used as its bit position in a `CohortBitmap`.
+    """
+
+    def __init__(self, course_codes, course_ids=None):
+        """
+        Args:
+            course_codes: The course codes (e.g 'CSC 225'), in index order
+            course_ids: The primary keys of the courses, in the same order, if they are known
+        """
+        self.course_codes = list(course_codes)
+        self.positions = {course_code: position for position, course_code in enumerate(self.course_codes)}
+        self.id_positions = {} if course_ids is None else \
+            {course_id: position for position, course_id in enumerate(course_ids)}
+
+    @staticmethod
+    def from_catalog():
+        rows = list(Course.objects.order_by('id').values_list('id', 'subject', 'number'))
+        return CourseIndex([SequenceSnapshot.get_course_code(subject, number) for _, subject, number in rows],
+                           [course_id for course_id, _, _ in rows])
+
+    def get_position(self, course_code):
+        return self.positions.get(course_code)
+
+    def __len__(self):
+        return len(self.course_codes)
+
+
+class CohortBitmap:
+    """
+    The completed courses of a cohort of students, encoded as two bit arrays of shape (students, courses)
+    packed eight courses per byte:
+
+      - `before_target`: courses completed in a term earlier than the student's target term
+      - `through_target`: courses completed in the target term or earlier
+
+    These are exactly the two questions a prerequisite and a corequisite course expression ask, so each
+    course expression is answered for every student at once by extracting a single bit column.
+    """
+
+    def __init__(self, course_index, before_target, through_target):
+        self.course_index = course_index
+        self.before_target = before_target
+        self.through_target = through_target
+
+    @property
+    def student_count(self):
+        return self.before_target.shape[0]
+
+    @staticmethod
+    def from_entries(course_index, student_count, students, positions, ordinals, target_ordinals):
+        """
+        Builds the bitmap from parallel arrays describing every (student, course) entry of the cohort.
+
+        Args:
+            course_index: The `CourseIndex` used to assign bit positions
+            student_count: The number of students in the cohort
+            students: The row of the student for each entry
+            positions: The course index position for each entry
+            ordinals: The term ordinal in which the course was completed for each entry
+            target_ordinals: An array with the target term ordinal of each student
+        """
+        students = np.asarray(students, dtype=np.int64)
+        positions = np.asarray(positions, dtype=np.int64)
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        target_ordinals = np.asarray(target_ordinals, dtype=np.int64)
+
+        shape = (student_count, (len(course_index) + 7) // 8)
+        before_target = np.zeros(shape, dtype=np.uint8)
+        through_target = np.zeros(shape, dtype=np.uint8)
+
+        columns = positions >> 3
+        bits = (0x80 >> (positions & 7)).astype(np.uint8)
+        targets = target_ordinals[students]
+
+        before = ordinals < targets
+        np.bitwise_or.at(before_target, (students[before], columns[before]), bits[before])
+        through = ordinals <= targets
+        np.bitwise_or.at(through_target, (students[through], columns[through]), bits[through])
+
+        return CohortBitmap(course_index, before_target, through_target)
+
+    @staticmethod
+    def from_snapshots(course_index, snapshots):
+        """
+        Builds the bitmap from a list of `SequenceSnapshot`, one per student.
+        """
+        students, positions, ordinals = [], [], []
+        for student, snapshot in enumerate(snapshots):
+            for course_code, ordinal in snapshot.course_ordinals.items():
+                position = course_index.get_position(course_code)
+                if position is not None:
+                    students.append(student)
+                    positions.append(position)
+                    ordinals.append(ordinal)
+
+        target_ordinals = [-1 if snapshot.target_ordinal is None else snapshot.target_ordinal
+                           for snapshot in snapshots]
+        return CohortBitmap.from_entries(course_index, len(snapshots), students, positions, ordinals,
+                                         target_ordinals)
+
+    @staticmethod
+    def from_sequences(course_index, sequence_ids):
+        """
+        Builds the bitmap for many `Sequence` at once with two queries, targeting the latest term of each.
+        The course index must have been built with `CourseIndex.from_catalog`, and the courses created since
+        are left out, as those missing from the index are by `from_snapshots`.
+
+        Args:
+            sequence_ids: The primary keys of the sequences, in student row order
+        """
+        rows = {sequence_id: row for row, sequence_id in enumerate(sequence_ids)}
+
+        target_ordinals = np.full(len(rows), -1, dtype=np.int64)
+        for sequence_id, year, term_type in Term.objects.filter(user__in=rows.keys()) \
+                .values_list('user_id', 'year', 'term_type').iterator():
+            row = rows[sequence_id]
+            target_ordinals[row] = max(target_ordinals[row], SequenceSnapshot.get_term_ordinal(year, term_type))
+
+        students, positions, ordinals = [], [], []
+        for sequence_id, course_id, year, term_type in TermCourse.objects.filter(term__user__in=rows.keys()) \
+                .values_list('term__user_id', 'course_id', 'term__year', 'term__term_type').iterator():
+            position = course_index.id_positions.get(course_id)
+            if position is not None:
+                students.append(rows[sequence_id])
+                positions.append(position)
+                ordinals.append(SequenceSnapshot.get_term_ordinal(year, term_type))
+
+        return CohortBitmap.from_entries(course_index, len(rows), students, positions, ordinals, target_ordinals)
+
+    def get_column(self, course_code, requisite_type):
+        """
+        Returns a boolean vector indicating, for each student, if the course satisfies a requisite of the
+        given type.
+        """
+        position = self.course_index.get_position(course_code)
+        if position is None:
+            return np.zeros(self.student_count, dtype=bool)
+
+        plane = self.before_target if requisite_type == RequisiteType.PREREQUISITE else self.through_target
+        return ((plane[:, position >> 3] >> (7 - (position & 7))) & 1).astype(bool)
+
+
+class CohortEvaluator:
+    """
+    Evaluates requisite expressions against every student of a `CohortBitmap` in a single pass, with every
+    node of the expression tree computed as a vectorized boolean operation over all the students.
+    """
+
+    def __init__(self, cohort):
+        self.cohort = cohort
+
+        self._evaluators = {
+            ExpressionType.COURSE: self._evaluate_course,
+            ExpressionType.CONDITIONAL: self._evaluate_conditional,
+            ExpressionType.LIST: self._evaluate_list,
+            ExpressionType.REGISTRATION_RESTRICTION: self._evaluate_registration_restriction
+        }
+
+    def evaluate_expression(self, expression, node_status=None, path='0'):
+        """
+        Evaluates an expression for the whole cohort.
+
+        Args:
+            expression: A compiled `Expression`
+            node_status: If set, a list to which the status of every node is appended, in evaluation order
+            path: The position of the expression within its tree, used to identify nodes in `node_status`
+        Returns:
+            (numpy.ndarray): A boolean vector, true for the students satisfying the expression
+        """
+        satisfied = self._evaluators[expression.expression_type](expression, node_status, path)
+
+        if node_status is not None:
+            node_status.append({
+                'path': path,
+                'expression_type': expression.expression_type.value,
+                'message': expression.message,
+                'satisfied': satisfied
+            })
+
+        return satisfied
+
+    def evaluate_requirements(self, requirements):
+        """
+        Evaluates a requirement document of the form {'expressions': [...]}, as stored on `Program` and
+        `Course`, all of which must be satisfied.
+
+        Returns:
+            (dict): 'satisfied', a boolean vector with the overall status of each student; 'unsatisfied',
+            the row indices of the students who do not satisfy the requirements; and 'nodes', the status
+            vector of every node of every expression
+        """
+        satisfied = np.ones(self.cohort.student_count, dtype=bool)
+        node_status = []
+
+        for index, json_data in enumerate((requirements or {}).get('expressions', [])):
+            expression = ExpressionFactory.build_and_get_expression(json_data)
+            satisfied &= self.evaluate_expression(expression, node_status, str(index))
+
+        return {
+            'satisfied': satisfied,
+            'unsatisfied': np.flatnonzero(~satisfied),
+            'nodes': node_status
+        }
+
+    def _evaluate_course(self, expression, node_status, path):
+        return self.cohort.get_column(expression.course_code, expression.requisite_type)
+
+    def _evaluate_conditional(self, expression, node_status, path):
+        satisfied_one = self.evaluate_expression(expression.expression_one, node_status, path + '.0')
+        satisfied_two = self.evaluate_expression(expression.expression_two, node_status, path + '.1')
+
+        if expression.condition == ConditionType.OR:
+            return satisfied_one | satisfied_two
+        return satisfied_one & satisfied_two
+
+    def _evaluate_list(self, expression, node_status, path):
+        satisfied_expressions = np.zeros(self.cohort.student_count, dtype=np.int32)
+        for index, child in enumerate(expression.expressions):
+            satisfied_expressions += self.evaluate_expression(child, node_status, '{}.{}'.format(path, index))
+
+        return expression.is_threshold_met(satisfied_expressions)
+
+    def _evaluate_registration_restriction(self, expression, node_status, path):
+        return ~self.evaluate_expression(expression.expression, node_status, path + '.0')
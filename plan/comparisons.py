@@ -0,0 +1,186 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+import numpy as np
+from plan.coordinators import ScheduleCoordinator
+from plan.models import Schedule, ScheduleSection
+
+
+class ScheduleComparison:
+    """
+    The metrics of every schedule a user keeps for a term, computed for all of them at once to compare them side
+    by side. The metrics, in the order of `METRICS`, are:
+
+      - credits: The total credits of the courses of the schedule, each course counted once
+      - contact_hours: The total weekly hours of lectures, labs and tutorials of the courses of the schedule
+      - days_on_campus: The number of days of the week with at least one meeting
+      - gap_minutes: The total weekly minutes between two meetings of the same day
+      - earliest_start: The earliest start of a meeting, in minutes of the day, or None without any meeting
+      - latest_end: The latest end of a meeting, in minutes of the day, or None without any meeting
+      - conflicts: The number of pairs of sections of the schedule with conflicting meetings
+
+    Courses are held in arrays with an entry per (schedule, course), and meetings in arrays with an entry per
+    (schedule, meeting), from which each metric is computed for every schedule by a single vectorized operation
+    grouped by schedule row. Gaps are computed over the meetings of each day of the week sorted by start, and
+    conflicts are found by comparing all the pairs of meetings at once, those which may conflict being checked
+    exactly with `MeetingRecord.does_meeting_conflict`.
+    """
+
+    METRICS = ('credits', 'contact_hours', 'days_on_campus', 'gap_minutes', 'earliest_start', 'latest_end',
+               'conflicts')
+    FRACTIONAL_METRICS = ('credits', 'contact_hours')
+
+    MINUTES_PER_DAY = 24 * 60
+    DAYS_PER_WEEK = 7
+
+    def __init__(self, schedules, schedule_crns, courses, records):
+        """
+        Args:
+            schedules: The `Schedule` compared, in row order
+            schedule_crns: The sorted CRNs of the sections of each schedule, in row order
+            courses: A list of (row, credits, contact hours) tuples, one per course of each schedule
+            records: A list of (row, `MeetingRecord`) tuples, one per meeting of each schedule
+        """
+        self.schedules = schedules
+        self.schedule_crns = schedule_crns
+        self.records = [record for _, record in records]
+
+        self.course_rows = np.array([row for row, _, _ in courses], dtype=np.int64)
+        self.credits = np.array([credits for _, credits, _ in courses], dtype=np.float64)
+        self.contact_hours = np.array([hours for _, _, hours in courses], dtype=np.float64)
+
+        self.meeting_rows = np.array([row for row, _ in records], dtype=np.int64)
+        self.crns = np.array([record.crn for record in self.records], dtype=np.int64)
+        self.weekdays = np.array([record.weekdays for record in self.records], dtype=np.int64)
+        self.start_minutes = np.array([record.start_minute for record in self.records], dtype=np.int64)
+        self.end_minutes = np.array([record.end_minute for record in self.records], dtype=np.int64)
+        self.start_ordinals = np.array([record.start_ordinal for record in self.records], dtype=np.int64)
+        self.end_ordinals = np.array([record.end_ordinal for record in self.records], dtype=np.int64)
+
+    @staticmethod
+    def from_term(user, year, term_type):
+        """
+        Loads the schedules of a user for a term with one query, and their sections joined to their courses with
+        another. Meetings are read from the index of `ScheduleCoordinator`.
+        """
+        schedules = list(Schedule.objects.filter(user=user, year=year, term=term_type).order_by('name', 'id'))
+        rows = {schedule.id: row for row, schedule in enumerate(schedules)}
+
+        schedule_crns = [[] for _ in schedules]
+        courses = {}
+        for schedule_id, crn, course_id, credits, *hours in ScheduleSection.objects \
+                .filter(schedule__in=list(rows)) \
+                .values_list('schedule_id', 'section_id', 'section__course_offering__course_id',
+                             'section__course_offering__course__credits',
+                             'section__course_offering__course__hours_lectures',
+                             'section__course_offering__course__hours_labs',
+                             'section__course_offering__course__hours_tutorials'):
+            row = rows[schedule_id]
+            schedule_crns[row].append(crn)
+            courses[(row, course_id)] = (row, float(credits), float(sum(hours)))
+
+        crn_rows = {}
+        for row, crns in enumerate(schedule_crns):
+            crns.sort()
+            for crn in crns:
+                crn_rows.setdefault(crn, []).append(row)
+
+        coordinator = ScheduleCoordinator.get_instance(year, term_type)
+        records = [(row, record) for record in coordinator.get_records(list(crn_rows))
+                   for row in crn_rows[record.crn]]
+
+        return ScheduleComparison(schedules, schedule_crns, list(courses.values()), records)
+
+    def get_matrix(self, conflicts=None):
+        """
+        Returns the metrics of every schedule as an array of shape (schedules, metrics), in the order of
+        `METRICS`. Start and end times are NaN for the schedules without any meeting.
+
+        Args:
+            conflicts: The result of `get_conflicts`, if it was already computed
+        """
+        count = len(self.schedules)
+        matrix = np.full((count, len(self.METRICS)), np.nan)
+
+        matrix[:, 0] = np.bincount(self.course_rows, weights=self.credits, minlength=count)
+        matrix[:, 1] = np.bincount(self.course_rows, weights=self.contact_hours, minlength=count)
+
+        weekdays = np.zeros(count, dtype=np.int64)
+        np.bitwise_or.at(weekdays, self.meeting_rows, self.weekdays)
+        matrix[:, 2] = ((weekdays[:, np.newaxis] >> np.arange(self.DAYS_PER_WEEK)) & 1).sum(axis=1)
+
+        matrix[:, 3] = self._get_gap_minutes(count)
+
+        if len(self.records):
+            earliest_start = np.full(count, np.iinfo(np.int64).max)
+            np.minimum.at(earliest_start, self.meeting_rows, self.start_minutes)
+            latest_end = np.full(count, -1)
+            np.maximum.at(latest_end, self.meeting_rows, self.end_minutes)
+
+            has_meetings = latest_end >= 0
+            matrix[has_meetings, 4] = earliest_start[has_meetings]
+            matrix[has_meetings, 5] = latest_end[has_meetings]
+
+        if conflicts is None:
+            conflicts = self.get_conflicts()
+        conflict_rows = np.array([row for row, _, _ in conflicts], dtype=np.int64)
+        matrix[:, 6] = np.bincount(conflict_rows, minlength=count)
+        return matrix
+
+    def get_conflicts(self):
+        """
+        Returns the sorted (row, crn, crn) tuples of the pairs of sections of a schedule with conflicting meetings.
+        """
+        # Pairs of meetings of different sections of the same schedule, on a common day of the week, overlapping
+        # in time and in dates
+        candidates = (self.meeting_rows[:, np.newaxis] == self.meeting_rows) & \
+                     (self.crns[:, np.newaxis] < self.crns) & \
+                     ((self.weekdays[:, np.newaxis] & self.weekdays) != 0) & \
+                     (self.start_minutes[:, np.newaxis] < self.end_minutes) & \
+                     (self.start_minutes < self.end_minutes[:, np.newaxis]) & \
+                     (self.start_ordinals[:, np.newaxis] <= self.end_ordinals) & \
+                     (self.start_ordinals <= self.end_ordinals[:, np.newaxis])
+
+        conflicts = {(int(self.meeting_rows[first]), int(self.crns[first]), int(self.crns[second]))
+                     for first, second in zip(*np.nonzero(candidates))
+                     if self.records[first].does_meeting_conflict(self.records[second])}
+        return sorted(conflicts)
+
+    def to_dict(self):
+        """
+        Returns the comparison as a dictionary with the names of the 'metrics', the 'schedules' compared, each with
+        its sections and conflicting pairs of sections, and the 'matrix' of the metrics of every schedule.
+        """
+        conflicts = self.get_conflicts()
+        schedule_conflicts = [[] for _ in self.schedules]
+        for row, crn, other_crn in conflicts:
+            schedule_conflicts[row].append([crn, other_crn])
+
+        return {
+            'metrics': list(self.METRICS),
+            'schedules': [dict(schedule.to_dict(), crns=crns, conflicts=pairs) for schedule, crns, pairs in
+                          zip(self.schedules, self.schedule_crns, schedule_conflicts)],
+            'matrix': [[None if np.isnan(value) else float(value) if metric in self.FRACTIONAL_METRICS else int(value)
+                        for metric, value in zip(self.METRICS, row)] for row in self.get_matrix(conflicts)]
+        }
+
+    def _get_gap_minutes(self, count):
+        """
+        Returns the total minutes between the meetings of the same day of each schedule.
+        """
+        meetings, days = np.nonzero((self.weekdays[:, np.newaxis] >> np.arange(self.DAYS_PER_WEEK)) & 1)
+        if not len(meetings):
+            return np.zeros(count)
+
+        # Every (schedule, day) is shifted to its own range of minutes, so that sorting and the running latest end
+        # never mix two days
+        days = self.meeting_rows[meetings] * self.DAYS_PER_WEEK + days
+        offsets = days * self.MINUTES_PER_DAY
+        order = np.lexsort((self.start_minutes[meetings], days))
+        days = days[order]
+        starts = (self.start_minutes[meetings] + offsets)[order]
+        ends = np.maximum.accumulate((self.end_minutes[meetings] + offsets)[order])
+
+        gaps = starts[1:] - ends[:-1]
+        same_day = (days[1:] == days[:-1]) & (gaps > 0)
+        return np.bincount(days[1:][same_day] // self.DAYS_PER_WEEK, weights=gaps[same_day], minlength=count)
@@ -0,0 +1,199 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+import datetime
+from plan.utils import DateUtils, Weekday
+
+
+class MeetingRecord:
+    """
+    A compact representation of a `Meeting` used to detect conflicts with plain integer operations: the days
+    of the week as a bitmask (bit `n` set for `Weekday(n)`), the start and end times as minutes of the day,
+    and the start and end dates as ordinals.
+    """
+
+    __slots__ = ('crn', 'weekdays', 'start_minute', 'end_minute', 'start_ordinal', 'end_ordinal')
+
+    def __init__(self, crn, weekdays, start_minute, end_minute, start_ordinal, end_ordinal):
+        self.crn = crn
+        self.weekdays = weekdays
+        self.start_minute = start_minute
+        self.end_minute = end_minute
+        self.start_ordinal = start_ordinal
+        self.end_ordinal = end_ordinal
+
+    # The `Meeting` fields from which a record is built, in constructor order
+    MEETING_FIELDS = ('section_id', 'weekdays', 'start_minute', 'end_minute', 'start_date', 'end_date')
+
+    @staticmethod
+    def from_meeting(meeting):
+        return MeetingRecord(meeting.section_id, meeting.weekdays, meeting.start_minute, meeting.end_minute,
+                             meeting.start_date.toordinal(), meeting.end_date.toordinal())
+
+    @staticmethod
+    def from_queryset(meetings):
+        """
+        Returns the records of a `Meeting` queryset, fetching only the packed fields instead of whole models.
+        """
+        return [MeetingRecord(crn, weekdays, start_minute, end_minute, start_date.toordinal(), end_date.toordinal())
+                for crn, weekdays, start_minute, end_minute, start_date, end_date in
+                meetings.values_list(*MeetingRecord.MEETING_FIELDS)]
+
+    def does_meeting_conflict(self, record):
+        """
+        Returns True if both meetings take place at overlapping times on the same day.
+        """
+        if self.start_minute >= record.end_minute or record.start_minute >= self.end_minute:
+            return False
+
+        start_ordinal = max(self.start_ordinal, record.start_ordinal)
+        end_ordinal = min(self.end_ordinal, record.end_ordinal)
+        if start_ordinal > end_ordinal:
+            return False
+
+        # When the date ranges overlap for less than a week, only the days they share may conflict
+        weekdays = self.weekdays & record.weekdays
+        if end_ordinal - start_ordinal < 6:
+            weekdays &= DateUtils.get_weekday_mask_in_date_range(datetime.date.fromordinal(start_ordinal),
+                                                                 datetime.date.fromordinal(end_ordinal))
+        return weekdays != 0
+
+
+class _IntervalNode:
+    __slots__ = ('start', 'end', 'value', 'max_end', 'height', 'left', 'right')
+
+    def __init__(self, start, end, value):
+        self.start = start
+        self.end = end
+        self.value = value
+        self.max_end = end
+        self.height = 1
+        self.left = None
+        self.right = None
+
+
+class IntervalTree:
+    """
+    An AVL tree of half-open intervals ordered by start, where each node also stores the greatest end of its
+    subtree. Insertion costs O(log n), and finding the m intervals overlapping another costs O(log n + m).
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def insert(self, start, end, value):
+        self.root = self._insert(self.root, _IntervalNode(start, end, value))
+        self.size += 1
+
+    def find_overlapping(self, start, end):
+        """
+        Returns the values of all the intervals overlapping [start, end).
+        """
+        values = []
+        pending = [self.root]
+        while pending:
+            node = pending.pop()
+            if node is None or node.max_end <= start:
+                continue
+
+            if node.start < end and start < node.end:
+                values.append(node.value)
+
+            pending.append(node.left)
+            if node.start < end:
+                pending.append(node.right)
+
+        return values
+
+    def __len__(self):
+        return self.size
+
+    def _insert(self, node, new_node):
+        if node is None:
+            return new_node
+
+        if new_node.start < node.start:
+            node.left = self._insert(node.left, new_node)
+        else:
+            node.right = self._insert(node.right, new_node)
+
+        return self._rebalance(node)
+
+    def _rebalance(self, node):
+        self._update(node)
+        balance = self._get_height(node.left) - self._get_height(node.right)
+
+        if balance > 1:
+            if self._get_height(node.left.left) < self._get_height(node.left.right):
+                node.left = self._rotate_left(node.left)
+            return self._rotate_right(node)
+
+        if balance < -1:
+            if self._get_height(node.right.right) < self._get_height(node.right.left):
+                node.right = self._rotate_right(node.right)
+            return self._rotate_left(node)
+
+        return node
+
+    def _rotate_left(self, node):
+        pivot = node.right
+        node.right = pivot.left
+        pivot.left = node
+        self._update(node)
+        self._update(pivot)
+        return pivot
+
+    def _rotate_right(self, node):
+        pivot = node.left
+        node.left = pivot.right
+        pivot.right = node
+        self._update(node)
+        self._update(pivot)
+        return pivot
+
+    @staticmethod
+    def _get_height(node):
+        return 0 if node is None else node.height
+
+    @staticmethod
+    def _update(node):
+        node.height = 1 + max(IntervalTree._get_height(node.left), IntervalTree._get_height(node.right))
+        node.max_end = node.end
+        if node.left is not None and node.left.max_end > node.max_end:
+            node.max_end = node.left.max_end
+        if node.right is not None and node.right.max_end > node.max_end:
+            node.max_end = node.right.max_end
+
+
+class ConflictIndex:
+    """
+    Indexes the meetings of a schedule in one interval tree per day of the week, keyed by minute of the day,
+    so that the conflicts of a section with k meetings are found in O(k log n).
+    """
+
+    def __init__(self, records=()):
+        self.trees = [IntervalTree() for _ in Weekday]
+        for record in records:
+            self.add_record(record)
+
+    def add_record(self, record):
+        for weekday in range(len(self.trees)):
+            if record.weekdays & (1 << weekday):
+                self.trees[weekday].insert(record.start_minute, record.end_minute, record)
+
+    def find_conflicts(self, records):
+        """
+        Returns the sorted CRNs of all the indexed sections with a meeting conflicting with one of the records.
+        """
+        crns = set()
+        for record in records:
+            for weekday in range(len(self.trees)):
+                if not record.weekdays & (1 << weekday):
+                    continue
+                for indexed_record in self.trees[weekday].find_overlapping(record.start_minute, record.end_minute):
+                    if indexed_record.crn not in crns and indexed_record.crn != record.crn and \
+                            indexed_record.does_meeting_conflict(record):
+                        crns.add(indexed_record.crn)
+
+        return sorted(crns)
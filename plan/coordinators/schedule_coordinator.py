@@ -1,5 +1,329 @@
 #  Copyright (c) 2020. by Anton Nikitenko
 #  All rights reserved.
 
+import datetime
+import threading
+from collections import OrderedDict
+from plan.catalog import CatalogSnapshot
+from plan.conflicts import MeetingRecord
+from plan.models import Meeting, Section
+from plan.timetables import TimetableGenerator
+
+
 class ScheduleCoordinator:
-    pass
+    """
+    An in-memory index of all the sections of a term and their meetings, from which the schedule queries are
+    answered without touching the database.
+
+    Sections are numbered by their position in CRN order, so that a set of sections is a bitset of positions.
+    The week is divided into slots of `SLOT_MINUTES` minutes, and each slot holds the bitset of the sections
+    meeting during it. The sections which may conflict with a set of meetings are the union of the bitsets of
+    the slots the meetings cover, each of which is then checked exactly with `MeetingRecord.does_meeting_conflict`.
+
+    An index is loaded with two queries the first time its term is requested, and loaded again once the catalog
+    version of `CatalogSnapshot` changes, which every process sees after a write to the catalog, including an
+    import. Sections missing from the index are fetched from the database instead.
+    """
+
+    SLOT_MINUTES = 5
+    SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+    DAYS_PER_WEEK = 7
+
+    # The maximum number of terms indexed at once, the least recently loaded being dropped first
+    MAX_TERMS = 8
+
+    # The date range of the records built for times which are busy every week
+    ALL_DATES = (datetime.date.min.toordinal(), datetime.date.max.toordinal())
+
+    _instances = OrderedDict()
+    _instances_lock = threading.Lock()
+
+    def __init__(self, year, term_type, sections, records, version=None):
+        """
+        Args:
+            year: The year of the course offerings
+            term_type: The term of the course offerings ('spring', 'summer' or 'fall')
+            sections: An iterable of (crn, course offering ID, name, section type, course code) tuples
+            records: An iterable of the `MeetingRecord` of every meeting of the sections
+            version: The catalog version the index was loaded at
+        """
+        self.year = year
+        self.term_type = term_type
+        self.version = version
+
+        sections = sorted(sections)
+        self.crns = [section[0] for section in sections]
+        self.positions = {crn: position for position, crn in enumerate(self.crns)}
+        self.sections = sections
+        self.all_sections = (1 << len(self.crns)) - 1
+
+        records_by_position = [[] for _ in self.crns]
+        for record in records:
+            position = self.positions.get(record.crn)
+            if position is not None:
+                records_by_position[position].append(record)
+        self.records = [tuple(section_records) for section_records in records_by_position]
+
+        course_positions = {}
+        for position, section in enumerate(self.sections):
+            course_positions.setdefault(section[4], []).append(position)
+        self.course_sections = {course_code: self._get_bitset(positions) for course_code, positions in
+                                course_positions.items()}
+
+        slot_positions = [[] for _ in range(self.DAYS_PER_WEEK * self.SLOTS_PER_DAY)]
+        for position, section_records in enumerate(self.records):
+            for record in section_records:
+                for slot in self._iter_slots(record):
+                    slot_positions[slot].append(position)
+        self.slot_sections = [self._get_bitset(positions) for positions in slot_positions]
+
+    @staticmethod
+    def from_term(year, term_type, version=None):
+        """
+        Loads the index of the sections offered in a term, with one query for the sections and one for their
+        meetings.
+        """
+        sections = Section.objects.filter(course_offering__year=year, course_offering__term_type=term_type) \
+            .values_list('crn', 'course_offering_id', 'name', 'section_type', 'course_offering__course__subject',
+                         'course_offering__course__number')
+
+        # Course codes are shared by the sections of a course, rather than stored once per section
+        course_codes = {}
+        sections = [(crn, course_offering_id, name, section_type,
+                     course_codes.setdefault((subject, number), subject + " " + number))
+                    for crn, course_offering_id, name, section_type, subject, number in sections]
+
+        records = MeetingRecord.from_queryset(Meeting.objects.filter(
+            section__course_offering__year=year, section__course_offering__term_type=term_type).order_by('id'))
+
+        return ScheduleCoordinator(year, term_type, sections, records, version)
+
+    @staticmethod
+    def get_instance(year, term_type):
+        """
+        Returns the index of a term for the current catalog version, loading it if needed.
+        """
+        key = (int(year), term_type)
+        version = CatalogSnapshot.get_version()
+
+        instance = ScheduleCoordinator._instances.get(key)
+        if instance is not None and instance.version == version:
+            return instance
+
+        with ScheduleCoordinator._instances_lock:
+            instance = ScheduleCoordinator._instances.get(key)
+            if instance is None or instance.version != version:
+                instance = ScheduleCoordinator.from_term(key[0], term_type, version)
+                ScheduleCoordinator._instances.pop(key, None)
+                ScheduleCoordinator._instances[key] = instance
+                if len(ScheduleCoordinator._instances) > ScheduleCoordinator.MAX_TERMS:
+                    ScheduleCoordinator._instances.popitem(last=False)
+
+        return instance
+
+    @staticmethod
+    def clear_instances():
+        with ScheduleCoordinator._instances_lock:
+            ScheduleCoordinator._instances.clear()
+
+    @staticmethod
+    def get_busy_record(weekdays, start_minute, end_minute):
+        """
+        Returns a record for a time which is busy every week, to be passed to `find_sections`.
+        """
+        return MeetingRecord(None, weekdays, start_minute, end_minute, *ScheduleCoordinator.ALL_DATES)
+
+    def __contains__(self, crn):
+        return crn in self.positions
+
+    def __len__(self):
+        return len(self.crns)
+
+    def get_sections(self, crns, encode_meeting=Meeting.to_dict):
+        """
+        Returns the sections with the given CRNs in CRN order, each as a dictionary combining
+        `Section.to_dict` and `CourseOffering.to_dict`, with the list of its meetings encoded by
+        `encode_meeting`. Sections missing from the index are fetched with two queries.
+        """
+        result = []
+        missing_crns = []
+        for crn in sorted(set(crns)):
+            position = self.positions.get(crn)
+            if position is None:
+                missing_crns.append(crn)
+                continue
+
+            result.append(self._get_section(position, encode_meeting))
+
+        if missing_crns:
+            sections = Section.objects.filter(crn__in=missing_crns) \
+                .select_related('course_offering__course') \
+                .prefetch_related('meeting_set')
+            result.extend(dict(section.to_dict(), **section.course_offering.to_dict(),
+                               meetings=[encode_meeting(meeting) for meeting in section.meeting_set.all()])
+                          for section in sections)
+            result.sort(key=lambda section: section['crn'])
+
+        return result
+
+    def iter_sections(self, crns, encode_meeting=Meeting.to_dict):
+        """
+        Returns an iterator of the sections of `get_sections`, each built as it is read, so that the sections of
+        a whole term are never held in memory at once.
+        """
+        crns = sorted(set(crns))
+        if not all(crn in self.positions for crn in crns):
+            return iter(self.get_sections(crns, encode_meeting))
+        return (self._get_section(self.positions[crn], encode_meeting) for crn in crns)
+
+    def find_sections(self, course_code=None, busy_records=(), schedule_crns=()):
+        """
+        Returns the CRNs of the sections of the term, in CRN order, satisfying all the given criteria.
+
+        Args:
+            course_code: If set, only the sections of this course (e.g 'CSC 225')
+            busy_records: Only the sections without a meeting conflicting with one of these records, such as
+                          those returned by `get_busy_record`
+            schedule_crns: Only the sections outside of the schedule with these CRNs, without a meeting
+                           conflicting with one of its sections
+        """
+        if course_code is not None:
+            sections = self.course_sections.get(course_code, 0)
+        else:
+            sections = self.all_sections
+
+        schedule_records = self.get_records(schedule_crns)
+        if busy_records or schedule_records:
+            sections &= ~self._get_conflicting_sections(sections, list(busy_records) + schedule_records)
+        for crn in schedule_crns:
+            position = self.positions.get(crn)
+            if position is not None:
+                sections &= ~(1 << position)
+
+        return [self.crns[position] for position in self._iter_positions(sections)]
+
+    def find_conflicts(self, crn, crns):
+        """
+        Returns the sorted CRNs of the sections among `crns` with a meeting conflicting with one of the meetings
+        of the section `crn`, as `Schedule.does_section_conflict` does.
+        """
+        candidates = 0
+        for other_crn in crns:
+            position = self.positions.get(other_crn)
+            if position is not None and other_crn != crn:
+                candidates |= 1 << position
+
+        records = self.get_records([crn])
+        conflicting_crns = [self.crns[position] for position in
+                            self._iter_positions(self._get_conflicting_sections(candidates, records))]
+
+        # Sections of the schedule which are not indexed are compared one by one
+        other_records = self.get_records([other_crn for other_crn in crns if other_crn not in self.positions
+                                           and other_crn != crn])
+        conflicting_crns.extend({other.crn for other in other_records
+                                 if any(other.does_meeting_conflict(record) for record in records)})
+        return sorted(conflicting_crns)
+
+    def get_timetable_generator(self, courses):
+        """
+        Returns the `TimetableGenerator` of the sections of a list of (subject, number) tuples, as
+        `TimetableGenerator.from_courses` does.
+        """
+        sections = 0
+        for subject, number in courses:
+            sections |= self.course_sections.get(subject + " " + number, 0)
+
+        groups = OrderedDict()
+        for position in self._iter_positions(sections):
+            crn, course_offering_id, name, section_type, course_code = self.sections[position]
+            groups.setdefault((course_offering_id, section_type), []).append((crn, self.records[position]))
+
+        return TimetableGenerator(list(groups.values()))
+
+    def get_missing_courses(self, courses):
+        """
+        Returns the codes of the courses of a list of (subject, number) tuples which have no section in the term.
+        """
+        return [subject + " " + number for subject, number in courses
+                if not self.course_sections.get(subject + " " + number, 0)]
+
+    def get_records(self, crns):
+        """
+        Returns the meeting records of the sections with the given CRNs, fetching those of the sections missing
+        from the index with a single query.
+        """
+        records = []
+        missing_crns = []
+        for crn in crns:
+            position = self.positions.get(crn)
+            if position is None:
+                missing_crns.append(crn)
+            else:
+                records.extend(self.records[position])
+
+        if missing_crns:
+            records.extend(MeetingRecord.from_queryset(Meeting.objects.filter(section__in=missing_crns)))
+        return records
+
+    def _get_conflicting_sections(self, sections, records):
+        """
+        Returns the bitset of the sections among `sections` with a meeting conflicting with one of the records,
+        other than the sections of the records themselves.
+        """
+        candidates = 0
+        for record in records:
+            for slot in self._iter_slots(record):
+                candidates |= self.slot_sections[slot]
+        candidates &= sections
+
+        conflicting = 0
+        for position in self._iter_positions(candidates):
+            crn = self.crns[position]
+            if any(indexed_record.does_meeting_conflict(record) for indexed_record in self.records[position]
+                   for record in records if record.crn != crn):
+                conflicting |= 1 << position
+        return conflicting
+
+    def _iter_slots(self, record):
+        first_slot = record.start_minute // self.SLOT_MINUTES
+        last_slot = min(-(-record.end_minute // self.SLOT_MINUTES), self.SLOTS_PER_DAY)
+        for weekday in range(self.DAYS_PER_WEEK):
+            if record.weekdays & (1 << weekday):
+                offset = weekday * self.SLOTS_PER_DAY
+                yield from range(offset + first_slot, offset + last_slot)
+
+    @staticmethod
+    def _get_bitset(positions):
+        if not positions:
+            return 0
+        bits = bytearray(max(positions) // 8 + 1)
+        for position in positions:
+            bits[position >> 3] |= 1 << (position & 7)
+        return int.from_bytes(bits, 'little')
+
+    @staticmethod
+    def _iter_positions(bitset):
+        # Reading the binary representation is much faster than clearing the lowest bit of a large integer
+        bits = bin(bitset)[:1:-1]
+        position = bits.find('1')
+        while position >= 0:
+            yield position
+            position = bits.find('1', position + 1)
+
+    def _get_section(self, position, encode_meeting):
+        crn, course_offering_id, name, section_type, course_code = self.sections[position]
+        return {
+            'crn': crn,
+            'course_offering': course_offering_id,
+            'name': name,
+            'section_type': section_type,
+            'course': course_code,
+            'year': self.year,
+            'term_type': self.term_type,
+            'meetings': [encode_meeting(self._get_meeting(record)) for record in self.records[position]]
+        }
+
+    def _get_meeting(self, record):
+        return Meeting(section_id=record.crn, weekdays=record.weekdays, start_minute=record.start_minute,
+                       end_minute=record.end_minute, start_date=datetime.date.fromordinal(record.start_ordinal),
+                       end_date=datetime.date.fromordinal(record.end_ordinal))
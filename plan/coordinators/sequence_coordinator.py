@@ -1,5 +1,567 @@
 #  Copyright (c) 2020. by Anton Nikitenko
 #  All rights reserved.
 
+import heapq
+import itertools
+import operator
+import time
+from functools import reduce
+from django.db.models import Q
+from plan.expressions import ConditionType, ExpressionFactory, ExpressionType, RequisiteType, ThresholdType
+from plan.graph import PrerequisiteGraph
+from plan.models import Course
+from plan.snapshots import SequenceSnapshot
+
+
+class SequencePlan:
+    """
+    A sequence found by `SequenceCoordinator.plan`, giving the courses to take in each term until the program
+    is completed.
+    """
+
+    __slots__ = ('terms', 'term_count', 'optimal', 'nodes', 'duration')
+
+    def __init__(self, terms, term_count, optimal, nodes, duration):
+        """
+        Args:
+            terms: A list of (year, term_type, course codes) tuples in chronological order, one for each term in
+                   which courses are taken
+            term_count: The number of terms from the first term planned to the term completing the program
+            optimal: Whether the program cannot be completed in fewer terms
+            nodes: The number of search nodes explored
+            duration: The duration of the search in seconds
+        """
+        self.terms = terms
+        self.term_count = term_count
+        self.optimal = optimal
+        self.nodes = nodes
+        self.duration = duration
+
+    def to_dict(self):
+        result = {
+            'terms': [{'year': year, 'term_type': term_type, 'courses': course_codes}
+                      for year, term_type, course_codes in self.terms],
+            'term_count': self.term_count,
+            'optimal': self.optimal,
+            'nodes': self.nodes,
+            'duration': self.duration
+        }
+        return result
+
+
 class SequenceCoordinator:
-    pass
+    """
+    Plans the sequence completing the requirements of a program in the fewest terms, given the courses already
+    completed, the maximum credits of each term type, and the term types in which each course is offered. Every
+    course of the sequence must have its requirement satisfied relative to its term, so that prerequisites are
+    taken in an earlier term and corequisites in an earlier term or the same one.
+
+    The search is an A* over the sets of completed courses, where each step takes a set of courses in the next
+    term in which any can be taken. Taking a course only invalidates the requirements which restrict the
+    registration to students who have not completed it, so only the sets to which no other eligible course can be
+    added within the credit cap are considered, unless the course left out is referred to by such a restriction.
+    Terms in which only such courses can be taken may also be skipped. The heuristic is
+    the prerequisite depth of the program, computed as the term depth of `PrerequisiteGraph` but relative to the
+    completed courses, which never overestimates the terms left since it ignores credit caps and seasons. Sets
+    of completed courses already reached in an earlier or the same term are not explored again.
+
+    A greedy sequence, taking courses in order of the length of the chain of requirements they start, is planned
+    first. It bounds the search, and is returned if the search exhausts its time budget or node count before
+    proving a shorter sequence exists.
+    """
+
+    TERM_OFFERINGS = {1: 'offered_spring', 2: 'offered_summer', 3: 'offered_fall'}
+    DEFAULT_CREDIT_CAPS = {1: 7.5, 2: 0, 3: 7.5}
+
+    def __init__(self, expressions, courses, completed=(), credit_caps=None):
+        """
+        Args:
+            expressions: The compiled requirement expressions of the program, all of which must be satisfied
+            courses: The `Course` instances which may be taken, including those required by other courses
+            completed: The codes of the courses already completed
+            credit_caps: A dictionary mapping each `Term.term_type` to the maximum credits of a term of that type,
+                         where term types with no credits are never planned
+        """
+        self.expressions = tuple(expressions)
+        self.completed = frozenset(completed)
+        self.credit_caps = {term_type: float(cap) for term_type, cap in
+                            (credit_caps if credit_caps is not None else self.DEFAULT_CREDIT_CAPS).items() if cap}
+        if not self.credit_caps:
+            raise ValueError('At least one term type must allow credits.')
+
+        # Courses which can never be taken are left out, so that the requirements referring to them are unsatisfiable
+        courses = [course for course in courses if str(course) not in self.completed and any(
+            getattr(course, self.TERM_OFFERINGS[term_type]) and float(course.credits) <= cap
+            for term_type, cap in self.credit_caps.items())]
+        course_expressions = {str(course): tuple(ExpressionFactory.build_and_get_expression(json_data) for json_data
+                                                 in (course.requirement or {}).get('expressions', []))
+                              for course in courses}
+
+        # Courses leading to no course of the program are never taken, and the others are ordered by the length of
+        # the longest chain of requirements they start, which is the order in which they are taken
+        chain_lengths = self._get_chain_lengths(
+            course_expressions, ExpressionFactory.get_course_codes(self.expressions, include_restrictions=False))
+        courses = sorted((course for course in courses if chain_lengths[str(course)]),
+                         key=lambda course: (-chain_lengths[str(course)], str(course)))
+
+        self.course_codes = [str(course) for course in courses]
+        self.positions = {course_code: position for position, course_code in enumerate(self.course_codes)}
+        self.credits = [float(course.credits) for course in courses]
+        self.term_types = [frozenset(term_type for term_type in self.credit_caps if
+                                     getattr(course, self.TERM_OFFERINGS[term_type])) for course in courses]
+        self.course_expressions = [course_expressions[course_code] for course_code in self.course_codes]
+        self.depth_order, self.is_acyclic = self._get_depth_order()
+
+        # The courses whose requirement contains a registration restriction may have it invalidated by taking the
+        # blocking courses it refers to, so that neither is assumed to be better taken as early as possible
+        self.restricted = frozenset(position for position, expressions in enumerate(self.course_expressions)
+                                    if self._get_restriction_course_codes(expressions) is not None)
+        restriction_course_codes = set(self._get_restriction_course_codes(self.expressions) or ())
+        for expressions in self.course_expressions:
+            restriction_course_codes.update(self._get_restriction_course_codes(expressions) or ())
+        self.blocking = frozenset(self.positions[course_code] for course_code in restriction_course_codes
+                                  if course_code in self.positions)
+
+        self._remaining = {}
+
+    @staticmethod
+    def from_program(program, completed=(), credit_caps=None):
+        """
+        Builds the coordinator of a `Program`, with the courses it refers to and all the courses they require,
+        loaded with a single query.
+        """
+        expressions = [ExpressionFactory.build_and_get_expression(json_data) for json_data in
+                       (program.requirements or {}).get('expressions', [])]
+
+        graph = PrerequisiteGraph.get_instance()
+        course_codes = set(ExpressionFactory.get_course_codes(expressions, include_restrictions=False))
+        for course_code in list(course_codes):
+            course_codes.update(graph.get_required_courses(course_code))
+        course_codes.difference_update(completed)
+
+        courses = []
+        if course_codes:
+            courses = list(Course.objects.filter(reduce(operator.or_, (
+                Q(subject=subject, number=number) for subject, number in
+                (course_code.split(' ', 1) for course_code in course_codes)))))
+
+        return SequenceCoordinator(expressions, courses, completed, credit_caps)
+
+    def plan(self, year, term_type, time_budget=2.0, max_nodes=100000, max_terms=24):
+        """
+        Returns the `SequencePlan` completing the program in the fewest terms, starting from the given term, or
+        None if the program cannot be completed within `max_terms` terms, or no sequence was found within the
+        time budget.
+
+        Args:
+            year: The year of the first term to plan
+            term_type: The `Term.term_type` of the first term to plan
+            time_budget: The maximum duration of the search in seconds
+            max_nodes: The maximum number of search nodes to explore
+            max_terms: The maximum number of terms of the sequence
+        """
+        start_time = time.perf_counter()
+        start = SequenceSnapshot.get_term_ordinal(year, term_type)
+        horizon = start + max_terms
+        self._remaining = {}
+
+        # A node is a tuple of the next term ordinal, the completed courses, the parent node, and the term ordinal
+        # and courses of the step from the parent
+        root = (start, 0, None, None, 0)
+
+        cost = self._get_lower_bound(start, 0)
+        if cost is None:
+            return None
+
+        incumbent = self._plan_greedily(root, horizon)
+        upper_bound = incumbent[0] - start if incumbent is not None else max_terms + 1
+
+        counter = itertools.count()
+        queue = [(cost - start, 0, next(counter), root)]
+        reached = {0: start}
+        nodes = 0
+        optimal = True
+
+        while queue:
+            if nodes >= max_nodes or time.perf_counter() - start_time > time_budget:
+                optimal = False
+                break
+
+            cost, _, _, node = heapq.heappop(queue)
+            if cost >= upper_bound:
+                break
+
+            ordinal, completed = node[0], node[1]
+            if reached.get(completed, ordinal) < ordinal:
+                continue
+
+            nodes += 1
+            if self._is_program_satisfied(completed):
+                incumbent = node
+                break
+
+            for child in self._iter_children(node, horizon):
+                child_ordinal, child_completed = child[0], child[1]
+                if reached.get(child_completed, horizon + 1) <= child_ordinal:
+                    continue
+
+                child_cost = self._get_lower_bound(child_ordinal, child_completed)
+                if child_cost is None:
+                    continue
+                child_cost -= start
+                if child_cost >= upper_bound:
+                    continue
+
+                reached[child_completed] = child_ordinal
+                heapq.heappush(queue, (child_cost, -bin(child_completed).count('1'), next(counter), child))
+
+        if incumbent is None:
+            return None
+        return self._get_plan(incumbent, start, optimal, nodes, time.perf_counter() - start_time)
+
+    def _plan_greedily(self, node, horizon):
+        """
+        Returns the node reached by always taking the first set of courses, or None if it does not complete the
+        program within the horizon.
+        """
+        while not self._is_program_satisfied(node[1]):
+            node = next(self._iter_children(node, horizon), None)
+            if node is None:
+                return None
+        return node
+
+    def _iter_children(self, node, horizon):
+        """
+        Yields the nodes reached by taking a set of courses in the first term, from the next term of the node, in
+        which any course can be taken.
+        """
+        completed = node[1]
+
+        for ordinal in range(node[0], horizon):
+            term_type = SequenceSnapshot.get_term(ordinal)[1]
+            cap = self.credit_caps.get(term_type)
+            if cap is None:
+                continue
+
+            offered = [position for position in range(len(self.course_codes)) if not (completed >> position) & 1
+                       and term_type in self.term_types[position] and self.credits[position] <= cap]
+            if not offered:
+                continue
+
+            # A course can only be taken if its requirement is satisfied when the other courses of the pool are taken
+            # along with it, and is ready if it is satisfied by the completed courses alone. A restricted course may
+            # only be satisfied without some of the others, so it is kept and checked with each set instead.
+            pool = offered
+            while pool:
+                pool_snapshot = self._get_snapshot(completed, reduce(operator.or_, (1 << position for position in pool)))
+                eligible = [position for position in pool if position in self.restricted or
+                            self._is_course_satisfied(position, pool_snapshot)]
+                if len(eligible) == len(pool):
+                    break
+                pool = eligible
+            if not pool:
+                continue
+
+            snapshot = self._get_snapshot(completed)
+            ready = {position for position in pool if position not in self.restricted and
+                     self._is_course_satisfied(position, snapshot)}
+
+            # Corequisites may not fit within the credit cap together, in which case the term is skipped, and so is
+            # it when the empty set is one of the sets, as only blocking courses can be taken
+            has_children = False
+            can_skip = False
+            for taken in self._iter_course_sets(completed, pool, ready, cap):
+                if not taken:
+                    can_skip = True
+                    continue
+                has_children = True
+                yield ordinal + 1, completed | taken, node, ordinal, taken
+            if has_children and not can_skip:
+                return
+
+    def _iter_course_sets(self, completed, pool, ready, cap):
+        """
+        Yields the sets of courses of the pool, as bitsets, that can be taken together within the credit cap and
+        to which no other course of the pool can be added, other than a blocking course. The empty set is only
+        yielded if the pool has a blocking course.
+        """
+        def is_satisfied(taken):
+            snapshot = self._get_snapshot(completed, taken)
+            return all(self._is_course_satisfied(position, snapshot) for position in pool
+                       if (taken >> position) & 1 and position not in ready)
+
+        def is_maximal(taken, credits):
+            return not any(not (taken >> position) & 1 and position not in self.blocking and credits + self.credits[position] <= cap and
+                           (position in ready or is_satisfied(taken | (1 << position))) for position in pool)
+
+        # The credits of the courses of the pool from each index, used to abandon sets to which a ready course
+        # left out could still be added
+        has_blocking = not self.blocking.isdisjoint(pool)
+        remaining_credits = list(itertools.accumulate(reversed([self.credits[position] for position in pool])))
+        remaining_credits = remaining_credits[::-1] + [0.0]
+
+        def visit(index, taken, credits, smallest_left_out):
+            if min(cap, credits + remaining_credits[index]) + smallest_left_out <= cap:
+                return
+
+            if index == len(pool):
+                if (taken or has_blocking) and is_satisfied(taken) and is_maximal(taken, credits):
+                    yield taken
+                return
+
+            position = pool[index]
+            if credits + self.credits[position] <= cap:
+                yield from visit(index + 1, taken | (1 << position), credits + self.credits[position],
+                                 smallest_left_out)
+            if position in ready and position not in self.blocking:
+                smallest_left_out = min(smallest_left_out, self.credits[position])
+            yield from visit(index + 1, taken, credits, smallest_left_out)
+
+        return visit(0, 0, 0.0, float('inf'))
+
+    def _get_lower_bound(self, ordinal, completed):
+        """
+        Returns a lower bound of the ordinal of the term following the completion of the program, from the given
+        term and completed courses, or None if the program cannot be completed.
+        """
+        key = (completed, ordinal % 3)
+        if key not in self._remaining:
+            self._remaining[key] = self._get_remaining(ordinal, completed)
+        if self._remaining[key] is None:
+            return None
+
+        # The credits left must also fit in the terms up to the completion of the program
+        depth, credits = self._remaining[key]
+        credits_ordinal = ordinal
+        while credits > 1e-9:
+            credits -= self.credit_caps.get(SequenceSnapshot.get_term(credits_ordinal)[1], 0)
+            credits_ordinal += 1
+        return max(ordinal + depth + 1, credits_ordinal)
+
+    def _get_remaining(self, ordinal, completed):
+        """
+        Returns lower bounds of the number of terms after the given term in which the program is completed, and of
+        the credits of the courses left to take, or None if the program cannot be completed. These only depend on
+        the term type of the given term.
+        """
+        # The depth of a course is the number of terms before the earliest term in which it can be taken, which is
+        # -1 for a completed course. Courses are visited dependencies first, so a single pass is enough unless
+        # there are requisite cycles, in which case depths are lowered until they are stable.
+        depths = [-1 if (completed >> position) & 1 else None for position in range(len(self.course_codes))]
+        changed = True
+        while changed:
+            changed = False
+            for position in self.depth_order:
+                if depths[position] == -1:
+                    continue
+                depth = self._get_depth(self.course_expressions[position], depths, True)
+                if depth is None:
+                    continue
+
+                # Courses are only taken in the terms in which they are offered
+                depth = max(depth, 0)
+                while SequenceSnapshot.get_term(ordinal + depth)[1] not in self.term_types[position]:
+                    depth += 1
+                if depths[position] is None or depth < depths[position]:
+                    depths[position] = depth
+                    changed = not self.is_acyclic
+
+        depth = self._get_depth(self.expressions, depths, False)
+        if depth is None:
+            return None
+
+        credits = [self._get_expression_credits(expression, completed) for expression in self.expressions]
+        return depth, max(credits, default=0)
+
+    def _get_depth(self, expressions, depths, is_requirement):
+        """
+        Returns the depth at which all the expressions are satisfied, or None if they cannot be. A prerequisite of
+        a course requirement adds a term to the depth of its course, unlike that of a program requirement, which is
+        satisfied as soon as the course is completed.
+        """
+        depth = -1
+        for expression in expressions:
+            expression_depth = self._get_expression_depth(expression, depths, is_requirement)
+            if expression_depth is None:
+                return None
+            depth = max(depth, expression_depth)
+        return depth
+
+    def _get_expression_depth(self, expression, depths, is_requirement):
+        if expression.expression_type == ExpressionType.COURSE:
+            if expression.course_code in self.completed:
+                return -1
+            position = self.positions.get(expression.course_code)
+            depth = None if position is None else depths[position]
+            if depth is None:
+                return None
+            return depth + 1 if is_requirement and expression.requisite_type == RequisiteType.PREREQUISITE else depth
+
+        if expression.expression_type == ExpressionType.CONDITIONAL:
+            expression_depths = [self._get_expression_depth(expression.expression_one, depths, is_requirement),
+                                 self._get_expression_depth(expression.expression_two, depths, is_requirement)]
+            if expression.condition == ConditionType.AND:
+                return None if None in expression_depths else max(expression_depths)
+            expression_depths = [depth for depth in expression_depths if depth is not None]
+            return min(expression_depths) if expression_depths else None
+
+        if expression.expression_type == ExpressionType.LIST:
+            required = {
+                ThresholdType.GREATER_THAN_OR_EQUAL: expression.threshold_value,
+                ThresholdType.GREATER_THAN: expression.threshold_value + 1,
+                ThresholdType.EQUAL: expression.threshold_value
+            }.get(expression.threshold_type, 0)
+            if required <= 0:
+                return -1
+
+            expression_depths = sorted(depth for depth in (
+                self._get_expression_depth(child, depths, is_requirement) for child in expression.expressions)
+                if depth is not None)
+            return expression_depths[required - 1] if required <= len(expression_depths) else None
+
+        # A registration restriction never requires any course to be taken
+        return -1
+
+    def _get_expression_credits(self, expression, completed):
+        """
+        Returns a lower bound of the credits of the courses to take to satisfy the expression, ignoring the courses
+        they require. Only the courses of a list are known to be distinct, so that their credits can be added.
+        """
+        if expression.expression_type == ExpressionType.COURSE:
+            if expression.course_code in self.completed:
+                return 0
+            position = self.positions.get(expression.course_code)
+            if position is None:
+                return None
+            return 0 if (completed >> position) & 1 else self.credits[position]
+
+        if expression.expression_type == ExpressionType.CONDITIONAL:
+            credits = [self._get_expression_credits(expression.expression_one, completed),
+                       self._get_expression_credits(expression.expression_two, completed)]
+            if expression.condition == ConditionType.AND:
+                return None if None in credits else max(credits)
+            credits = [course_credits for course_credits in credits if course_credits is not None]
+            return min(credits) if credits else None
+
+        if expression.expression_type == ExpressionType.LIST:
+            required = {
+                ThresholdType.GREATER_THAN_OR_EQUAL: expression.threshold_value,
+                ThresholdType.GREATER_THAN: expression.threshold_value + 1,
+                ThresholdType.EQUAL: expression.threshold_value
+            }.get(expression.threshold_type, 0)
+            if required <= 0:
+                return 0
+
+            if all(child.expression_type == ExpressionType.COURSE for child in expression.expressions):
+                children = {child.course_code: child for child in expression.expressions}.values()
+                credits = sorted(course_credits for course_credits in (
+                    self._get_expression_credits(child, completed) for child in children) if course_credits is not None)
+                return sum(credits[:required]) if required <= len(credits) else None
+
+            credits = sorted(course_credits for course_credits in (
+                self._get_expression_credits(child, completed) for child in expression.expressions)
+                if course_credits is not None)
+            return credits[required - 1] if required <= len(credits) else None
+
+        return 0
+
+    def _get_snapshot(self, completed, taken=0):
+        """
+        Returns a snapshot in which the completed courses precede the target term, and the taken courses are in it.
+        """
+        course_ordinals = dict.fromkeys(self.completed, 0)
+        for position, course_code in enumerate(self.course_codes):
+            if (completed >> position) & 1:
+                course_ordinals[course_code] = 0
+            elif (taken >> position) & 1:
+                course_ordinals[course_code] = 1
+        return SequenceSnapshot(course_ordinals, [0, 1], 1)
+
+    def _is_course_satisfied(self, position, snapshot):
+        return all(expression.evaluate_expression(snapshot).satisfied
+                   for expression in self.course_expressions[position])
+
+    def _is_program_satisfied(self, completed):
+        snapshot = self._get_snapshot(completed)
+        return all(expression.evaluate_expression(snapshot).satisfied for expression in self.expressions)
+
+    def _get_plan(self, node, start, optimal, nodes, duration):
+        terms = []
+        while node[2] is not None:
+            year, term_type = SequenceSnapshot.get_term(node[3])
+            terms.append((year, term_type, sorted(course_code for position, course_code in enumerate(self.course_codes)
+                                                  if (node[4] >> position) & 1)))
+            node = node[2]
+        terms.reverse()
+
+        term_count = SequenceSnapshot.get_term_ordinal(*terms[-1][:2]) - start + 1 if terms else 0
+        return SequencePlan(terms, term_count, optimal, nodes, duration)
+
+    def _get_depth_order(self):
+        """
+        Returns the positions of the courses ordered so that every course follows the courses its requirement
+        refers to, and whether the requirements are free of cycles, in which case the order is complete.
+        """
+        dependencies = [{self.positions[course_code] for course_code in ExpressionFactory.get_course_codes(expressions)
+                         if course_code in self.positions} for expressions in self.course_expressions]
+        dependents = [[] for _ in dependencies]
+        for position, position_dependencies in enumerate(dependencies):
+            for dependency in position_dependencies:
+                dependents[dependency].append(position)
+
+        counts = [len(position_dependencies) for position_dependencies in dependencies]
+        order = [position for position, count in enumerate(counts) if count == 0]
+        for position in order:
+            for dependent in dependents[position]:
+                counts[dependent] -= 1
+                if counts[dependent] == 0:
+                    order.append(dependent)
+
+        if len(order) == len(dependencies):
+            return order, True
+        return order + [position for position, count in enumerate(counts) if count > 0], False
+
+    @staticmethod
+    def _get_restriction_course_codes(expressions):
+        """
+        Returns the codes of the courses referred to by the registration restrictions of the expression trees, or
+        None if they contain no restriction.
+        """
+        course_codes = None
+        pending = list(expressions)
+        while pending:
+            expression = pending.pop()
+            if expression.expression_type == ExpressionType.CONDITIONAL:
+                pending.extend([expression.expression_one, expression.expression_two])
+            elif expression.expression_type == ExpressionType.LIST:
+                pending.extend(expression.expressions)
+            elif expression.expression_type == ExpressionType.REGISTRATION_RESTRICTION:
+                course_codes = (course_codes or set()) | ExpressionFactory.get_course_codes([expression.expression])
+        return course_codes
+
+    @staticmethod
+    def _get_chain_lengths(course_expressions, program_course_codes):
+        """
+        Returns a dictionary mapping each course code to the number of courses of the longest chain of requirements
+        from the course to a course of the program, or 0 if the course leads to none.
+        """
+        dependents = {course_code: set() for course_code in course_expressions}
+        for course_code, expressions in course_expressions.items():
+            for dependency in ExpressionFactory.get_course_codes(expressions, include_restrictions=False):
+                if dependency in dependents:
+                    dependents[dependency].add(course_code)
+
+        chain_lengths = {}
+
+        def visit(course_code):
+            if course_code not in chain_lengths:
+                # Courses in a requisite cycle are counted once
+                chain_lengths[course_code] = 0
+                lengths = [visit(dependent) for dependent in dependents[course_code]]
+                chain_lengths[course_code] = max([length + 1 for length in lengths if length] +
+                                                 [1 if course_code in program_course_codes else 0])
+            return chain_lengths[course_code]
+
+        for course_code in course_expressions:
+            visit(course_code)
+        return chain_lengths
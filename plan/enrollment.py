@@ -0,0 +1,222 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+import threading
+import time
+from collections import OrderedDict
+from enum import Enum
+from django.db import connection
+from plan.catalog import CatalogSnapshot
+from plan.models import Section
+
+
+class EnrollmentStatus(Enum):
+    ENROLLED = 'enrolled'
+    WAITLISTED = 'waitlisted'
+    FULL = 'full'
+
+
+class SeatRecord:
+    """
+    The seat counters of a section. `updates` is the number of updates of the counters made so far, which orders
+    the records returned by concurrent updates.
+    """
+
+    __slots__ = ('crn', 'capacity', 'enrolled', 'waitlist_capacity', 'waitlisted', 'updates')
+
+    # The `Section` fields from which a record is built, in constructor order
+    SECTION_FIELDS = ('crn', 'capacity', 'enrolled', 'waitlist_capacity', 'waitlisted', 'seat_updates')
+
+    def __init__(self, crn, capacity, enrolled, waitlist_capacity, waitlisted, updates):
+        self.crn = crn
+        self.capacity = capacity
+        self.enrolled = enrolled
+        self.waitlist_capacity = waitlist_capacity
+        self.waitlisted = waitlisted
+        self.updates = updates
+
+    def has_seat(self):
+        return self.capacity is None or self.enrolled < self.capacity
+
+    def to_dict(self):
+        return {
+            'crn': self.crn,
+            'capacity': self.capacity,
+            'enrolled': self.enrolled,
+            'seats': None if self.capacity is None else self.capacity - self.enrolled,
+            'waitlist_capacity': self.waitlist_capacity,
+            'waitlisted': self.waitlisted,
+            'full': not self.has_seat()
+        }
+
+
+class SeatCounter:
+    """
+    Updates the seat counters of sections when many students register in the same sections at once.
+
+    Every update is a single conditional UPDATE statement, which checks the capacity, changes a counter relative to
+    its current value and returns the new counters with RETURNING. The database serializes concurrent updates of a
+    section with its row lock, held only for the statement outside of a transaction, so that counters are never
+    read before being written and never exceed their capacity. Requires PostgreSQL, or SQLite 3.35 or later.
+
+    The records returned by the updates are applied to `SeatAvailability`. Updates bypass the `Section` model, so
+    they neither send signals nor change the catalog version.
+    """
+
+    @staticmethod
+    def enroll(crn):
+        """
+        Takes a seat of a section, or a spot on its waitlist if it has no seat left. Returns the `EnrollmentStatus`
+        and the `SeatRecord` of the section, or None if there is no such section.
+        """
+        while True:
+            record = SeatCounter._update(crn, 'enrolled = enrolled + 1', 'capacity IS NULL OR enrolled < capacity')
+            if record is not None:
+                return EnrollmentStatus.ENROLLED, record
+
+            record = SeatCounter._update(crn, 'waitlisted = waitlisted + 1',
+                                         'enrolled >= capacity AND waitlisted < waitlist_capacity')
+            if record is not None:
+                return EnrollmentStatus.WAITLISTED, record
+
+            # A seat may have been freed between both updates, in which case the seat is taken again
+            record = SeatCounter.get_record(crn)
+            if record is None:
+                return None
+            if not record.has_seat():
+                return EnrollmentStatus.FULL, record
+
+    @staticmethod
+    def drop(crn):
+        """
+        Frees a seat of a section. Returns its `SeatRecord`, or None if it has no enrolled student.
+        """
+        return SeatCounter._update(crn, 'enrolled = enrolled - 1', 'enrolled > 0')
+
+    @staticmethod
+    def leave_waitlist(crn):
+        """
+        Frees a spot on the waitlist of a section. Returns its `SeatRecord`, or None if its waitlist is empty.
+        """
+        return SeatCounter._update(crn, 'waitlisted = waitlisted - 1', 'waitlisted > 0')
+
+    @staticmethod
+    def get_record(crn):
+        values = Section.objects.filter(crn=crn).values_list(*SeatRecord.SECTION_FIELDS).first()
+        return SeatRecord(*values) if values is not None else None
+
+    @staticmethod
+    def _update(crn, assignment, condition):
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                UPDATE {section} SET {assignment}, seat_updates = seat_updates + 1
+                WHERE crn = %s AND ({condition})
+                RETURNING {fields}
+            """.format(section=connection.ops.quote_name(Section._meta.db_table), assignment=assignment,
+                       condition=condition, fields=', '.join(SeatRecord.SECTION_FIELDS)), [crn])
+            values = cursor.fetchone()
+
+        if values is None:
+            return None
+        record = SeatRecord(*values)
+        SeatAvailability.apply(record)
+        return record
+
+
+class SeatAvailability:
+    """
+    A read-optimized view of the seat counters of every section of a term, answering availability queries without
+    touching the database.
+
+    A view is loaded with one query the first time its term is requested. It is then refreshed incrementally with
+    the records returned by the updates of `SeatCounter` in this process, a record replacing the one of its section
+    only if it counts more updates, as concurrent updates may return out of order. The updates of other processes
+    are picked up by loading the view again once it is `REFRESH_SECONDS` old, or once the catalog version changes.
+    """
+
+    REFRESH_SECONDS = 5
+
+    # The maximum number of terms viewed at once, the least recently loaded being dropped first
+    MAX_TERMS = 8
+
+    _instances = OrderedDict()
+    _instances_lock = threading.Lock()
+
+    def __init__(self, year, term_type, records, version=None):
+        """
+        Args:
+            year: The year of the course offerings
+            term_type: The term of the course offerings ('spring', 'summer' or 'fall')
+            records: An iterable of the `SeatRecord` of every section of the term
+            version: The catalog version the view was loaded at
+        """
+        self.year = year
+        self.term_type = term_type
+        self.version = version
+        self.records = {record.crn: record for record in records}
+        self.loaded_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def from_term(year, term_type, version=None):
+        records = Section.objects.filter(course_offering__year=year, course_offering__term_type=term_type) \
+            .values_list(*SeatRecord.SECTION_FIELDS)
+        return SeatAvailability(year, term_type, (SeatRecord(*values) for values in records), version)
+
+    @staticmethod
+    def get_instance(year, term_type):
+        """
+        Returns the view of a term, loading it if there is none for the current catalog version or it is too old.
+        """
+        key = (int(year), term_type)
+        version = CatalogSnapshot.get_version()
+
+        instance = SeatAvailability._instances.get(key)
+        if instance is not None and not instance._is_stale(version):
+            return instance
+
+        with SeatAvailability._instances_lock:
+            instance = SeatAvailability._instances.get(key)
+            if instance is None or instance._is_stale(version):
+                previous = instance
+                instance = SeatAvailability.from_term(key[0], term_type, version)
+
+                # Records applied to the previous view while loading may be newer than those loaded
+                if previous is not None and previous.version == version:
+                    for record in list(previous.records.values()):
+                        instance._apply(record)
+
+                SeatAvailability._instances.pop(key, None)
+                SeatAvailability._instances[key] = instance
+                if len(SeatAvailability._instances) > SeatAvailability.MAX_TERMS:
+                    SeatAvailability._instances.popitem(last=False)
+
+        return instance
+
+    @staticmethod
+    def apply(record):
+        """
+        Applies the record returned by an update to the view of the term of its section, if it is loaded.
+        """
+        for instance in list(SeatAvailability._instances.values()):
+            instance._apply(record)
+
+    @staticmethod
+    def clear_instances():
+        with SeatAvailability._instances_lock:
+            SeatAvailability._instances.clear()
+
+    def get_records(self, crns):
+        """
+        Returns the `SeatRecord` of the sections with the given CRNs in CRN order, skipping unknown sections.
+        """
+        return [self.records[crn] for crn in sorted(set(crns)) if crn in self.records]
+
+    def _apply(self, record):
+        with self.lock:
+            current = self.records.get(record.crn)
+            if current is not None and current.updates < record.updates:
+                self.records[record.crn] = record
+
+    def _is_stale(self, version):
+        return self.version != version or time.monotonic() - self.loaded_at >= self.REFRESH_SECONDS
@@ -0,0 +1,309 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+import bisect
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.db.models import F
+from plan.cache import LRUCache, MISSING
+from plan.catalog import CatalogSnapshot
+from plan.expressions import ExpressionFactory
+from plan.models import Sequence, Term, TermCourse
+from plan.snapshots import SequenceSnapshot
+
+
+class SequenceEvaluation:
+    """
+    The requisite status of every course of a sequence, and of the programs evaluated against it, kept up to
+    date as courses are added to and removed from its terms.
+
+    The status of a course only depends on the terms in which the courses referenced by its requirement are
+    first taken, and the status of a program on those referenced by its requirements. Each evaluation records
+    these dependencies, so that adding or removing a course only re-evaluates the courses and programs which
+    reference it, and only when the earliest term in which it is taken changes. The status of a course is that
+    of `Course.evaluate_requirement` relative to its own term, and the status of a program that of
+    `Program.evaluate_requirements` relative to the latest term of the sequence.
+
+    Evaluations are cached per sequence by `get_instance`, for the current catalog version and the version of
+    the sequence, which the signals of `plan.signals` increment within the transaction of every write to its
+    terms and courses, so that an evaluation cached by a process is never used once another process wrote to
+    the sequence. Writes made through `SequenceHandler` are applied incrementally instead, and the evaluation
+    is stored again with `store` at the version of the write.
+    """
+
+    CACHE_SIZE = 1000
+
+    _cache = None
+    _cache_lock = threading.Lock()
+
+    def __init__(self, sequence_id, placements, term_ordinals, version=None, catalog_version=None):
+        """
+        Args:
+            sequence_id: The primary key of the sequence
+            placements: An iterable of (`Course`, term ordinal) pairs, one for each `TermCourse` of the sequence
+            term_ordinals: The ordinals of all the terms of the sequence
+            version: The version of the sequence the placements were read at
+            catalog_version: The catalog version the courses were read at
+        """
+        self.sequence_id = sequence_id
+        self.version = version
+        self.catalog_version = catalog_version
+        self.lock = threading.RLock()
+
+        self.courses = {}
+        self.course_terms = defaultdict(list)
+        self.course_statuses = {}
+        self.course_dependents = defaultdict(set)
+
+        self.programs = {}
+        self.program_statuses = {}
+        self.program_dependents = defaultdict(set)
+
+        placements = list(placements)
+        for course, ordinal in placements:
+            course_code = str(course)
+            self.courses[course_code] = course
+            bisect.insort(self.course_terms[course_code], ordinal)
+
+        self.snapshot = SequenceSnapshot({course_code: ordinals[0] for course_code, ordinals in
+                                          self.course_terms.items()}, term_ordinals)
+
+        for course, ordinal in placements:
+            self._add_course_node(str(course), ordinal)
+
+    @staticmethod
+    def from_sequence(sequence, catalog_version=None):
+        """
+        Evaluates every course of a `Sequence`, with one query for its terms and one for their courses, which are
+        read after `sequence.version`.
+        """
+        term_ordinals = [SequenceSnapshot.get_term_ordinal(year, term_type) for year, term_type in
+                         Term.objects.filter(user=sequence).values_list('year', 'term_type')]
+        placements = [(term_course.course, SequenceSnapshot.get_term_ordinal(term_course.term.year,
+                                                                             term_course.term.term_type))
+                      for term_course in TermCourse.objects.filter(term__user=sequence).select_related('course',
+                                                                                                      'term')]
+        return SequenceEvaluation(sequence.pk, placements, term_ordinals, sequence.version, catalog_version)
+
+    @staticmethod
+    def get_instance(sequence):
+        """
+        Returns the cached evaluation of a `Sequence`, building it if there is none for the current catalog
+        version and the version of the sequence, as it was loaded.
+        """
+        cache = SequenceEvaluation._get_cache()
+        catalog_version = CatalogSnapshot.get_version()
+
+        evaluation = cache.get(sequence.pk)
+        if evaluation is not MISSING and evaluation.catalog_version == catalog_version and \
+                evaluation.version == sequence.version:
+            return evaluation
+
+        evaluation = SequenceEvaluation.from_sequence(sequence, catalog_version)
+        cache.set(sequence.pk, evaluation)
+        return evaluation
+
+    @staticmethod
+    def store(evaluation, version):
+        """
+        Caches an evaluation again once a write to its sequence has been applied to it. The evaluation is only
+        kept if it reflected every write preceding this one, and is otherwise left to be built again.
+
+        Args:
+            evaluation: The evaluation the write was applied to
+            version: The version of the sequence written by the write
+        """
+        with evaluation.lock:
+            if evaluation.version != version - 1:
+                SequenceEvaluation.invalidate(evaluation.sequence_id)
+                return
+            evaluation.version = version
+        SequenceEvaluation._get_cache().set(evaluation.sequence_id, evaluation)
+
+    @staticmethod
+    def bump_version(sequence_id):
+        """
+        Increments the version of a sequence within the current transaction.
+        """
+        Sequence.objects.filter(pk=sequence_id).update(version=F('version') + 1)
+
+    @staticmethod
+    def get_version(sequence_id):
+        return Sequence.objects.filter(pk=sequence_id).values_list('version', flat=True).first()
+
+    @staticmethod
+    def invalidate(sequence_id):
+        SequenceEvaluation._get_cache().delete(sequence_id)
+
+    @staticmethod
+    def _get_cache():
+        if SequenceEvaluation._cache is None:
+            with SequenceEvaluation._cache_lock:
+                if SequenceEvaluation._cache is None:
+                    ttl = getattr(settings, 'PLAN_CACHE', {}).get('TTL', 300)
+                    SequenceEvaluation._cache = LRUCache(SequenceEvaluation.CACHE_SIZE, ttl)
+        return SequenceEvaluation._cache
+
+    def add_course(self, course, year, term_type):
+        """
+        Applies the addition of a course to a term, and returns the status of the courses and programs it
+        changed, as returned by `get_status`.
+        """
+        course_code = str(course)
+        ordinal = SequenceSnapshot.get_term_ordinal(year, term_type)
+
+        with self.lock:
+            self.courses[course_code] = course
+            ordinals = self.course_terms[course_code]
+            if ordinal in ordinals:
+                return self._get_diff([], [], [])
+            bisect.insort(ordinals, ordinal)
+
+            course_nodes, program_nodes = self._update_course_ordinal(course_code)
+            self._add_course_node(course_code, ordinal)
+            return self._get_diff(self._evaluate_courses(course_nodes) + [(course_code, ordinal)],
+                                  [], self._evaluate_programs(program_nodes))
+
+    def remove_course(self, course, year, term_type):
+        """
+        Applies the removal of a course from a term, and returns the status of the courses and programs it
+        changed, as returned by `get_status`.
+        """
+        course_code = str(course)
+        ordinal = SequenceSnapshot.get_term_ordinal(year, term_type)
+
+        with self.lock:
+            ordinals = self.course_terms.get(course_code)
+            if not ordinals or ordinal not in ordinals:
+                return self._get_diff([], [], [])
+            ordinals.remove(ordinal)
+            if not ordinals:
+                del self.course_terms[course_code]
+
+            self._remove_course_node(course_code, ordinal)
+            course_nodes, program_nodes = self._update_course_ordinal(course_code)
+            return self._get_diff(self._evaluate_courses(course_nodes), [(course_code, ordinal)],
+                                  self._evaluate_programs(program_nodes))
+
+    def evaluate_program(self, program):
+        """
+        Evaluates a `Program` and tracks its status from then on. Returns the same result as
+        `Program.evaluate_requirements`.
+        """
+        with self.lock:
+            self._remove_program_node(program.pk)
+            self.programs[program.pk] = program
+            for course_code in self._get_requirement_course_codes(program.requirements):
+                self.program_dependents[course_code].add(program.pk)
+
+            self.program_statuses[program.pk] = program.evaluate_requirements(self.snapshot)
+            return self.program_statuses[program.pk]
+
+    def get_status(self):
+        """
+        Returns the status of every course and program of the evaluation, in the form:
+          - courses: A list of dictionaries with the subject, number, year and term_type of a course, and the
+                     satisfied flag and expression status of its requirement
+          - removed: A list of dictionaries with the subject, number, year and term_type of removed courses
+          - programs: A list of dictionaries with the institution and name of a program, and the satisfied
+                      flag and expression status of its requirements
+        """
+        with self.lock:
+            return self._get_diff(sorted(self.course_statuses), [], sorted(self.program_statuses))
+
+    def _update_course_ordinal(self, course_code):
+        """
+        Updates the earliest term of a course in the snapshot. Returns the course and program nodes which depend
+        on it if it changed, or empty sets if it did not.
+        """
+        ordinals = self.course_terms.get(course_code)
+        ordinal = ordinals[0] if ordinals else None
+
+        if self.snapshot.course_ordinals.get(course_code) == ordinal:
+            return set(), set()
+
+        if ordinal is None:
+            del self.snapshot.course_ordinals[course_code]
+        else:
+            self.snapshot.course_ordinals[course_code] = ordinal
+        return set(self.course_dependents.get(course_code, ())), set(self.program_dependents.get(course_code, ()))
+
+    def _add_course_node(self, course_code, ordinal):
+        for dependency in self._get_requirement_course_codes(self.courses[course_code].requirement):
+            self.course_dependents[dependency].add((course_code, ordinal))
+        self._evaluate_courses([(course_code, ordinal)])
+
+    def _remove_course_node(self, course_code, ordinal):
+        for dependency in self._get_requirement_course_codes(self.courses[course_code].requirement):
+            dependents = self.course_dependents[dependency]
+            dependents.discard((course_code, ordinal))
+            if not dependents:
+                del self.course_dependents[dependency]
+        del self.course_statuses[(course_code, ordinal)]
+
+    def _remove_program_node(self, program_id):
+        program = self.programs.pop(program_id, None)
+        if program is None:
+            return
+
+        for dependency in self._get_requirement_course_codes(program.requirements):
+            dependents = self.program_dependents[dependency]
+            dependents.discard(program_id)
+            if not dependents:
+                del self.program_dependents[dependency]
+        del self.program_statuses[program_id]
+
+    def _evaluate_courses(self, nodes):
+        """
+        Re-evaluates the given course nodes, and returns those whose status changed.
+        """
+        changed = []
+        for course_code, ordinal in nodes:
+            status = self.courses[course_code].evaluate_requirement(
+                self.snapshot.at_term(*SequenceSnapshot.get_term(ordinal)))
+            if self.course_statuses.get((course_code, ordinal)) != status:
+                self.course_statuses[(course_code, ordinal)] = status
+                changed.append((course_code, ordinal))
+        return changed
+
+    def _evaluate_programs(self, program_ids):
+        """
+        Re-evaluates the given programs, and returns those whose status changed.
+        """
+        changed = []
+        for program_id in program_ids:
+            status = self.programs[program_id].evaluate_requirements(self.snapshot)
+            if self.program_statuses[program_id] != status:
+                self.program_statuses[program_id] = status
+                changed.append(program_id)
+        return changed
+
+    @staticmethod
+    def _get_requirement_course_codes(requirement):
+        return ExpressionFactory.get_course_codes(ExpressionFactory.build_and_get_expression(json_data)
+                                                  for json_data in (requirement or {}).get('expressions', []))
+
+    def _get_diff(self, course_nodes, removed_nodes, program_ids):
+        def get_course(course_code, ordinal):
+            course = self.courses[course_code]
+            year, term_type = SequenceSnapshot.get_term(ordinal)
+            return {'subject': course.subject, 'number': course.number, 'year': year, 'term_type': term_type}
+
+        courses = []
+        for course_code, ordinal in sorted(set(course_nodes)):
+            satisfied, expressions = self.course_statuses[(course_code, ordinal)]
+            courses.append(dict(get_course(course_code, ordinal), satisfied=satisfied, expressions=expressions))
+
+        programs = []
+        for program_id in program_ids:
+            program = self.programs[program_id]
+            satisfied, expressions = self.program_statuses[program_id]
+            programs.append({'institution': program.institution, 'name': program.name, 'satisfied': satisfied,
+                             'expressions': expressions})
+
+        return {
+            'courses': courses,
+            'removed': [get_course(course_code, ordinal) for course_code, ordinal in removed_nodes],
+            'programs': programs
+        }
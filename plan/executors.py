@@ -0,0 +1,60 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import AsyncToSync, sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from plan.metrics import RequestMetrics
+
+
+class DatabaseExecutor:
+    """
+    Runs the synchronous handlers of the asynchronous views, which access the database, in a dedicated pool of
+    threads, so that a single ASGI worker serves many concurrent requests while each thread holds at most one
+    database connection. The size of the pool is given by the `PLAN_DATABASE_THREADS` setting, 32 by default,
+    and bounds the number of connections opened by a worker.
+
+    When the view is itself called from synchronous code, as under WSGI or the test client, the handler runs in
+    the calling thread instead, within its connection and transaction.
+
+    Handlers run within the context of the view, so that their queries are counted in the `RequestMetrics` of
+    the request, and are profiled if it is sampled.
+    """
+
+    _executor = None
+    _executor_lock = threading.Lock()
+
+    @staticmethod
+    async def run(function, *args, **kwargs):
+        """
+        Awaits the result of calling `function` with the given arguments.
+        """
+        if hasattr(AsyncToSync.executors, 'current'):
+            return await sync_to_async(RequestMetrics.call, thread_sensitive=True)(function, *args, **kwargs)
+
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(DatabaseExecutor._get_executor(), functools.partial(
+            contextvars.copy_context().run, DatabaseExecutor._call, function, args, kwargs))
+
+    @staticmethod
+    def _call(function, args, kwargs):
+        # Connections are closed as at the end of a request, unless they are persistent and still usable
+        close_old_connections()
+        try:
+            return RequestMetrics.call(function, *args, **kwargs)
+        finally:
+            close_old_connections()
+
+    @staticmethod
+    def _get_executor():
+        if DatabaseExecutor._executor is None:
+            with DatabaseExecutor._executor_lock:
+                if DatabaseExecutor._executor is None:
+                    DatabaseExecutor._executor = ThreadPoolExecutor(
+                        max_workers=getattr(settings, 'PLAN_DATABASE_THREADS', 32), thread_name_prefix='plan-db')
+        return DatabaseExecutor._executor
@@ -1,6 +1,11 @@
 #  Copyright (c) 2020. by Anton Nikitenko
 #  All rights reserved.
 
+import hashlib
+import json
+import operator
+import threading
+from collections import OrderedDict
 from enum import Enum
 import jsonschema
 from .schemas import *
@@ -24,6 +29,15 @@ class ThresholdType(Enum):
     GREATER_THAN = "gt"
 
 
+THRESHOLD_OPERATORS = {
+    ThresholdType.LESS_THAN: operator.lt,
+    ThresholdType.LESS_THAN_OR_EQUAL: operator.le,
+    ThresholdType.EQUAL: operator.eq,
+    ThresholdType.GREATER_THAN_OR_EQUAL: operator.ge,
+    ThresholdType.GREATER_THAN: operator.gt
+}
+
+
 class ExpressionResultContainer:
 
     def __init__(self):
@@ -64,20 +78,28 @@ class ExpressionType(Enum):
 
 class Expression:
     """
-    This is the parent class of all possible expression types. Ensures by validating the JSON 
-    data that the subclass is indeed a valid expression.
+    This is the parent class of all possible expression types. Expressions are immutable once built, which
+    allows a compiled expression tree to be cached by `ExpressionFactory` and shared between requests.
+
+    The JSON data used to build an expression is expected to have been validated against `REQUISITE_SCHEMA`
+    beforehand, which `ExpressionFactory.build_and_get_expression` does once for the whole document.
     """
     SCHEMA = EXPRESSION_SCHEMA
 
+    __slots__ = ('expression_type', 'message')
+
     def __init__(self, json_data):
-        jsonschema.validate(json_data, Expression.SCHEMA)
+        self._set_attribute('expression_type', ExpressionType(json_data['expression_type']))
+        self._set_attribute('message', json_data.get('message'))
 
-        self.expression_type = ExpressionType(json_data['expression_type'])
+    def _set_attribute(self, name, value):
+        object.__setattr__(self, name, value)
 
-        if 'message' not in json_data:
-            self.message = None
-        else:
-            self.message = json_data['message']
+    def __setattr__(self, name, value):
+        raise AttributeError("'{}' objects are immutable".format(type(self).__name__))
+
+    def __delattr__(self, name):
+        raise AttributeError("'{}' objects are immutable".format(type(self).__name__))
 
 
 class CourseExpression(Expression):
@@ -86,95 +108,84 @@ class CourseExpression(Expression):
     """
     SCHEMA = COURSE_EXPRESSION_SCHEMA
 
+    __slots__ = ('subject', 'number', 'course_code', 'requisite_type')
+
     def __init__(self, json_data):
         """
         Returns an instance of this class that can be used to check if the expression is satisfied. 
 
         Args:
-            json_data: A parsed JSON expression to be validated and used to build the expression 
+            json_data: A parsed and validated JSON expression used to build the expression
         """
-
-        jsonschema.validate(json_data, self.SCHEMA)
-
         super().__init__(json_data)
 
-        self.subject = json_data['subject']
-        self.number = json_data['number']
+        self._set_attribute('subject', json_data['subject'])
+        self._set_attribute('number', json_data['number'])
+        self._set_attribute('course_code', json_data['subject'] + " " + json_data['number'])
 
         if "requisite_type" not in json_data:
-            self.requisite_type = RequisiteType.COREQUISITE
+            self._set_attribute('requisite_type', RequisiteType.COREQUISITE)
         else:
-            self.requisite_type = RequisiteType(json_data["requisite_type"])
+            self._set_attribute('requisite_type', RequisiteType(json_data["requisite_type"]))
 
     @staticmethod
     def build_and_get_expression(json_data):
-        jsonschema.validate(json_data, CourseExpression.SCHEMA)
-        return CourseExpression(json_data)
+        return ExpressionFactory.build_and_get_expression(json_data)
 
-    def evaluate_expression(self, sequence, result_container=None):
+    def evaluate_expression(self, snapshot, result_container=None):
         """
         Determines if the expression, given the sequence, is satisfied
 
         Args:
-            activeTerms: A dictionary containing the list of courses to evaluate
+            snapshot: A `SequenceSnapshot` of the sequence to evaluate
         Returns:
-            (boolean): True if the expression is satisfied, false otherwise
+            (ExpressionResultContainer): The container, with the satisfied flag set for this expression
         """
         if result_container is None:
             result_container = ExpressionResultContainer()
 
-        latest_term = max(list(sequence.terms.all()))
-        sorted_terms = list(sequence.terms.all())
-        sorted_terms.sort()
-
-        for term in sorted_terms:
-            if term.courses.filter(course_code__exact={'subject': self.subject}). \
-                    filter(course_code__exact={'number': self.number}).count() == 1:
+        ordinal = snapshot.get_course_ordinal(self.course_code)
 
-                if (self.requisite_type == RequisiteType.PREREQUISITE) and (
-                        term.year == latest_term.year and term.term_type == latest_term.term_type):
-                    result_container.add_expression_status(self.message, False)
-                    return result_container
-
-                else:
-                    result_container.add_expression_status(self.message, True)
-                    return result_container
+        if ordinal is None:
+            result_container.add_expression_status(self.message, False)
+        elif self.requisite_type == RequisiteType.PREREQUISITE:
+            result_container.add_expression_status(self.message, ordinal < snapshot.target_ordinal)
+        else:
+            result_container.add_expression_status(self.message, ordinal <= snapshot.target_ordinal)
 
-        result_container.add_expression_status(self.message, False)
         return result_container
 
 
 class ConditionalExpression(Expression):
     SCHEMA = CONDITIONAL_EXPRESSION_SCHEMA
 
-    def __init__(self, json_data):
-        jsonschema.validate(json_data, ConditionalExpression.SCHEMA)
+    __slots__ = ('expression_one', 'expression_two', 'condition')
 
+    def __init__(self, json_data):
         super().__init__(json_data)
 
-        self.expression_one = ExpressionFactory.build_and_get_expression(json_data['expression_one'])
-        self.expression_two = ExpressionFactory.build_and_get_expression(json_data['expression_two'])
-        self.condition = ConditionType(json_data['condition'])
+        self._set_attribute('expression_one', ExpressionFactory.lower_expression(json_data['expression_one']))
+        self._set_attribute('expression_two', ExpressionFactory.lower_expression(json_data['expression_two']))
+        self._set_attribute('condition', ConditionType(json_data['condition']))
 
     @staticmethod
     def build_and_get_expression(json_data):
-        jsonschema.validate(json_data, ConditionalExpression.SCHEMA)
-        return ConditionalExpression(json_data)
+        return ExpressionFactory.build_and_get_expression(json_data)
 
-    def evaluate_expression(self, sequence, result_container=None):
+    def evaluate_expression(self, snapshot, result_container=None):
         if result_container is None:
             result_container = ExpressionResultContainer()
 
         if self.condition == ConditionType.OR:
-            if self.expression_one.evaluate_expression(sequence, result_container).satisfied \
-                    or self.expression_two.evaluate_expression(sequence, result_container).satisfied:
+            if self.expression_one.evaluate_expression(snapshot, result_container).satisfied \
+                    or self.expression_two.evaluate_expression(snapshot, result_container).satisfied:
                 result_container.add_expression_status(self.message, True)
             else:
                 result_container.add_expression_status(self.message, False)
 
         elif self.condition == ConditionType.AND:
-            if self.expression_one.evaluate_expression(sequence, result_container).satisfied \
-                    and self.expression_two.evaluate_expression(sequence, result_container).satisfied:
+            if self.expression_one.evaluate_expression(snapshot, result_container).satisfied \
+                    and self.expression_two.evaluate_expression(snapshot, result_container).satisfied:
                 result_container.add_expression_status(self.message, True)
             else:
                 result_container.add_expression_status(self.message, False)
@@ -189,66 +200,58 @@ class ConditionalExpression(Expression):
 class ListExpression(Expression):
     SCHEMA = LIST_EXPRESSION_SCHEMA
 
-    def __init__(self, json_data):
-        jsonschema.validate(json_data, ListExpression.SCHEMA)
+    __slots__ = ('threshold_value', 'threshold_type', 'expressions')
 
+    def __init__(self, json_data):
         super().__init__(json_data)
 
-        self.threshold_value = json_data['threshold_value']
-        self.threshold_type = ThresholdType(json_data['threshold_type'])
-        self.expressions = [ExpressionFactory.build_and_get_expression(expression) for expression in
-                            json_data['expressions']]
+        self._set_attribute('threshold_value', json_data['threshold_value'])
+        self._set_attribute('threshold_type', ThresholdType(json_data['threshold_type']))
+        self._set_attribute('expressions', tuple(ExpressionFactory.lower_expression(expression) for expression in
+                                                 json_data['expressions']))
 
     @staticmethod
     def build_and_get_expression(json_data):
-        jsonschema.validate(json_data, ListExpression.SCHEMA)
-        return ListExpression(json_data)
+        return ExpressionFactory.build_and_get_expression(json_data)
 
-    def evaluate_expression(self, sequence, result_container=None):
+    def evaluate_expression(self, snapshot, result_container=None):
         if result_container is None:
             result_container = ExpressionResultContainer()
 
         satisfied_expressions = len([True for expression in self.expressions if
-                                     expression.evaluate_expressions(sequence, result_container).satisfied])
-
-        if self.threshold_type == ThresholdType.LESS_THAN:
-            result_container.add_expression_status(self.message, satisfied_expressions < self.threshold_value)
-        elif self.threshold_type == ThresholdType.LESS_THAN_OR_EQUAL:
-            result_container.add_expression_status(self.message, satisfied_expressions <= self.threshold_value)
-        elif self.threshold_type == ThresholdType.EQUAL:
-            result_container.add_expression_status(self.message, satisfied_expressions == self.threshold_value)
-        elif self.threshold_type == ThresholdType.GREATER_THAN_OR_EQUAL:
-            result_container.add_expression_status(self.message, satisfied_expressions >= self.threshold_value)
-        elif self.threshold_type == ThresholdType.GREATER_THAN:
-            result_container.add_expression_status(self.message, satisfied_expressions > self.threshold_value)
-        else:
-            # TODO: Raise an exception since this expression CANNOT be evaluated. This is an error.
-            pass
+                                     expression.evaluate_expression(snapshot, result_container).satisfied])
 
+        result_container.add_expression_status(self.message, bool(self.is_threshold_met(satisfied_expressions)))
         return result_container
 
+    def is_threshold_met(self, satisfied_expressions):
+        """
+        Compares the number of satisfied expressions to the threshold. The count may also be a NumPy array,
+        in which case the comparison is done element-wise.
+        """
+        return THRESHOLD_OPERATORS[self.threshold_type](satisfied_expressions, self.threshold_value)
+
 
 class RegistrationRestrictionExpression(Expression):
     SCHEMA = REGISTRATION_RESTRICTION_EXPRESSION_SCHEMA
 
-    def __init__(self, json_data):
-        jsonschema.validate(json_data, RegistrationRestrictionExpression.SCHEMA)
+    __slots__ = ('expression',)
 
+    def __init__(self, json_data):
         super().__init__(json_data)
 
-        self.expression = ExpressionFactory.build_and_get_expression(json_data['expression'])
+        self._set_attribute('expression', ExpressionFactory.lower_expression(json_data['expression']))
 
     @staticmethod
     def build_and_get_expression(json_data):
-        jsonschema.validate(json_data, RegistrationRestrictionExpression.SCHEMA)
-        return RegistrationRestrictionExpression(json_data)
+        return ExpressionFactory.build_and_get_expression(json_data)
 
-    def evaluate_expression(self, sequence, result_container=None):
+    def evaluate_expression(self, snapshot, result_container=None):
         if result_container is None:
             result_container = ExpressionResultContainer()
 
-        result_container.add_expression_status(self.message,
-                                               not self.expression.evaluate_expression(sequence, result_container))
+        result_container.add_expression_status(
+            self.message, not self.expression.evaluate_expression(snapshot, result_container).satisfied)
         return result_container
 
 
@@ -256,6 +259,10 @@ class ExpressionFactory():
     """
     A factory with the mechanism necessary to create expression objects of whatever type is required. The class
     returned from this class may be any child of the `Expression` class
+
+    Requisite documents are compiled once: the JSON is validated against `REQUISITE_SCHEMA` in a single pass,
+    lowered into an immutable expression tree, and cached by a hash of its content. Building the same requisite
+    again returns the cached tree without re-parsing or re-validating it.
     """
 
     EXPRESSION_TYPE_MAP = {
@@ -265,7 +272,80 @@ class ExpressionFactory():
         "REGISTRATION_RESTRICTION": RegistrationRestrictionExpression
     }
 
+    VALIDATOR = jsonschema.Draft7Validator(REQUISITE_SCHEMA)
+
+    CACHE_SIZE = 4096
+    _cache = OrderedDict()
+    _cache_lock = threading.Lock()
+
     @staticmethod
     def build_and_get_expression(json_data):
+        """
+        Returns the compiled expression tree for a requisite JSON document.
+
+        Args:
+            json_data: A parsed JSON expression
+        Returns:
+            (Expression): The root of the immutable expression tree
+        Raises:
+            jsonschema.ValidationError: If the document is not a valid requisite expression
+        """
+        key = ExpressionFactory.get_content_hash(json_data)
+
+        with ExpressionFactory._cache_lock:
+            expression = ExpressionFactory._cache.get(key)
+            if expression is not None:
+                ExpressionFactory._cache.move_to_end(key)
+                return expression
+
+        ExpressionFactory.VALIDATOR.validate(json_data)
+        expression = ExpressionFactory.lower_expression(json_data)
+
+        with ExpressionFactory._cache_lock:
+            ExpressionFactory._cache[key] = expression
+            if len(ExpressionFactory._cache) > ExpressionFactory.CACHE_SIZE:
+                ExpressionFactory._cache.popitem(last=False)
+
+        return expression
+
+    @staticmethod
+    def lower_expression(json_data):
+        """
+        Builds the expression tree for JSON data that has already been validated, without any validation or
+        caching of its own.
+        """
         expression_class = ExpressionFactory.EXPRESSION_TYPE_MAP[json_data['expression_type']]
-        return expression_class.build_and_get_expression(json_data)
+        return expression_class(json_data)
+
+    @staticmethod
+    def get_content_hash(json_data):
+        """
+        Returns a digest of the JSON data which is independent of key ordering.
+        """
+        encoded = json.dumps(json_data, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        return hashlib.sha1(encoded).hexdigest()
+
+    @staticmethod
+    def get_course_codes(expressions, include_restrictions=True):
+        """
+        Returns the codes of all the courses referenced by course expressions in the expression trees, including
+        those within registration restrictions unless `include_restrictions` is False.
+        """
+        course_codes = set()
+        pending = list(expressions)
+        while pending:
+            expression = pending.pop()
+            if expression.expression_type == ExpressionType.COURSE:
+                course_codes.add(expression.course_code)
+            elif expression.expression_type == ExpressionType.CONDITIONAL:
+                pending.extend([expression.expression_one, expression.expression_two])
+            elif expression.expression_type == ExpressionType.LIST:
+                pending.extend(expression.expressions)
+            elif expression.expression_type == ExpressionType.REGISTRATION_RESTRICTION and include_restrictions:
+                pending.append(expression.expression)
+        return frozenset(course_codes)
+
+    @staticmethod
+    def clear_cache():
+        with ExpressionFactory._cache_lock:
+            ExpressionFactory._cache.clear()
@@ -0,0 +1,463 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+import threading
+
+import numpy as np
+from plan.catalog import CatalogSnapshot
+from plan.expressions import ConditionType, ExpressionFactory, ExpressionType, RequisiteType, ThresholdType
+from plan.models import Course
+from plan.snapshots import SequenceSnapshot
+
+
+class PrerequisiteGraph:
+    """
+    A precomputed index of the dependencies between courses, built from the requisite expressions of every
+    course of the catalog.
+
+    Course `A` depends on course `B` if `B` appears in a course expression of the requirement of `A`, outside
+    of a registration restriction. Dependencies and dependents are stored as CSR arrays, and for every course
+    the graph precomputes:
+      - the transitive closure of the courses it requires and of the courses it unlocks, as integer bitsets
+        indexed by course position
+      - the earliest term depth at which it can be taken, where a course without requirements has a depth
+        of 0 and every prerequisite chain adds a term (AND takes the maximum, OR the minimum, and LIST the
+        smallest depth which satisfies its threshold)
+      - the strongly connected components of the graph, which identify requisite cycles
+
+    Updating the requirement of a single course only recomputes the closures and depths of the courses it
+    affects. A full rebuild only happens when the update creates a cycle, or affects a course in one, and when a
+    course is renamed or deleted, or a course which does not exist is no longer referred to. The graph
+    shared by the process is built again by `get_instance` when the courses are written by another process.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, requirements=None):
+        """
+        Args:
+            requirements: A dictionary mapping course codes to requirement documents, as stored in
+                          `Course.requirement`
+        """
+        self._lock = threading.RLock()
+
+        # The version of the courses the graph reflects, if it was built from the catalog
+        self.version = None
+
+        self._load(dict(requirements or {}))
+
+    @staticmethod
+    def from_catalog():
+        """
+        Builds the graph by reading the requirement of every course once, and records the version of the
+        courses it was built at.
+        """
+        version = CatalogSnapshot.get_version(CatalogSnapshot.COURSES)
+        requirements = {SequenceSnapshot.get_course_code(subject, number): requirement for subject, number, requirement
+                        in Course.objects.values_list('subject', 'number', 'requirement').iterator()}
+        graph = PrerequisiteGraph(requirements)
+        graph.version = version
+        return graph
+
+    @staticmethod
+    def get_instance():
+        """
+        Returns the graph of the catalog shared by the process, building it again whenever the courses changed,
+        including by another process.
+        """
+        version = CatalogSnapshot.get_version(CatalogSnapshot.COURSES)
+        graph = PrerequisiteGraph._instance
+        if graph is not None and graph.version == version:
+            return graph
+
+        with PrerequisiteGraph._instance_lock:
+            graph = PrerequisiteGraph._instance
+            if graph is None or graph.version != version:
+                graph = PrerequisiteGraph.from_catalog()
+                PrerequisiteGraph._instance = graph
+            return graph
+
+    @staticmethod
+    def on_course_changed(course_code, requirement, versions, previous_course_code=None, deleted=False):
+        """
+        Keeps the shared graph, if it has been built, up to date with a committed write to a course. The graph
+        is only updated if it reflects every write preceding this one, and is otherwise left to be rebuilt.
+
+        Args:
+            course_code: The code of the course written
+            requirement: The requirement of the course
+            versions: The versions of the courses before and after the write, as returned by `bump_version`
+            previous_course_code: The code the course was stored with before the write, if it was renamed
+            deleted: Whether the course was deleted
+        """
+        previous_version, version = versions
+        graph = PrerequisiteGraph._instance
+        if graph is not None:
+            with graph._lock:
+                if graph.version == previous_version:
+                    if previous_course_code is not None and previous_course_code != course_code:
+                        graph.remove_course(previous_course_code)
+                    if deleted:
+                        graph.remove_course(course_code)
+                    else:
+                        graph.update_course(course_code, requirement)
+                    graph.version = version
+
+    def get_required_courses(self, course_code):
+        """
+        Returns the codes of all the courses that are directly or transitively required by the course.
+        """
+        position = self.positions.get(course_code)
+        return [] if position is None else self._get_course_codes(self.requisite_closure[position])
+
+    def get_unlocked_courses(self, course_code):
+        """
+        Returns the codes of all the courses whose requirements directly or transitively refer to the course.
+        """
+        position = self.positions.get(course_code)
+        return [] if position is None else self._get_course_codes(self.dependent_closure[position])
+
+    def get_term_depth(self, course_code):
+        """
+        Returns the number of terms that must precede the course, or None if the course is unknown, or its
+        requirement cannot be satisfied because of a cycle or an unreachable threshold.
+        """
+        position = self.positions.get(course_code)
+        return None if position is None else self.depths[position]
+
+    def get_minimum_terms(self, course_code):
+        """
+        Returns the minimum number of terms needed to complete the course, starting from an empty sequence.
+        """
+        depth = self.get_term_depth(course_code)
+        return None if depth is None else depth + 1
+
+    def get_cycles(self):
+        """
+        Returns the course codes of every requisite cycle.
+        """
+        return [[self.course_codes[position] for position in component] for component in self.cycles]
+
+    def is_in_cycle(self, course_code):
+        position = self.positions.get(course_code)
+        return position is not None and position in self._cyclic_positions
+
+    def update_course(self, course_code, requirement):
+        """
+        Replaces the requirement of a single course, and incrementally updates the index.
+        """
+        with self._lock:
+            course_count = len(self.course_codes)
+            position = self._get_or_add_position(course_code)
+            expressions = self._compile_requirement(requirement)
+            dependencies = self._get_dependencies(expressions)
+            self._extend_arrays(course_count)
+
+            self.requirements[course_code] = requirement
+            self.expressions[position] = expressions
+            old_dependencies = self.dependencies[position]
+            if dependencies == old_dependencies:
+                self._update_depths([position] + self._get_positions(self.dependent_closure[position]))
+                return
+            # Courses which do not exist are only indexed while referred to, and are dropped by a full rebuild
+            if any(self.course_codes[dependency] not in self.requirements and
+                   all(dependent == position for dependent in self.dependent_indices[
+                       self.dependent_offsets[dependency]:self.dependent_offsets[dependency + 1]])
+                   for dependency in set(old_dependencies).difference(dependencies)):
+                self._load(self.requirements)
+                return
+
+            self.dependencies[position] = dependencies
+            self._splice_dependencies(position, dependencies)
+
+            # Cycles change the strongly connected components, which are only computed by a full rebuild, and
+            # closures are shared by every course of a component
+            descendants = self._get_positions(self.dependent_closure[position])
+            ancestors = self._get_positions(self.requisite_closure[position] | self._get_requisite_closure(position))
+            if any(dependency == position or (self.dependent_closure[position] >> dependency) & 1
+                   for dependency in dependencies) or \
+                    self._cyclic_positions.intersection([position] + descendants + ancestors):
+                self._build()
+                return
+
+            if any(self.ranks[dependency] >= self.ranks[position] for dependency in dependencies):
+                self._build_order()
+
+            affected = sorted([position] + descendants, key=lambda affected_position: self.ranks[affected_position])
+            for affected_position in affected:
+                self.requisite_closure[affected_position] = self._get_requisite_closure(affected_position)
+            self._update_depths(affected)
+
+            ancestors.sort(key=lambda ancestor: self.ranks[ancestor], reverse=True)
+            for ancestor in ancestors:
+                self.dependent_closure[ancestor] = self._get_dependent_closure(ancestor)
+
+    def remove_course(self, course_code):
+        """
+        Removes a deleted or renamed course, which remains indexed as long as other courses refer to it. Positions
+        are not reused, so the whole index is built again.
+        """
+        with self._lock:
+            if course_code in self.requirements:
+                del self.requirements[course_code]
+                self._load(self.requirements)
+
+    def _load(self, requirements):
+        """
+        Indexes the requirements of every course from scratch.
+        """
+        self.requirements = requirements
+        self.course_codes = []
+        self.positions = {}
+        self.expressions = []
+        self.dependencies = []
+
+        for course_code in requirements:
+            self._get_or_add_position(course_code)
+        for course_code, requirement in requirements.items():
+            position = self.positions[course_code]
+            self.expressions[position] = self._compile_requirement(requirement)
+            self.dependencies[position] = self._get_dependencies(self.expressions[position])
+
+        self.dependency_offsets = np.zeros(1, dtype=np.int32)
+        self.dependency_indices = np.zeros(0, dtype=np.int32)
+        self.dependent_offsets = np.zeros(1, dtype=np.int32)
+        self.dependent_indices = np.zeros(0, dtype=np.int32)
+
+        self._build()
+
+    def _build(self):
+        """
+        Rebuilds the CSR arrays, the ordering, the closures and the depths of the whole graph.
+        """
+        course_count = len(self.course_codes)
+        lengths = np.array([len(dependencies) for dependencies in self.dependencies], dtype=np.int32)
+        self.dependency_offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int32)
+        self.dependency_indices = np.fromiter((dependency for dependencies in self.dependencies
+                                               for dependency in dependencies), dtype=np.int32,
+                                              count=int(lengths.sum()))
+        self._build_dependents()
+        self._build_order()
+
+        self.requisite_closure = [0] * course_count
+        self.dependent_closure = [0] * course_count
+        self.depths = [None] * course_count
+
+        for component in self.components:
+            closure = 0
+            for position in component:
+                closure |= self._get_requisite_closure(position)
+            for position in component:
+                self.requisite_closure[position] = closure
+
+        for component in reversed(self.components):
+            closure = 0
+            for position in component:
+                closure |= self._get_dependent_closure(position)
+            for position in component:
+                self.dependent_closure[position] = closure
+
+        for component in self.components:
+            if component[0] not in self._cyclic_positions:
+                self.depths[component[0]] = self._get_course_depth(component[0])
+
+    def _build_dependents(self):
+        course_count = len(self.course_codes)
+        sources = np.repeat(np.arange(course_count, dtype=np.int32), np.diff(self.dependency_offsets))
+        order = np.argsort(self.dependency_indices, kind='stable')
+        self.dependent_indices = sources[order]
+        counts = np.bincount(self.dependency_indices, minlength=course_count)
+        self.dependent_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int32)
+
+    def _build_order(self):
+        """
+        Computes the strongly connected components with Tarjan's algorithm. Components are found in
+        topological order, dependencies first, and every course is ranked by the position of its component.
+        """
+        course_count = len(self.course_codes)
+        offsets, indices = self.dependency_offsets, self.dependency_indices
+
+        index_of = [-1] * course_count
+        low_link = [0] * course_count
+        on_stack = [False] * course_count
+        stack = []
+        components = []
+        counter = 0
+
+        for root in range(course_count):
+            if index_of[root] != -1:
+                continue
+
+            work = [(root, int(offsets[root]))]
+            index_of[root] = low_link[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = True
+
+            while work:
+                position, edge = work[-1]
+                if edge < offsets[position + 1]:
+                    work[-1] = (position, edge + 1)
+                    dependency = int(indices[edge])
+                    if index_of[dependency] == -1:
+                        index_of[dependency] = low_link[dependency] = counter
+                        counter += 1
+                        stack.append(dependency)
+                        on_stack[dependency] = True
+                        work.append((dependency, int(offsets[dependency])))
+                    elif on_stack[dependency]:
+                        low_link[position] = min(low_link[position], index_of[dependency])
+                    continue
+
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low_link[parent] = min(low_link[parent], low_link[position])
+
+                if low_link[position] == index_of[position]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = False
+                        component.append(member)
+                        if member == position:
+                            break
+                    components.append(component)
+
+        self.components = components
+        self.ranks = [0] * course_count
+        for rank, component in enumerate(components):
+            for position in component:
+                self.ranks[position] = rank
+
+        self.cycles = [sorted(component) for component in components
+                       if len(component) > 1 or component[0] in self.dependencies[component[0]]]
+        self._cyclic_positions = {position for component in self.cycles for position in component}
+
+    def _update_depths(self, positions):
+        for position in sorted(positions, key=lambda affected_position: self.ranks[affected_position]):
+            if position not in self._cyclic_positions:
+                self.depths[position] = self._get_course_depth(position)
+
+    def _get_requisite_closure(self, position):
+        closure = 0
+        for dependency in self.dependency_indices[self.dependency_offsets[position]:
+                                                  self.dependency_offsets[position + 1]]:
+            closure |= self.requisite_closure[dependency] | (1 << int(dependency))
+        return closure
+
+    def _get_dependent_closure(self, position):
+        closure = 0
+        for dependent in self.dependent_indices[self.dependent_offsets[position]:self.dependent_offsets[position + 1]]:
+            closure |= self.dependent_closure[dependent] | (1 << int(dependent))
+        return closure
+
+    def _get_course_depth(self, position):
+        depth = 0
+        for expression in self.expressions[position]:
+            expression_depth = self._get_expression_depth(expression)
+            if expression_depth is None:
+                return None
+            depth = max(depth, expression_depth)
+        return depth
+
+    def _get_expression_depth(self, expression):
+        """
+        Returns the earliest term depth at which the expression can be satisfied, or None if it cannot be.
+        """
+        if expression.expression_type == ExpressionType.COURSE:
+            depth = self.depths[self.positions[expression.course_code]]
+            if depth is None:
+                return None
+            return depth + 1 if expression.requisite_type == RequisiteType.PREREQUISITE else depth
+
+        if expression.expression_type == ExpressionType.CONDITIONAL:
+            depths = [self._get_expression_depth(expression.expression_one),
+                      self._get_expression_depth(expression.expression_two)]
+            if expression.condition == ConditionType.AND:
+                return None if None in depths else max(depths)
+            depths = [depth for depth in depths if depth is not None]
+            return min(depths) if depths else None
+
+        if expression.expression_type == ExpressionType.LIST:
+            required = {
+                ThresholdType.GREATER_THAN_OR_EQUAL: expression.threshold_value,
+                ThresholdType.GREATER_THAN: expression.threshold_value + 1,
+                ThresholdType.EQUAL: expression.threshold_value
+            }.get(expression.threshold_type, 0)
+            if required <= 0:
+                return 0
+
+            depths = sorted(depth for depth in map(self._get_expression_depth, expression.expressions)
+                            if depth is not None)
+            return depths[required - 1] if required <= len(depths) else None
+
+        # A registration restriction never requires any course to be taken
+        return 0
+
+    def _get_dependencies(self, expressions):
+        dependencies = set()
+        pending = list(expressions)
+        while pending:
+            expression = pending.pop()
+            if expression.expression_type == ExpressionType.COURSE:
+                dependencies.add(self._get_or_add_position(expression.course_code))
+            elif expression.expression_type == ExpressionType.CONDITIONAL:
+                pending.extend([expression.expression_one, expression.expression_two])
+            elif expression.expression_type == ExpressionType.LIST:
+                pending.extend(expression.expressions)
+        return tuple(sorted(dependencies))
+
+    def _compile_requirement(self, requirement):
+        return tuple(ExpressionFactory.build_and_get_expression(json_data) for json_data in
+                     (requirement or {}).get('expressions', []))
+
+    def _get_or_add_position(self, course_code):
+        position = self.positions.get(course_code)
+        if position is None:
+            position = len(self.course_codes)
+            self.positions[course_code] = position
+            self.course_codes.append(course_code)
+            self.expressions.append(())
+            self.dependencies.append(())
+        return position
+
+    def _extend_arrays(self, course_count):
+        """
+        Adds empty entries for the courses added since the graph had `course_count` courses.
+        """
+        added = len(self.course_codes) - course_count
+        if added == 0:
+            return
+
+        self.dependency_offsets = np.concatenate([self.dependency_offsets,
+                                                  np.repeat(self.dependency_offsets[-1:], added)])
+        self.dependent_offsets = np.concatenate([self.dependent_offsets, np.repeat(self.dependent_offsets[-1:], added)])
+        self.requisite_closure.extend([0] * added)
+        self.dependent_closure.extend([0] * added)
+        self.depths.extend([0] * added)
+
+        # New courses have no dependencies, so ranking them before every other course keeps the order valid
+        self.ranks = [rank + added for rank in self.ranks] + list(range(added))
+        self.components = [[position] for position in range(course_count, len(self.course_codes))] + \
+                          self.components
+
+    def _splice_dependencies(self, position, dependencies):
+        start, end = self.dependency_offsets[position], self.dependency_offsets[position + 1]
+        self.dependency_indices = np.concatenate([self.dependency_indices[:start],
+                                                  np.array(dependencies, dtype=np.int32),
+                                                  self.dependency_indices[end:]])
+        self.dependency_offsets[position + 1:] += len(dependencies) - (end - start)
+        self._build_dependents()
+
+    def _get_positions(self, bitset):
+        positions = []
+        while bitset:
+            lowest = bitset & -bitset
+            positions.append(lowest.bit_length() - 1)
+            bitset ^= lowest
+        return positions
+
+    def _get_course_codes(self, bitset):
+        return sorted(self.course_codes[position] for position in self._get_positions(bitset))
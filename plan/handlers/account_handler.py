@@ -3,6 +3,7 @@
 
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
+from plan.anonymous import AnonymousSequence
 
 
 class AccountHandler:
@@ -30,6 +31,12 @@ class AccountHandler:
         # TODO: Determine what failure conditions to handle
         user = User.objects.create_user(username=username, email=email, password=password)
 
+        # Keep the sequence planned before registering
+        sequence = AnonymousSequence.from_session(request.session)
+        if sequence is not None:
+            sequence.promote(user)
+            AnonymousSequence.delete(request.session)
+
         return True
 
     @staticmethod
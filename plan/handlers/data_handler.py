@@ -1,16 +1,23 @@
 #  Copyright (c) 2020. by Anton Nikitenko
 #  All rights reserved.
 
-from plan.models import Course, Program
+import datetime
+from plan.analytics import TermOccupancy
+from plan.cache import CatalogCache
+from plan.models import Course, CourseOffering, Program
+from plan.search import CourseSearchIndex
 
 
 class DataHandler:
     RESPONSE_BASE = {'success': False, 'message': '', 'data': None}
 
+    # The number of rows fetched at once by the queries of streamed responses
+    STREAM_CHUNK_SIZE = 2000
+
 
 
     @staticmethod
-    def get_course_data(request):
+    def get_course_data(request, stream=False):
         """
         Returns a list of courses corresponding to request parameters 
         provided.
@@ -22,8 +29,12 @@ class DataHandler:
         If 'subject' is undefined, all of the institution's courses will be returned.
         If 'subject' is defined and 'number' undefined, then all courses for that subject will be returned.
 
+        If `stream` is set, lists of courses are returned as iterators reading the courses in chunks as the
+        response is written by `StreamingJsonResponse`.
+
         Args:
           - request: An `HttpRequest` object.
+          - stream: Whether the response is streamed.
         Returns:
           - response: A JSON-serializable object with result.
         """
@@ -34,17 +45,17 @@ class DataHandler:
         number = request.GET.get('number', None)
 
         if subject is None and number is None:
-            response['data'] = [course.to_dict() for course in Course.objects.all()]
-            response['success'] = True
+            return DataHandler.get_course_catalog(stream)
 
         elif subject is not None and number is None:
-            response['data'] = [course.to_dict() for course in Course.objects.filter(course_code__exact={'subject': subject})]
+            courses = Course.objects.filter(subject=subject).order_by('number')
+            response['data'] = DataHandler.__iter_courses(courses) if stream else \
+                [course.to_dict() for course in courses]
             response['success'] = True
 
         elif subject is not None and number is not None:
-            response['data'] = [course.to_dict() for course in
-                      Course.objects.filter(course_code__exact={'subject': subject}).filter(
-                          course_code__exact={'number': number})]
+            course = CatalogCache.get_instance().get_course(subject, number)
+            response['data'] = [course.to_dict()] if course is not None else []
             response['success'] = True
 
         # Invalid request parameters
@@ -53,6 +64,142 @@ class DataHandler:
 
         return response
 
+    @staticmethod
+    def search_courses(request):
+        """
+        Returns the courses best matching a search query, ranked as described in `CourseSearchIndex`, each
+        with its subject, number and name.
+
+        The following parameters are supported by the `request`:
+          - 'q': The search query (e.g 'CSC 2', 'data struct' or 'calculus')
+          - 'limit': The maximum number of courses to return, 20 by default and at most 100
+
+        Args:
+          - request: An `HttpRequest` object.
+        Returns:
+          - response: A JSON-serializable object with result.
+        """
+        response = DataHandler.RESPONSE_BASE.copy()
+
+        # Parameter parsing
+        query = request.GET.get('q', None)
+        limit = request.GET.get('limit', '20')
+
+        if query is None or not limit.isdigit():
+            response['message'] = 'Invalid request parameter values'
+            return response
+
+        response['data'] = CourseSearchIndex.get_instance().search(query, min(int(limit), 100))
+        response['success'] = True
+
+        return response
+
+    @staticmethod
+    def get_course_catalog(stream=False):
+        """
+        Returns all of the institution's courses, ordered by subject and number. This is the document
+        precomputed by `CatalogSnapshot` for each catalog version.
+
+        If `stream` is set, 'data' is an iterator reading the courses in chunks as the response is written, so
+        that the memory used does not grow with the size of the catalog.
+
+        Returns:
+          - response: A JSON-serializable object with result.
+        """
+        response = DataHandler.RESPONSE_BASE.copy()
+        courses = Course.objects.order_by('subject', 'number')
+        response['data'] = DataHandler.__iter_courses(courses) if stream else \
+            [course.to_dict() for course in courses]
+        response['success'] = True
+
+        return response
+
+    @staticmethod
+    def get_offering_data(request, stream=False):
+        """
+        Returns the course offerings of a term, ordered by course code.
+
+        The following parameters must be specified by the `request`:
+          - 'year': Year of the term
+          - 'term_type': Term type ('spring', 'summer' or 'fall')
+
+        If `stream` is set, 'data' is an iterator reading the offerings in chunks as the response is written,
+        rather than the offerings cached by `CatalogCache`.
+
+        Args:
+          - request: An `HttpRequest` object.
+          - stream: Whether the response is streamed.
+        Returns:
+          - response: A JSON-serializable object with result.
+        """
+        response = DataHandler.RESPONSE_BASE.copy()
+
+        # Parameter parsing
+        year = request.GET.get('year', None)
+        term_type = request.GET.get('term_type', None)
+
+        if year is None or not year.isdigit() or term_type not in ('spring', 'summer', 'fall'):
+            response['message'] = 'Invalid request parameter values'
+            return response
+
+        if stream:
+            offerings = CourseOffering.objects.filter(year=int(year), term_type=term_type) \
+                .order_by('course__subject', 'course__number') \
+                .values_list('course__subject', 'course__number', 'year', 'term_type') \
+                .iterator(chunk_size=DataHandler.STREAM_CHUNK_SIZE)
+            response['data'] = ({'course': subject + " " + number, 'year': offering_year, 'term_type': offering_term}
+                                for subject, number, offering_year, offering_term in offerings)
+        else:
+            response['data'] = [offering.to_dict() for offering in
+                                CatalogCache.get_instance().get_offerings(int(year), term_type)]
+        response['success'] = True
+
+        return response
+
+    @staticmethod
+    def get_occupancy_data(request):
+        """
+        Returns the number of sections meeting during each 5 minute slot of each day of the week of a term, as
+        described in `TermOccupancy.to_dict`.
+
+        The following parameters must be specified by the `request`:
+          - 'year': Year of the term
+          - 'term_type': Term type ('spring', 'summer' or 'fall')
+
+        The following parameters are optional:
+          - 'subject': Only the sections of the courses of this subject
+          - 'section_type': Only the sections of this type ('lecture', 'lab' or 'tutorial')
+          - 'date': Only the meetings taking place on this date (e.g '2020-10-05')
+
+        Args:
+          - request: An `HttpRequest` object.
+        Returns:
+          - response: A JSON-serializable object with result.
+        """
+        response = DataHandler.RESPONSE_BASE.copy()
+
+        # Parameter parsing
+        year = request.GET.get('year', None)
+        term_type = request.GET.get('term_type', None)
+        subject = request.GET.get('subject', None)
+        section_type = request.GET.get('section_type', None)
+        date = request.GET.get('date', None)
+
+        if year is None or not year.isdigit() or term_type not in ('spring', 'summer', 'fall'):
+            response['message'] = 'Invalid request parameter values'
+            return response
+
+        try:
+            date = datetime.date.fromisoformat(date) if date is not None else None
+        except ValueError:
+            response['message'] = 'Invalid request parameter values'
+            return response
+
+        response['data'] = TermOccupancy.get_instance(int(year), term_type, subject, section_type, date).to_dict()
+        response['success'] = True
+
+        return response
+
     @staticmethod
     def get_program_data(request):
         """
@@ -78,3 +225,12 @@ class DataHandler:
             response['success'] = True
 
         return response
+
+    @staticmethod
+    def __iter_courses(courses):
+        """
+        Returns an iterator of the `Course.to_dict` of the courses of a queryset, fetching their values in chunks
+        without creating their models.
+        """
+        return map(Course.values_to_dict, courses.values(*Course.DICT_FIELDS)
+                   .iterator(chunk_size=DataHandler.STREAM_CHUNK_SIZE))
@@ -1,8 +1,18 @@
 #  Copyright (c) 2020. by Anton Nikitenko
 #  All rights reserved.
 
+import itertools
+import operator
 from typing import Dict, Union
+from django.db import IntegrityError, transaction
+from plan.cache import CatalogCache
+from plan.comparisons import ScheduleComparison
+from plan.coordinators import ScheduleCoordinator
+from plan.enrollment import SeatAvailability
 from plan.models import ScheduleSection, Section, Schedule, Meeting
+from plan.streaming import StreamedObject
+from plan.timetables import DaysOnCampusScorer, EarlyMorningScorer
+from plan.utils import DateUtils
 
 
 class ScheduleHandler:
@@ -22,17 +32,17 @@ class ScheduleHandler:
         assert year is not None
         assert term is not None
 
-        if request.user.is_authenticated:
-            schedules = Schedule.objects.filter(user=request.user)
-        else:
-            schedules = request.session.get('saved_schedules')
+        if not request.user.is_authenticated:
+            return response
 
-        # Ensure that no schedules with the same name exist
-        if schedules is not None and len(schedules.filter(name=name)) > 0:
+        # Create the schedule, unless one with the same name already exists
+        try:
+            with transaction.atomic():
+                Schedule.objects.create(user=request.user, year=year, term=term, name=name)
+        except IntegrityError:
             response['message'] = 'A schedule with the same name already exists.'
             return response
 
-        schedule = Schedule.objects.create(user=request.user, year=year, term=term, name=name)
         response['success'] = True
 
         # Clean-up
@@ -112,7 +122,10 @@ class ScheduleHandler:
         assert ignore_conflicts is not None
 
         # Fetch section to add.
-        section_to_add = Section.objects.get(crn=crn)
+        section_to_add = CatalogCache.get_instance().get_section(crn)
+        if section_to_add is None:
+            response['message'] = 'No sections with the specified CRN exist.'
+            return response
 
         # Fetch user's schedules
         if request.user.is_authenticated:
@@ -126,20 +139,28 @@ class ScheduleHandler:
             response['message'] = 'No schedules with the specified name exist.'
             return response
 
-        # Ensure that the section is not already present
-        if len(schedule.sections.filter(crn=crn)) > 0:
-            response['message'] = 'A section with the same CRN already exists for the specified schedule.'
-            return response
-
         # Evaluate if the section conflicts with currently added sections
         if not ignore_conflicts:
-            conflict_results = schedule.does_section_conflict(section_to_add)
-            if conflict_results['conflicts']:
-                response['data'] = conflict_results['data']
+            coordinator = ScheduleCoordinator.get_instance(schedule.year, schedule.term)
+            if crn in coordinator:
+                conflicting_crns = coordinator.find_conflicts(crn, ScheduleSection.objects.filter(
+                    schedule=schedule).values_list('section_id', flat=True))
+            else:
+                conflicting_crns = schedule.does_section_conflict(section_to_add)['data']
+
+            if conflicting_crns:
+                response['message'] = 'The section conflicts with sections of the specified schedule.'
+                response['data'] = conflicting_crns
                 return response
 
-        # Add section to schedule
-        schedule.sections.add(section_to_add)
+        # Add section to schedule, unless it is already present
+        try:
+            with transaction.atomic():
+                ScheduleSection.objects.create(schedule=schedule, section=section_to_add)
+        except IntegrityError:
+            response['message'] = 'A section with the same CRN already exists for the specified schedule.'
+            return response
+
         response['success'] = True
 
         # Clean-up
@@ -185,7 +206,8 @@ class ScheduleHandler:
     def get_section(request):
         """
         Returns the sections associated with the specific user and semester including
-        meetings
+        meetings. If the 'encoding' parameter is 'compact', each meeting is encoded as
+        a list of integers, as described in `Meeting.to_compact`.
         :param request:
         :return:
         """
@@ -203,22 +225,19 @@ class ScheduleHandler:
         # TODO: Add more parameter-specific queries
 
         # Fetch the schedule associated with the request
-        schedule = Schedule.objects.filter(user=request.user).get(id=schedule_id)
-
-        # Fetch all sections associated with the schedule
-        sections_references = ScheduleSection.objects.filter(schedule=schedule).values('section')
-        sections = []
-        for section_reference in sections_references:
-            sections.append(Section.objects.get(crn=section_reference["section"]))
-
-        # Fetch the associated course offering and meetings
-        for i in range(len(sections)):
-            section_dict = sections[i].to_dict()
-            section_dict.update(sections[i].course_offering.to_dict())
-            section_dict["meetings"] = [meeting.to_dict() for meeting in Meeting.objects.filter(section=sections[i])]
-            sections[i] = section_dict
-
-        response['data'] = sections
+        try:
+            schedule = Schedule.objects.filter(user=request.user).get(id=schedule_id)
+        except Schedule.DoesNotExist:
+            response['message'] = 'No schedules with the specified ID exist.'
+            return response
+
+        # Read the sections of the schedule and their meetings from the index of its term, so that the number
+        # of queries does not depend on the number of sections
+        crns = ScheduleSection.objects.filter(schedule=schedule).values_list('section_id', flat=True)
+        coordinator = ScheduleCoordinator.get_instance(schedule.year, schedule.term)
+
+        encode_meeting = Meeting.to_compact if request.GET.get('encoding') == 'compact' else Meeting.to_dict
+        response['data'] = coordinator.get_sections(crns, encode_meeting)
         response['success'] = True
 
         # Clean-up
@@ -228,7 +247,9 @@ class ScheduleHandler:
     @staticmethod
     def get_meeting(request):
         """
-        At this point, this method only returns all the meetings associated with a CRN
+        At this point, this method only returns all the meetings associated with a CRN. If the
+        'encoding' parameter is 'compact', each meeting is encoded as a list of integers, as
+        described in `Meeting.to_compact`.
 
         :param request:
         :return:
@@ -239,18 +260,254 @@ class ScheduleHandler:
         crn = int(request.GET.get('crn'))
         assert crn is not None
 
-        # Fetch the section with the corresponding CRN
-        section = Section.objects.get(crn=crn)
+        # Fetch all meetings of the section with the corresponding CRN
+        meetings = CatalogCache.get_instance().get_meetings(crn)
+
+        encode_meeting = Meeting.to_compact if request.GET.get('encoding') == 'compact' else Meeting.to_dict
+        response['data'] = [encode_meeting(meeting) for meeting in meetings]
+        response['success'] = True
+
+        ScheduleHandler.__clean_up(request, None)
+        return response
 
-        # Query all meetings with foreign key
-        meetings = Meeting.objects.filter(section=section)
+    @staticmethod
+    def get_meetings(request, stream=False):
+        """
+        Returns the meetings of many sections at once, grouped by CRN, with a single query. The
+        sections are specified by one of the following parameters:
+          - crns: Comma-separated CRNs of the sections
+          - id: The ID of one of the user's schedules, for all of its sections
+
+        Sections without meetings are omitted. If the 'encoding' parameter is 'compact', each
+        meeting is encoded as a list of integers, as described in `Meeting.to_compact`. If
+        `stream` is set, 'data' is a `StreamedObject` reading the meetings in chunks as the
+        response is written.
+        """
+        response = ScheduleHandler.RESPONSE_BASE.copy()
 
-        response['data'] = [meeting.to_dict() for meeting in meetings]
+        # Parameter parsing
+        crns = request.GET.get('crns')
+        schedule_id = request.GET.get('id')
+
+        try:
+            if crns is not None:
+                sections = [int(crn) for crn in crns.split(',') if crn.strip()]
+            elif schedule_id is not None and request.user.is_authenticated:
+                sections = ScheduleSection.objects.filter(schedule_id=int(schedule_id),
+                                                          schedule__user=request.user).values('section')
+            else:
+                response['message'] = 'Either CRNs or the ID of a schedule must be specified.'
+                return response
+        except ValueError:
+            response['message'] = 'Invalid request parameter values'
+            return response
+
+        meetings = Meeting.objects.filter(section__in=sections).order_by('section_id', 'id')
+        if stream:
+            meetings = meetings.iterator(chunk_size=2000)
+
+        encode_meeting = Meeting.to_compact if request.GET.get('encoding') == 'compact' else Meeting.to_dict
+        groups = ((crn, [encode_meeting(meeting) for meeting in group]) for crn, group in
+                  itertools.groupby(meetings, key=operator.attrgetter('section_id')))
+
+        response['data'] = StreamedObject(groups) if stream else dict(groups)
         response['success'] = True
 
         ScheduleHandler.__clean_up(request, None)
         return response
 
+    @staticmethod
+    def get_seats(request):
+        """
+        Returns the seats of sections of a term, as described in `SeatRecord.to_dict`, from the cached view of
+        `SeatAvailability`, which may lag the updates of other processes by a few seconds. The following
+        parameters are supported:
+          - year: Year of the course offerings
+          - term: Term of the course offerings ('spring', 'summer' or 'fall')
+          - crns: Comma-separated CRNs of the sections
+          - id: The ID of one of the user's schedules, for all of its sections, if 'crns' is not set
+        """
+        response = ScheduleHandler.RESPONSE_BASE.copy()
+
+        # Parameter parsing
+        crns = request.GET.get('crns')
+        schedule_id = request.GET.get('id')
+        term = request.GET.get('term')
+
+        try:
+            year = int(request.GET.get('year'))
+            if crns is not None:
+                crns = [int(crn) for crn in crns.split(',') if crn.strip()]
+            elif schedule_id is not None and request.user.is_authenticated:
+                crns = ScheduleSection.objects.filter(schedule_id=int(schedule_id), schedule__user=request.user) \
+                    .values_list('section_id', flat=True)
+            else:
+                response['message'] = 'Either CRNs or the ID of a schedule must be specified.'
+                return response
+        except (TypeError, ValueError):
+            response['message'] = 'Invalid request parameter values'
+            return response
+        assert term is not None
+
+        response['data'] = [record.to_dict() for record in
+                            SeatAvailability.get_instance(year, term).get_records(crns)]
+        response['success'] = True
+        return response
+
+    @staticmethod
+    def compare_schedules(request):
+        """
+        Returns the comparison of all the logged in user's schedules for a term, as described in
+        `ScheduleComparison.to_dict`, with the following parameters:
+          - year: Year of the schedules
+          - term: Term of the schedules ('spring', 'summer' or 'fall')
+        """
+        response = ScheduleHandler.RESPONSE_BASE.copy()
+
+        if not request.user.is_authenticated:
+            response['message'] = 'Only the schedules of a logged in user can be compared.'
+            return response
+
+        # Parameter parsing
+        term = request.GET.get('term')
+        try:
+            year = int(request.GET.get('year'))
+        except (TypeError, ValueError):
+            response['message'] = 'Invalid request parameter values'
+            return response
+        if term not in ('spring', 'summer', 'fall'):
+            response['message'] = 'Invalid request parameter values'
+            return response
+
+        response['data'] = ScheduleComparison.from_term(request.user, year, term).to_dict()
+        response['success'] = True
+        return response
+
+    @staticmethod
+    def generate_timetables(request):
+        """
+        Returns the valid timetables, without conflicts, for a list of courses offered in a term. The
+        following parameters are supported:
+          - courses: Comma-separated course codes (e.g 'CSC 225,MATH 211')
+          - year: Year of the course offerings
+          - term: Term of the course offerings ('spring', 'summer' or 'fall')
+          - rank: If set, comma-separated criteria by which to rank the timetables, among 'days' (fewest
+                  days on campus) and 'mornings' (fewest meetings before 9:00)
+          - limit: Maximum number of timetables to return, 20 by default
+        If a course has no section in the term, the request fails with the codes of such courses in
+        'data' as 'missing'.
+        """
+        response = ScheduleHandler.RESPONSE_BASE.copy()
+
+        # Parameter parsing
+        courses = request.GET.get('courses')
+        term = request.GET.get('term')
+        rank = request.GET.get('rank')
+
+        try:
+            year = int(request.GET.get('year'))
+            limit = int(request.GET.get('limit', 20))
+            assert courses is not None and term is not None and limit >= 0
+            courses = [tuple(course.split()) for course in courses.split(',')]
+            assert all(len(course) == 2 for course in courses)
+        except (AssertionError, TypeError, ValueError):
+            response['message'] = 'Invalid request parameter values'
+            return response
+
+        scorer_types = {'days': DaysOnCampusScorer, 'mornings': EarlyMorningScorer}
+        try:
+            scorers = [scorer_types[criterion]() for criterion in rank.split(',')] if rank else []
+        except KeyError:
+            response['message'] = 'Unsupported ranking criterion.'
+            return response
+
+        # Unknown courses and courses not offered in the term are reported rather than left out of the timetables
+        coordinator = ScheduleCoordinator.get_instance(year, term)
+        missing = coordinator.get_missing_courses(courses)
+        if missing:
+            response['message'] = 'No sections offered in this term for: ' + ', '.join(missing)
+            response['data'] = {'missing': missing}
+            return response
+
+        generator = coordinator.get_timetable_generator(courses)
+
+        if scorers:
+            response['data'] = [{'crns': crns, 'score': score} for score, crns in generator.rank(scorers, limit)]
+        else:
+            response['data'] = [{'crns': crns, 'score': None} for crns in
+                                itertools.islice(generator.iter_timetables(), limit)]
+        response['success'] = True
+
+        return response
+
+    @staticmethod
+    def find_sections(request, stream=False):
+        """
+        Returns the CRNs of the sections offered in a term matching all of the following criteria, with the
+        following parameters:
+          - year: Year of the course offerings
+          - term: Term of the course offerings ('spring', 'summer' or 'fall')
+          - course: If set, only the sections of this course (e.g 'CSC 225')
+          - busy: If set, only the sections free at these times, as comma-separated days of the week and
+                  times (e.g 'MR 08:30-09:50,T 13:00-14:00')
+          - id: If set, only the sections compatible with the user's schedule with this ID, which are not
+                already part of it
+        If the 'details' parameter is 'true', the sections are returned as by `get_section` instead, and if
+        `stream` is also set, 'data' is an iterator building each section as the response is written.
+        """
+        response = ScheduleHandler.RESPONSE_BASE.copy()
+
+        # Parameter parsing
+        course = request.GET.get('course')
+        busy = request.GET.get('busy')
+        schedule_id = request.GET.get('id')
+
+        try:
+            year = int(request.GET.get('year'))
+            term = request.GET.get('term')
+            assert term is not None
+            if schedule_id is not None:
+                schedule_id = int(schedule_id)
+
+            busy_records = []
+            for busy_time in (busy.split(',') if busy else []):
+                letters, times = busy_time.split()
+                start_minute, end_minute = [ScheduleHandler.__get_minute(time) for time in times.split('-')]
+                busy_records.append(ScheduleCoordinator.get_busy_record(DateUtils.get_weekday_mask(letters),
+                                                                        start_minute, end_minute))
+        except (AssertionError, TypeError, ValueError):
+            response['message'] = 'Invalid request parameter values'
+            return response
+
+        schedule_crns = []
+        if schedule_id is not None:
+            if not request.user.is_authenticated:
+                response['message'] = 'Error: user must be authenticated to process this request.'
+                return response
+            schedule_crns = list(ScheduleSection.objects.filter(schedule_id=schedule_id, schedule__user=request.user)
+                                 .values_list('section_id', flat=True))
+
+        coordinator = ScheduleCoordinator.get_instance(year, term)
+        crns = coordinator.find_sections(course, busy_records, schedule_crns)
+
+        if request.GET.get('details') == 'true':
+            encode_meeting = Meeting.to_compact if request.GET.get('encoding') == 'compact' else Meeting.to_dict
+            response['data'] = coordinator.iter_sections(crns, encode_meeting) if stream else \
+                coordinator.get_sections(crns, encode_meeting)
+        else:
+            response['data'] = crns
+        response['success'] = True
+
+        return response
+
+    @staticmethod
+    def __get_minute(time):
+        """
+        Returns the minute of the day of a time of the form 'HH:MM'.
+        """
+        hours, minutes = time.split(':')
+        return int(hours) * 60 + int(minutes)
+
     @staticmethod
     def __clean_up(request, profile):
         """
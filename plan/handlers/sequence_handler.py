@@ -1,10 +1,15 @@
 #  Copyright (c) 2020. by Anton Nikitenko
 #  All rights reserved.
 
-from plan.models import Course, Program, Sequence, Term
+from django.db import IntegrityError, transaction
+from plan.anonymous import AnonymousSequence
+from plan.cache import CatalogCache
+from plan.coordinators import SequenceCoordinator
+from plan.evaluations import SequenceEvaluation
+from plan.models import Course, Program, Sequence, Term, TermCourse
+from plan.snapshots import SequenceSnapshot
 
 
-# TODO: Refactor class to properly handle anonymous, session-based requests.
 # TODO: Refactor class to properly catch any relevant errors or exceptions
 
 
@@ -12,7 +17,8 @@ class SequenceHandler:
     """
     This handles requests and manages user-specific information regarding their program plan.
 
-    To handle requests, the user must either have an existing session, or be logged in.
+    To handle requests, the user must either have an existing session, or be logged in. The sequence of a user
+    who is not logged in is an `AnonymousSequence` stored in their session.
     """
     RESPONSE_BASE = {'success': False, 'message': '', 'data': None}
 
@@ -41,36 +47,53 @@ class SequenceHandler:
         assert ignore_requirements is not None
 
         # Fetch course to add.
-        course = Course.objects.filter(course_code={'subject': subject}).filter(course_code={'number': number})[0]
+        course = CatalogCache.get_instance().get_course(subject, number)
+        if course is None:
+            response['message'] = 'No courses with the specified subject and number exist.'
+            return response
 
-        # Fetch sequence
+        # Fetch sequence, and find term to which to add course to.
         if request.user.is_authenticated:
-            sequence = Sequence.objects.filter(user=request.user)
+            sequence = Sequence.objects.filter(user=request.user).first()
+            term = Term.objects.filter(user=sequence, year=year, term_type=term_type).first()
         else:
-            sequence = request.session.get('active_sequence')
+            sequence = AnonymousSequence.from_session(request.session)
+            term = (year, term_type) if sequence is not None and sequence.has_term(year, term_type) else None
 
-        # Find term to which to add course to.
-        try:
-            term = sequence.terms.get(year=year, term_type=term_type)
-        except Term.DoesNotExist:
+        if term is None:
             response['message'] = 'The selected term does not exist.'
             return response
 
-        # Ensure that the course is not already present
-        if len(term.courses.filter(course_code={'subject': subject}).filter(course_code={'number': number})) > 0:
-            response['message'] = 'The same course already exists for the specified term.'
-            return response
-
-        # Evaluate if requirements are fulfilled for that course
+        # Evaluate if requirements are fulfilled for that course, relative to the term it is added to
+        evaluation = SequenceHandler.__get_evaluation(sequence)
         if not ignore_requirements:
-            evaluation_status, evaluation_container = course.evaluate_requirement(sequence)
+            evaluation_status, evaluation_container = course.evaluate_requirement(
+                evaluation.snapshot.at_term(year, term_type))
             if not evaluation_status:
                 response['message'] = 'The requirements for the course have not been fulfilled.'
                 response['data'] = evaluation_container
                 return response
 
-        # Add course to term
-        term.courses.add(course)
+        # Add the course, unless it is already present
+        version = None
+        if isinstance(sequence, AnonymousSequence):
+            added = sequence.add_course(course, year, term_type)
+        else:
+            try:
+                with transaction.atomic():
+                    TermCourse.objects.create(term=term, course=course)
+                    version = SequenceEvaluation.get_version(sequence.pk)
+                added = True
+            except IntegrityError:
+                added = False
+
+        if not added:
+            response['message'] = 'The same course already exists for the specified term.'
+            return response
+
+        # Only re-evaluate the courses and programs depending on the added course
+        response['data'] = evaluation.add_course(course, year, term_type)
+        SequenceHandler.__store(request, sequence, evaluation, version)
         response['success'] = True
 
         # Clean-up
@@ -101,27 +124,38 @@ class SequenceHandler:
 
         # Fetch targeted sequence and term
         if request.user.is_authenticated:
-            sequence = Sequence.objects.filter(user=request.user)
+            sequence = Sequence.objects.filter(user=request.user).first()
+            term = Term.objects.filter(user=sequence, year=year, term_type=term_type).first()
         else:
-            sequence = request.session.get('active_sequence')
-
-        # Find term & course and remove it
-        try:
-            term = sequence.terms.get(year=year, term_type=term_type)
-            course = term.courses.filter(course_code__exact={'subject': subject}).filter(
-                course_code__exact={'number': number})[0]
-            term.courses.remove(course)
-            response['success'] = True
+            sequence = AnonymousSequence.from_session(request.session)
+            term = (year, term_type) if sequence is not None and sequence.has_term(year, term_type) else None
 
-        except Term.DoesNotExist:
+        if term is None:
             response['message'] = 'The selected term does not exist.'
             return response
 
-        except IndexError:
-            # TODO: Find a better way to catch this error
+        # Find course and remove it
+        course = CatalogCache.get_instance().get_course(subject, number)
+        evaluation = SequenceHandler.__get_evaluation(sequence)
+        version = None
+        if course is None:
+            removed = False
+        elif isinstance(sequence, AnonymousSequence):
+            removed = sequence.remove_course(course, year, term_type)
+        else:
+            with transaction.atomic():
+                removed = TermCourse.objects.filter(term=term, course=course).delete()[0] > 0
+                version = SequenceEvaluation.get_version(sequence.pk)
+
+        if not removed:
             response['message'] = 'The selected course does not exist in the selected term.'
             return response
 
+        # Only re-evaluate the courses and programs depending on the removed course
+        response['data'] = evaluation.remove_course(course, year, term_type)
+        SequenceHandler.__store(request, sequence, evaluation, version)
+        response['success'] = True
+
         # Clean-up
         SequenceHandler.__clean_up(request, None)
         return response
@@ -164,9 +198,106 @@ class SequenceHandler:
 
     @staticmethod
     def evaluate_program(request):
-        # TODO complete evaluate_program method
+        """
+        Evaluates the requirements of a program against the user's sequence. The following parameters
+        must be specified:
+          - institution: Institution offering the program
+          - name: Name of the program
+
+        To evaluate a program against many sequences at once, see `plan.cohorts.CohortEvaluator`.
+        """
         response = SequenceHandler.RESPONSE_BASE.copy()
-        response['message'] = 'This method is currently not implemented.'
+
+        # Parameter parsing
+        institution = request.GET.get('institution')
+        name = request.GET.get('name')
+        assert institution is not None
+        assert name is not None
+
+        try:
+            program = Program.objects.get(institution=institution, name=name)
+        except Program.DoesNotExist:
+            response['message'] = 'The selected program does not exist.'
+            return response
+
+        # Fetch sequence
+        if request.user.is_authenticated:
+            sequence = Sequence.objects.filter(user=request.user).first()
+        else:
+            sequence = AnonymousSequence.from_session(request.session)
+
+        if sequence is None:
+            response['message'] = 'The user does not have a sequence.'
+            return response
+
+        evaluation_status, evaluation_container = SequenceHandler.__get_evaluation(sequence).evaluate_program(program)
+
+        response['data'] = {
+            'satisfied': evaluation_status,
+            'expressions': evaluation_container
+        }
+        response['success'] = True
+
+        return response
+
+    @staticmethod
+    def plan_program(request):
+        """
+        Plans the sequence completing a program in the fewest terms, given the courses of the user's sequence
+        taken before the first term to plan. The following parameters must be specified:
+          - institution: Institution offering the program
+          - name: Name of the program
+          - year: Year of the first term to plan
+          - term_type: term_type of the first term to plan
+        The following parameters are optional:
+          - max_credits: Maximum credits of each term, 7.5 by default
+          - summer: Whether courses may be taken in summer terms, 'false' by default
+          - time_budget: Maximum duration of the search in seconds, 2 by default and at most 10
+        """
+        response = SequenceHandler.RESPONSE_BASE.copy()
+
+        # Parameter parsing
+        institution = request.GET.get('institution')
+        name = request.GET.get('name')
+        year = int(request.GET.get('year'))
+        term_type = int(request.GET.get('term_type'))
+        max_credits = float(request.GET.get('max_credits', 7.5))
+        summer = True if request.GET.get('summer') == 'true' else False
+        time_budget = min(float(request.GET.get('time_budget', 2)), 10)
+        assert institution is not None
+        assert name is not None
+
+        try:
+            program = Program.objects.get(institution=institution, name=name)
+        except Program.DoesNotExist:
+            response['message'] = 'The selected program does not exist.'
+            return response
+
+        # Fetch sequence
+        if request.user.is_authenticated:
+            sequence = Sequence.objects.filter(user=request.user).first()
+        else:
+            sequence = AnonymousSequence.from_session(request.session)
+
+        completed = []
+        if sequence is not None:
+            start = SequenceSnapshot.get_term_ordinal(year, term_type)
+            completed = [course_code for course_code, ordinal in
+                         SequenceHandler.__get_evaluation(sequence).snapshot.course_ordinals.items()
+                         if ordinal < start]
+
+        coordinator = SequenceCoordinator.from_program(program, completed, {
+            1: max_credits,
+            2: max_credits if summer else 0,
+            3: max_credits
+        })
+        plan = coordinator.plan(year, term_type, time_budget=time_budget)
+        if plan is None:
+            response['message'] = 'The program cannot be completed with the selected courses and credits.'
+            return response
+
+        response['data'] = plan.to_dict()
+        response['success'] = True
 
         return response
 
@@ -211,13 +342,12 @@ class SequenceHandler:
             profile.active_sequence = Sequence(user=request.user, name=sequence_name)
             response['success'] = True
 
-        #else:
-        #    result = request.session.get('active_sequence')
-        #    if result is not None:
-        #        response['message'] = 'Could not add sequence, one already exists.'
-        #        return response
-        #    request.session['active_sequence'] = Sequence(name=sequence_name, terms=[])
-        #    response['success'] = True
+        else:
+            if AnonymousSequence.from_session(request.session) is not None:
+                response['message'] = 'Could not add sequence, one already exists.'
+                return response
+            AnonymousSequence(sequence_name).save(request.session)
+            response['success'] = True
 
         # Clean-up
         SequenceHandler.__clean_up(request, None)
@@ -246,8 +376,8 @@ class SequenceHandler:
                 response['message'] = 'The selected user profile does not have an associated sequence.'
 
         else:
-            result = request.session.get('active_sequence')
-            response['data'] = result
+            result = AnonymousSequence.from_session(request.session)
+            response['data'] = result.to_dict() if result is not None else None
             response['success'] = True
 
         return response
@@ -260,29 +390,33 @@ class SequenceHandler:
         response = SequenceHandler.RESPONSE_BASE.copy()
 
         # Parameter parsing
-        year = int(request.GET.get('year'))
-        term_type = int(request.GET.get('term_type'))
-        assert year is not None
-        assert term_type is not None
-
-        if request.user.is_authenticated:
-            #profile = Profile.objects.get(user=request.user)
-            #sequence = profile.active_sequence
-            sequence = None
-        else:
-            sequence = request.session.get('active_sequence')
+        term = SequenceHandler.__parse_term(request)
+        if term is None:
+            response['message'] = 'Invalid request parameter values'
+            return response
+        year, term_type = term
 
-        # TODO: Improve validation
-        assert sequence is not None
+        sequence = SequenceHandler.__get_sequence(request)
+        if sequence is None:
+            response['message'] = 'The user does not have a sequence.'
+            return response
 
-        # Check that no Term with same year and term_type already exist
-        if len(sequence.terms.filter(year=year).filter(term_type=term_type)) > 0:
+        # Add the term, unless one with the same year and term_type already exists
+        if isinstance(sequence, AnonymousSequence):
+            added = sequence.add_term(year, term_type)
+            sequence.save(request.session)
+        else:
+            try:
+                with transaction.atomic():
+                    Term.objects.create(user=sequence, year=year, term_type=term_type)
+                added = True
+            except IntegrityError:
+                added = False
+
+        if not added:
             response['message'] = 'A term with the same year and term type already exists.'
             return response
 
-        term_to_add = Term(user=request.user, year=year, term_type=term_type)
-        term_to_add.save()
-        sequence.terms.add(term_to_add)
         response['success'] = True
 
         # Clean-up
@@ -290,76 +424,85 @@ class SequenceHandler:
         return response
 
     @staticmethod
-    def get_term(request):
+    def remove_term(request):
+        """
+        Removes a term for the user, depending on whether they're logged in or not.
+        """
         response = SequenceHandler.RESPONSE_BASE.copy()
 
         # Parameter parsing
-        year = int(request.GET.get('year'))
-        term_type = int(request.GET.get('term_type'))
-
-        if request.user.is_authenticated:
-            #profile = Profile.objects.get(user=request.user)
-            #sequence = profile.active_sequence
-            sequence = None
-        else:
-            sequence = request.session.get('active_sequence')
-
-        # TODO: Improve validation
-        assert sequence is not None
+        term = SequenceHandler.__parse_term(request)
+        if term is None:
+            response['message'] = 'Invalid request parameter values'
+            return response
+        year, term_type = term
 
-        if year is None and term_type is None:
-            response['data'] = [term.to_dict() for term in sequence.terms.all()]
-            response['success'] = True
+        sequence = SequenceHandler.__get_sequence(request)
+        if sequence is None:
+            response['message'] = 'The user does not have a sequence.'
+            return response
 
-        elif year is not None and term_type is None:
-            response['data'] = [term.to_dict() for term in sequence.terms.filter(year=year)]
-            response['success'] = True
+        if isinstance(sequence, AnonymousSequence):
+            removed = sequence.remove_term(year, term_type)
+            sequence.save(request.session)
+        else:
+            removed = Term.objects.filter(user=sequence, year=year, term_type=term_type).delete()[0] > 0
 
-        elif year is not None and term_type is not None:
-            response['data'] = [term.to_dict() for term in sequence.terms.filter(year=year).filter(term_type=term_type)]
-            response['success'] = True
+        if not removed:
+            response['message'] = 'No terms with the selected year and term type exist.'
+            return response
 
-        # Invalid request parameters
-        else:
-            response['message'] = 'Invalid request parameter values'
+        response['success'] = True
 
+        # Clean-up
+        SequenceHandler.__clean_up(request, None)
         return response
 
     @staticmethod
-    def remove_term(request):
+    def __parse_term(request):
         """
-        Removes a term for the user, depending on whether they're logged in or not.
+        Returns the year and term type of the request, or None if they are missing or invalid. The year of a term
+        must be stored by both `Term` and `AnonymousSequence`.
         """
-        response = SequenceHandler.RESPONSE_BASE.copy()
+        try:
+            year = int(request.GET.get('year'))
+            term_type = int(request.GET.get('term_type'))
+        except (TypeError, ValueError):
+            return None
 
-        # Parameter parsing
-        year = int(request.GET.get('year'))
-        term_type = int(request.GET.get('term_type'))
-        assert year is not None
-        assert term_type is not None
+        term_types = dict(Term._meta.get_field('term_type').choices)
+        if not 0 <= year <= AnonymousSequence.MAX_YEAR or term_type not in term_types:
+            return None
+        return year, term_type
 
-        # Fetching sequence
+    @staticmethod
+    def __get_sequence(request):
+        """
+        Returns the `Sequence` of a logged in user, or else the `AnonymousSequence` of the session, if any.
+        """
         if request.user.is_authenticated:
-            #profile = Profile.objects.get(user=request.user)
-            #sequence = profile.active_sequence
-            sequence = None
-        else:
-            sequence = request.session.get('active_sequence')
-
-        # TODO: Improve validation
-        assert sequence is not None
+            return Sequence.objects.filter(user=request.user).first()
+        return AnonymousSequence.from_session(request.session)
 
-        try:
-            term = sequence.terms.get(year=year, term_type=term_type)
-            sequence.terms.remove(term)
-            response['success'] = True
-        except Term.DoesNotExist:
-            response['message'] = 'No terms with the selected year and term type exist.'
-            return response
+    @staticmethod
+    def __get_evaluation(sequence):
+        """
+        Returns the `SequenceEvaluation` of a `Sequence`, from the cache if possible, or of an `AnonymousSequence`.
+        """
+        if isinstance(sequence, AnonymousSequence):
+            return sequence.get_evaluation()
+        return SequenceEvaluation.get_instance(sequence)
 
-        # Clean-up
-        SequenceHandler.__clean_up(request, None)
-        return response
+    @staticmethod
+    def __store(request, sequence, evaluation, version):
+        """
+        Stores a sequence and its evaluation once a course was added to or removed from it, which brought a
+        `Sequence` to `version`.
+        """
+        if isinstance(sequence, AnonymousSequence):
+            sequence.save(request.session)
+        else:
+            SequenceEvaluation.store(evaluation, version)
 
     @staticmethod
     def __clean_up(request, profile):
@@ -368,6 +511,7 @@ class SequenceHandler:
         """
 
         if request.user.is_authenticated:
-            profile.save()
+            if profile is not None:
+                profile.save()
         else:
             request.session.modified = True
@@ -0,0 +1,287 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+import csv
+import datetime
+import io
+import json
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from plan.cache import CatalogCache
+from plan.catalog import CatalogSnapshot
+from plan.models import Course, CourseOffering, Meeting, Section
+from plan.utils import DateUtils
+
+# The columns of the staging table, in COPY order
+STAGING_COLUMNS = [
+    ('subject', 'varchar(4)'),
+    ('number', 'varchar(8)'),
+    ('name', 'varchar(200)'),
+    ('credits', 'numeric(3, 1)'),
+    ('hours_lectures', 'numeric(4, 2)'),
+    ('hours_labs', 'numeric(4, 2)'),
+    ('hours_tutorials', 'numeric(4, 2)'),
+    ('crn', 'integer'),
+    ('section_name', 'varchar(4)'),
+    ('section_type', 'varchar(20)'),
+    ('capacity', 'integer'),
+    ('waitlist_capacity', 'integer'),
+    ('start_date', 'date'),
+    ('end_date', 'date'),
+    ('weekdays', 'smallint'),
+    ('start_minute', 'smallint'),
+    ('end_minute', 'smallint')
+]
+
+STAGING_TABLE = 'plan_catalog_staging'
+SECTION_TYPES = ('lecture', 'lab', 'tutorial')
+TERM_TYPES = ('spring', 'summer', 'fall')
+
+
+class Command(BaseCommand):
+    help = """
+    Imports the courses, course offerings, sections and meetings of a term from a CSV or JSON-lines file,
+    with one row per meeting and the following columns:
+
+      subject, number, name, credits, hours_lectures, hours_labs, hours_tutorials,
+      crn, section_name, section_type, start_date, end_date, start_time, end_time, days
+
+    and the optional columns capacity and waitlist_capacity, where `days` contains the letters of the meeting
+    days among 'MTWRFSZ' (e.g 'MR'). A section without meetings is given by a single row with empty meeting
+    columns. The capacities of a section are left unchanged when empty, and cannot be below the number of
+    students enrolled or waitlisted.
+
+    Rows are streamed in batches into a staging table with COPY, then merged with set-based upserts: courses
+    and sections are inserted or updated, offerings are inserted if missing, and the meetings of every
+    imported section are replaced. Requires PostgreSQL.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='The CSV or JSON-lines file to import')
+        parser.add_argument('--year', type=int, required=True, help='The year of the term')
+        parser.add_argument('--term', choices=TERM_TYPES, required=True, help='The term type')
+        parser.add_argument('--format', choices=('csv', 'jsonl'), default=None,
+                            help='The file format, by default inferred from the file extension')
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='The number of rows sent to the database with each COPY')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('import_catalog requires PostgreSQL, not ' + connection.vendor)
+
+        file_format = options['format'] or ('jsonl' if options['path'].endswith(('.jsonl', '.json')) else 'csv')
+        start = time.perf_counter()
+
+        with open(options['path'], newline='', encoding='utf-8') as file, transaction.atomic(), \
+                connection.cursor() as cursor:
+            self.create_staging_table(cursor)
+
+            rows = self.read_rows(file, file_format)
+            row_count = self.copy_rows(cursor, rows, options['batch_size'])
+            copy_duration = time.perf_counter() - start
+            self.stdout.write('Staged {} rows in {:.2f} s ({:.0f} rows/sec)'.format(
+                row_count, copy_duration, row_count / max(copy_duration, 1e-9)))
+
+            counts = self.merge(cursor, options['year'], options['term'])
+
+            # Bulk writes do not send model signals, so the catalog versions are bumped explicitly, within the
+            # transaction so that every server process sees them along with the import, once every cached lookup
+            # is marked as changed
+            cache = CatalogCache.get_instance()
+            cache.mark_changed([CatalogCache.ALL_KEYS])
+            _, version = CatalogSnapshot.bump_version()
+            CatalogSnapshot.bump_version(CatalogSnapshot.COURSES)
+            cache.mark_changed([CatalogCache.ALL_KEYS], version)
+            transaction.on_commit(cache.clear)
+
+        duration = time.perf_counter() - start
+        self.stdout.write(', '.join('{} {}'.format(count, name) for name, count in counts))
+        self.stdout.write(self.style.SUCCESS('Imported {} rows in {:.2f} s ({:.0f} rows/sec)'.format(
+            row_count, duration, row_count / max(duration, 1e-9))))
+
+    @staticmethod
+    def create_staging_table(cursor):
+        cursor.execute('CREATE TEMPORARY TABLE {} ({}) ON COMMIT DROP'.format(
+            STAGING_TABLE, ', '.join('{} {}'.format(connection.ops.quote_name(column), column_type)
+                                     for column, column_type in STAGING_COLUMNS)))
+
+    def read_rows(self, file, file_format):
+        """
+        Lazily yields the rows of the file as tuples of staging column values.
+        """
+        if file_format == 'csv':
+            records = csv.DictReader(file)
+        else:
+            records = (json.loads(line) for line in file if line.strip())
+
+        for line_number, record in enumerate(records, start=2 if file_format == 'csv' else 1):
+            try:
+                yield self.parse_record(record)
+            except (KeyError, TypeError, ValueError) as e:
+                raise CommandError('Invalid row at line {}: {}'.format(line_number, repr(e)))
+
+    @staticmethod
+    def parse_record(record):
+        def get(key, default=None):
+            value = record.get(key)
+            if value is None or value == '':
+                if default is None:
+                    raise KeyError(key)
+                return default
+            return str(value).strip()
+
+        section_type = get('section_type')
+        if section_type not in SECTION_TYPES:
+            raise ValueError('Unknown section type ' + section_type)
+
+        values = [
+            get('subject'), get('number'), get('name'), float(get('credits')),
+            float(get('hours_lectures', '0')), float(get('hours_labs', '0')), float(get('hours_tutorials', '0')),
+            int(get('crn')), get('section_name'), section_type
+        ]
+        for key in ('capacity', 'waitlist_capacity'):
+            count = get(key, '')
+            if count and int(count) < 0:
+                raise ValueError('Negative ' + key)
+            values.append(int(count) if count else None)
+
+        days = get('days', '')
+        if not days:
+            return tuple(values + [None] * 5)
+
+        return tuple(values + [
+            datetime.date.fromisoformat(get('start_date')), datetime.date.fromisoformat(get('end_date')),
+            DateUtils.get_weekday_mask(days),
+            DateUtils.get_minute_of_day(datetime.time.fromisoformat(get('start_time'))),
+            DateUtils.get_minute_of_day(datetime.time.fromisoformat(get('end_time')))
+        ])
+
+    @staticmethod
+    def copy_rows(cursor, rows, batch_size):
+        """
+        Sends the rows to the staging table with one COPY per batch, so that at most one batch is held in
+        memory at a time. Returns the number of rows copied.
+        """
+        statement = 'COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+            STAGING_TABLE, ', '.join(connection.ops.quote_name(column) for column, _ in STAGING_COLUMNS))
+
+        row_count = 0
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        batch_rows = 0
+
+        for row in rows:
+            writer.writerow(row)
+            batch_rows += 1
+            if batch_rows == batch_size:
+                buffer.seek(0)
+                cursor.copy_expert(statement, buffer)
+                row_count += batch_rows
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                batch_rows = 0
+
+        if batch_rows:
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+            row_count += batch_rows
+
+        return row_count
+
+    @staticmethod
+    def merge(cursor, year, term_type):
+        """
+        Merges the staging table into the catalog tables. Returns the number of rows written to each table.
+        """
+        quote = connection.ops.quote_name
+        course_table = quote(Course._meta.db_table)
+        offering_table = quote(CourseOffering._meta.db_table)
+        section_table = quote(Section._meta.db_table)
+        meeting_table = quote(Meeting._meta.db_table)
+        offered_column = quote('offered_' + term_type)
+
+        cursor.execute("""
+            INSERT INTO {course} (subject, number, name, credits, hours_lectures, hours_labs, hours_tutorials,
+                                  {offered})
+            SELECT DISTINCT ON (subject, number)
+                   subject, number, name, credits, hours_lectures, hours_labs, hours_tutorials, TRUE
+            FROM {staging}
+            ORDER BY subject, number
+            ON CONFLICT (subject, number) DO UPDATE
+            SET name = EXCLUDED.name, credits = EXCLUDED.credits, hours_lectures = EXCLUDED.hours_lectures,
+                hours_labs = EXCLUDED.hours_labs, hours_tutorials = EXCLUDED.hours_tutorials,
+                {offered} = TRUE
+        """.format(course=course_table, offered=offered_column, staging=STAGING_TABLE))
+        course_count = cursor.rowcount
+
+        cursor.execute("""
+            INSERT INTO {offering} (course_id, year, term_type)
+            SELECT DISTINCT course.id, %s, %s
+            FROM {staging} staging
+            JOIN {course} course ON course.subject = staging.subject AND course.number = staging.number
+            ON CONFLICT (course_id, year, term_type) DO NOTHING
+        """.format(offering=offering_table, staging=STAGING_TABLE, course=course_table), [year, term_type])
+        offering_count = cursor.rowcount
+
+        # The capacities of existing sections are updated separately, as only those given by the file change,
+        # after checking that none would drop below its counter, which the check constraints would reject
+        capacities = """
+            SELECT crn, MAX(capacity) AS capacity, MAX(waitlist_capacity) AS waitlist_capacity
+            FROM {staging}
+            GROUP BY crn
+        """.format(staging=STAGING_TABLE)
+
+        cursor.execute("""
+            SELECT section.crn
+            FROM {section} section
+            JOIN ({capacities}) capacities ON capacities.crn = section.crn
+            WHERE capacities.capacity < section.enrolled OR capacities.waitlist_capacity < section.waitlisted
+            ORDER BY section.crn
+        """.format(section=section_table, capacities=capacities))
+        crns = [crn for crn, in cursor.fetchall()]
+        if crns:
+            raise CommandError('Capacities below the students enrolled or waitlisted in sections ' +
+                               ', '.join(str(crn) for crn in crns))
+
+        cursor.execute("""
+            UPDATE {section} section
+            SET capacity = COALESCE(capacities.capacity, section.capacity),
+                waitlist_capacity = COALESCE(capacities.waitlist_capacity, section.waitlist_capacity)
+            FROM ({capacities}) capacities
+            WHERE capacities.crn = section.crn
+                  AND (capacities.capacity IS NOT NULL OR capacities.waitlist_capacity IS NOT NULL)
+        """.format(section=section_table, capacities=capacities))
+
+        cursor.execute("""
+            INSERT INTO {section} (crn, course_offering_id, name, section_type, capacity, enrolled,
+                                   waitlist_capacity, waitlisted, seat_updates)
+            SELECT DISTINCT ON (staging.crn) staging.crn, offering.id, staging.section_name, staging.section_type,
+                   capacities.capacity, 0, COALESCE(capacities.waitlist_capacity, 0), 0, 0
+            FROM {staging} staging
+            JOIN {course} course ON course.subject = staging.subject AND course.number = staging.number
+            JOIN {offering} offering ON offering.course_id = course.id AND offering.year = %s
+                                        AND offering.term_type = %s
+            JOIN ({capacities}) capacities ON capacities.crn = staging.crn
+            ORDER BY staging.crn
+            ON CONFLICT (crn) DO UPDATE
+            SET course_offering_id = EXCLUDED.course_offering_id, name = EXCLUDED.name,
+                section_type = EXCLUDED.section_type
+        """.format(section=section_table, staging=STAGING_TABLE, course=course_table, offering=offering_table,
+                   capacities=capacities), [year, term_type])
+        section_count = cursor.rowcount
+
+        cursor.execute("""
+            DELETE FROM {meeting} WHERE section_id IN (SELECT DISTINCT crn FROM {staging})
+        """.format(meeting=meeting_table, staging=STAGING_TABLE))
+
+        cursor.execute("""
+            INSERT INTO {meeting} (section_id, start_date, end_date, weekdays, start_minute, end_minute)
+            SELECT crn, start_date, end_date, weekdays, start_minute, end_minute
+            FROM {staging}
+            WHERE weekdays IS NOT NULL
+        """.format(meeting=meeting_table, staging=STAGING_TABLE))
+        meeting_count = cursor.rowcount
+
+        return [('courses', course_count), ('offerings', offering_count), ('sections', section_count),
+                ('meetings', meeting_count)]
@@ -0,0 +1,240 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+import contextvars
+import cProfile
+import threading
+import time
+from collections import Counter
+
+
+class Histogram:
+    """
+    A histogram of non-negative integers in the style of HdrHistogram, recording a value in O(1) with a
+    relative error of at most 1 / `SUB_BUCKETS`, whatever its magnitude.
+
+    Values below 2 * `SUB_BUCKETS` have a bucket each. Above, each range [2^k, 2^(k+1)) is divided into
+    `SUB_BUCKETS` buckets of equal width, so that powers of two are always bucket boundaries. Bucket counts are
+    kept in a list grown as larger values are recorded, of a few hundred entries at most.
+    """
+
+    SUB_BUCKET_BITS = 5
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+    __slots__ = ('counts', 'count', 'sum', 'max')
+
+    def __init__(self):
+        self.counts = []
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def record(self, value):
+        value = max(int(value), 0)
+        index = self.get_index(value)
+        if index >= len(self.counts):
+            self.counts.extend([0] * (index + 1 - len(self.counts)))
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    @staticmethod
+    def get_index(value):
+        shift = value.bit_length() - Histogram.SUB_BUCKET_BITS - 1
+        if shift <= 0:
+            return value
+        return Histogram.SUB_BUCKETS * shift + (value >> shift)
+
+    @staticmethod
+    def get_upper_bound(index):
+        """
+        Returns the largest value recorded in the bucket with the given index.
+        """
+        shift = index // Histogram.SUB_BUCKETS - 1
+        if shift <= 0:
+            return index
+        return ((index - Histogram.SUB_BUCKETS * shift + 1) << shift) - 1
+
+    def get_percentile(self, percentile):
+        """
+        Returns the upper bound of the bucket of the value at the given percentile, or 0 if there are none.
+        """
+        rank = max(1, -(-self.count * percentile // 100))
+        total = 0
+        for index, count in enumerate(self.counts):
+            total += count
+            if total >= rank:
+                return min(self.get_upper_bound(index), self.max)
+        return 0
+
+    def get_cumulative_count(self, bound):
+        """
+        Returns the number of values lower than or equal to `bound`, which is exact if `bound + 1` is a bucket
+        boundary, such as a power of two minus one.
+        """
+        return sum(self.counts[:self.get_index(bound) + 1])
+
+
+class RequestMetrics:
+    """
+    The measures of the request being served by `InstrumentationMiddleware`: the number of SQL queries, the
+    time spent executing them and the number of times each statement was executed, to detect the queries made
+    once per item of a list. The metrics of the current request are held by a context variable, which is
+    copied to the threads of `DatabaseExecutor`, and are updated by `execute`, installed as an execute wrapper
+    on every database connection by `plan.signals`.
+
+    When the request is sampled for profiling, `call` runs functions within a `cProfile.Profile` of the
+    calling thread, so that the profiles of the request gather the work done by all the threads serving it.
+    """
+
+    __slots__ = ('queries', 'db_time', 'statements', 'profiles')
+
+    _current = contextvars.ContextVar('plan_request_metrics', default=None)
+    _profiling = threading.local()
+
+    def __init__(self, profile=False):
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = Counter()
+        self.profiles = [] if profile else None
+
+    @staticmethod
+    def get_current():
+        return RequestMetrics._current.get()
+
+    def activate(self):
+        """
+        Makes these metrics those of the current context. Returns a token to pass to `deactivate`.
+        """
+        return RequestMetrics._current.set(self)
+
+    @staticmethod
+    def deactivate(token):
+        RequestMetrics._current.reset(token)
+
+    @staticmethod
+    def execute(execute, sql, params, many, context):
+        metrics = RequestMetrics._current.get()
+        if metrics is None:
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            metrics.db_time += time.perf_counter() - start
+            metrics.queries += 1
+            metrics.statements[sql] += 1
+
+    @staticmethod
+    def call(function, *args, **kwargs):
+        """
+        Returns the result of calling `function`, profiled if the current request is sampled and the calling
+        thread is not already being profiled.
+        """
+        metrics = RequestMetrics._current.get()
+        if metrics is None or metrics.profiles is None or getattr(RequestMetrics._profiling, 'active', False):
+            return function(*args, **kwargs)
+
+        profile = cProfile.Profile()
+        RequestMetrics._profiling.active = True
+        try:
+            return profile.runcall(function, *args, **kwargs)
+        finally:
+            RequestMetrics._profiling.active = False
+            metrics.profiles.append(profile)
+
+    def get_duplicates(self):
+        """
+        Returns the number of queries repeating a statement already executed during the request.
+        """
+        return self.queries - len(self.statements)
+
+
+class MetricsRegistry:
+    """
+    The histograms of the measures of the requests served by the process, per endpoint, rendered in the text
+    format of Prometheus by `render`. Each process keeps its own histograms, and must be scraped separately.
+
+    Each histogram is exported with a bucket per power of two 2^k, for k from `min_exponent` to `max_exponent`,
+    which are exact bucket boundaries of `Histogram`. Durations are recorded in truncated microseconds, so that
+    those below 2^k microseconds are counted in the bucket 'le' 2^k microseconds. Counts are recorded exactly,
+    and those below 2^k are counted in the bucket 'le' 2^k - 1.
+    """
+
+    # The name, description, scale of the recorded integers (None for counts) and exponent range of the histograms
+    HISTOGRAMS = (
+        ('plan_request_duration_seconds', 'Time to serve a request, including streaming', 1e-6, 6, 26),
+        ('plan_request_db_duration_seconds', 'Time spent executing SQL queries during a request', 1e-6, 6, 26),
+        ('plan_request_queries', 'Number of SQL queries made by a request', None, 0, 12),
+        ('plan_request_duplicate_queries', 'Number of SQL queries repeating a statement of the same request', None,
+         0, 12),
+        ('plan_response_size_bytes', 'Size of the response body', None, 6, 26)
+    )
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.requests = Counter()
+
+    @staticmethod
+    def get_instance():
+        if MetricsRegistry._instance is None:
+            with MetricsRegistry._instance_lock:
+                if MetricsRegistry._instance is None:
+                    MetricsRegistry._instance = MetricsRegistry()
+        return MetricsRegistry._instance
+
+    def record(self, endpoint, status, duration, metrics, size):
+        """
+        Records a request served in `duration` seconds with the given `RequestMetrics`, with a response body of
+        `size` bytes.
+        """
+        values = (duration * 1e6, metrics.db_time * 1e6, metrics.queries, metrics.get_duplicates(), size)
+        with self.lock:
+            histograms = self.endpoints.get(endpoint)
+            if histograms is None:
+                histograms = self.endpoints[endpoint] = [Histogram() for _ in self.HISTOGRAMS]
+            for histogram, value in zip(histograms, values):
+                histogram.record(value)
+            self.requests[(endpoint, status)] += 1
+
+    def get_histogram(self, endpoint, name):
+        """
+        Returns the `Histogram` of a metric of `HISTOGRAMS` for an endpoint, or None if it served no request.
+        """
+        index = [histogram[0] for histogram in self.HISTOGRAMS].index(name)
+        histograms = self.endpoints.get(endpoint)
+        return histograms[index] if histograms is not None else None
+
+    def clear(self):
+        with self.lock:
+            self.endpoints.clear()
+            self.requests.clear()
+
+    def render(self):
+        lines = ['# HELP plan_requests_total Requests served, by endpoint and status',
+                 '# TYPE plan_requests_total counter']
+        with self.lock:
+            for (endpoint, status), count in sorted(self.requests.items()):
+                lines.append('plan_requests_total{{endpoint="{}",status="{}"}} {}'.format(endpoint, status, count))
+
+            for index, (name, description, scale, min_exponent, max_exponent) in enumerate(self.HISTOGRAMS):
+                lines.append('# HELP {} {}'.format(name, description))
+                lines.append('# TYPE {} histogram'.format(name))
+                for endpoint, histograms in sorted(self.endpoints.items()):
+                    histogram = histograms[index]
+                    for exponent in range(min_exponent, max_exponent + 1):
+                        bound = (1 << exponent) * scale if scale is not None else (1 << exponent) - 1
+                        lines.append('{}_bucket{{endpoint="{}",le="{:.9g}"}} {}'.format(
+                            name, endpoint, bound, histogram.get_cumulative_count((1 << exponent) - 1)))
+                    lines.append('{}_bucket{{endpoint="{}",le="+Inf"}} {}'.format(name, endpoint, histogram.count))
+                    lines.append('{}_sum{{endpoint="{}"}} {:.9g}'.format(
+                        name, endpoint, histogram.sum * (scale if scale is not None else 1)))
+                    lines.append('{}_count{{endpoint="{}"}} {}'.format(name, endpoint, histogram.count))
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,129 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+import asyncio
+import contextvars
+import logging
+import os
+import pstats
+import random
+import time
+from django.conf import settings
+from plan.metrics import MetricsRegistry, RequestMetrics
+
+logger = logging.getLogger(__name__)
+
+
+class InstrumentationMiddleware:
+    """
+    Records the wall time, the time spent in SQL queries, the number of queries, the number of queries repeating
+    a statement of the same request and the size of the response of every request into the histograms of
+    `MetricsRegistry`, per name of the URL pattern of `plan.urls` it was routed to. Streaming responses are
+    recorded once they were written.
+
+    A request repeating a statement at least 'DUPLICATE_QUERY_THRESHOLD' times, such as the queries made once
+    per item of a list, is logged as a warning along with the statement.
+
+    If the 'PROFILE_DIR' setting is set, a fraction 'PROFILE_RATE' of the requests are profiled with cProfile,
+    in the thread serving the request and in the threads of `DatabaseExecutor`, and the profiles of those
+    taking at least 'PROFILE_THRESHOLD' seconds are written to that directory, to be read with `pstats` or
+    snakeviz. Only the work done until the view returns is profiled.
+
+    The following settings are read from the `PLAN_METRICS` dictionary:
+      - DUPLICATE_QUERY_THRESHOLD: The number of executions of a statement logged as duplicates, 10 by default
+      - PROFILE_DIR: The directory of the profiles of slow requests, None by default to disable profiling
+      - PROFILE_RATE: The fraction of the requests which are profiled, 0.01 by default
+      - PROFILE_THRESHOLD: The minimum duration in seconds of the requests whose profiles are kept, 1 by default
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+        options = getattr(settings, 'PLAN_METRICS', {})
+        self.duplicate_threshold = options.get('DUPLICATE_QUERY_THRESHOLD', 10)
+        self.profile_dir = options.get('PROFILE_DIR')
+        self.profile_rate = options.get('PROFILE_RATE', 0.01)
+        self.profile_threshold = options.get('PROFILE_THRESHOLD', 1)
+
+        # Marks the middleware as a coroutine function for Django when the rest of the chain is asynchronous
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        start, metrics = self._start()
+        token = metrics.activate()
+        try:
+            response = RequestMetrics.call(self.get_response, request)
+        finally:
+            RequestMetrics.deactivate(token)
+        return self._finish(request, response, start, metrics)
+
+    async def __acall__(self, request):
+        start, metrics = self._start()
+        token = metrics.activate()
+        try:
+            response = await self.get_response(request)
+        finally:
+            RequestMetrics.deactivate(token)
+        return self._finish(request, response, start, metrics)
+
+    def _start(self):
+        profile = self.profile_dir is not None and random.random() < self.profile_rate
+        return time.perf_counter(), RequestMetrics(profile)
+
+    def _finish(self, request, response, start, metrics):
+        endpoint = request.resolver_match.view_name if request.resolver_match is not None else 'unresolved'
+        if metrics.profiles:
+            self._dump_profiles(endpoint, time.perf_counter() - start, metrics.profiles)
+
+        if response.streaming:
+            response.streaming_content = self._iter_recorded(response.streaming_content, endpoint,
+                                                             response.status_code, start, metrics)
+        else:
+            self._record(endpoint, response.status_code, start, metrics, len(response.content))
+        return response
+
+    def _iter_recorded(self, content, endpoint, status, start, metrics):
+        """
+        Yields the chunks of a streaming response, counting the queries made while they are read, and records
+        the request once they were all read or the response was closed.
+        """
+        # The response may be read by another thread than the one serving the request (see `StreamingJsonResponse`)
+        context = contextvars.copy_context()
+        context.run(metrics.activate)
+
+        size = 0
+        content = iter(content)
+        try:
+            for chunk in iter(lambda: context.run(next, content, None), None):
+                size += len(chunk)
+                yield chunk
+        finally:
+            self._record(endpoint, status, start, metrics, size)
+
+    def _record(self, endpoint, status, start, metrics, size):
+        MetricsRegistry.get_instance().record(endpoint, status, time.perf_counter() - start, metrics, size)
+
+        if metrics.statements:
+            statement, count = metrics.statements.most_common(1)[0]
+            if count >= self.duplicate_threshold:
+                logger.warning('%s executed the same query %d times: %s', endpoint, count, statement)
+
+    def _dump_profiles(self, endpoint, duration, profiles):
+        if duration < self.profile_threshold:
+            return
+
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+
+        os.makedirs(self.profile_dir, exist_ok=True)
+        stats.dump_stats(os.path.join(self.profile_dir, '{}-{}-{}.prof'.format(
+            endpoint.replace(':', '-'), int(time.time() * 1000), os.getpid())))
@@ -0,0 +1,122 @@
+# Generated by Django 3.1.2 on 2026-10-18 14:47
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Course',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=4)),
+                ('number', models.CharField(max_length=8)),
+                ('name', models.CharField(max_length=200)),
+                ('credits', models.DecimalField(decimal_places=1, max_digits=3)),
+                ('hours_lectures', models.DecimalField(decimal_places=2, max_digits=4)),
+                ('hours_labs', models.DecimalField(decimal_places=2, max_digits=4)),
+                ('hours_tutorials', models.DecimalField(decimal_places=2, max_digits=4)),
+                ('offered_spring', models.BooleanField(blank=True, null=True)),
+                ('offered_summer', models.BooleanField(blank=True, null=True)),
+                ('offered_fall', models.BooleanField(blank=True, null=True)),
+                ('requirement', models.JSONField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CourseOffering',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('term_type', models.CharField(choices=[('spring', 'spring'), ('summer', 'summer'), ('fall', 'fall')], max_length=10)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='plan.course')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Program',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('institution', models.CharField(max_length=100)),
+                ('name', models.CharField(max_length=50)),
+                ('requirements', models.JSONField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Schedule',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('term', models.CharField(choices=[('spring', 'spring'), ('summer', 'summer'), ('fall', 'fall')], max_length=10)),
+                ('name', models.CharField(max_length=100)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Sequence',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Term',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('term_type', models.PositiveSmallIntegerField(choices=[(1, 'spring'), (2, 'summer'), (3, 'fall')])),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='plan.sequence')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TermCourse',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='plan.course')),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='plan.term')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Section',
+            fields=[
+                ('crn', models.IntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=4)),
+                ('section_type', models.CharField(choices=[('lecture', 'lecture'), ('lab', 'lab'), ('tutorial', 'tutorial')], max_length=20)),
+                ('course_offering', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='plan.courseoffering')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ScheduleSection',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='plan.schedule')),
+                ('section', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='plan.section')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Meeting',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('meet_M', models.BooleanField(default=False)),
+                ('meet_T', models.BooleanField(default=False)),
+                ('meet_W', models.BooleanField(default=False)),
+                ('meet_R', models.BooleanField(default=False)),
+                ('meet_F', models.BooleanField(default=False)),
+                ('meet_S', models.BooleanField(default=False)),
+                ('meet_Z', models.BooleanField(default=False)),
+                ('section', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='plan.section')),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.1.2 on 2026-10-18 14:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plan', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='course',
+            constraint=models.UniqueConstraint(fields=('subject', 'number'), name='course_subject_number_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='courseoffering',
+            constraint=models.UniqueConstraint(fields=('course', 'year', 'term_type'), name='course_offering_term_unique'),
+        ),
+    ]
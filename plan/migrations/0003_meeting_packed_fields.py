@@ -0,0 +1,38 @@
+# Generated by Django 3.1.2 on 2026-10-18 14:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plan', '0002_catalog_unique_constraints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meeting',
+            name='weekdays',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='meeting',
+            name='start_minute',
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='meeting',
+            name='end_minute',
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='meeting',
+            name='start_time',
+            field=models.TimeField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='meeting',
+            name='end_time',
+            field=models.TimeField(null=True),
+        ),
+    ]
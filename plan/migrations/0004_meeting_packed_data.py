@@ -0,0 +1,46 @@
+import datetime
+from django.db import migrations
+from django.db.models import F, Value
+from django.db.models.functions import ExtractHour, ExtractMinute
+
+# The former day fields of `Meeting`, in the order of the `Weekday` values
+WEEKDAY_FIELDS = ['meet_M', 'meet_T', 'meet_W', 'meet_R', 'meet_F', 'meet_S', 'meet_Z']
+
+
+def pack_meetings(apps, schema_editor):
+    """
+    Fills the weekday bitmask and the minutes of the day from the day fields and times, with one UPDATE
+    per day of the week and one for the times.
+    """
+    Meeting = apps.get_model('plan', 'Meeting')
+
+    Meeting.objects.update(start_minute=ExtractHour('start_time') * 60 + ExtractMinute('start_time'),
+                           end_minute=ExtractHour('end_time') * 60 + ExtractMinute('end_time'))
+    for index, field in enumerate(WEEKDAY_FIELDS):
+        Meeting.objects.filter(**{field: True}).update(weekdays=F('weekdays') + Value(1 << index))
+
+
+def unpack_meetings(apps, schema_editor):
+    """
+    Restores the day fields and times, with one UPDATE per day of the week and one per distinct time.
+    """
+    Meeting = apps.get_model('plan', 'Meeting')
+
+    for index, field in enumerate(WEEKDAY_FIELDS):
+        Meeting.objects.annotate(day=F('weekdays').bitand(1 << index)).filter(day__gt=0).update(**{field: True})
+
+    for minute_field, time_field in (('start_minute', 'start_time'), ('end_minute', 'end_time')):
+        for minute in Meeting.objects.values_list(minute_field, flat=True).distinct():
+            Meeting.objects.filter(**{minute_field: minute}).update(
+                **{time_field: datetime.time(minute // 60, minute % 60)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plan', '0003_meeting_packed_fields'),
+    ]
+
+    operations = [
+        migrations.RunPython(pack_meetings, unpack_meetings),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 3.1.2 on 2026-10-18 14:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plan', '0004_meeting_packed_data'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='meeting',
+            name='end_time',
+        ),
+        migrations.RemoveField(
+            model_name='meeting',
+            name='meet_F',
+        ),
+        migrations.RemoveField(
+            model_name='meeting',
+            name='meet_M',
+        ),
+        migrations.RemoveField(
+            model_name='meeting',
+            name='meet_R',
+        ),
+        migrations.RemoveField(
+            model_name='meeting',
+            name='meet_S',
+        ),
+        migrations.RemoveField(
+            model_name='meeting',
+            name='meet_T',
+        ),
+        migrations.RemoveField(
+            model_name='meeting',
+            name='meet_W',
+        ),
+        migrations.RemoveField(
+            model_name='meeting',
+            name='meet_Z',
+        ),
+        migrations.RemoveField(
+            model_name='meeting',
+            name='start_time',
+        ),
+        migrations.AlterField(
+            model_name='meeting',
+            name='end_minute',
+            field=models.PositiveSmallIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='meeting',
+            name='start_minute',
+            field=models.PositiveSmallIntegerField(),
+        ),
+    ]
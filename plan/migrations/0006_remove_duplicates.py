@@ -0,0 +1,46 @@
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def remove_duplicates(apps, schema_editor):
+    """
+    Removes the rows that would violate the unique constraints added by the next migration: duplicate
+    schedule and term courses are deleted, the courses of duplicate terms are moved to the first of them,
+    and duplicate schedule names are suffixed with the schedule ID.
+    """
+    Schedule = apps.get_model('plan', 'Schedule')
+    ScheduleSection = apps.get_model('plan', 'ScheduleSection')
+    Term = apps.get_model('plan', 'Term')
+    TermCourse = apps.get_model('plan', 'TermCourse')
+
+    for duplicate in Term.objects.values('user', 'year', 'term_type').annotate(
+            first_id=Min('id'), count=Count('id')).filter(count__gt=1):
+        terms = Term.objects.filter(user=duplicate['user'], year=duplicate['year'],
+                                    term_type=duplicate['term_type']).exclude(id=duplicate['first_id'])
+        TermCourse.objects.filter(term__in=terms).update(term_id=duplicate['first_id'])
+        terms.delete()
+
+    for model, fields in ((ScheduleSection, ('schedule', 'section')), (TermCourse, ('term', 'course'))):
+        for duplicate in model.objects.values(*fields).annotate(first_id=Min('id'), count=Count('id')) \
+                .filter(count__gt=1):
+            model.objects.filter(**{field: duplicate[field] for field in fields}) \
+                .exclude(id=duplicate['first_id']).delete()
+
+    for duplicate in Schedule.objects.values('user', 'name').annotate(first_id=Min('id'), count=Count('id')) \
+            .filter(count__gt=1):
+        for schedule in Schedule.objects.filter(user=duplicate['user'], name=duplicate['name']) \
+                .exclude(id=duplicate['first_id']):
+            suffix = ' ({})'.format(schedule.id)
+            schedule.name = schedule.name[:100 - len(suffix)] + suffix
+            schedule.save(update_fields=['name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plan', '0005_remove_meeting_day_fields'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 3.1.2 on 2026-10-18 15:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('plan', '0006_remove_duplicates'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='courseoffering',
+            name='course',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='plan.course'),
+        ),
+        migrations.AlterField(
+            model_name='schedule',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='schedulesection',
+            name='schedule',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='plan.schedule'),
+        ),
+        migrations.AlterField(
+            model_name='term',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='plan.sequence'),
+        ),
+        migrations.AlterField(
+            model_name='termcourse',
+            name='term',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='plan.term'),
+        ),
+        migrations.AddIndex(
+            model_name='courseoffering',
+            index=models.Index(fields=['year', 'term_type'], name='course_offering_term_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='schedule',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='schedule_user_name_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='schedulesection',
+            constraint=models.UniqueConstraint(fields=('schedule', 'section'), name='schedule_section_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='term',
+            constraint=models.UniqueConstraint(fields=('user', 'year', 'term_type'), name='term_sequence_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='termcourse',
+            constraint=models.UniqueConstraint(fields=('term', 'course'), name='term_course_unique'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 3.1.2 on 2026-10-18 15:57
+
+from django.db import migrations, models
+import django.db.models.expressions
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plan', '0007_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='section',
+            name='capacity',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='section',
+            name='enrolled',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='section',
+            name='seat_updates',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='section',
+            name='waitlist_capacity',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='section',
+            name='waitlisted',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddConstraint(
+            model_name='section',
+            constraint=models.CheckConstraint(check=models.Q(('capacity__isnull', True), ('enrolled__lte', django.db.models.expressions.F('capacity')), _connector='OR'), name='section_enrolled_within_capacity'),
+        ),
+        migrations.AddConstraint(
+            model_name='section',
+            constraint=models.CheckConstraint(check=models.Q(waitlisted__lte=django.db.models.expressions.F('waitlist_capacity')), name='section_waitlisted_within_capacity'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.1.2 on 2026-10-18 16:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plan', '0008_section_seats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('scope', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField()),
+            ],
+        ),
+    ]
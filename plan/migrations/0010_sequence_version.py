@@ -0,0 +1,18 @@
+# Generated by Django 3.1.2 on 2026-10-18 16:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plan', '0009_catalog_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sequence',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1.2 on 2026-10-18 16:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plan', '0010_sequence_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='section',
+            name='enrolled',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='section',
+            name='seat_updates',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='section',
+            name='waitlisted',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
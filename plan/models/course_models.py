@@ -1,11 +1,65 @@
 #  Copyright (c) 2020. by Anton Nikitenko
 #  All rights reserved.
 
+from django.core.exceptions import ValidationError
 from django.db import models
 from plan.expressions import *
+from plan.utils import DateUtils, EPOCH_ORDINAL, WEEKDAY_LETTERS
 
 
-class Course(models.Model):
+class TrackedModel(models.Model):
+    """
+    A model remembering the values of the fields it was loaded with, and last saved with, so that the fields
+    changed since can be told without querying the database.
+    """
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        fields = self._meta.concrete_fields if update_fields is None else \
+            [self._meta.get_field(name) for name in update_fields]
+        self._loaded_values = dict(getattr(self, '_loaded_values', {}),
+                                   **{field.attname: getattr(self, field.attname) for field in fields})
+
+    def get_loaded_values(self, field_names):
+        """
+        Returns a dictionary of the values the given fields were loaded or last saved with, or None if the
+        instance was neither loaded nor saved with all of them.
+        """
+        loaded_values = getattr(self, '_loaded_values', {})
+        if not all(name in loaded_values for name in field_names):
+            return None
+        return {name: loaded_values[name] for name in field_names}
+
+
+class CounterModel(models.Model):
+    """
+    A model with counters, named by `COUNTER_FIELDS`, which are only changed by atomic UPDATE statements. Saving
+    a stored instance writes every other field, so that the counters it was loaded with are never written back.
+    """
+
+    COUNTER_FIELDS = ()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.COUNTER_FIELDS]
+        super().save(*args, **kwargs)
+
+
+class Course(TrackedModel):
     subject = models.CharField(max_length=4)
     number = models.CharField(max_length=8)
     name = models.CharField(max_length=200)
@@ -19,46 +73,86 @@ class Course(models.Model):
     offered_summer = models.BooleanField(blank=True, null=True)
     offered_fall = models.BooleanField(blank=True, null=True)
 
+    # Requisite document of the form {'expressions': [...]}, each entry being a JSON expression
+    # as described in `plan.schemas`
+    requirement = models.JSONField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['subject', 'number'], name='course_subject_number_unique')
+        ]
+
     def __str__(self):
         return self.subject + " " + self.number
 
-   #  TODO: Refactor
-   #  def evaluate_requirement(self, sequence):
-   #     """
-   #     Evaluates if the requirement is satisfied given a sequence.
-   #     """
-   #
-   #     expressions = [ExpressionFactory.build_and_get_expression(json_data) for json_data in
-   #                    self.requirement['expressions']]
-   #
-   #     evaluation_result_container = []
-   #     evaluation_result_status = True
-   #
-   #     for expression in expressions:
-   #         result = expression.evaluate_expression(sequence)
-   #         evaluation_result_container.append(result.expression_status)
-   #         if not result.satisfied:
-   #             evaluation_result_status = False
-   #             break
-   #
-   #     return evaluation_result_status, evaluation_result_container
-   #
-   #  TODO: Refactor
-   # def to_dict(self):
-   #     result = {
-   #         'course_code': self.course_code.to_dict(),
-   #         'name': self.name,
-   #         'credits': self.credits,
-   #         'hours_lectures': float(self.hours_lectures),
-   #         'hours_labs': float(self.hours_labs),
-   #         'hours_tutorials': float(self.hours_tutorials),
-   #         'requirement': self.requirement
-   #     }
-   #     return result
-
-
-class CourseOffering(models.Model):
-    course = models.ForeignKey(to=Course, on_delete=models.CASCADE)
+    def evaluate_requirement(self, sequence):
+        """
+        Evaluates if the requirement is satisfied given a sequence.
+
+        The requirement's expressions are compiled and cached by `ExpressionFactory`, so that checking the
+        same course repeatedly only pays for the evaluation itself.
+
+        Args:
+            sequence: A `SequenceSnapshot`, or a `Sequence` from which a snapshot will be built
+        """
+        from plan.snapshots import SequenceSnapshot
+
+        if not self.requirement:
+            return True, []
+
+        if not isinstance(sequence, SequenceSnapshot):
+            sequence = SequenceSnapshot.from_sequence(sequence)
+
+        expressions = [ExpressionFactory.build_and_get_expression(json_data) for json_data in
+                       self.requirement['expressions']]
+
+        evaluation_result_container = []
+        evaluation_result_status = True
+
+        for expression in expressions:
+            result = expression.evaluate_expression(sequence)
+            evaluation_result_container.append(result.expression_status)
+            if not result.satisfied:
+                evaluation_result_status = False
+                break
+
+        return evaluation_result_status, evaluation_result_container
+
+    # The fields of `to_dict`, in order, and those of them stored as decimals
+    DICT_FIELDS = ('subject', 'number', 'name', 'credits', 'hours_lectures', 'hours_labs', 'hours_tutorials',
+                   'offered_spring', 'offered_summer', 'offered_fall', 'requirement')
+    DECIMAL_FIELDS = ('credits', 'hours_lectures', 'hours_labs', 'hours_tutorials')
+
+    def to_dict(self):
+        result = {
+            'subject': self.subject,
+            'number': self.number,
+            'name': self.name,
+            'credits': float(self.credits),
+            'hours_lectures': float(self.hours_lectures),
+            'hours_labs': float(self.hours_labs),
+            'hours_tutorials': float(self.hours_tutorials),
+            'offered_spring': self.offered_spring,
+            'offered_summer': self.offered_summer,
+            'offered_fall': self.offered_fall,
+            'requirement': self.requirement
+        }
+        return result
+
+    @staticmethod
+    def values_to_dict(values):
+        """
+        Returns the dictionary of `to_dict` from the dictionary of a course returned by `values(*DICT_FIELDS)`,
+        which is updated in place, so that large querysets can be encoded without creating their models.
+        """
+        for field in Course.DECIMAL_FIELDS:
+            values[field] = float(values[field])
+        return values
+
+
+class CourseOffering(TrackedModel):
+    # Indexed by the leading column of `course_offering_term_unique`
+    course = models.ForeignKey(to=Course, on_delete=models.CASCADE, db_index=False)
     year = models.PositiveSmallIntegerField()
     term_type = models.CharField(
         choices=[
@@ -69,6 +163,14 @@ class CourseOffering(models.Model):
         max_length=10
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['course', 'year', 'term_type'], name='course_offering_term_unique')
+        ]
+        indexes = [
+            models.Index(fields=['year', 'term_type'], name='course_offering_term_idx')
+        ]
+
     def __str__(self):
         return str(self.course) + " - " + str(self.year) + " " + str(self.term_type)
 
@@ -82,7 +184,7 @@ class CourseOffering(models.Model):
         return result
 
 
-class Section(models.Model):
+class Section(CounterModel, TrackedModel):
     crn = models.IntegerField(primary_key=True)
     course_offering = models.ForeignKey(to=CourseOffering, on_delete=models.CASCADE)
     name = models.CharField(max_length=4)
@@ -95,10 +197,39 @@ class Section(models.Model):
         ]
     )
 
+    # Seats, with no limit when the capacity is unknown. The counters are only updated by the atomic statements
+    # of `plan.enrollment.SeatCounter`, never by saving a section, and `seat_updates` counts those statements.
+    capacity = models.PositiveIntegerField(null=True, blank=True)
+    enrolled = models.PositiveIntegerField(default=0, editable=False)
+    waitlist_capacity = models.PositiveIntegerField(default=0)
+    waitlisted = models.PositiveIntegerField(default=0, editable=False)
+    seat_updates = models.PositiveIntegerField(default=0, editable=False)
+
+    COUNTER_FIELDS = ('enrolled', 'waitlisted', 'seat_updates')
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(check=models.Q(capacity__isnull=True) | models.Q(enrolled__lte=models.F('capacity')),
+                                   name='section_enrolled_within_capacity'),
+            models.CheckConstraint(check=models.Q(waitlisted__lte=models.F('waitlist_capacity')),
+                                   name='section_waitlisted_within_capacity')
+        ]
+
+    def clean(self):
+        # The capacities cannot drop below the counters, which the check constraints would reject when saving
+        errors = {}
+        if self.capacity is not None and self.capacity < self.enrolled:
+            errors['capacity'] = 'The capacity cannot be below the {} students enrolled.'.format(self.enrolled)
+        if self.waitlist_capacity < self.waitlisted:
+            errors['waitlist_capacity'] = 'The waitlist capacity cannot be below the {} students waitlisted.' \
+                .format(self.waitlisted)
+        if errors:
+            raise ValidationError(errors)
+
     def to_dict(self):
         result = {
             'crn': self.crn,
-            'course_offering': self.course_offering.id,
+            'course_offering': self.course_offering_id,
             'name': self.name,
             'section_type': self.section_type
         }
@@ -107,56 +238,48 @@ class Section(models.Model):
 
     # TODO: Add location field
 
-    # def does_section_conflict(self, section_to_compare):
-    #     for meeting_to_compare in section_to_compare:
-    #         for meeting in self.meetings:
-    #             if meeting.does_meeting_conflict(meeting_to_compare):
-    #                 return True
-    #
-    #     return False
-
     def __str__(self):
         return str(self.course_offering) + " - " + str(self.crn) + " - " + str(self.name)
 
 
-class Meeting(models.Model):
+class Meeting(TrackedModel):
     section = models.ForeignKey(to=Section, on_delete=models.CASCADE)
 
     start_date = models.DateField()
     end_date = models.DateField()
-    start_time = models.TimeField()
-    end_time = models.TimeField()
-
-    # TODO: Ensure that when creating course, default value is False
-    meet_M = models.BooleanField(blank=False, null=False, default=False)
-    meet_T = models.BooleanField(blank=False, null=False, default=False)
-    meet_W = models.BooleanField(blank=False, null=False, default=False)
-    meet_R = models.BooleanField(blank=False, null=False, default=False)
-    meet_F = models.BooleanField(blank=False, null=False, default=False)
-    meet_S = models.BooleanField(blank=False, null=False, default=False)
-    meet_Z = models.BooleanField(blank=False, null=False, default=False)
+
+    # The days of the week as a bitmask, with bit `n` set for `Weekday(n)` (see `plan.utils`)
+    weekdays = models.PositiveSmallIntegerField(default=0)
+    # The start and end times, in minutes after midnight
+    start_minute = models.PositiveSmallIntegerField()
+    end_minute = models.PositiveSmallIntegerField()
 
     def __str__(self):
         return str(self.section)
 
     def to_dict(self):
         result = {
-            'section': self.section.crn,
+            'section': self.section_id,
             'start_date': str(self.start_date),
             'end_date': str(self.end_date),
-            'start_time': str(self.start_time),
-            'end_time': str(self.end_time),
-            'meet_M': self.meet_M,
-            'meet_T': self.meet_T,
-            'meet_W': self.meet_W,
-            'meet_R': self.meet_R,
-            'meet_F': self.meet_F,
-            'meet_S': self.meet_S,
-            'meet_Z': self.meet_Z
+            'start_time': str(DateUtils.get_time_of_minute(self.start_minute)),
+            'end_time': str(DateUtils.get_time_of_minute(self.end_minute)),
+            'weekdays': self.weekdays
         }
 
+        for index, letter in enumerate(WEEKDAY_LETTERS):
+            result['meet_' + letter] = bool(self.weekdays & (1 << index))
+
         return result
 
+    def to_compact(self):
+        """
+        Returns the meeting as a list of integers: the section CRN, the days of the week bitmask, the start and
+        end minutes of the day, and the start and end dates as days since 1970-01-01.
+        """
+        return [self.section_id, self.weekdays, self.start_minute, self.end_minute,
+                self.start_date.toordinal() - EPOCH_ORDINAL, self.end_date.toordinal() - EPOCH_ORDINAL]
+
     # def to_dict(self):
     #     result = {
     #         'days': [day.to_dict()['day'] for day in self.days],
@@ -167,37 +290,14 @@ class Meeting(models.Model):
     #     return result
 
 
-    #
-    # def does_meeting_conflict(self, meeting_to_compare):
-    #
-    #     if not DateUtils.do_dates_overlap(self.date_range, meeting_to_compare.date_range):
-    #         # Skip if the date ranges don't overlap
-    #         return False
-    #
-    #     # If the start and end dates overlap for 6 days or less, then
-    #     # we must only check the specific days they overlap for time
-    #     # conflicts.
-    #     if abs(meeting_to_compare.date_range.end_date - self.date_range.start_date) < datetime.timedelta(days=7) \
-    #         or abs(self.date_range.end_date - meeting_to_compare.date_range.start_date) < datetime.timedelta(days=7):
-    #
-    #         overlapping_weekdays = DateUtils.get_weekdays_in_date_range(meeting_to_compare.date_range.start_date, self.date_range.end_date)
-    #         # TODO: Double-check compatibility  with MeetingDay ArrayField
-    #         weekdays_to_compare = [day for day in overlapping_weekdays if (day in meeting_to_compare.days) and (day in self.days)]
-    #
-    #         if len(weekdays_to_compare) == 0:
-    #             return False
-    #         if DateUtils.do_times_overlap(self.time_range, meeting_to_compare.time_range):
-    #             return True
-    #
-    #     # Third case when overlap is 7 days or more. Any weekdays are applicable
-    #     else:
-    #         weekdays_to_compare = [day for day in list(Weekday) if (day in meeting_to_compare.days) and (day in self.days)]
-    #         if len(weekdays_to_compare) == 0:
-    #             return False
-    #
-    #         # TODO: Double-check compatibility with MeetingDay
-    #         if DateUtils.do_times_overlap(self.time_range, meeting_to_compare.time_range):
-    #             return True
-    #
-    #     return False
-    #
+class CatalogVersion(models.Model):
+    """
+    A version of the catalog shared by every process, changed by `CatalogSnapshot.bump_version` whenever the data
+    of its scope is written (see `plan.catalog`).
+    """
+
+    scope = models.CharField(max_length=20, primary_key=True)
+    version = models.BigIntegerField()
+
+    def __str__(self):
+        return self.scope + " - " + str(self.version)
@@ -2,12 +2,35 @@
 #  All rights reserved.
 
 from django.db import models
+from plan.expressions import ExpressionFactory
 
 
 class Program(models.Model):
+    institution = models.CharField(max_length=100)
     name = models.CharField(max_length=50)
 
-    #TODO: Refactor
+    # Requirement document of the form {'expressions': [...]}, all of which must be satisfied
+    requirements = models.JSONField(blank=True, null=True)
+
+    def evaluate_requirements(self, snapshot):
+        """
+        Evaluates every requirement of the program given a `SequenceSnapshot`. Unlike a course requirement,
+        evaluation does not stop at the first unsatisfied expression, so that the status of each is reported.
+        """
+        expressions = [ExpressionFactory.build_and_get_expression(json_data) for json_data in
+                       (self.requirements or {}).get('expressions', [])]
+
+        evaluation_result_container = []
+        evaluation_result_status = True
+
+        for expression in expressions:
+            result = expression.evaluate_expression(snapshot)
+            evaluation_result_container.append(result.expression_status)
+            if not result.satisfied:
+                evaluation_result_status = False
+
+        return evaluation_result_status, evaluation_result_container
+
     def to_dict(self):
         result = {
             'institution': self.institution,
@@ -1,15 +1,15 @@
 #  Copyright (c) 2020. by Anton Nikitenko
 #  All rights reserved.
 
-import datetime
 from django.contrib.auth.models import User
 from django.db import models
-from plan.utils import DateUtils, Weekday
-from .course_models import Section
+from plan.conflicts import ConflictIndex, MeetingRecord
+from .course_models import Meeting, Section
 
 
 class Schedule(models.Model):
-    user = models.ForeignKey(to=User, on_delete=models.CASCADE)
+    # Indexed by the leading column of `schedule_user_name_unique`
+    user = models.ForeignKey(to=User, on_delete=models.CASCADE, db_index=False)
     year = models.PositiveSmallIntegerField()
     term = models.CharField(
         choices=[
@@ -21,6 +21,11 @@ class Schedule(models.Model):
     )
     name = models.CharField(max_length=100)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'name'], name='schedule_user_name_unique')
+        ]
+
     def to_dict(self):
         result = {
             'id': self.id,
@@ -33,20 +38,30 @@ class Schedule(models.Model):
     def __str__(self):
         return str(self.user) + " - " + self.name
 
-    # def does_section_conflict(self, section_to_compare):
-    #     result = {'conflicts': False, 'data': []}
-    #     for section in self.sections.all():
-    #         conflict_exists = section.does_section_conflict(section_to_compare)
-    #         if conflict_exists:
-    #             result['conflicts'] = True
-    #             result['data'].append(section.crn)
-    #
-    #     return result
+    def does_section_conflict(self, section_to_compare):
+        """
+        Determines which sections of the schedule have a meeting conflicting with one of the section's
+        meetings. The meetings of the schedule are indexed by `ConflictIndex`, and both sets of meetings are
+        fetched with a single query each.
+        """
+        index = ConflictIndex(MeetingRecord.from_queryset(
+            Meeting.objects.filter(section__schedulesection__schedule=self)))
+        conflicting_crns = index.find_conflicts(MeetingRecord.from_queryset(
+            Meeting.objects.filter(section=section_to_compare)))
+
+        result = {'conflicts': len(conflicting_crns) > 0, 'data': conflicting_crns}
+        return result
 
 
 class ScheduleSection(models.Model):
-    schedule = models.ForeignKey(to=Schedule, on_delete=models.CASCADE)
+    # Indexed by the leading column of `schedule_section_unique`
+    schedule = models.ForeignKey(to=Schedule, on_delete=models.CASCADE, db_index=False)
     section = models.ForeignKey(to=Section, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['schedule', 'section'], name='schedule_section_unique')
+        ]
+
     def __str__(self):
         return str(self.schedule) + " - " + str(self.section)
\ No newline at end of file
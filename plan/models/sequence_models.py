@@ -3,13 +3,19 @@
 
 from django.contrib.auth.models import User
 from django.db import models
-from .course_models import Course
+from .course_models import Course, CounterModel
 
 
-class Sequence(models.Model):
+class Sequence(CounterModel):
     user = models.ForeignKey(to=User, on_delete=models.CASCADE)
     name = models.CharField(max_length=100, blank=False)
 
+    # Incremented within the transaction of every write to the terms and courses of the sequence by
+    # `plan.signals`, so that cached evaluations can tell they are outdated
+    version = models.PositiveIntegerField(default=0, editable=False)
+
+    COUNTER_FIELDS = ('version',)
+
     # def to_dict(self):
     #     result = {
     #         'name': self.name,
@@ -19,7 +25,8 @@ class Sequence(models.Model):
 
 
 class Term(models.Model):
-    user = models.ForeignKey(to=Sequence, on_delete=models.CASCADE)
+    # Indexed by the leading column of `term_sequence_unique`
+    user = models.ForeignKey(to=Sequence, on_delete=models.CASCADE, db_index=False)
     year = models.PositiveSmallIntegerField()
     term_type = models.PositiveSmallIntegerField(
         choices=[
@@ -28,6 +35,11 @@ class Term(models.Model):
             (3, 'fall')
         ]
     )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'year', 'term_type'], name='term_sequence_unique')
+        ]
     #TODO: Add multiple attributes for up to 10 courses??
     #courses = models.ArrayReferenceField(
     #    to=Course,
@@ -51,4 +63,10 @@ class Term(models.Model):
 
 class TermCourse(models.Model):
     course = models.ForeignKey(to=Course, on_delete=models.CASCADE)
-    term = models.ForeignKey(to=Term, on_delete=models.CASCADE)
+    # Indexed by the leading column of `term_course_unique`
+    term = models.ForeignKey(to=Term, on_delete=models.CASCADE, db_index=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'course'], name='term_course_unique')
+        ]
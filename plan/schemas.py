@@ -89,6 +89,71 @@ REGISTRATION_RESTRICTION_EXPRESSION_SCHEMA = {
     "required": ["expression"]
 }
 
+# Schema for a complete requisite document. Every node is checked against `EXPRESSION_SCHEMA` and the schema
+# of its own expression type, and nested expressions are resolved recursively, so that a whole requisite tree
+# is validated with a single call instead of once per node.
+REQUISITE_SCHEMA = {
+    "$ref": "#/definitions/expression",
+    "definitions": {
+        "expression": {
+            "allOf": [
+                EXPRESSION_SCHEMA,
+                {
+                    "anyOf": [
+                        {"$ref": "#/definitions/course"},
+                        {"$ref": "#/definitions/conditional"},
+                        {"$ref": "#/definitions/list"},
+                        {"$ref": "#/definitions/registration_restriction"}
+                    ]
+                }
+            ]
+        },
+        "course": {
+            "allOf": [
+                {"properties": {"expression_type": {"const": "COURSE"}}},
+                COURSE_EXPRESSION_SCHEMA
+            ]
+        },
+        "conditional": {
+            "allOf": [
+                {"properties": {"expression_type": {"const": "CONDITIONAL"}}},
+                CONDITIONAL_EXPRESSION_SCHEMA,
+                {
+                    "properties": {
+                        "expression_one": {"$ref": "#/definitions/expression"},
+                        "expression_two": {"$ref": "#/definitions/expression"}
+                    }
+                }
+            ]
+        },
+        "list": {
+            "allOf": [
+                {"properties": {"expression_type": {"const": "LIST"}}},
+                LIST_EXPRESSION_SCHEMA,
+                {
+                    "properties": {
+                        "expressions": {
+                            "type": "array",
+                            "items": {"$ref": "#/definitions/expression"}
+                        }
+                    }
+                }
+            ]
+        },
+        "registration_restriction": {
+            "allOf": [
+                {"properties": {"expression_type": {"const": "REGISTRATION_RESTRICTION"}}},
+                REGISTRATION_RESTRICTION_EXPRESSION_SCHEMA,
+                {
+                    "properties": {
+                        "expression": {"$ref": "#/definitions/expression"}
+                    }
+                }
+            ]
+        }
+    }
+}
+
 # YEAR_STANDING_EXPRESSION_SCHEMA = {
 #    "type": "object",
 #    "properties": {
@@ -0,0 +1,318 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+import bisect
+import re
+import threading
+from collections import Counter
+from plan.catalog import CatalogSnapshot
+from plan.models import Course
+
+
+class CourseSearchIndex:
+    """
+    An in-memory index of the subject, number and name of every course of the catalog, answering the queries
+    typed into the course picker, such as 'CSC 2', 'data struct' or 'calculus'.
+
+    Courses are numbered by their position in course code order, and every token of a course (its subject, its
+    number and each word of its name) maps to the bitset of the positions of the courses containing it. Tokens
+    are kept in a sorted vocabulary, so that the courses with a token starting with a given prefix are the union
+    of the bitsets of a range of the vocabulary, which is cached per prefix. Results are ranked in tiers, and in
+    course code order within a tier:
+      0. The course whose code is the query (e.g 'CSC 225')
+      1. The courses of the subject of the query, with a number starting with its number if any (e.g 'CSC 2')
+      2. The courses containing every token of the query
+      3. The courses containing a token starting with every token of the query
+      4. The courses containing, for every token of the query, a token starting with it or similar to it, the
+         similarity being that of the trigrams of both tokens as computed by PostgreSQL's `pg_trgm`
+
+    The index shared by the process is built on first use, and kept up to date by the signals of `plan.signals`
+    on every write to a `Course` made by the process. Courses added since the index was built are numbered after
+    all the others, and are sorted among them when the results are ranked, until `REBUILD_THRESHOLD` courses were
+    added or updated and the index is built again from its own documents. The index is built again from the
+    catalog by `get_instance` when the courses are written by another process, or by an import.
+    """
+
+    TOKEN_PATTERN = re.compile(r'[a-z]+|[0-9]+[a-z]*')
+
+    # The minimum trigram similarity for a token to be considered similar to a token of the query
+    SIMILARITY_THRESHOLD = 0.3
+    MAX_CACHED_PREFIXES = 10000
+
+    # The number of courses added or updated since the index was built, beyond which it is built again
+    REBUILD_THRESHOLD = 1000
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, courses=()):
+        """
+        Args:
+            courses: An iterable of (primary key, subject, number, name) tuples
+        """
+        self._lock = threading.RLock()
+
+        # The version of the courses the index reflects, if it was built from the catalog
+        self.version = None
+
+        self.documents = []
+        self.positions = {}
+        self.sorted_count = 0
+
+        self.subject_courses = {}
+        self.number_courses = {}
+        self.token_courses = {}
+        self.vocabulary = []
+        self.trigram_tokens = {}
+        self.prefix_courses = {}
+
+        for course in sorted(courses, key=lambda course: (course[1], course[2])):
+            self._add_document(*course)
+        self.sorted_count = len(self.documents)
+
+    @staticmethod
+    def from_catalog():
+        version = CatalogSnapshot.get_version(CatalogSnapshot.COURSES)
+        index = CourseSearchIndex(Course.objects.values_list('pk', 'subject', 'number', 'name').iterator())
+        index.version = version
+        return index
+
+    @staticmethod
+    def get_instance():
+        """
+        Returns the index of the catalog shared by the process, building it again whenever the courses changed,
+        including by another process.
+        """
+        version = CatalogSnapshot.get_version(CatalogSnapshot.COURSES)
+        index = CourseSearchIndex._instance
+        if index is not None and index.version == version:
+            return index
+
+        with CourseSearchIndex._instance_lock:
+            index = CourseSearchIndex._instance
+            if index is None or index.version != version:
+                index = CourseSearchIndex.from_catalog()
+                CourseSearchIndex._instance = index
+            return index
+
+    @staticmethod
+    def on_course_changed(course_id, subject, number, name, versions, deleted=False):
+        """
+        Keeps the shared index, if it has been built, up to date with a committed write to a `Course`, as
+        `PrerequisiteGraph.on_course_changed` does.
+
+        Args:
+            versions: The versions of the courses before and after the write, as returned by `bump_version`
+        """
+        previous_version, version = versions
+        index = CourseSearchIndex._instance
+        if index is not None:
+            with index._lock:
+                if index.version != previous_version:
+                    return
+                if deleted:
+                    index.remove_course(course_id)
+                else:
+                    index.update_course(course_id, subject, number, name)
+                index.version = version
+
+    def __len__(self):
+        return len(self.positions)
+
+    def update_course(self, course_id, subject, number, name):
+        with self._lock:
+            self.remove_course(course_id)
+            self._add_document(course_id, subject, number, name)
+            self.prefix_courses.clear()
+
+            if len(self.documents) - self.sorted_count > self.REBUILD_THRESHOLD:
+                index = CourseSearchIndex(document for document in self.documents if document is not None)
+                index._lock = self._lock
+                self.__dict__.update(index.__dict__)
+
+    def remove_course(self, course_id):
+        with self._lock:
+            position = self.positions.pop(course_id, None)
+            if position is None:
+                return
+
+            _, subject, number, name = self.documents[position]
+            self.documents[position] = None
+            mask = ~(1 << position)
+
+            self._remove_from(self.subject_courses, subject.lower(), mask)
+            self._remove_from(self.number_courses, number.lower(), mask)
+            for token in self._get_document_tokens(subject, number, name):
+                if not self._remove_from(self.token_courses, token, mask):
+                    del self.vocabulary[bisect.bisect_left(self.vocabulary, token)]
+                    for trigram in self._get_trigrams(token):
+                        tokens = self.trigram_tokens[trigram]
+                        tokens.discard(token)
+                        if not tokens:
+                            del self.trigram_tokens[trigram]
+            self.prefix_courses.clear()
+
+    def search(self, query, limit=20):
+        """
+        Returns the best matching courses for a query, as dictionaries with their subject, number and name.
+        """
+        tokens = self.TOKEN_PATTERN.findall(query.lower())
+        if not tokens or limit <= 0:
+            return []
+
+        with self._lock:
+            tiers = []
+
+            # A query starting with a subject is first matched against course codes
+            subject_courses = self.subject_courses.get(tokens[0], 0)
+            if subject_courses:
+                if len(tokens) > 1:
+                    tiers.append(subject_courses & self.number_courses.get(tokens[1], 0) &
+                                 self._get_all_prefix_courses(tokens[2:]))
+                    tiers.append(subject_courses & self._get_prefix_courses(tokens[1], self.number_courses) &
+                                 self._get_all_prefix_courses(tokens[2:]))
+                else:
+                    tiers.append(subject_courses)
+
+            exact_courses = self._get_all_exact_courses(tokens)
+            tiers.append(exact_courses)
+            prefix_courses = self._get_all_prefix_courses(tokens)
+            tiers.append(prefix_courses)
+
+            # Misspelled queries only match similar tokens when there are not enough other results
+            positions = self._get_ranked_positions(tiers, limit)
+            if len(positions) < limit:
+                fuzzy_courses = ~0
+                for token in tokens:
+                    fuzzy_courses &= self._get_prefix_courses(token) | self._get_similar_courses(token)
+                tiers.append(fuzzy_courses)
+                positions = self._get_ranked_positions(tiers, limit)
+
+            return [{'subject': subject, 'number': number, 'name': name} for _, subject, number, name in
+                    (self.documents[position] for position in positions)]
+
+    def _add_document(self, course_id, subject, number, name):
+        position = len(self.documents)
+        self.documents.append((course_id, subject, number, name))
+        self.positions[course_id] = position
+        bit = 1 << position
+
+        self.subject_courses[subject.lower()] = self.subject_courses.get(subject.lower(), 0) | bit
+        self.number_courses[number.lower()] = self.number_courses.get(number.lower(), 0) | bit
+        for token in self._get_document_tokens(subject, number, name):
+            courses = self.token_courses.get(token)
+            if courses is None:
+                courses = 0
+                bisect.insort(self.vocabulary, token)
+                for trigram in self._get_trigrams(token):
+                    self.trigram_tokens.setdefault(trigram, set()).add(token)
+            self.token_courses[token] = courses | bit
+
+    def _get_document_tokens(self, subject, number, name):
+        return {subject.lower(), number.lower()} | set(self.TOKEN_PATTERN.findall(name.lower()))
+
+    @staticmethod
+    def _remove_from(courses, key, mask):
+        """
+        Removes the course of `mask` from the bitset of the key. Returns False if the key has no course left.
+        """
+        remaining = courses[key] & mask
+        if remaining:
+            courses[key] = remaining
+            return True
+        del courses[key]
+        return False
+
+    def _get_all_exact_courses(self, tokens):
+        courses = ~0
+        for token in tokens:
+            courses &= self.token_courses.get(token, 0)
+        return courses
+
+    def _get_all_prefix_courses(self, tokens):
+        courses = ~0
+        for token in tokens:
+            courses &= self._get_prefix_courses(token)
+        return courses
+
+    def _get_prefix_courses(self, prefix, token_courses=None):
+        """
+        Returns the bitset of the courses with a token starting with `prefix`, or with a number starting with it
+        if `token_courses` is the number index.
+        """
+        if token_courses is not None:
+            return self._union(courses for number, courses in token_courses.items() if number.startswith(prefix))
+
+        courses = self.prefix_courses.get(prefix)
+        if courses is None:
+            start = bisect.bisect_left(self.vocabulary, prefix)
+            end = bisect.bisect_left(self.vocabulary, prefix + '\uffff', start)
+            courses = self._union(self.token_courses[token] for token in self.vocabulary[start:end])
+
+            if len(self.prefix_courses) >= self.MAX_CACHED_PREFIXES:
+                self.prefix_courses.clear()
+            self.prefix_courses[prefix] = courses
+        return courses
+
+    def _get_similar_courses(self, token):
+        """
+        Returns the bitset of the courses with a token whose trigram similarity with `token` is at least
+        `SIMILARITY_THRESHOLD`.
+        """
+        trigrams = self._get_trigrams(token)
+        shared = Counter()
+        for trigram in trigrams:
+            shared.update(self.trigram_tokens.get(trigram, ()))
+
+        return self._union(self.token_courses[other] for other, count in shared.items()
+                           if count / (len(trigrams) + len(self._get_trigrams(other)) - count) >=
+                           self.SIMILARITY_THRESHOLD)
+
+    @staticmethod
+    def _get_trigrams(token):
+        padded = '  ' + token + ' '
+        return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+    @staticmethod
+    def _union(bitsets):
+        courses = 0
+        for bitset in bitsets:
+            courses |= bitset
+        return courses
+
+    def _get_ranked_positions(self, tiers, limit):
+        """
+        Returns the positions of the first `limit` courses of the tiers, each course only being returned for the
+        first tier containing it.
+        """
+        positions = []
+        seen = 0
+        for courses in tiers:
+            courses &= ~seen
+            seen |= courses
+            if courses:
+                positions.extend(self._get_first_positions(courses, limit - len(positions)))
+                if len(positions) >= limit:
+                    break
+        return positions
+
+    def _get_first_positions(self, courses, limit):
+        """
+        Returns the positions of the first `limit` courses of a bitset in course code order.
+        """
+        sorted_courses = courses & ((1 << self.sorted_count) - 1)
+        positions = []
+        bits = bin(sorted_courses)[:1:-1]
+        position = bits.find('1')
+        while position >= 0 and len(positions) < limit:
+            positions.append(position)
+            position = bits.find('1', position + 1)
+
+        # Courses added since the index was built are not in code order
+        added_courses = courses >> self.sorted_count
+        if added_courses:
+            bits = bin(added_courses)[:1:-1]
+            positions.extend(self.sorted_count + position for position, bit in enumerate(bits) if bit == '1')
+            positions.sort(key=lambda position: self.documents[position][1:3])
+            del positions[limit:]
+        return positions
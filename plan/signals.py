@@ -0,0 +1,112 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+import copy
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from plan.cache import CatalogCache
+from plan.catalog import CatalogSnapshot
+from plan.evaluations import SequenceEvaluation
+from plan.graph import PrerequisiteGraph
+from plan.metrics import RequestMetrics
+from plan.models import Course, CourseOffering, Meeting, Section, Term, TermCourse
+from plan.search import CourseSearchIndex
+
+
+@receiver(post_save, sender=Course)
+def on_course_saved(sender, instance, **kwargs):
+    _on_course_changed(instance)
+
+
+@receiver(post_delete, sender=Course)
+def on_course_deleted(sender, instance, **kwargs):
+    _on_course_changed(instance, deleted=True)
+
+
+def _on_course_changed(course, deleted=False):
+    # The graph and search index of this process are updated once the write commits, with the course as it was
+    # written, and those of the other processes are built again from the new version of the courses
+    course_id, subject, number, name = course.pk, course.subject, course.number, course.name
+    course_code, requirement = str(course), None if deleted else course.requirement
+    previous_course_code = None if deleted else getattr(course, '_previous_course_code', None)
+    versions = CatalogSnapshot.bump_version(CatalogSnapshot.COURSES)
+    transaction.on_commit(lambda: PrerequisiteGraph.on_course_changed(course_code, requirement, versions,
+                                                                      previous_course_code, deleted))
+    transaction.on_commit(lambda: CourseSearchIndex.on_course_changed(course_id, subject, number, name, versions,
+                                                                      deleted))
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+@receiver(post_save, sender=CourseOffering)
+@receiver(post_delete, sender=CourseOffering)
+@receiver(post_save, sender=Section)
+@receiver(post_delete, sender=Section)
+@receiver(post_save, sender=Meeting)
+@receiver(post_delete, sender=Meeting)
+def on_catalog_changed(sender, instance, **kwargs):
+    # Bumped within the transaction of the write, so that the other processes see both at once, and only once
+    # the cache entries containing the instance are marked as changed
+    keys = set(CatalogCache.get_instance_keys(instance) + getattr(instance, '_previous_cache_keys', []))
+    cache = CatalogCache.get_instance()
+    cache.mark_changed(keys)
+    versions = CatalogSnapshot.bump_version()
+    cache.mark_changed(keys, versions[1])
+    transaction.on_commit(lambda: cache.invalidate(*keys, versions=versions))
+
+
+@receiver(pre_save, sender=Course)
+@receiver(pre_save, sender=CourseOffering)
+@receiver(pre_save, sender=Section)
+@receiver(pre_save, sender=Meeting)
+def on_catalog_saving(sender, instance, **kwargs):
+    # Remember the entries containing the stored instance if the fields they are keyed by changed, which is only
+    # looked up in the database for an instance neither loaded nor saved with these fields
+    instance._previous_cache_keys = []
+    instance._previous_course_code = None
+    if instance.pk is None:
+        return
+
+    key_fields = CatalogCache.KEY_FIELDS[sender]
+    loaded_values = instance.get_loaded_values(key_fields)
+    if loaded_values is None:
+        previous = sender.objects.filter(pk=instance.pk).first()
+    elif any(getattr(instance, field) != value for field, value in loaded_values.items()):
+        previous = copy.copy(instance)
+        for field, value in loaded_values.items():
+            setattr(previous, field, value)
+    else:
+        previous = None
+
+    if previous is not None:
+        instance._previous_cache_keys = CatalogCache.get_instance_keys(previous)
+        if sender is Course:
+            # The graph of the process also indexes a course by its code, which changes with these fields
+            instance._previous_course_code = str(previous)
+
+
+@receiver(post_save, sender=Term)
+@receiver(post_delete, sender=Term)
+@receiver(post_save, sender=TermCourse)
+@receiver(post_delete, sender=TermCourse)
+def on_sequence_changed(sender, instance, **kwargs):
+    if isinstance(instance, Term):
+        sequence_id = instance.user_id
+    elif TermCourse.term.is_cached(instance):
+        sequence_id = instance.term.user_id
+    else:
+        # The term may already be deleted by a cascade, in which case its own signal invalidates the sequence
+        sequence_id = Term.objects.filter(pk=instance.term_id).values_list('user_id', flat=True).first()
+
+    if sequence_id is not None:
+        # Incremented within the transaction of the write, so that the other processes see both at once
+        SequenceEvaluation.bump_version(sequence_id)
+
+
+@receiver(connection_created)
+def on_connection_created(sender, connection, **kwargs):
+    # Wrappers are kept by the connection object, which is reused when it reconnects
+    if RequestMetrics.execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(RequestMetrics.execute)
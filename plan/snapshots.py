@@ -0,0 +1,91 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+from plan.models import Term, TermCourse
+
+
+class SequenceSnapshot:
+    """
+    An in-memory view of a sequence against which requisite expressions are evaluated.
+
+    The snapshot is built once per request and maps each course code to the ordinal of the earliest term
+    that contains it, so that every course expression is answered with a single dictionary lookup instead
+    of a query per term. The `Sequence`, `Term` and `TermCourse` models remain the storage of record.
+
+    Expressions are evaluated relative to a target term: prerequisites must be completed in an earlier
+    term, while corequisites may also be taken in the target term itself. Unless specified otherwise, the
+    target is the latest term of the sequence.
+    """
+
+    __slots__ = ('course_ordinals', 'term_ordinals', 'target_ordinal')
+
+    def __init__(self, course_ordinals=None, term_ordinals=None, target_ordinal=None):
+        """
+        Args:
+            course_ordinals: A dictionary mapping course codes (e.g 'CSC 225') to earliest term ordinals
+            term_ordinals: The ordinals of all the terms of the sequence
+            target_ordinal: The ordinal of the term to evaluate expressions for
+        """
+        self.course_ordinals = course_ordinals if course_ordinals is not None else {}
+        self.term_ordinals = sorted(set(term_ordinals if term_ordinals is not None else
+                                        self.course_ordinals.values()))
+
+        if target_ordinal is None and self.term_ordinals:
+            target_ordinal = self.term_ordinals[-1]
+        self.target_ordinal = target_ordinal
+
+    @staticmethod
+    def from_sequence(sequence):
+        """
+        Builds the snapshot of a `Sequence` with two queries: one for its terms, and one for the courses of
+        every term joined to the `Course` table.
+        """
+        term_ordinals = [SequenceSnapshot.get_term_ordinal(year, term_type) for year, term_type in
+                         Term.objects.filter(user=sequence).values_list('year', 'term_type')]
+
+        course_ordinals = {}
+        rows = TermCourse.objects.filter(term__user=sequence).values_list(
+            'course__subject', 'course__number', 'term__year', 'term__term_type')
+
+        for subject, number, year, term_type in rows:
+            course_code = SequenceSnapshot.get_course_code(subject, number)
+            ordinal = SequenceSnapshot.get_term_ordinal(year, term_type)
+            if ordinal < course_ordinals.get(course_code, ordinal + 1):
+                course_ordinals[course_code] = ordinal
+
+        return SequenceSnapshot(course_ordinals, term_ordinals)
+
+    @staticmethod
+    def get_course_code(subject, number):
+        return subject + " " + number
+
+    @staticmethod
+    def get_term_ordinal(year, term_type):
+        """
+        Returns an integer that orders terms chronologically, given the year and the `Term.term_type`
+        (1 for spring, 2 for summer and 3 for fall).
+        """
+        return year * 3 + (term_type - 1)
+
+    @staticmethod
+    def get_term(ordinal):
+        """
+        Returns the year and term type of a term ordinal, the inverse of `get_term_ordinal`.
+        """
+        return ordinal // 3, ordinal % 3 + 1
+
+    def get_course_ordinal(self, course_code):
+        """
+        Returns the ordinal of the earliest term containing the course, or None if it is not in the sequence.
+        """
+        return self.course_ordinals.get(course_code)
+
+    def at_term(self, year, term_type):
+        """
+        Returns a snapshot sharing the same data, but evaluating expressions relative to the specified term.
+        """
+        snapshot = SequenceSnapshot.__new__(SequenceSnapshot)
+        snapshot.course_ordinals = self.course_ordinals
+        snapshot.term_ordinals = self.term_ordinals
+        snapshot.target_ordinal = SequenceSnapshot.get_term_ordinal(year, term_type)
+        return snapshot
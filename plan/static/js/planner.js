@@ -50,6 +50,39 @@ function convert_meeting_days_to_numbers_array(array) {
     return days;
 }
 
+/**
+ * Decodes a meeting in the compact encoding of the API, a list of integers
+ * [section, weekdays bitmask, start minute, end minute, start day, end day], where
+ * bit n of the bitmask is set for the n-th day starting from Monday, and days are
+ * counted from 1970-01-01.
+ * @param values
+ */
+function decode_compact_meeting(values) {
+    let format_minute = function(minute) {
+        return String(Math.floor(minute / 60)).padStart(2, "0") + ":" + String(minute % 60).padStart(2, "0");
+    };
+    let format_day = function(day) {
+        return new Date(day * 86400000).toISOString().slice(0, 10);
+    };
+
+    let days = [];
+    let index;
+    for (index = 0; index < 7; index++) {
+        if (values[1] & (1 << index)) {
+            days.push((index + 1) % 7);
+        }
+    }
+
+    return {
+        "section": values[0],
+        "start_date": format_day(values[4]),
+        "end_date": format_day(values[5]),
+        "start_time": format_minute(values[2]),
+        "end_time": format_minute(values[3]),
+        "days": days
+    };
+}
+
 /**
  * Provides a set of methods that calls the course API methods (incl course offerings)
  */
@@ -65,8 +98,26 @@ class CourseProvider {
             successCallbackHandler(data);
         });
     }
+
+    /**
+     * Fetches the full course catalog. The request is only sent once per page, and the browser
+     * revalidates the catalog with its ETag, so an unchanged catalog is never downloaded twice.
+     * @param successCallbackHandler
+     */
+    static get_catalog(successCallbackHandler) {
+        if (CourseProvider.catalog_request === null) {
+            CourseProvider.catalog_request = $.get("/api/data/course", {action: "get"}).fail(function() {
+                CourseProvider.catalog_request = null;
+            });
+        }
+        CourseProvider.catalog_request.done(function(data) {
+            successCallbackHandler(data);
+        });
+    }
 }
 
+CourseProvider.catalog_request = null;
+
 /**
  * Provides a set of methods that calls the schedule API methods.
  */
@@ -100,7 +151,7 @@ class ScheduleProvider {
      * @param successCallbackHandler
      */
     static get_schedule_sections(id, successCallbackHandler) {
-        $.get("/api/section/get", { id: id}).done(function(data){
+        $.get("/api/section/get", { id: id, encoding: "compact"}).done(function(data){
             successCallbackHandler(data);
         });
     }
@@ -0,0 +1,144 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+import asyncio
+import itertools
+import json
+import threading
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from plan.executors import DatabaseExecutor
+
+
+class StreamedObject:
+    """
+    Wraps an iterator of (key, value) pairs to be streamed as a JSON object by `StreamingJsonResponse`.
+    """
+
+    __slots__ = ('items',)
+
+    def __init__(self, items):
+        self.items = items
+
+
+class StreamingJsonResponse(StreamingHttpResponse):
+    """
+    A streaming response encoding a JSON document, in which iterators are encoded as arrays and
+    `StreamedObject` as objects as they are consumed, so that large results are never held in memory as a
+    whole. Iterators and `StreamedObject` may be nested in dictionaries and in other iterators, while lists
+    and other values are encoded at once with `DjangoJSONEncoder`, as by `JsonResponse`.
+
+    Iterators may read from the database, such as `QuerySet.iterator()`. Since ASGI responses are written from
+    the event loop, where the database cannot be accessed, the response is also an asynchronous iterator, read
+    by `plan.asgi.StreamingASGIHandler`, which encodes the document in a thread of `DatabaseExecutor` at most
+    `QUEUE_SIZE` chunks ahead of the client, and awaits each chunk.
+    """
+
+    BUFFER_SIZE = 16 * 1024
+    # The number of items of an iterator encoded at once
+    BATCH_SIZE = 100
+    QUEUE_SIZE = 4
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(self._iter_buffered(data), **kwargs)
+
+    def __aiter__(self):
+        return self._iter_in_executor(super().__iter__())
+
+    @staticmethod
+    async def _iter_in_executor(chunks):
+        """
+        Reads the chunks in a thread of `DatabaseExecutor`, which stops early if the returned iterator is closed
+        before the end of the document.
+        """
+        loop = asyncio.get_running_loop()
+        chunk_queue = asyncio.Queue()
+        slots = threading.Semaphore(StreamingJsonResponse.QUEUE_SIZE)
+        stopped = threading.Event()
+
+        def put(item):
+            while not stopped.is_set():
+                if slots.acquire(timeout=0.1):
+                    loop.call_soon_threadsafe(chunk_queue.put_nowait, item)
+                    return True
+            return False
+
+        def produce():
+            try:
+                for chunk in chunks:
+                    if not put((chunk, None)):
+                        return
+                put((None, None))
+            except Exception as error:
+                put((None, error))
+
+        asyncio.ensure_future(DatabaseExecutor.run(produce))
+        try:
+            while True:
+                chunk, error = await chunk_queue.get()
+                slots.release()
+                if error is not None:
+                    raise error
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            stopped.set()
+
+    @staticmethod
+    def _iter_buffered(data):
+        """
+        Groups the encoded fragments into chunks of about `BUFFER_SIZE` bytes.
+        """
+        chunks = []
+        size = 0
+        for fragment in StreamingJsonResponse._iter_encoded(data, DjangoJSONEncoder(separators=(',', ':'))):
+            chunks.append(fragment)
+            size += len(fragment)
+            if size >= StreamingJsonResponse.BUFFER_SIZE:
+                yield ''.join(chunks)
+                chunks = []
+                size = 0
+
+        if chunks:
+            yield ''.join(chunks)
+
+    @staticmethod
+    def _iter_encoded(value, encoder):
+        if isinstance(value, StreamedObject) or isinstance(value, dict) and StreamingJsonResponse._is_streamed(value):
+            yield '{'
+            items = value.items() if isinstance(value, dict) else value.items
+            for index, (key, item) in enumerate(items):
+                yield '{}{}:'.format(',' if index else '', json.dumps(str(key)))
+                yield from StreamingJsonResponse._iter_encoded(item, encoder)
+            yield '}'
+
+        elif hasattr(value, '__next__'):
+            # Items are encoded in batches, which is much faster than encoding them one by one
+            yield '['
+            separator = ''
+            batch = list(itertools.islice(value, StreamingJsonResponse.BATCH_SIZE))
+            while batch:
+                if any(StreamingJsonResponse._is_streamed(item) for item in batch):
+                    for item in batch:
+                        yield separator
+                        yield from StreamingJsonResponse._iter_encoded(item, encoder)
+                        separator = ','
+                else:
+                    yield separator + encoder.encode(batch)[1:-1]
+                    separator = ','
+                batch = list(itertools.islice(value, StreamingJsonResponse.BATCH_SIZE))
+            yield ']'
+
+        else:
+            yield encoder.encode(value)
+
+    @staticmethod
+    def _is_streamed(value):
+        """
+        Returns whether a value is, or is a dictionary containing, an iterator or a `StreamedObject`.
+        """
+        if isinstance(value, dict):
+            return any(StreamingJsonResponse._is_streamed(item) for item in value.values())
+        return isinstance(value, StreamedObject) or hasattr(value, '__next__')
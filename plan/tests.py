@@ -1,3 +1,1525 @@
-from django.test import TestCase
+import asyncio
+import base64
+import datetime
+import io
+import json
+import math
+import operator
+import os
+import random
+import tempfile
+import threading
+import time
+import unittest
+from collections import Counter
+from unittest import mock
+import jsonschema
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.http import JsonResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+from plan.anonymous import AnonymousSequence
+from plan.asgi import StreamingASGIHandler
+from plan.cache import CatalogCache
+from plan.catalog import CatalogSnapshot
+from plan.cohorts import CohortBitmap, CohortEvaluator, CourseIndex
+from plan.conflicts import ConflictIndex, IntervalTree, MeetingRecord
+from plan.comparisons import ScheduleComparison
+from plan.coordinators import ScheduleCoordinator, SequenceCoordinator
+from plan.enrollment import EnrollmentStatus, SeatAvailability, SeatCounter
+from plan.evaluations import SequenceEvaluation
+from plan.expressions import ExpressionFactory, RequisiteType
+from plan.graph import PrerequisiteGraph
+from plan.handlers.schedule_handler import ScheduleHandler
+from plan.handlers.sequence_handler import SequenceHandler
+from plan.metrics import MetricsRegistry
+from plan.models import CatalogVersion, Course, CourseOffering, Meeting, Schedule, ScheduleSection, Section, \
+    Sequence, Term, TermCourse
+from plan.search import CourseSearchIndex
+from plan.snapshots import SequenceSnapshot
+from plan.streaming import StreamingJsonResponse
+from plan.urls import urlpatterns as plan_urlpatterns
+from plan.utils import DateUtils, EPOCH_ORDINAL, WEEKDAY_LETTERS
 
-# Create your tests here.
+
+class ScheduleHandlerTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='student', password='password')
+        self.schedule = Schedule.objects.create(user=self.user, year=2020, term='fall', name='Schedule')
+        self.factory = RequestFactory()
+
+    def add_sections(self, count):
+        """
+        Adds `count` sections of distinct courses to the schedule, each with two meetings.
+        """
+        first_crn = Section.objects.count() + 10000
+        for crn in range(first_crn, first_crn + count):
+            course = Course.objects.create(subject='CSC', number=str(crn), name='Course', credits=1.5,
+                                           hours_lectures=3, hours_labs=0, hours_tutorials=0)
+            offering = CourseOffering.objects.create(course=course, year=2020, term_type='fall')
+            section = Section.objects.create(crn=crn, course_offering=offering, name='A01', section_type='lecture')
+            for start_hour in (8, 13):
+                Meeting.objects.create(section=section, start_date=datetime.date(2020, 9, 8),
+                                       end_date=datetime.date(2020, 12, 4), weekdays=0b1001,
+                                       start_minute=start_hour * 60, end_minute=start_hour * 60 + 50)
+            ScheduleSection.objects.create(schedule=self.schedule, section=section)
+
+    def get_section(self):
+        request = self.factory.get('/api/section/get', {'id': self.schedule.id})
+        request.user = self.user
+
+        with CaptureQueriesContext(connection) as context:
+            response = ScheduleHandler.get_section(request)
+
+        return response, len(context.captured_queries)
+
+    def test_get_section_query_count_is_constant(self):
+        self.add_sections(1)
+        response, single_section_queries = self.get_section()
+        self.assertTrue(response['success'])
+        self.assertEqual(len(response['data']), 1)
+
+        self.add_sections(9)
+        response, many_section_queries = self.get_section()
+        self.assertTrue(response['success'])
+        self.assertEqual(len(response['data']), 10)
+        self.assertEqual(single_section_queries, many_section_queries)
+
+    def test_find_sections_rejects_invalid_schedule(self):
+        request = self.factory.get('/api/section/search', {'year': 2020, 'term': 'fall', 'id': 'schedule'})
+        request.user = self.user
+        response = ScheduleHandler.find_sections(request)
+        self.assertFalse(response['success'])
+        self.assertEqual(response['message'], 'Invalid request parameter values')
+
+    def generate_timetables(self, courses):
+        request = self.factory.get('/api/schedule/generate', {'year': 2020, 'term': 'fall', 'courses': courses})
+        request.user = self.user
+        return ScheduleHandler.generate_timetables(request)
+
+    def test_generate_timetables(self):
+        self.add_sections(2)
+        response = self.generate_timetables('CSC 10000,CSC 10001')
+        self.assertTrue(response['success'])
+        self.assertEqual(response['data'], [])
+
+        response = self.generate_timetables('CSC 10000')
+        self.assertTrue(response['success'])
+        self.assertEqual(response['data'], [{'crns': [10000], 'score': None}])
+
+    def test_generate_timetables_rejects_invalid_courses(self):
+        self.add_sections(1)
+        response = self.generate_timetables('CSC10000')
+        self.assertFalse(response['success'])
+        self.assertEqual(response['message'], 'Invalid request parameter values')
+
+        response = self.generate_timetables('CSC 10000,CSC 999')
+        self.assertFalse(response['success'])
+        self.assertEqual(response['data'], {'missing': ['CSC 999']})
+
+    def test_index_is_loaded_again_after_catalog_write(self):
+        self.add_sections(1)
+        self.assertIn(10000, ScheduleCoordinator.get_instance(2020, 'fall'))
+
+        self.add_sections(1)
+        self.assertIn(10001, ScheduleCoordinator.get_instance(2020, 'fall'))
+
+    def test_get_section_includes_offering_and_meetings(self):
+        self.add_sections(2)
+        response, _ = self.get_section()
+
+        section = response['data'][0]
+        self.assertEqual(section['crn'], 10000)
+        self.assertEqual(section['course'], 'CSC 10000')
+        self.assertEqual(section['term_type'], 'fall')
+        self.assertEqual([meeting['start_time'] for meeting in section['meetings']], ['08:00:00', '13:00:00'])
+
+    def compare_schedules(self, params):
+        return self.client.get('/api/schedule/compare', params).json()['response']
+
+    def test_compare_schedules_of_user(self):
+        self.add_sections(2)
+        alternative = Schedule.objects.create(user=self.user, year=2020, term='fall', name='Alternative')
+        ScheduleSection.objects.create(schedule=alternative, section_id=10000)
+        Schedule.objects.create(user=self.user, year=2020, term='spring', name='Spring')
+
+        # Schedules of other users are never compared, even for the same sections
+        other = Schedule.objects.create(user=User.objects.create_user(username='other', password='password'),
+                                        year=2020, term='fall', name='Other')
+        ScheduleSection.objects.create(schedule=other, section_id=10001)
+
+        self.assertEqual(self.compare_schedules({'year': 2020, 'term': 'fall'})['message'],
+                         'Only the schedules of a logged in user can be compared.')
+
+        self.client.force_login(self.user)
+        data = self.compare_schedules({'year': 2020, 'term': 'fall'})['data']
+        self.assertEqual(data['metrics'], list(ScheduleComparison.METRICS))
+        self.assertEqual([(schedule['id'], schedule['crns'], schedule['conflicts']) for schedule in data['schedules']],
+                         [(alternative.id, [10000], []), (self.schedule.id, [10000, 10001], [[10000, 10001]])])
+        # Two meetings on Mondays and Thursdays from 8:00 to 8:50 and from 13:00 to 13:50, for each section
+        self.assertEqual(data['matrix'], [[1.5, 3.0, 2, 500, 480, 830, 0], [3.0, 6.0, 2, 500, 480, 830, 1]])
+
+        for params in ({'year': 2020}, {'year': 'year', 'term': 'fall'}, {'year': 2020, 'term': 'winter'}):
+            self.assertEqual(self.compare_schedules(params)['message'], 'Invalid request parameter values')
+
+    def get_meeting_batch(self, params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/meeting/batch', params)
+            # A streamed response reads the meetings as it is written
+            content = b''.join(response.streaming_content) if response.streaming else response.content
+        queries = [query for query in context.captured_queries if '"plan_meeting"' in query['sql']]
+        return json.loads(content)['response'], len(queries)
+
+    def test_meeting_batch_groups_meetings_by_crn(self):
+        self.add_sections(3)
+        self.client.force_login(self.user)
+
+        for params, crns in (({'crns': '10000,10002'}, ['10000', '10002']),
+                             ({'id': self.schedule.id}, ['10000', '10001', '10002'])):
+            for stream in ('false', 'true'):
+                with self.subTest(params=params, stream=stream):
+                    response, queries = self.get_meeting_batch(dict(params, stream=stream))
+                    self.assertTrue(response['success'])
+                    self.assertEqual(queries, 1)
+                    self.assertEqual(list(response['data']), crns)
+                    self.assertEqual([[meeting['start_time'] for meeting in meetings]
+                                      for meetings in response['data'].values()],
+                                     [['08:00:00', '13:00:00']] * len(crns))
+
+        response, _ = self.get_meeting_batch({'crns': '10001', 'encoding': 'compact'})
+        self.assertEqual(response['data']['10001'],
+                         [meeting.to_compact() for meeting in Meeting.objects.filter(section_id=10001).order_by('id')])
+
+    def test_meeting_batch_rejects_schedule_of_other_user(self):
+        self.add_sections(1)
+        self.client.force_login(User.objects.create_user(username='other', password='password'))
+        response, _ = self.get_meeting_batch({'id': self.schedule.id})
+        self.assertEqual(response['data'], {})
+
+        response, _ = self.get_meeting_batch({'crns': '10000,crn'})
+        self.assertEqual(response['message'], 'Invalid request parameter values')
+
+
+class OccupancyTestCase(TestCase):
+
+    def setUp(self):
+        # Two lecture sections on Monday morning, and a lab on Tuesday
+        for crn, subject, section_type, weekdays, start_minute, year, term_type in (
+                (10000, 'CSC', 'lecture', 0b1001, 480, 2020, 'fall'),
+                (10001, 'CSC', 'lecture', 0b0001, 510, 2020, 'fall'),
+                (10002, 'MATH', 'lab', 0b0010, 600, 2020, 'fall'),
+                (10003, 'CSC', 'lecture', 0b0001, 480, 2020, 'spring')):
+            course = Course.objects.create(subject=subject, number=str(crn), name='Course', credits=1.5,
+                                           hours_lectures=3, hours_labs=0, hours_tutorials=0)
+            offering = CourseOffering.objects.create(course=course, year=year, term_type=term_type)
+            section = Section.objects.create(crn=crn, course_offering=offering, name='A01', section_type=section_type)
+            Meeting.objects.create(section=section, start_date=datetime.date(2020, 9, 8),
+                                   end_date=datetime.date(2020, 12, 4), weekdays=weekdays,
+                                   start_minute=start_minute, end_minute=start_minute + 50)
+
+    def get_occupancy(self, **params):
+        return self.client.get('/api/data/occupancy', dict({'action': 'get'}, **params)).json()['response']
+
+    def test_occupancy_of_term(self):
+        response = self.get_occupancy(year=2020, term_type='fall')
+        self.assertTrue(response['success'])
+
+        data = response['data']
+        self.assertEqual(data['slot_minutes'], 5)
+        self.assertEqual(data['meetings'], 3)
+        self.assertEqual([len(day) for day in data['occupancy']], [24 * 60 // 5] * 7)
+        self.assertEqual(data['occupancy'][0][480 // 5:560 // 5], [1] * 6 + [2] * 4 + [1] * 6)
+        self.assertEqual(data['occupancy'][3][480 // 5:560 // 5], [1] * 10 + [0] * 6)
+        self.assertEqual(data['peak'], 2)
+        self.assertEqual(data['peak_slots'], [{'weekday': 0, 'start_minute': minute} for minute in range(510, 530, 5)])
+
+    def test_occupancy_filters(self):
+        for params in ({'subject': 'MATH'}, {'section_type': 'lab'}):
+            data = self.get_occupancy(year=2020, term_type='fall', **params)['data']
+            self.assertEqual((data['meetings'], data['peak']), (1, 1))
+            self.assertEqual(data['peak_slots'][0], {'weekday': 1, 'start_minute': 600})
+
+        self.assertEqual(self.get_occupancy(year=2020, term_type='fall', date='2020-12-05')['data']['meetings'], 0)
+        self.assertEqual(self.get_occupancy(year=2020, term_type='spring')['data']['meetings'], 1)
+
+    def test_occupancy_rejects_invalid_parameters(self):
+        for params in ({'year': 'year', 'term_type': 'fall'}, {'year': 2020, 'term_type': 'winter'},
+                       {'year': 2020, 'term_type': 'fall', 'date': '2020-13-01'}):
+            response = self.get_occupancy(**params)
+            self.assertFalse(response['success'])
+            self.assertEqual(response['message'], 'Invalid request parameter values')
+
+        response = self.client.get('/api/data/occupancy', {'action': 'list', 'year': 2020, 'term_type': 'fall'})
+        self.assertEqual(response.json()['response'], 'Unsupported action')
+
+
+class ScheduleCoordinatorTestCase(TestCase):
+    """
+    Compares the answers of the index to those of the schedule models over random meetings, some of which only
+    overlap in dates or in times.
+    """
+
+    def setUp(self):
+        rng = random.Random(0)
+        self.user = User.objects.create_user(username='student', password='password')
+        self.schedule = Schedule.objects.create(user=self.user, year=2020, term='fall', name='Schedule')
+
+        for index in range(60):
+            course = Course.objects.create(subject='CSC', number=str(100 + index), name='Course', credits=1.5,
+                                           hours_lectures=3, hours_labs=0, hours_tutorials=0)
+            offering = CourseOffering.objects.create(course=course, year=2020, term_type='fall')
+            section = Section.objects.create(crn=10000 + index, course_offering=offering, name='A01',
+                                             section_type='lecture')
+            for _ in range(rng.randint(0, 3)):
+                start_minute = rng.randrange(8 * 60, 20 * 60, 10)
+                start_date = datetime.date(2020, 9, 8) + datetime.timedelta(days=rng.choice([0, 0, 42]))
+                Meeting.objects.create(section=section, start_date=start_date,
+                                       end_date=start_date + datetime.timedelta(days=rng.choice([41, 87])),
+                                       weekdays=rng.randrange(1, 1 << 7), start_minute=start_minute,
+                                       end_minute=start_minute + rng.choice([50, 80, 170]))
+            if index % 9 == 0:
+                ScheduleSection.objects.create(schedule=self.schedule, section=section)
+
+        self.sections = list(Section.objects.order_by('crn'))
+        self.schedule_crns = list(ScheduleSection.objects.filter(schedule=self.schedule)
+                                  .values_list('section_id', flat=True))
+        self.coordinator = ScheduleCoordinator.get_instance(2020, 'fall')
+
+    def test_find_conflicts_matches_schedule(self):
+        for section in self.sections:
+            self.assertEqual(self.coordinator.find_conflicts(section.crn, self.schedule_crns),
+                             self.schedule.does_section_conflict(section)['data'], section.crn)
+
+    def test_find_sections_matches_schedule(self):
+        expected_crns = [section.crn for section in self.sections if section.crn not in self.schedule_crns
+                         and not self.schedule.does_section_conflict(section)['conflicts']]
+        self.assertEqual(self.coordinator.find_sections(schedule_crns=self.schedule_crns), expected_crns)
+
+    def test_find_sections_with_busy_times(self):
+        busy_records = [ScheduleCoordinator.get_busy_record(0b10101, 10 * 60, 12 * 60)]
+        expected_crns = [section.crn for section in self.sections if not any(
+            record.does_meeting_conflict(busy_records[0])
+            for record in MeetingRecord.from_queryset(Meeting.objects.filter(section=section)))]
+        self.assertEqual(self.coordinator.find_sections(busy_records=busy_records), expected_crns)
+
+
+class ConflictIndexTestCase(TestCase):
+    """
+    Compares the conflicts found by the index to those of every pair of meetings, over random meetings many of
+    which share their times or only overlap for a few days.
+    """
+
+    def setUp(self):
+        self.rng = random.Random(0)
+
+    def get_record(self, crn):
+        start_minute = self.rng.randrange(8 * 60, 12 * 60, 30)
+        start_ordinal = datetime.date(2020, 9, 7).toordinal() + self.rng.randrange(0, 21)
+        return MeetingRecord(crn, self.rng.randrange(0, 1 << 7), start_minute,
+                             start_minute + self.rng.choice([30, 50, 60, 90]), start_ordinal,
+                             start_ordinal + self.rng.choice([0, 1, 3, 5, 6, 7, 30]))
+
+    def test_find_conflicts_matches_pairwise(self):
+        for _ in range(20):
+            records = [self.get_record(self.rng.randrange(10000, 10040)) for _ in range(self.rng.randint(0, 80))]
+            index = ConflictIndex(records)
+            for _ in range(20):
+                section_records = [self.get_record(self.rng.randrange(10000, 10050))
+                                   for _ in range(self.rng.randint(1, 3))]
+                expected = sorted({record.crn for record in records for section_record in section_records
+                                   if record.crn != section_record.crn
+                                   and record.does_meeting_conflict(section_record)})
+                self.assertEqual(index.find_conflicts(section_records), expected)
+
+    def test_interval_tree_finds_overlapping_intervals(self):
+        tree = IntervalTree()
+        intervals = []
+        for value in range(500):
+            start = self.rng.randrange(0, 1000)
+            intervals.append((start, start + self.rng.randint(1, 100), value))
+            tree.insert(*intervals[-1])
+
+            # An AVL tree is never higher than 1.44 log2(n + 2)
+            self.assertLessEqual(tree.root.height, 1.45 * math.log2(len(tree) + 2))
+
+        for _ in range(200):
+            start = self.rng.randrange(-50, 1100)
+            end = start + self.rng.randint(1, 60)
+            self.assertEqual(sorted(tree.find_overlapping(start, end)),
+                             [value for interval_start, interval_end, value in intervals
+                              if interval_start < end and start < interval_end])
+
+
+class SequenceCoordinatorTestCase(TestCase):
+    """
+    Plans sequences with courses whose registration is restricted to students who have not completed another.
+    """
+
+    @staticmethod
+    def get_course(number, offered_spring=True, offered_fall=True, expressions=()):
+        return Course(subject='CSC', number=number, name='Course', credits=1.5, hours_lectures=3, hours_labs=0,
+                      hours_tutorials=0, offered_spring=offered_spring, offered_summer=False,
+                      offered_fall=offered_fall, requirement={'expressions': list(expressions)})
+
+    @staticmethod
+    def get_expression(number, requisite_type='P'):
+        return {'expression_type': 'COURSE', 'subject': 'CSC', 'number': number, 'requisite_type': requisite_type}
+
+    def get_coordinator(self, *courses):
+        program = [ExpressionFactory.build_and_get_expression(self.get_expression(number))
+                   for number in ('110', '130')]
+        return SequenceCoordinator(program, courses)
+
+    def test_plan_skips_term_before_restricted_course(self):
+        coordinator = self.get_coordinator(
+            self.get_course('110', offered_spring=False, expressions=[
+                {'expression_type': 'REGISTRATION_RESTRICTION', 'expression': self.get_expression('120')}]),
+            self.get_course('120'),
+            self.get_course('130', expressions=[self.get_expression('120')]))
+
+        plan = coordinator.plan(2021, 1)
+        self.assertIsNotNone(plan)
+        self.assertEqual(plan.terms, [(2021, 3, ['CSC 110', 'CSC 120']), (2022, 1, ['CSC 130'])])
+        self.assertEqual(plan.term_count, 4)
+
+    def test_plan_leaves_out_blocking_course(self):
+        # Taking both courses of the fall would prevent taking the restricted course afterwards
+        coordinator = self.get_coordinator(
+            self.get_course('110', expressions=[
+                self.get_expression('100'),
+                {'expression_type': 'REGISTRATION_RESTRICTION', 'expression': self.get_expression('120')}]),
+            self.get_course('100', offered_spring=False),
+            self.get_course('120', offered_spring=False),
+            self.get_course('130', offered_spring=False, expressions=[self.get_expression('120')]))
+
+        plan = coordinator.plan(2021, 3)
+        self.assertIsNotNone(plan)
+        self.assertEqual(plan.terms[0], (2021, 3, ['CSC 100']))
+        self.assertEqual(plan.terms[-1], (2023, 3, ['CSC 130']))
+        self.assertEqual(plan.term_count, 7)
+
+
+class CatalogCacheTestCase(TestCase):
+
+    def setUp(self):
+        Course.objects.create(subject='CSC', number='110', name='Course', credits=1.5, hours_lectures=3,
+                              hours_labs=0, hours_tutorials=0)
+
+    def test_saving_loaded_instance_only_queries_it_if_keys_changed(self):
+        course = Course.objects.get(subject='CSC', number='110')
+        course.name = 'Renamed'
+        with CaptureQueriesContext(connection) as context:
+            course.save()
+        self.assertFalse([query for query in context.captured_queries if 'FROM "plan_course"' in query['sql']])
+        self.assertEqual(course._previous_cache_keys, [])
+
+        course.number = '115'
+        course.save()
+        self.assertIn(CatalogCache.get_course_key('CSC', '110'), course._previous_cache_keys)
+
+        # Saved with its new number, which the next save compares to
+        course.name = 'Course'
+        course.save()
+        self.assertEqual(course._previous_cache_keys, [])
+
+
+@override_settings(PLAN_CACHE={'VERSION_TTL': 0}, CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'catalog': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'catalog'}
+})
+class CatalogCacheInvalidationTestCase(TransactionTestCase):
+    # The lookups reloaded after a write of each kind, the course being part of the offerings of its terms
+    CHANGED_LOOKUPS = {
+        'course': {'course', 'offerings'},
+        'section': {'section'},
+        'meetings': {'meetings'},
+        'offerings': {'offerings'}
+    }
+
+    def setUp(self):
+        course = Course.objects.create(subject='CSC', number='110', name='Course', credits=1.5, hours_lectures=3,
+                                       hours_labs=0, hours_tutorials=0)
+        offering = CourseOffering.objects.create(course=course, year=2020, term_type='fall')
+        section = Section.objects.create(crn=10000, course_offering=offering, name='A01', section_type='lecture')
+        Meeting.objects.create(section=section, start_date=datetime.date(2020, 9, 8),
+                               end_date=datetime.date(2020, 12, 4), weekdays=0b1001, start_minute=480,
+                               end_minute=530)
+        caches['catalog'].clear()
+        self.set_instance(CatalogCache(shared='catalog'))
+
+    def tearDown(self):
+        CatalogCache._instance = None
+
+    @staticmethod
+    def set_instance(cache):
+        # The instance invalidated by the signals, that is the cache of the writing process
+        CatalogCache._instance = cache
+        return cache
+
+    @staticmethod
+    def lookup(cache, name):
+        if name == 'course':
+            return cache.get_course('CSC', '110')
+        if name == 'section':
+            return cache.get_section(10000)
+        if name == 'meetings':
+            return cache.get_meetings(10000)
+        return cache.get_offerings(2020, 'fall')
+
+    def get_reloaded(self, cache):
+        """
+        Looks up every entry, and returns the names of the lookups which were not answered by the in-process entry.
+        """
+        reloaded = set()
+        for name in self.CHANGED_LOOKUPS:
+            hits = cache.hits
+            self.lookup(cache, name)
+            if cache.hits == hits:
+                reloaded.add(name)
+        return reloaded
+
+    @staticmethod
+    def write(name):
+        if name == 'course':
+            course = Course.objects.get(subject='CSC', number='110')
+            course.name = course.name + '+'
+            course.save()
+        elif name == 'section':
+            section = Section.objects.get(crn=10000)
+            section.name = 'A0{}'.format(int(section.name[1:]) + 1)
+            section.save()
+        elif name == 'meetings':
+            meeting = Meeting.objects.get(section_id=10000)
+            meeting.end_minute += 10
+            meeting.save()
+        else:
+            course = Course.objects.create(subject='MATH', number=str(100 + CourseOffering.objects.count()),
+                                           name='Course', credits=1.5, hours_lectures=3, hours_labs=0,
+                                           hours_tutorials=0)
+            CourseOffering.objects.create(course=course, year=2020, term_type='fall')
+
+    def assertCurrent(self, cache):
+        self.assertEqual(self.lookup(cache, 'course').name, Course.objects.get(subject='CSC', number='110').name)
+        self.assertEqual(self.lookup(cache, 'section').name, Section.objects.get(crn=10000).name)
+        self.assertEqual([meeting.end_minute for meeting in self.lookup(cache, 'meetings')],
+                         [meeting.end_minute for meeting in Meeting.objects.filter(section_id=10000)])
+        self.assertEqual(len(self.lookup(cache, 'offerings')), CourseOffering.objects.count())
+
+    def test_lookups_hit_after_miss(self):
+        cache = CatalogCache.get_instance()
+        for name in self.CHANGED_LOOKUPS:
+            with self.subTest(name):
+                misses = cache.misses
+                value = self.lookup(cache, name)
+                self.assertEqual(cache.misses, misses + 1)
+                with self.assertNumQueries(1):  # The catalog version only
+                    self.assertIs(self.lookup(cache, name), value)
+                self.assertEqual(cache.misses, misses + 1)
+
+        # Another process finds the entries in the shared cache
+        other = CatalogCache(shared='catalog')
+        self.assertEqual(self.get_reloaded(other), set(self.CHANGED_LOOKUPS))
+        self.assertEqual(other.shared_hits, len(self.CHANGED_LOOKUPS))
+        self.assertEqual(other.misses, 0)
+        self.assertEqual(self.get_reloaded(other), set())
+
+    def test_write_only_invalidates_its_lookups(self):
+        for shared in ('catalog', None):
+            writer = self.set_instance(CatalogCache(shared=shared))
+            other = CatalogCache(shared=shared)
+            for name, changed in self.CHANGED_LOOKUPS.items():
+                with self.subTest(shared=shared, write=name):
+                    self.get_reloaded(writer)
+                    self.get_reloaded(other)
+                    self.write(name)
+
+                    # The writer reloads the changed entries only, as does another process sharing the entries
+                    self.assertEqual(self.get_reloaded(writer), changed)
+                    self.assertEqual(self.get_reloaded(other), changed if shared else set(self.CHANGED_LOOKUPS))
+                    self.assertCurrent(writer)
+                    self.assertCurrent(other)
+
+    def test_stale_shared_entry_is_reloaded(self):
+        cache = CatalogCache.get_instance()
+        self.lookup(cache, 'course')
+        shared_key = CatalogCache.KEY_PREFIX + CatalogCache.get_course_key('CSC', '110')
+        stale = caches['catalog'].get(shared_key)
+
+        # Stored back by a process which loaded the course before the write committed
+        self.write('course')
+        caches['catalog'].set(shared_key, stale)
+
+        other = CatalogCache(shared='catalog')
+        self.assertEqual(self.lookup(other, 'course').name, 'Course+')
+        self.assertEqual((other.shared_hits, other.misses), (0, 1))
+
+    def test_lookup_within_transaction_is_not_stored(self):
+        cache = CatalogCache.get_instance()
+        with transaction.atomic():
+            self.write('section')
+            self.assertEqual(self.lookup(cache, 'section').name, 'A02')
+            transaction.set_rollback(True)
+
+        self.assertEqual(self.lookup(cache, 'section').name, 'A01')
+        self.assertEqual(cache.misses, 2)
+
+    def test_import_invalidates_every_lookup(self):
+        writer = CatalogCache.get_instance()
+        other = CatalogCache(shared='catalog')
+        self.get_reloaded(writer)
+        self.get_reloaded(other)
+
+        # As done by the import_catalog command around its bulk statements
+        with transaction.atomic():
+            writer.mark_changed([CatalogCache.ALL_KEYS])
+            _, version = CatalogSnapshot.bump_version()
+            writer.mark_changed([CatalogCache.ALL_KEYS], version)
+            transaction.on_commit(writer.clear)
+
+        self.assertEqual(self.get_reloaded(writer), set(self.CHANGED_LOOKUPS))
+        self.assertEqual(self.get_reloaded(other), set(self.CHANGED_LOOKUPS))
+        self.assertCurrent(other)
+
+
+@override_settings(PLAN_CACHE={'VERSION_TTL': 0})
+class CatalogVersionTestCase(TransactionTestCase):
+
+    def create_course(self, number='110'):
+        return Course.objects.create(subject='CSC', number=number, name='Course', credits=1.5, hours_lectures=3,
+                                     hours_labs=0, hours_tutorials=0)
+
+    def test_write_bumps_version_of_its_scopes(self):
+        catalog_version = CatalogSnapshot.get_version()
+        courses_version = CatalogSnapshot.get_version(CatalogSnapshot.COURSES)
+        course = self.create_course()
+        self.assertGreater(CatalogSnapshot.get_version(), catalog_version)
+        self.assertGreater(CatalogSnapshot.get_version(CatalogSnapshot.COURSES), courses_version)
+
+        catalog_version = CatalogSnapshot.get_version()
+        courses_version = CatalogSnapshot.get_version(CatalogSnapshot.COURSES)
+        CourseOffering.objects.create(course=course, year=2020, term_type='fall')
+        self.assertGreater(CatalogSnapshot.get_version(), catalog_version)
+        self.assertEqual(CatalogSnapshot.get_version(CatalogSnapshot.COURSES), courses_version)
+
+    def test_version_is_read_from_database(self):
+        version = CatalogSnapshot.get_version()
+
+        # As written by another process
+        CatalogVersion.objects.filter(scope=CatalogSnapshot.CATALOG).update(version=version + 10)
+        self.assertEqual(CatalogSnapshot.get_version(), version + 10)
+
+    def test_rolled_back_version_is_not_reused(self):
+        version = CatalogSnapshot.get_version()
+        try:
+            with transaction.atomic():
+                self.create_course()
+                rolled_back_version = CatalogSnapshot.get_version()
+                self.assertGreater(rolled_back_version, version)
+                raise IntegrityError
+        except IntegrityError:
+            pass
+
+        self.assertEqual(CatalogSnapshot.get_version(), version)
+        self.create_course()
+        self.assertGreater(CatalogSnapshot.get_version(), rolled_back_version)
+
+
+class ExpressionFactoryTestCase(TestCase):
+
+    REQUISITE = {
+        'expression_type': 'LIST',
+        'threshold_type': 'geq',
+        'threshold_value': 1,
+        'expressions': [
+            {'expression_type': 'COURSE', 'subject': 'CSC', 'number': '110', 'requisite_type': 'P'},
+            {'expression_type': 'CONDITIONAL', 'condition': 'AND',
+             'expression_one': {'expression_type': 'COURSE', 'subject': 'MATH', 'number': '100'},
+             'expression_two': {'expression_type': 'REGISTRATION_RESTRICTION',
+                                'expression': {'expression_type': 'COURSE', 'subject': 'CSC', 'number': '111'}}}
+        ]
+    }
+
+    def setUp(self):
+        ExpressionFactory.clear_cache()
+
+    def test_identical_documents_return_cached_expression(self):
+        expression = ExpressionFactory.build_and_get_expression(self.REQUISITE)
+        self.assertIs(ExpressionFactory.build_and_get_expression(json.loads(json.dumps(self.REQUISITE))), expression)
+
+        # Documents are identified by their content, whatever the order of their keys
+        reordered = {key: self.REQUISITE[key] for key in reversed(list(self.REQUISITE))}
+        self.assertIs(ExpressionFactory.build_and_get_expression(reordered), expression)
+
+        changed = dict(self.REQUISITE, threshold_value=2)
+        self.assertIsNot(ExpressionFactory.build_and_get_expression(changed), expression)
+        self.assertIs(ExpressionFactory.build_and_get_expression(self.REQUISITE), expression)
+
+        ExpressionFactory.clear_cache()
+        self.assertIsNot(ExpressionFactory.build_and_get_expression(self.REQUISITE), expression)
+
+    def test_cached_expression_is_immutable(self):
+        expression = ExpressionFactory.build_and_get_expression(self.REQUISITE)
+        with self.assertRaises(AttributeError):
+            expression.threshold_value = 2
+        with self.assertRaises(AttributeError):
+            del expression.expressions[0].course_code
+        self.assertEqual(expression.threshold_value, 1)
+
+    def test_invalid_document_is_not_cached(self):
+        invalid = dict(self.REQUISITE, threshold_type='most')
+        for _ in range(2):
+            with self.assertRaises(jsonschema.ValidationError):
+                ExpressionFactory.build_and_get_expression(invalid)
+        self.assertNotIn(ExpressionFactory.get_content_hash(invalid), ExpressionFactory._cache)
+
+    def test_least_recently_used_expression_is_evicted(self):
+        expression = ExpressionFactory.build_and_get_expression(self.REQUISITE)
+        with mock.patch.object(ExpressionFactory, 'CACHE_SIZE', 3):
+            for number in range(100, 103):
+                ExpressionFactory.build_and_get_expression(
+                    {'expression_type': 'COURSE', 'subject': 'CSC', 'number': str(number)})
+                # Used again, so that the evicted expression is the least recently used one
+                self.assertIs(ExpressionFactory.build_and_get_expression(self.REQUISITE), expression)
+            self.assertEqual(len(ExpressionFactory._cache), 3)
+            self.assertNotIn(ExpressionFactory.get_content_hash(
+                {'expression_type': 'COURSE', 'subject': 'CSC', 'number': '100'}), ExpressionFactory._cache)
+
+
+def generate_requisite(rng, course_codes, depth=0):
+    """
+    Returns a random requisite document of every expression type, referring to the given course codes.
+    """
+    kind = rng.random()
+    if depth >= 3 or kind < 0.4:
+        subject, number = rng.choice(course_codes).split(' ')
+        return {'expression_type': 'COURSE', 'subject': subject, 'number': number,
+                'requisite_type': rng.choice(['P', 'C'])}
+    if kind < 0.65:
+        return {'expression_type': 'CONDITIONAL', 'condition': rng.choice(['AND', 'OR']),
+                'expression_one': generate_requisite(rng, course_codes, depth + 1),
+                'expression_two': generate_requisite(rng, course_codes, depth + 1)}
+    if kind < 0.9:
+        expressions = [generate_requisite(rng, course_codes, depth + 1) for _ in range(rng.randint(1, 4))]
+        return {'expression_type': 'LIST', 'threshold_value': rng.randint(0, len(expressions)),
+                'threshold_type': rng.choice(['lt', 'leq', 'eq', 'geq', 'gt']), 'expressions': expressions}
+    return {'expression_type': 'REGISTRATION_RESTRICTION',
+            'expression': generate_requisite(rng, course_codes, depth + 1)}
+
+
+class CourseRequirementTestCase(TestCase):
+    """
+    Compares the evaluation of course requirements against a `SequenceSnapshot` to evaluating them by querying
+    the terms of the sequence, as was done before snapshots, over sequences whose terms span year boundaries.
+    """
+
+    COURSE_CODES = ['CSC {}'.format(number) for number in range(100, 108)]
+
+    # The operators of the threshold types of list expressions
+    THRESHOLDS = {'lt': operator.lt, 'leq': operator.le, 'eq': operator.eq, 'geq': operator.ge, 'gt': operator.gt}
+
+    def setUp(self):
+        self.rng = random.Random(0)
+        self.user = User.objects.create_user(username='student', password='password')
+        self.courses = [Course.objects.create(subject='CSC', number=course_code.split(' ')[1], name='Course',
+                                              credits=1.5, hours_lectures=3, hours_labs=0, hours_tutorials=0)
+                        for course_code in self.COURSE_CODES]
+
+    def get_reference(self, sequence, json_data):
+        """
+        Evaluates a requisite against the latest term of a sequence, with queries for the terms and their courses.
+        """
+        expression_type = json_data['expression_type']
+        if expression_type == 'COURSE':
+            terms = sorted(Term.objects.filter(user=sequence), key=lambda term: (term.year, term.term_type))
+            # The earliest term with the course satisfies a prerequisite unless it is the latest term
+            for term in terms:
+                if TermCourse.objects.filter(term=term, course__subject=json_data['subject'],
+                                             course__number=json_data['number']).exists():
+                    return json_data.get('requisite_type') != 'P' or term != terms[-1]
+            return False
+
+        if expression_type == 'CONDITIONAL':
+            satisfied = [self.get_reference(sequence, json_data['expression_one']),
+                         self.get_reference(sequence, json_data['expression_two'])]
+            return any(satisfied) if json_data['condition'] == 'OR' else all(satisfied)
+
+        if expression_type == 'LIST':
+            satisfied = sum(self.get_reference(sequence, child) for child in json_data['expressions'])
+            return self.THRESHOLDS[json_data['threshold_type']](satisfied, json_data['threshold_value'])
+
+        return not self.get_reference(sequence, json_data['expression'])
+
+    def create_sequence(self, terms):
+        """
+        Creates a sequence with the given courses for each of its (year, term type).
+        """
+        sequence = Sequence.objects.create(user=self.user, name='Sequence')
+        for (year, term_type), courses in terms.items():
+            term = Term.objects.create(user=sequence, year=year, term_type=term_type)
+            for course in courses:
+                TermCourse.objects.create(term=term, course=course)
+        return sequence
+
+    def test_matches_term_queries(self):
+        # Consecutive terms from the fall of 2019 to the summer of 2021
+        ordinals = range(SequenceSnapshot.get_term_ordinal(2019, 3), SequenceSnapshot.get_term_ordinal(2021, 2) + 1)
+        for _ in range(15):
+            sequence = self.create_sequence({
+                SequenceSnapshot.get_term(ordinal): self.rng.sample(self.courses, self.rng.randint(0, 3))
+                for ordinal in self.rng.sample(ordinals, self.rng.randint(1, len(ordinals)))})
+            snapshot = SequenceSnapshot.from_sequence(sequence)
+
+            for _ in range(10):
+                requisites = [generate_requisite(self.rng, self.COURSE_CODES) for _ in range(self.rng.randint(1, 3))]
+                course = Course(subject='CSC', number='200', requirement={'expressions': requisites})
+
+                expected = all(self.get_reference(sequence, json_data) for json_data in requisites)
+                self.assertEqual(course.evaluate_requirement(snapshot)[0], expected, requisites)
+                self.assertEqual(course.evaluate_requirement(sequence)[0], expected, requisites)
+
+    def test_requisite_types_at_year_boundary(self):
+        fall, spring, summer = self.courses[:3]
+        sequence = self.create_sequence({(2020, 3): [fall], (2021, 1): [spring], (2021, 2): [summer]})
+        self.assertEqual(SequenceSnapshot.get_term_ordinal(2020, 3) + 1, SequenceSnapshot.get_term_ordinal(2021, 1))
+        self.assertEqual(SequenceSnapshot.get_term(SequenceSnapshot.get_term_ordinal(2021, 1)), (2021, 1))
+
+        def is_satisfied(snapshot, course, requisite_type):
+            requirement = {'expressions': [{'expression_type': 'COURSE', 'subject': 'CSC', 'number': course.number,
+                                            'requisite_type': requisite_type}]}
+            return Course(subject='CSC', number='200', requirement=requirement).evaluate_requirement(snapshot)[0]
+
+        snapshot = SequenceSnapshot.from_sequence(sequence)
+        for target, satisfied in (
+                (None, {(fall, 'P'): True, (fall, 'C'): True, (spring, 'P'): True, (spring, 'C'): True,
+                        (summer, 'P'): False, (summer, 'C'): True}),
+                ((2021, 1), {(fall, 'P'): True, (fall, 'C'): True, (spring, 'P'): False, (spring, 'C'): True,
+                             (summer, 'P'): False, (summer, 'C'): False}),
+                ((2020, 3), {(fall, 'P'): False, (fall, 'C'): True, (spring, 'P'): False, (spring, 'C'): False,
+                             (summer, 'P'): False, (summer, 'C'): False})):
+            target_snapshot = snapshot if target is None else snapshot.at_term(*target)
+            for (course, requisite_type), expected in satisfied.items():
+                with self.subTest(target=target, course=course.number, requisite_type=requisite_type):
+                    self.assertEqual(is_satisfied(target_snapshot, course, requisite_type), expected)
+
+
+class SequenceEvaluationTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='student', password='password')
+        self.sequence = Sequence.objects.create(user=self.user, name='Sequence')
+        self.term = Term.objects.create(user=self.sequence, year=2020, term_type=3)
+        self.course = Course.objects.create(subject='CSC', number='110', name='Course', credits=1.5,
+                                            hours_lectures=3, hours_labs=0, hours_tutorials=0)
+        self.factory = RequestFactory()
+
+    def get_sequence(self):
+        return Sequence.objects.get(pk=self.sequence.pk)
+
+    def test_write_by_another_process_outdates_evaluation(self):
+        evaluation = SequenceEvaluation.get_instance(self.get_sequence())
+        TermCourse.objects.create(term=self.term, course=self.course)
+
+        updated_evaluation = SequenceEvaluation.get_instance(self.get_sequence())
+        self.assertIsNot(updated_evaluation, evaluation)
+        self.assertEqual(updated_evaluation.snapshot.course_ordinals,
+                         {'CSC 110': SequenceSnapshot.get_term_ordinal(2020, 3)})
+
+    def test_write_through_handler_keeps_evaluation(self):
+        evaluation = SequenceEvaluation.get_instance(self.get_sequence())
+        request = self.factory.get('/api/sequence/course/add', {'subject': 'CSC', 'number': '110', 'year': 2020,
+                                                                 'term_type': 3})
+        request.user = self.user
+        self.assertTrue(SequenceHandler.add_course_to_active_sequence(request)['success'])
+
+        self.assertIs(SequenceEvaluation.get_instance(self.get_sequence()), evaluation)
+        self.assertIn('CSC 110', evaluation.snapshot.course_ordinals)
+
+    def test_add_term_rejects_unsupported_year(self):
+        self.client.get('/api/plan/sequence', {'action': 'add', 'name': 'Sequence'})
+        for year, added in ((AnonymousSequence.MAX_YEAR, True), (AnonymousSequence.MAX_YEAR + 1, False)):
+            response = self.client.get('/api/plan/term', {'action': 'add', 'year': year, 'term_type': 3})
+            self.assertEqual(response.json()['response']['success'], added)
+
+        self.assertEqual(list(AnonymousSequence.from_session(self.client.session).terms),
+                         [SequenceSnapshot.get_term_ordinal(AnonymousSequence.MAX_YEAR, 3)])
+
+    def test_saving_sequence_keeps_version(self):
+        sequence = self.get_sequence()
+        TermCourse.objects.create(term=self.term, course=self.course)
+
+        sequence.name = 'Renamed'
+        sequence.save()
+        self.assertEqual(self.get_sequence().version, sequence.version + 1)
+
+
+class AnonymousSequenceTestCase(TestCase):
+
+    def setUp(self):
+        self.courses = [Course.objects.create(subject='CSC', number=number, name='Course', credits=1.5,
+                                              hours_lectures=3, hours_labs=0, hours_tutorials=0)
+                        for number in ('110', '111', '115')]
+
+    def request_term(self, action, year, term_type):
+        return self.client.get('/api/plan/term', {'action': action, 'year': year, 'term_type': term_type}) \
+            .json()['response']
+
+    def test_encode_decode_round_trip(self):
+        terms = {
+            SequenceSnapshot.get_term_ordinal(2020, 3): {7: None, 2: None, 0xFFFFFFFF: None},
+            SequenceSnapshot.get_term_ordinal(2020, 1): {},
+            SequenceSnapshot.get_term_ordinal(AnonymousSequence.MAX_YEAR, 3): {1: None}
+        }
+        for name in ('Sequence', '', 'Séquence ✓ ' * 100):
+            with self.subTest(name=name[:10]):
+                decoded = AnonymousSequence.decode(AnonymousSequence(name, terms).encode())
+                self.assertEqual(decoded.name, name)
+                self.assertEqual(decoded.terms, terms)
+                # The order of the terms and of their courses is kept
+                self.assertEqual([list(course_ids) for course_ids in decoded.terms.values()],
+                                 [list(course_ids) for course_ids in terms.values()])
+
+    def test_unreadable_session_data_is_missing(self):
+        data = AnonymousSequence('Sequence', {SequenceSnapshot.get_term_ordinal(2020, 3): {1: None}}).encode()
+        raw = base64.b64decode(data)
+        for invalid in (base64.b64encode(raw[:-1]).decode('ascii'),
+                        base64.b64encode(bytes([AnonymousSequence.VERSION + 1]) + raw[1:]).decode('ascii')):
+            self.assertIsNone(AnonymousSequence.from_session({AnonymousSequence.SESSION_KEY: invalid}))
+        self.assertIsNone(AnonymousSequence.from_session({}))
+
+    def test_session_sequence_is_promoted_on_register(self):
+        self.client.get('/api/plan/sequence', {'action': 'add', 'name': 'Sequence'})
+        self.assertTrue(self.request_term('add', 2020, 3)['success'])
+        self.assertTrue(self.request_term('add', 2021, 1)['success'])
+        self.assertTrue(self.request_term('add', 2021, 2)['success'])
+        for course, (year, term_type) in zip(self.courses, ((2020, 3), (2021, 1), (2021, 1))):
+            self.client.get('/api/plan/course', {'action': 'add', 'subject': 'CSC', 'number': course.number,
+                                                 'year': year, 'term_type': term_type,
+                                                 'ignore_requirements': 'true'})
+        self.assertEqual(len(AnonymousSequence.from_session(self.client.session)._get_course_ids()), 3)
+
+        # Courses removed from the catalog since they were added are not promoted
+        self.courses[2].delete()
+        self.client.post('/account/register', {'username': 'student', 'email': 'student@example.com',
+                                               'password': 'password'})
+
+        sequence = Sequence.objects.get(user__username='student')
+        self.assertEqual(sequence.name, 'Sequence')
+        self.assertEqual(sorted(Term.objects.filter(user=sequence).values_list('year', 'term_type')),
+                         [(2020, 3), (2021, 1), (2021, 2)])
+        self.assertEqual(sorted(TermCourse.objects.filter(term__user=sequence)
+                                .values_list('course__number', 'term__year', 'term__term_type')),
+                         [('110', 2020, 3), ('111', 2021, 1)])
+        self.assertIsNone(AnonymousSequence.from_session(self.client.session))
+
+    def test_remove_term_validates_parameters(self):
+        self.assertEqual(self.request_term('remove', 2020, 3)['message'], 'The user does not have a sequence.')
+
+        self.client.get('/api/plan/sequence', {'action': 'add', 'name': 'Sequence'})
+        self.request_term('add', 2020, 3)
+        for year, term_type in (('year', 3), (2020, 4), (AnonymousSequence.MAX_YEAR + 1, 3), (-1, 3)):
+            self.assertEqual(self.request_term('remove', year, term_type)['message'],
+                             'Invalid request parameter values')
+        self.assertFalse(self.request_term('remove', 2020, 1)['success'])
+        self.assertTrue(self.request_term('remove', 2020, 3)['success'])
+
+    def test_terms_of_logged_in_user(self):
+        user = User.objects.create_user(username='student', password='password')
+        sequence = Sequence.objects.create(user=user, name='Sequence')
+        self.client.force_login(user)
+
+        self.assertTrue(self.request_term('add', 2020, 3)['success'])
+        self.assertFalse(self.request_term('add', 2020, 3)['success'])
+        self.assertEqual(list(Term.objects.filter(user=sequence).values_list('year', 'term_type')), [(2020, 3)])
+        self.assertEqual(self.request_term('remove', 'year', 3)['message'], 'Invalid request parameter values')
+        self.assertTrue(self.request_term('remove', 2020, 3)['success'])
+        self.assertFalse(Term.objects.filter(user=sequence).exists())
+
+
+class CohortEvaluatorTestCase(TestCase):
+    """
+    Compares the vectorized evaluation of a cohort to the evaluation of the snapshot of each of its sequences,
+    over random sequences some of which have no terms, or terms without courses.
+    """
+
+    COURSE_CODES = ['CSC {}'.format(number) for number in range(100, 112)]
+
+    def setUp(self):
+        self.rng = random.Random(0)
+        user = User.objects.create_user(username='student', password='password')
+        courses = [Course.objects.create(subject='CSC', number=course_code.split(' ')[1], name='Course', credits=1.5,
+                                         hours_lectures=3, hours_labs=0, hours_tutorials=0)
+                   for course_code in self.COURSE_CODES]
+
+        self.sequences = []
+        for index in range(40):
+            sequence = Sequence.objects.create(user=user, name='Sequence')
+            terms = self.rng.sample([(year, term_type) for year in (2019, 2020, 2021) for term_type in (1, 2, 3)],
+                                    self.rng.choice([0, 1, 2, 4]))
+            for year, term_type in terms:
+                term = Term.objects.create(user=sequence, year=year, term_type=term_type)
+                for course in self.rng.sample(courses, self.rng.randint(0, 4)):
+                    TermCourse.objects.create(term=term, course=course)
+            self.sequences.append(sequence)
+
+        self.course_index = CourseIndex.from_catalog()
+
+    def assertMatchesSnapshots(self, cohort, requirements):
+        snapshots = [SequenceSnapshot.from_sequence(sequence) for sequence in self.sequences]
+        expressions = [ExpressionFactory.build_and_get_expression(json_data)
+                       for json_data in requirements['expressions']]
+        evaluator = CohortEvaluator(cohort)
+
+        for json_data, expression in zip(requirements['expressions'], expressions):
+            self.assertEqual(evaluator.evaluate_expression(expression).tolist(),
+                             [expression.evaluate_expression(snapshot).satisfied for snapshot in snapshots],
+                             json_data)
+
+        result = evaluator.evaluate_requirements(requirements)
+        self.assertEqual(result['satisfied'].tolist(),
+                         [all(expression.evaluate_expression(snapshot).satisfied for expression in expressions)
+                          for snapshot in snapshots])
+
+    def test_matches_snapshot_evaluation(self):
+        requirements = {'expressions': [generate_requisite(self.rng, self.COURSE_CODES + ['MATH 100'])
+                                        for _ in range(200)]}
+        cohort = CohortBitmap.from_sequences(self.course_index, [sequence.pk for sequence in self.sequences])
+        self.assertMatchesSnapshots(cohort, requirements)
+
+        snapshots = [SequenceSnapshot.from_sequence(sequence) for sequence in self.sequences]
+        cohort = CohortBitmap.from_snapshots(self.course_index, snapshots)
+        self.assertMatchesSnapshots(cohort, requirements)
+
+    def test_requisite_types_at_target_term(self):
+        sequence = self.sequences[0]
+        Term.objects.filter(user=sequence).delete()
+        first = Term.objects.create(user=sequence, year=2020, term_type=3)
+        target = Term.objects.create(user=sequence, year=2021, term_type=1)
+        TermCourse.objects.create(term=first, course=Course.objects.get(number='100'))
+        TermCourse.objects.create(term=target, course=Course.objects.get(number='101'))
+
+        cohort = CohortBitmap.from_sequences(self.course_index, [sequence.pk, self.sequences[1].pk])
+        requirements = {'expressions': [
+            {'expression_type': 'COURSE', 'subject': 'CSC', 'number': number, 'requisite_type': requisite_type}
+            for number in ('100', '101') for requisite_type in ('P', 'C')
+        ]}
+        result = CohortEvaluator(cohort).evaluate_requirements(requirements)
+        self.assertEqual([node['satisfied'][0] for node in result['nodes']], [True, True, False, True])
+
+    def test_courses_missing_from_index_are_left_out(self):
+        course = Course.objects.create(subject='MATH', number='100', name='Course', credits=1.5, hours_lectures=3,
+                                       hours_labs=0, hours_tutorials=0)
+        term = Term.objects.filter(user=self.sequences[0]).first() or \
+            Term.objects.create(user=self.sequences[0], year=2020, term_type=3)
+        TermCourse.objects.create(term=term, course=course)
+
+        cohort = CohortBitmap.from_sequences(self.course_index, [sequence.pk for sequence in self.sequences])
+        snapshots = [SequenceSnapshot.from_sequence(sequence) for sequence in self.sequences]
+        for other in (cohort, CohortBitmap.from_snapshots(self.course_index, snapshots)):
+            self.assertFalse(other.get_column('MATH 100', RequisiteType.COREQUISITE).any())
+            self.assertTrue((other.before_target == cohort.before_target).all())
+            self.assertTrue((other.through_target == cohort.through_target).all())
+
+
+@override_settings(PLAN_CACHE={'VERSION_TTL': 0})
+class PrerequisiteGraphTestCase(TransactionTestCase):
+
+    REQUIREMENT = {'expressions': [{'expression_type': 'COURSE', 'subject': 'CSC', 'number': '110',
+                                    'requisite_type': 'P'}]}
+
+    def setUp(self):
+        self.create_course('110')
+        self.graph = PrerequisiteGraph.get_instance()
+
+    def create_course(self, number, requirement=None):
+        return Course.objects.create(subject='CSC', number=number, name='Course', credits=1.5, hours_lectures=3,
+                                     hours_labs=0, hours_tutorials=0, requirement=requirement)
+
+    def test_committed_write_updates_graph_in_place(self):
+        self.create_course('115', self.REQUIREMENT)
+        self.assertIs(PrerequisiteGraph.get_instance(), self.graph)
+        self.assertEqual(self.graph.get_term_depth('CSC 115'), 1)
+
+    def test_rolled_back_write_leaves_graph_unchanged(self):
+        try:
+            with transaction.atomic():
+                self.create_course('115', self.REQUIREMENT)
+                raise IntegrityError
+        except IntegrityError:
+            pass
+
+        self.assertIs(PrerequisiteGraph.get_instance(), self.graph)
+        self.assertIsNone(self.graph.get_term_depth('CSC 115'))
+
+    @staticmethod
+    def get_requirement(*numbers, requisite_type='P'):
+        return {'expressions': [{'expression_type': 'COURSE', 'subject': 'CSC', 'number': number,
+                                 'requisite_type': requisite_type} for number in numbers]}
+
+    def assertMatchesCatalog(self):
+        graph = PrerequisiteGraph.get_instance()
+        self.assertIs(graph, self.graph)
+        rebuilt = PrerequisiteGraph.from_catalog()
+
+        self.assertEqual(sorted(graph.positions), sorted(rebuilt.positions))
+        for course_code in rebuilt.positions:
+            self.assertEqual(graph.get_required_courses(course_code), rebuilt.get_required_courses(course_code))
+            self.assertEqual(graph.get_unlocked_courses(course_code), rebuilt.get_unlocked_courses(course_code))
+            self.assertEqual(graph.get_term_depth(course_code), rebuilt.get_term_depth(course_code), course_code)
+        self.assertEqual(sorted(map(sorted, graph.get_cycles())), sorted(map(sorted, rebuilt.get_cycles())))
+
+    def test_incremental_updates_match_rebuild(self):
+        self.create_course('200', self.get_requirement('110'))
+        course = self.create_course('300', self.get_requirement('200', '999', requisite_type='C'))
+        self.assertMatchesCatalog()
+
+        # A requirement creating a cycle, then breaking it and no longer referring to a missing course
+        first = Course.objects.get(number='110')
+        first.requirement = self.get_requirement('300')
+        first.save()
+        self.assertMatchesCatalog()
+        self.assertTrue(self.graph.is_in_cycle('CSC 200'))
+
+        first.requirement = None
+        first.save()
+        course.requirement = self.get_requirement('200')
+        course.save()
+        self.assertMatchesCatalog()
+        self.assertIsNone(self.graph.get_term_depth('CSC 999'))
+
+        second = Course.objects.get(number='200')
+        second.number = '250'
+        second.save()
+        self.assertMatchesCatalog()
+        self.assertEqual(self.graph.get_unlocked_courses('CSC 110'), ['CSC 250'])
+        self.assertEqual(self.graph.get_required_courses('CSC 200'), [])
+
+        second.delete()
+        course.delete()
+        self.assertMatchesCatalog()
+        self.assertIsNone(self.graph.get_term_depth('CSC 300'))
+
+    def test_closures_depths_and_cycles(self):
+        graph = PrerequisiteGraph({
+            'CSC 100': None,
+            'CSC 110': self.get_requirement('100'),
+            'CSC 120': {'expressions': [
+                {'expression_type': 'COURSE', 'subject': 'CSC', 'number': '110', 'requisite_type': 'C'},
+                {'expression_type': 'CONDITIONAL', 'condition': 'OR',
+                 'expression_one': {'expression_type': 'COURSE', 'subject': 'CSC', 'number': '100'},
+                 'expression_two': {'expression_type': 'COURSE', 'subject': 'CSC', 'number': '130'}}]},
+            'CSC 130': self.get_requirement('140'),
+            'CSC 140': self.get_requirement('130'),
+            'CSC 150': {'expressions': [{'expression_type': 'LIST', 'threshold_type': 'geq', 'threshold_value': 2,
+                                         'expressions': self.get_requirement('100', '110', '999')['expressions']}]}
+        })
+
+        self.assertEqual([graph.get_term_depth('CSC ' + number) for number in ('100', '110', '120', '130', '150')],
+                         [0, 1, 1, None, 1])
+        self.assertEqual(graph.get_required_courses('CSC 120'), ['CSC 100', 'CSC 110', 'CSC 130', 'CSC 140'])
+        self.assertEqual(graph.get_unlocked_courses('CSC 100'), ['CSC 110', 'CSC 120', 'CSC 150'])
+        self.assertEqual(graph.get_cycles(), [['CSC 130', 'CSC 140']])
+        self.assertTrue(graph.is_in_cycle('CSC 140'))
+        self.assertFalse(graph.is_in_cycle('CSC 120'))
+
+
+@override_settings(PLAN_CACHE={'VERSION_TTL': 0})
+class CourseSearchIndexTestCase(TransactionTestCase):
+
+    def setUp(self):
+        self.index = CourseSearchIndex.get_instance()
+
+    def get_course(self, number):
+        return Course(subject='CSC', number=number, name='Data Structures', credits=1.5, hours_lectures=3,
+                      hours_labs=0, hours_tutorials=0)
+
+    def search(self):
+        return [course['number'] for course in CourseSearchIndex.get_instance().search('data struct')]
+
+    def test_committed_write_updates_index_in_place(self):
+        self.get_course('225').save()
+        self.assertIs(CourseSearchIndex.get_instance(), self.index)
+        self.assertEqual(self.search(), ['225'])
+
+    def test_write_bypassing_signals_rebuilds_index(self):
+        # As an import made by another process does
+        with transaction.atomic():
+            Course.objects.bulk_create([self.get_course('225')])
+            CatalogSnapshot.bump_version(CatalogSnapshot.COURSES)
+
+        self.assertIsNot(CourseSearchIndex.get_instance(), self.index)
+        self.assertEqual(self.search(), ['225'])
+
+
+class StreamingJsonResponseTestCase(TestCase):
+
+    def test_slow_stream_does_not_block_concurrent_requests(self):
+        def iter_slowly():
+            for number in range(5):
+                time.sleep(0.05)
+                yield number
+
+        async def serve():
+            messages = []
+
+            async def send(message):
+                messages.append(message)
+
+            # Other requests are served by the event loop while the document is encoded
+            response = StreamingJsonResponse({'data': iter_slowly()})
+            stream = asyncio.ensure_future(StreamingASGIHandler().send_response(response, send))
+            ticks = 0
+            while not stream.done():
+                await asyncio.sleep(0.01)
+                ticks += 1
+            await stream
+            return messages, ticks
+
+        messages, ticks = asyncio.run(serve())
+        self.assertEqual(json.loads(b''.join(message.get('body', b'') for message in messages[1:])),
+                         {'data': [0, 1, 2, 3, 4]})
+        self.assertGreater(ticks, 10)
+
+
+def get_course_names(request):
+    """
+    Reads the name of every course with a query each, as a view looping over a list of items would.
+    """
+    names = [Course.objects.get(pk=pk).name for pk in Course.objects.order_by('pk').values_list('pk', flat=True)]
+    return JsonResponse({'names': names})
+
+
+# The URLs of the application, along with views used to test the middleware
+urlpatterns = plan_urlpatterns + [
+    path('test/course/names', get_course_names, name='test_course_names')
+]
+
+
+@override_settings(ROOT_URLCONF='plan.tests', PLAN_METRICS={'DUPLICATE_QUERY_THRESHOLD': 5})
+class InstrumentationMiddlewareTestCase(TestCase):
+
+    def setUp(self):
+        for number in range(100, 106):
+            Course.objects.create(subject='CSC', number=str(number), name='Course', credits=1.5, hours_lectures=3,
+                                  hours_labs=0, hours_tutorials=0)
+        self.registry = MetricsRegistry.get_instance()
+        self.registry.clear()
+
+    def get_sum(self, endpoint, name):
+        return self.registry.get_histogram(endpoint, name).sum
+
+    def test_records_queries_of_request(self):
+        with self.assertLogs('plan.middleware', 'WARNING') as logs, CaptureQueriesContext(connection) as context:
+            response = self.client.get('/test/course/names')
+        self.assertEqual(len(response.json()['names']), 6)
+
+        # One query for the primary keys, then the same statement for each of the 6 courses
+        self.assertEqual(self.get_sum('test_course_names', 'plan_request_queries'), len(context.captured_queries))
+        self.assertEqual(self.get_sum('test_course_names', 'plan_request_duplicate_queries'), 5)
+        self.assertEqual(self.get_sum('test_course_names', 'plan_response_size_bytes'), len(response.content))
+        self.assertIn('executed the same query 6 times', logs.output[0])
+
+    def test_records_streamed_response_once_written(self):
+        course = Course.objects.get(number='100')
+        offering = CourseOffering.objects.create(course=course, year=2020, term_type='fall')
+        section = Section.objects.create(crn=10000, course_offering=offering, name='A01', section_type='lecture')
+        for start_hour in (8, 13):
+            Meeting.objects.create(section=section, start_date=datetime.date(2020, 9, 8),
+                                   end_date=datetime.date(2020, 12, 4), weekdays=0b1001,
+                                   start_minute=start_hour * 60, end_minute=start_hour * 60 + 50)
+
+        response = self.client.get('/api/meeting/batch', {'crns': '10000', 'stream': 'true'})
+        self.assertIsNone(self.registry.get_histogram('api_meeting_batch', 'plan_response_size_bytes'))
+
+        with CaptureQueriesContext(connection) as context:
+            content = b''.join(response.streaming_content)
+        self.assertEqual(len(json.loads(content)['response']['data']['10000']), 2)
+        self.assertEqual(self.get_sum('api_meeting_batch', 'plan_response_size_bytes'), len(content))
+        # The meetings are only read as the response is written
+        self.assertEqual(self.get_sum('api_meeting_batch', 'plan_request_queries'), len(context.captured_queries))
+        self.assertEqual(self.get_sum('api_meeting_batch', 'plan_request_duplicate_queries'), 0)
+
+    def test_metrics_renders_histograms(self):
+        with self.assertLogs('plan.middleware', 'WARNING'):
+            self.client.get('/test/course/names')
+            self.client.get('/test/course/names')
+        self.client.get('/api/unknown')
+
+        metrics = self.client.get('/metrics').content.decode()
+        self.assertIn('plan_requests_total{endpoint="test_course_names",status="200"} 2', metrics)
+        self.assertIn('plan_requests_total{endpoint="unresolved",status="404"} 1', metrics)
+        self.assertIn('plan_request_duplicate_queries_sum{endpoint="test_course_names"} 10', metrics)
+        self.assertIn('plan_request_duplicate_queries_bucket{endpoint="test_course_names",le="3"} 0', metrics)
+        self.assertIn('plan_request_duplicate_queries_bucket{endpoint="test_course_names",le="7"} 2', metrics)
+        self.assertIn('plan_request_queries_count{endpoint="test_course_names"} 2', metrics)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'import_catalog requires PostgreSQL')
+@override_settings(PLAN_CACHE={'VERSION_TTL': 0})
+class ImportCatalogTestCase(TransactionTestCase):
+
+    def import_catalog(self, header, *rows):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as file:
+            file.write('\n'.join((header,) + rows) + '\n')
+        try:
+            call_command('import_catalog', file.name, year=2020, term='fall', stdout=io.StringIO())
+        finally:
+            os.remove(file.name)
+
+    def test_import_invalidates_indexes_of_every_process(self):
+        graph = PrerequisiteGraph.get_instance()
+        catalog_version = CatalogSnapshot.get_version()
+        courses_version = CatalogSnapshot.get_version(CatalogSnapshot.COURSES)
+
+        self.import_catalog('subject,number,name,credits,crn,section_name,section_type,start_date,end_date,'
+                            'start_time,end_time,days',
+                            'CSC,110,Course,1.5,10000,A01,lecture,2020-09-08,2020-12-04,08:30,09:20,MR')
+
+        # Nothing but the shared versions tells the indexes of the server processes about the import
+        self.assertGreater(CatalogSnapshot.get_version(), catalog_version)
+        self.assertGreater(CatalogSnapshot.get_version(CatalogSnapshot.COURSES), courses_version)
+        self.assertIsNot(PrerequisiteGraph.get_instance(), graph)
+        self.assertEqual(PrerequisiteGraph.get_instance().get_term_depth('CSC 110'), 0)
+
+    def test_import_capacities(self):
+        header = 'subject,number,name,credits,crn,section_name,section_type,capacity,waitlist_capacity'
+        self.import_catalog(header, 'CSC,110,Course,1.5,10000,A01,lecture,2,1', 'CSC,110,Course,1.5,10001,A02,lab,,')
+        self.assertEqual(list(Section.objects.order_by('crn').values_list('capacity', 'waitlist_capacity')),
+                         [(2, 1), (None, 0)])
+
+        # Empty capacities are left unchanged, and capacities below the students enrolled are rejected
+        SeatCounter.enroll(10000)
+        SeatCounter.enroll(10000)
+        self.import_catalog(header, 'CSC,110,Course,1.5,10000,A01,lecture,,3', 'CSC,110,Course,1.5,10001,A02,lab,40,')
+        self.assertEqual(list(Section.objects.order_by('crn').values_list('capacity', 'waitlist_capacity')),
+                         [(2, 3), (40, 0)])
+        with self.assertRaises(CommandError):
+            self.import_catalog(header, 'CSC,110,Course,1.5,10000,A01,lecture,1,')
+        self.assertEqual(Section.objects.get(crn=10000).capacity, 2)
+
+
+class MeetingEncodingTestCase(TestCase):
+
+    def setUp(self):
+        course = Course.objects.create(subject='CSC', number='110', name='Course', credits=1.5, hours_lectures=3,
+                                       hours_labs=0, hours_tutorials=0)
+        offering = CourseOffering.objects.create(course=course, year=2020, term_type='fall')
+        self.section = Section.objects.create(crn=10000, course_offering=offering, name='A01', section_type='lecture')
+
+    def test_compact_encoding_matches_dict(self):
+        # Dates around the epoch from which the compact encoding counts days, and the extreme times of a day
+        for start_date, end_date, weekdays, start_minute, end_minute in (
+                (datetime.date(1969, 12, 31), datetime.date(1970, 1, 1), 0b1000000, 0, 1439),
+                (datetime.date(1970, 1, 2), datetime.date(2020, 12, 4), 0b0010101, 510, 590),
+                (datetime.date(2020, 9, 8), datetime.date(2020, 9, 8), 0, 60, 61)):
+            meeting = Meeting.objects.create(section=self.section, start_date=start_date, end_date=end_date,
+                                             weekdays=weekdays, start_minute=start_minute, end_minute=end_minute)
+            crn, compact_weekdays, compact_start, compact_end, start_day, end_day = meeting.to_compact()
+            result = meeting.to_dict()
+
+            with self.subTest(start_date=start_date):
+                self.assertEqual(crn, result['section'])
+                self.assertEqual(compact_weekdays, result['weekdays'])
+                self.assertEqual([letter for index, letter in enumerate(WEEKDAY_LETTERS)
+                                  if compact_weekdays & (1 << index)],
+                                 [letter for letter in WEEKDAY_LETTERS if result['meet_' + letter]])
+                self.assertEqual(str(DateUtils.get_time_of_minute(compact_start)), result['start_time'])
+                self.assertEqual(str(DateUtils.get_time_of_minute(compact_end)), result['end_time'])
+                self.assertEqual(str(datetime.date.fromordinal(EPOCH_ORDINAL + start_day)), result['start_date'])
+                self.assertEqual(str(datetime.date.fromordinal(EPOCH_ORDINAL + end_day)), result['end_date'])
+
+        self.assertEqual(Meeting.objects.get(start_date=datetime.date(1970, 1, 2)).to_compact()[4:], [1, 18600])
+        self.assertEqual(Meeting.objects.get(start_date=datetime.date(1969, 12, 31)).to_compact()[4:], [-1, 0])
+
+
+class MeetingMigrationTestCase(TransactionTestCase):
+    """
+    Migrates meetings stored with day fields and times to the weekday bitmask and minutes of the day, and back.
+    """
+
+    UNPACKED = '0003_meeting_packed_fields'
+    PACKED = '0004_meeting_packed_data'
+
+    # The days and times of each meeting, and its expected weekday bitmask
+    MEETINGS = [
+        ('MW', datetime.time(8, 30), datetime.time(9, 50), 0b0000101),
+        ('Z', datetime.time(23, 0), datetime.time(23, 59), 0b1000000),
+        ('', datetime.time(0, 0), datetime.time(0, 10), 0),
+        ('MTWRFSZ', datetime.time(12, 5), datetime.time(13, 0), 0b1111111)
+    ]
+
+    def migrate(self, name):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('plan', name)])
+        return executor.loader.project_state([('plan', name)]).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes('plan'))
+
+    def test_pack_and_unpack_meetings(self):
+        apps = self.migrate(self.UNPACKED)
+        course = apps.get_model('plan', 'Course').objects.create(
+            subject='CSC', number='110', name='Course', credits=1.5, hours_lectures=3, hours_labs=0, hours_tutorials=0)
+        offering = apps.get_model('plan', 'CourseOffering').objects.create(course=course, year=2020, term_type='fall')
+        section = apps.get_model('plan', 'Section').objects.create(crn=10000, course_offering=offering, name='A01',
+                                                                   section_type='lecture')
+        for days, start_time, end_time, _ in self.MEETINGS:
+            apps.get_model('plan', 'Meeting').objects.create(
+                section=section, start_date=datetime.date(2020, 9, 8), end_date=datetime.date(2020, 12, 4),
+                start_time=start_time, end_time=end_time, **{'meet_' + letter: True for letter in days})
+
+        Meeting = self.migrate(self.PACKED).get_model('plan', 'Meeting')
+        self.assertEqual(list(Meeting.objects.order_by('id').values_list('weekdays', 'start_minute', 'end_minute')),
+                         [(weekdays, start_time.hour * 60 + start_time.minute, end_time.hour * 60 + end_time.minute)
+                          for _, start_time, end_time, weekdays in self.MEETINGS])
+
+        # The day fields and times are only read from the packed fields when migrating back
+        Meeting.objects.update(start_time=None, end_time=None,
+                               **{'meet_' + letter: False for letter in WEEKDAY_LETTERS})
+        Meeting = self.migrate(self.UNPACKED).get_model('plan', 'Meeting')
+        for meeting, (days, start_time, end_time, _) in zip(Meeting.objects.order_by('id'), self.MEETINGS):
+            self.assertEqual((meeting.start_time, meeting.end_time), (start_time, end_time))
+            self.assertEqual(''.join(letter for letter in WEEKDAY_LETTERS if getattr(meeting, 'meet_' + letter)),
+                             days)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Query plans are only checked on PostgreSQL')
+class HotPathIndexTestCase(TestCase):
+    """
+    Asserts that each hot lookup can be served by an index. Sequential scans are disabled, since on tables this
+    small the planner would otherwise prefer them.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='student', password='password')
+        self.course = Course.objects.create(subject='CSC', number='110', name='Course', credits=1.5,
+                                            hours_lectures=3, hours_labs=0, hours_tutorials=0)
+        self.offering = CourseOffering.objects.create(course=self.course, year=2020, term_type='fall')
+        self.schedule = Schedule.objects.create(user=self.user, year=2020, term='fall', name='Schedule')
+        self.sequence = Sequence.objects.create(user=self.user, name='Sequence')
+        self.term = Term.objects.create(user=self.sequence, year=2020, term_type=3)
+
+        with connection.cursor() as cursor:
+            cursor.execute('SET enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, 'Expected an index scan on {}:\n{}'.format(index_name, plan))
+
+    def test_course_by_code(self):
+        self.assertUsesIndex(Course.objects.filter(subject='CSC', number='110'), 'course_subject_number_unique')
+
+    def test_offerings_by_course(self):
+        self.assertUsesIndex(CourseOffering.objects.filter(course=self.course), 'course_offering_term_unique')
+
+    def test_offerings_by_term(self):
+        self.assertUsesIndex(CourseOffering.objects.filter(year=2020, term_type='fall'), 'course_offering_term_idx')
+
+    def test_schedule_by_user_and_name(self):
+        self.assertUsesIndex(Schedule.objects.filter(user=self.user, name='Schedule'), 'schedule_user_name_unique')
+
+    def test_schedule_sections_by_schedule(self):
+        self.assertUsesIndex(ScheduleSection.objects.filter(schedule=self.schedule), 'schedule_section_unique')
+
+    def test_term_by_sequence_and_term(self):
+        self.assertUsesIndex(Term.objects.filter(user=self.sequence, year=2020, term_type=3), 'term_sequence_unique')
+
+    def test_term_courses_by_term(self):
+        self.assertUsesIndex(TermCourse.objects.filter(term=self.term), 'term_course_unique')
+
+    def test_meetings_by_section(self):
+        self.assertUsesIndex(Meeting.objects.filter(section_id=10000), 'plan_meeting_section_id')
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Concurrent updates are only tested on PostgreSQL')
+class SeatCounterConcurrencyTestCase(TransactionTestCase):
+    """
+    Updates the seats of a single section from many threads at once, each with its own database connection.
+    """
+
+    THREADS = 16
+    ATTEMPTS = 25
+
+    def setUp(self):
+        course = Course.objects.create(subject='CSC', number='110', name='Course', credits=1.5, hours_lectures=3,
+                                       hours_labs=0, hours_tutorials=0)
+        offering = CourseOffering.objects.create(course=course, year=2020, term_type='fall')
+        self.section = Section.objects.create(crn=10000, course_offering=offering, name='A01', section_type='lecture',
+                                              capacity=150, waitlist_capacity=50)
+        SeatAvailability.clear_instances()
+
+    def run_threads(self, target):
+        """
+        Calls `target` from every thread at once, and returns the concatenation of the lists they returned.
+        """
+        results = []
+        barrier = threading.Barrier(self.THREADS)
+
+        def run():
+            try:
+                barrier.wait()
+                results.extend(target())
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_enroll_never_exceeds_capacity(self):
+        availability = SeatAvailability.get_instance(2020, 'fall')
+        statuses = Counter(self.run_threads(lambda: [SeatCounter.enroll(self.section.crn)[0]
+                                                     for _ in range(self.ATTEMPTS)]))
+
+        self.assertEqual(statuses[EnrollmentStatus.ENROLLED], 150)
+        self.assertEqual(statuses[EnrollmentStatus.WAITLISTED], 50)
+        self.assertEqual(statuses[EnrollmentStatus.FULL], self.THREADS * self.ATTEMPTS - 200)
+
+        self.section.refresh_from_db()
+        self.assertEqual((self.section.enrolled, self.section.waitlisted, self.section.seat_updates), (150, 50, 200))
+
+        # The view was refreshed with the latest counters, whatever the order in which the updates returned
+        record = availability.get_records([self.section.crn])[0]
+        self.assertEqual((record.enrolled, record.waitlisted, record.updates), (150, 50, 200))
+
+    def test_saving_section_keeps_counters(self):
+        section = Section.objects.get(crn=self.section.crn)
+        SeatCounter.enroll(self.section.crn)
+
+        section.name = 'A02'
+        section.save()
+        self.section.refresh_from_db()
+        self.assertEqual((self.section.name, self.section.enrolled, self.section.seat_updates), ('A02', 1, 1))
+
+        self.section.capacity = 0
+        with self.assertRaises(ValidationError):
+            self.section.full_clean()
+
+    def test_enroll_and_drop_balance(self):
+        def register():
+            statuses = []
+            for _ in range(self.ATTEMPTS):
+                status, _ = SeatCounter.enroll(self.section.crn)
+                if status == EnrollmentStatus.ENROLLED:
+                    self.assertIsNotNone(SeatCounter.drop(self.section.crn))
+                elif status == EnrollmentStatus.WAITLISTED:
+                    self.assertIsNotNone(SeatCounter.leave_waitlist(self.section.crn))
+                statuses.append(status)
+            return statuses
+
+        statuses = self.run_threads(register)
+        self.assertEqual(len(statuses), self.THREADS * self.ATTEMPTS)
+
+        self.section.refresh_from_db()
+        self.assertEqual((self.section.enrolled, self.section.waitlisted), (0, 0))
+        self.assertEqual(self.section.seat_updates, 2 * (len(statuses) - statuses.count(EnrollmentStatus.FULL)))
@@ -0,0 +1,209 @@
+#  Copyright (c) 2020. by Anton Nikitenko
+#  All rights reserved.
+
+import heapq
+import itertools
+from collections import OrderedDict
+from django.db.models import Q
+from plan.conflicts import ConflictIndex, MeetingRecord
+from plan.models import Meeting, Section
+
+
+class TimetableScorer:
+    """
+    The base class of the scoring hooks used to rank timetables, where a lower score is better.
+
+    A scorer folds the meetings of each selected section into a state, from which the score is computed.
+    Adding a section must never decrease the score, which allows ranking to discard a partial timetable as
+    soon as it scores worse than the timetables already found.
+    """
+
+    def __init__(self, weight=1):
+        self.weight = weight
+
+    def get_initial_state(self):
+        return 0
+
+    def add_section(self, state, records):
+        raise NotImplementedError
+
+    def get_score(self, state):
+        return state
+
+
+class DaysOnCampusScorer(TimetableScorer):
+    """
+    Scores a timetable by the number of days of the week with at least one meeting.
+    """
+
+    def add_section(self, state, records):
+        for record in records:
+            state |= record.weekdays
+        return state
+
+    def get_score(self, state):
+        return bin(state).count('1')
+
+
+class EarlyMorningScorer(TimetableScorer):
+    """
+    Scores a timetable by the number of weekly meetings starting before a given minute of the day.
+    """
+
+    def __init__(self, before_minute=9 * 60, weight=1):
+        super().__init__(weight)
+        self.before_minute = before_minute
+
+    def add_section(self, state, records):
+        return state + sum(bin(record.weekdays).count('1') for record in records
+                           if record.start_minute < self.before_minute)
+
+
+class TimetableGenerator:
+    """
+    Enumerates every combination of sections without conflicts for a list of courses.
+
+    Sections are grouped by course offering and section type, and a timetable takes exactly one section of
+    every group. Conflicts between all pairs of sections are precomputed as one bitset per section, and the
+    search picks the group with the fewest remaining candidates first, removing the sections conflicting with
+    each choice from the other groups so that dead ends are detected before they are explored.
+    """
+
+    def __init__(self, groups):
+        """
+        Args:
+            groups: A list of groups, each a list of (crn, meeting records) tuples for the sections of that group
+        """
+        self.crns = []
+        self.records = []
+        self.group_domains = []
+
+        for group in groups:
+            domain = 0
+            for crn, records in group:
+                domain |= 1 << len(self.crns)
+                self.crns.append(crn)
+                self.records.append(list(records))
+            self.group_domains.append(domain)
+
+        self.conflicts = self._get_conflicts()
+
+    @staticmethod
+    def from_courses(courses, year, term_type):
+        """
+        Builds the generator for the sections of the courses offered in a term, with two queries.
+
+        Args:
+            courses: A list of (subject, number) tuples
+            year: The year of the course offerings
+            term_type: The term of the course offerings ('spring', 'summer' or 'fall')
+        """
+        course_filter = Q(pk__in=[])
+        for subject, number in courses:
+            course_filter |= Q(course_offering__course__subject=subject, course_offering__course__number=number)
+
+        sections = list(Section.objects.filter(course_filter, course_offering__year=year,
+                                               course_offering__term_type=term_type).order_by('crn'))
+
+        records = {section.crn: [] for section in sections}
+        for record in MeetingRecord.from_queryset(Meeting.objects.filter(section__in=records.keys())):
+            records[record.crn].append(record)
+
+        groups = OrderedDict()
+        for section in sections:
+            groups.setdefault((section.course_offering_id, section.section_type), []).append(
+                (section.crn, records[section.crn]))
+
+        return TimetableGenerator(list(groups.values()))
+
+    def iter_timetables(self):
+        """
+        Lazily yields the CRNs of every valid timetable, one per group in group order.
+        """
+        for chosen in self._search(list(self.group_domains), [None] * len(self.group_domains)):
+            yield [self.crns[section] for section in chosen]
+
+    def rank(self, scorers, limit=10):
+        """
+        Returns the `limit` valid timetables with the lowest weighted score, best first, as a list of
+        (score, CRNs) tuples.
+        """
+        best = []
+        counter = itertools.count()
+
+        def get_score(states):
+            return sum(scorer.weight * scorer.get_score(state) for scorer, state in zip(scorers, states))
+
+        def prune(states):
+            return len(best) == limit and get_score(states) >= -best[0][0]
+
+        initial_states = [scorer.get_initial_state() for scorer in scorers]
+        for chosen, states in self._search(list(self.group_domains), [None] * len(self.group_domains),
+                                           scorers, initial_states, prune):
+            entry = (-get_score(states), next(counter), [self.crns[section] for section in chosen])
+            if len(best) < limit:
+                heapq.heappush(best, entry)
+            else:
+                heapq.heappushpop(best, entry)
+
+        return [(-score, crns) for score, _, crns in sorted(best, key=lambda entry: (-entry[0], entry[1]))]
+
+    def _search(self, domains, chosen, scorers=None, states=None, prune=None):
+        # Choose the unassigned group with the fewest candidates left
+        group = None
+        group_size = 0
+        for index, domain in enumerate(domains):
+            if chosen[index] is None:
+                size = bin(domain).count('1')
+                if group is None or size < group_size:
+                    group, group_size = index, size
+
+        if group is None:
+            yield (list(chosen), states) if scorers is not None else list(chosen)
+            return
+
+        candidates = domains[group]
+        while candidates:
+            lowest = candidates & -candidates
+            candidates ^= lowest
+            section = lowest.bit_length() - 1
+
+            section_states = states
+            if scorers is not None:
+                section_states = [scorer.add_section(state, self.records[section])
+                                  for scorer, state in zip(scorers, states)]
+                if prune(section_states):
+                    continue
+
+            # Forward checking: remove the sections conflicting with this one from the other groups
+            allowed = ~self.conflicts[section]
+            next_domains = list(domains)
+            feasible = True
+            for index, domain in enumerate(domains):
+                if chosen[index] is None and index != group:
+                    next_domains[index] = domain & allowed
+                    if not next_domains[index]:
+                        feasible = False
+                        break
+            if not feasible:
+                continue
+
+            chosen[group] = section
+            yield from self._search(next_domains, chosen, scorers, section_states, prune)
+            chosen[group] = None
+
+    def _get_conflicts(self):
+        """
+        Returns, for every section, the bitset of the sections it conflicts with.
+        """
+        positions = {crn: position for position, crn in enumerate(self.crns)}
+        index = ConflictIndex(record for records in self.records for record in records)
+
+        conflicts = []
+        for records in self.records:
+            bitset = 0
+            for crn in index.find_conflicts(records):
+                bitset |= 1 << positions[crn]
+            conflicts.append(bitset)
+
+        return conflicts
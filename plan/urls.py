@@ -12,6 +12,9 @@ urlpatterns = [
     path('account/logout', views.account_logout, name='account_logout'),
     path('account/register', views.account_register, name='account_register'),
     path('api/data/course', views.api_data_course, name='api_data_course'),
+    path('api/data/course/search', views.api_data_course_search, name='api_data_course_search'),
+    path('api/data/offering', views.api_data_offering, name='api_data_offering'),
+    path('api/data/occupancy', views.api_data_occupancy, name='api_data_occupancy'),
     path('api/data/program', views.api_data_program, name='api_data_program'),
     path('api/plan/course', views.api_plan_course, name='api_plan_course'),
     path('api/plan/program', views.api_plan_program, name='api_plan_program'),
@@ -20,7 +23,14 @@ urlpatterns = [
     path('api/schedule/add', views.api_schedule_add, name='api_schedule_add'),
     path('api/schedule/get', views.api_schedule_get, name='api_schedule_get'),
     path('api/schedule/remove', views.api_schedule_remove, name='api_schedule_remove'),
+    path('api/schedule/compare', views.api_schedule_compare, name='api_schedule_compare'),
+    path('api/schedule/generate', views.api_schedule_generate, name='api_schedule_generate'),
     #path('api/schedule/section', views.api_schedule_section, name='api_schedule_section'),
     path('api/section/get', views.api_section_get, name='api_section_get'),
-    path('api/meeting/get', views.api_meeting_get, name='api_meeting_get')
+    path('api/section/search', views.api_section_search, name='api_section_search'),
+    path('api/section/seats', views.api_section_seats, name='api_section_seats'),
+    path('api/meeting/get', views.api_meeting_get, name='api_meeting_get'),
+    path('api/meeting/batch', views.api_meeting_batch, name='api_meeting_batch'),
+    path('api/cache/stats', views.api_cache_stats, name='api_cache_stats'),
+    path('metrics', views.metrics, name='metrics')
 ]
\ No newline at end of file
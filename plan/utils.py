@@ -1,3 +1,4 @@
+import datetime
 from enum import Enum
 
 
@@ -11,6 +12,15 @@ class Weekday(Enum):
     SUNDAY = 6
 
 
+# The letters of the days of the week used by the registrar, in the order of the `Weekday` values
+WEEKDAY_LETTERS = 'MTWRFSZ'
+
+ALL_WEEKDAYS_MASK = (1 << len(Weekday)) - 1
+
+# The ordinal of 1970-01-01, from which the compact JSON encoding counts days
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
 class DateUtils:
 
     @staticmethod
@@ -25,12 +35,15 @@ class DateUtils:
     def do_times_overlap(time_range_one, time_range_two):
 
         if time_range_one.end_time > time_range_two.start_time \
-                and time_range_one.start_time < time_range_one.end_time:
+                and time_range_one.start_time < time_range_two.end_time:
             return True
         return False
 
     @staticmethod
     def get_weekdays_in_date_range(date_one, date_two):
+        """
+        Returns the weekdays occurring between the two dates, inclusively, in chronological order.
+        """
 
         if date_two < date_one:
             earlier_date = date_two
@@ -40,5 +53,42 @@ class DateUtils:
             later_date = date_two
 
         weekdays = []
-        for _ in range(7):
-            weekdays.append(Weekday(earlier_date.weekday()))
+        for offset in range(min((later_date - earlier_date).days + 1, 7)):
+            weekdays.append(Weekday((earlier_date.weekday() + offset) % 7))
+
+        return weekdays
+
+    @staticmethod
+    def get_weekday_mask_in_date_range(date_one, date_two):
+        """
+        Returns the weekdays occurring between the two dates as a bitmask, with bit `n` set for `Weekday(n)`.
+        """
+        if abs((date_two - date_one).days) >= 6:
+            return ALL_WEEKDAYS_MASK
+
+        mask = 0
+        for weekday in DateUtils.get_weekdays_in_date_range(date_one, date_two):
+            mask |= 1 << weekday.value
+        return mask
+
+    @staticmethod
+    def get_minute_of_day(time):
+        return time.hour * 60 + time.minute
+
+    @staticmethod
+    def get_time_of_minute(minute):
+        return datetime.time(minute // 60, minute % 60)
+
+    @staticmethod
+    def get_weekday_mask(letters):
+        """
+        Returns the bitmask of the days of the week given by their letters (e.g 'MR'), with bit `n` set for
+        `Weekday(n)`. Raises ValueError for an unknown letter.
+        """
+        mask = 0
+        for letter in letters:
+            index = WEEKDAY_LETTERS.find(letter)
+            if index < 0:
+                raise ValueError('Unknown day of the week ' + letter)
+            mask |= 1 << index
+        return mask
@@ -1,6 +1,11 @@
 from django.http import JsonResponse, HttpResponse, HttpResponseRedirect
 from django.template import loader
+from .cache import CatalogCache
+from .catalog import CatalogSnapshot
+from .executors import DatabaseExecutor
 from .handlers import AccountHandler, DataHandler, PageHandler, SequenceHandler, ScheduleHandler
+from .metrics import MetricsRegistry
+from .streaming import StreamingJsonResponse
 
 API_RESPONSE_BASE = {'method': '', 'response': ''}
 
@@ -76,32 +81,104 @@ def account_register(request):
     return HttpResponseRedirect("/")
 
 
-def api_data_course(request):
+async def api_data_course(request):
     # TODO: Better validation
     response_json = API_RESPONSE_BASE.copy()
     response_json['method'] = 'data_course'
 
     action = request.GET.get('action')
     if action == 'get':
-        response_json['response'] = DataHandler.get_course_data(request)
+        if 'subject' not in request.GET and 'number' not in request.GET:
+            return await api_data_course_catalog(request)
+        if request.GET.get('stream') == 'true':
+            response_json['response'] = await DatabaseExecutor.run(DataHandler.get_course_data, request, stream=True)
+            return StreamingJsonResponse(response_json)
+        response_json['response'] = await DatabaseExecutor.run(DataHandler.get_course_data, request)
     else:
         response_json['response'] = 'Unsupported action'
 
     return JsonResponse(response_json)
 
 
-def api_data_offering(request):
-    # TODO: Complete API_DATA_OFFERING route view and handling
-    pass
+async def api_data_course_catalog(request):
+    """
+    Serves the full course catalog from the snapshot of the current catalog version, compressed with gzip
+    when the client accepts it. A client presenting the current ETag receives 304 without any database access.
+    If the 'stream' parameter is 'true', the catalog is instead read from the database as it is written.
+    """
+    if request.GET.get('stream') == 'true':
+        response_json = API_RESPONSE_BASE.copy()
+        response_json['method'] = 'data_course'
+        response_json['response'] = await DatabaseExecutor.run(DataHandler.get_course_catalog, stream=True)
+        return StreamingJsonResponse(response_json)
+
+    def build_document():
+        response_json = API_RESPONSE_BASE.copy()
+        response_json['method'] = 'data_course'
+        response_json['response'] = DataHandler.get_course_catalog()
+        return response_json
+
+    snapshot = await DatabaseExecutor.run(CatalogSnapshot.get_instance, build_document)
+
+    if snapshot.is_not_modified(request):
+        response = HttpResponse(status=304)
+    elif snapshot.accepts_gzip(request):
+        response = HttpResponse(snapshot.compressed_content, content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(snapshot.content, content_type='application/json')
+
+    response['ETag'] = snapshot.etag
+    response['Cache-Control'] = 'no-cache'
+    response['Vary'] = 'Accept-Encoding'
+    return response
+
+
+async def api_data_course_search(request):
+    response_json = API_RESPONSE_BASE.copy()
+    response_json['method'] = 'data_course_search'
+
+    response_json['response'] = await DatabaseExecutor.run(DataHandler.search_courses, request)
+    return JsonResponse(response_json)
 
 
-def api_data_program(request):
+async def api_data_offering(request):
+    response_json = API_RESPONSE_BASE.copy()
+    response_json['method'] = 'data_offering'
+
+    action = request.GET.get('action')
+    if action == 'get':
+        if request.GET.get('stream') == 'true':
+            response_json['response'] = await DatabaseExecutor.run(DataHandler.get_offering_data, request,
+                                                                   stream=True)
+            return StreamingJsonResponse(response_json)
+        response_json['response'] = await DatabaseExecutor.run(DataHandler.get_offering_data, request)
+    else:
+        response_json['response'] = 'Unsupported action'
+
+    return JsonResponse(response_json)
+
+
+async def api_data_occupancy(request):
+    response_json = API_RESPONSE_BASE.copy()
+    response_json['method'] = 'data_occupancy'
+
+    action = request.GET.get('action')
+    if action == 'get':
+        response_json['response'] = await DatabaseExecutor.run(DataHandler.get_occupancy_data, request)
+    else:
+        response_json['response'] = 'Unsupported action'
+
+    return JsonResponse(response_json)
+
+
+async def api_data_program(request):
     response_json = API_RESPONSE_BASE.copy()
     response_json['method'] = 'data_program'
 
     action = request.GET.get('action')
     if action == 'get':
-        response_json['response'] = DataHandler.get_program_data(request)
+        response_json['response'] = await DatabaseExecutor.run(DataHandler.get_program_data, request)
     else:
         response_json['response'] = 'Unsupported action'
 
@@ -136,6 +213,8 @@ def api_plan_program(request):
         response_json['response'] = SequenceHandler.get_program(request)
     elif action == 'evaluate':
         response_json['response'] = SequenceHandler.evaluate_program(request)
+    elif action == 'plan':
+        response_json['response'] = SequenceHandler.plan_program(request)
     elif action == 'remove':
         response_json['response'] = SequenceHandler.remove_program(request)
     else:
@@ -184,11 +263,11 @@ def api_schedule_add(request):
     return HttpResponseRedirect("/")
 
 
-def api_schedule_get(request):
+async def api_schedule_get(request):
     response_json = API_RESPONSE_BASE.copy()
     response_json['method'] = 'schedule_get'
 
-    response_json['response'] = ScheduleHandler.get_schedule(request)
+    response_json['response'] = await DatabaseExecutor.run(ScheduleHandler.get_schedule, request)
     return JsonResponse(response_json)
 
 
@@ -200,19 +279,67 @@ def api_schedule_remove(request):
     return HttpResponseRedirect("/")
 
 
-def api_section_get(request):
+async def api_schedule_compare(request):
+    response_json = API_RESPONSE_BASE.copy()
+    response_json['method'] = 'schedule_compare'
+
+    response_json['response'] = await DatabaseExecutor.run(ScheduleHandler.compare_schedules, request)
+    return JsonResponse(response_json)
+
+
+async def api_schedule_generate(request):
+    response_json = API_RESPONSE_BASE.copy()
+    response_json['method'] = 'schedule_generate'
+
+    response_json['response'] = await DatabaseExecutor.run(ScheduleHandler.generate_timetables, request)
+    return JsonResponse(response_json)
+
+
+async def api_section_get(request):
     response_json = API_RESPONSE_BASE.copy()
     response_json['method'] = 'section_get'
 
-    response_json['response'] = ScheduleHandler.get_section(request)
+    response_json['response'] = await DatabaseExecutor.run(ScheduleHandler.get_section, request)
+    return JsonResponse(response_json)
+
+
+async def api_section_search(request):
+    response_json = API_RESPONSE_BASE.copy()
+    response_json['method'] = 'section_search'
+
+    if request.GET.get('stream') == 'true':
+        response_json['response'] = await DatabaseExecutor.run(ScheduleHandler.find_sections, request, stream=True)
+        return StreamingJsonResponse(response_json)
+
+    response_json['response'] = await DatabaseExecutor.run(ScheduleHandler.find_sections, request)
+    return JsonResponse(response_json)
+
+
+async def api_section_seats(request):
+    response_json = API_RESPONSE_BASE.copy()
+    response_json['method'] = 'section_seats'
+
+    response_json['response'] = await DatabaseExecutor.run(ScheduleHandler.get_seats, request)
     return JsonResponse(response_json)
 
 
-def api_meeting_get(request):
+async def api_meeting_get(request):
     response_json = API_RESPONSE_BASE.copy()
     response_json['method'] = 'meeting_get'
 
-    response_json['response'] = ScheduleHandler.get_meeting(request)
+    response_json['response'] = await DatabaseExecutor.run(ScheduleHandler.get_meeting, request)
+    return JsonResponse(response_json)
+
+
+async def api_meeting_batch(request):
+    response_json = API_RESPONSE_BASE.copy()
+    response_json['method'] = 'meeting_batch'
+
+    if request.GET.get('stream') == 'true':
+        response_json['response'] = await DatabaseExecutor.run(ScheduleHandler.get_meetings, request, stream=True)
+        return StreamingJsonResponse(response_json)
+
+    response_json['response'] = await DatabaseExecutor.run(ScheduleHandler.get_meetings, request)
     return JsonResponse(response_json)
 
 
@@ -231,6 +358,18 @@ def api_meeting_get(request):
 #     return JsonResponse(response_json)
 
 
+def api_cache_stats(request):
+    response_json = API_RESPONSE_BASE.copy()
+    response_json['method'] = 'cache_stats'
+
+    response_json['response'] = CatalogCache.get_instance().get_stats()
+    return JsonResponse(response_json)
+
+
+def metrics(request):
+    return HttpResponse(MetricsRegistry.get_instance().render(), content_type='text/plain; version=0.0.4')
+
+
 def error_404(request, exception):
     template = loader.get_template('404.html')
     http_response = HttpResponse(template.render({}, request))
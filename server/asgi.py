@@ -9,8 +9,13 @@ https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'server.settings')
 
-application = get_asgi_application()
+# As `get_asgi_application`, with a handler which does not block the event loop while streaming responses
+django.setup(set_prefix=False)
+
+from plan.asgi import StreamingASGIHandler
+
+application = StreamingASGIHandler()
@@ -39,6 +39,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'plan.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,6 +83,32 @@ DATABASES = {
     }
 }
 
+# Catalog lookup cache (see plan.cache.CatalogCache). Set 'SHARED' to the alias of a cache of CACHES
+# dedicated to the catalog to share entries between processes. 'VERSION_TTL' is the number of seconds for which
+# a process reuses the catalog versions it read from the database (see plan.catalog.CatalogSnapshot).
+
+PLAN_CACHE = {
+    'MAX_SIZE': 10000,
+    'TTL': 300,
+    'SHARED': None,
+    'VERSION_TTL': 1
+}
+
+# Threads of each ASGI worker running the database work of the asynchronous API views (see
+# plan.executors.DatabaseExecutor), which bounds the database connections opened by the worker.
+
+PLAN_DATABASE_THREADS = 32
+
+# Request metrics exposed on /metrics, and sampled profiling of slow requests (see
+# plan.middleware.InstrumentationMiddleware). Set 'PROFILE_DIR' to a directory to enable profiling.
+
+PLAN_METRICS = {
+    'DUPLICATE_QUERY_THRESHOLD': 10,
+    'PROFILE_DIR': None,
+    'PROFILE_RATE': 0.01,
+    'PROFILE_THRESHOLD': 1
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 